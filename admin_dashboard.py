@@ -435,7 +435,10 @@ async def show_health_status(update: Update, context: ContextTypes.DEFAULT_TYPE)
     # دریافت گزارش
     report = health_checker.get_health_report()
     
-    keyboard = [[InlineKeyboardButton("🔙 بازگشت", callback_data="dash:main")]]
+    keyboard = [
+        [InlineKeyboardButton("🔬 پروفایل زنده", callback_data="dash:profile")],
+        [InlineKeyboardButton("🔙 بازگشت", callback_data="dash:main")]
+    ]
     
     try:
         await query.edit_message_text(
@@ -450,6 +453,110 @@ async def show_health_status(update: Update, context: ContextTypes.DEFAULT_TYPE)
             raise
 
 
+# مدت‌های قابل انتخاب برای پروفایل زنده (ثانیه)
+PROFILE_DURATIONS = (10, 30, 60)
+
+
+async def show_profiler_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """منوی پروفایلر نمونه‌برداری (فقط ادمین)"""
+    query = update.callback_query
+    
+    if update.effective_user.id != ADMIN_ID:
+        await query.answer("⛔ دسترسی ندارید", show_alert=True)
+        return
+    
+    await query.answer()
+    
+    from stack_sampler import DEFAULT_INTERVAL
+    
+    text = "🔬 **پروفایل زنده**\n"
+    text += "═" * 30 + "\n\n"
+    text += "پشته همه thread ها در مدت انتخابی نمونه‌برداری میشه و فایل "
+    text += "collapsed\\-stack (قابل باز کردن با speedscope یا flamegraph) ارسال میشه.\n\n"
+    text += f"├ فاصله نمونه‌برداری: {DEFAULT_INTERVAL * 1000:.0f}ms\n"
+    text += "└ سربار معمولاً کمتر از 1% (مقدار واقعی در گزارش میاد)\n"
+    
+    keyboard = [
+        [InlineKeyboardButton(f"⏱ {seconds} ثانیه", callback_data=f"dash:profile:{seconds}")
+         for seconds in PROFILE_DURATIONS],
+        [InlineKeyboardButton("🔙 بازگشت", callback_data="dash:health")]
+    ]
+    
+    await query.edit_message_text(
+        text,
+        parse_mode='Markdown',
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
+
+
+async def start_profiling(update: Update, context: ContextTypes.DEFAULT_TYPE, seconds: int):
+    """شروع پروفایل برای seconds ثانیه و ارسال نتیجه به صورت فایل"""
+    query = update.callback_query
+    
+    if update.effective_user.id != ADMIN_ID:
+        await query.answer("⛔ دسترسی ندارید", show_alert=True)
+        return
+    
+    if seconds not in PROFILE_DURATIONS:
+        await query.answer("❌ مدت نامعتبر", show_alert=True)
+        return
+    
+    from stack_sampler import StackSampler, ProfilerBusyError
+    
+    sampler = StackSampler()
+    try:
+        sampler.start(duration=seconds)
+    except ProfilerBusyError:
+        await query.answer("⏳ یک پروفایل دیگر در حال اجراست", show_alert=True)
+        return
+    
+    await query.answer("🔬 پروفایل شروع شد")
+    log_admin_action(update.effective_user.id, "Profiler Start", f"{seconds}s")
+    
+    await query.edit_message_text(
+        f"🔬 در حال نمونه‌برداری به مدت {seconds} ثانیه...\n"
+        "نتیجه به صورت فایل ارسال میشه."
+    )
+    
+    # ✅ انتظار در پس‌زمینه تا handler و بقیه آپدیت‌ها بلاک نشن
+    context.application.create_task(
+        _finish_profiling(context.bot, query.message.chat_id, sampler, seconds),
+        update=update
+    )
+
+
+async def _finish_profiling(bot, chat_id: int, sampler, seconds: int):
+    """پایان پروفایل و ارسال فایل collapsed-stack"""
+    import asyncio
+    import io
+    
+    await asyncio.sleep(seconds)
+    result = await asyncio.to_thread(sampler.stop)
+    summary = result.summary()
+    
+    caption = (
+        f"🔬 پروفایل {summary['duration']}s\n"
+        f"نمونه‌ها: {summary['samples']} (هر {summary['interval_ms']}ms)\n"
+        f"پشته یکتا: {summary['unique_stacks']}\n"
+        f"سربار: {summary['overhead_percent']}%\n"
+    )
+    top = result.top_functions(5)
+    if top:
+        caption += "\nپرتکرارترین توابع:\n"
+        for label, count in top:
+            caption += f"• {label[:80]} — {count}\n"
+    
+    document = io.BytesIO(result.collapsed().encode('utf-8'))
+    filename = f"profile_{datetime.now().strftime('%Y%m%d_%H%M%S')}.folded"
+    
+    await bot.send_document(
+        chat_id=chat_id,
+        document=document,
+        filename=filename,
+        caption=caption[:1024]
+    )
+
+
 async def show_cache_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """نمایش آمار کش"""
     query = update.callback_query
@@ -557,7 +664,9 @@ async def show_analysis(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
-    db = context.bot_data['db']
+    # ✅ کوئری‌های تحلیلی روی snapshot فقط‌خواندنی (در صورت فعال بودن)
+    from analytics_snapshot import get_read_db
+    db = await get_read_db(context)
     cursor = db.cursor
     
     # تحلیل فروش
@@ -599,8 +708,20 @@ async def show_analysis(update: Update, context: ContextTypes.DEFAULT_TYPE):
     for hour, count in peak_hours:
         text += f"├ {hour}:00 \\- {count} سفارش\n"
     
+    # ✅ پرهزینه‌ترین کوئری‌ها (پروفایلر)
+    from query_profiler import query_profiler
+    top_queries = query_profiler.top(3)
+    text += "\n**🐢 پرهزینه‌ترین کوئری‌ها:**\n"
+    if top_queries:
+        for row in top_queries:
+            text += f"├ p95 {row['p95_ms']}ms \\| max {row['max_ms']}ms\n"
+            text += f"│ `{_short_sql(row['fingerprint'], 60)}`\n"
+    else:
+        text += "├ هنوز نمونه‌ای ثبت نشده\n"
+    
     keyboard = [
         [InlineKeyboardButton("📊 گزارش کامل", callback_data="analytics:sales_weekly")],
+        [InlineKeyboardButton("🐢 کوئری‌های پرهزینه", callback_data="dash:queries")],
         [InlineKeyboardButton("🔙 بازگشت", callback_data="dash:main")]
     ]
     
@@ -617,6 +738,70 @@ async def show_analysis(update: Update, context: ContextTypes.DEFAULT_TYPE):
             raise
 
 
+def _short_sql(fingerprint: str, limit: int) -> str:
+    """کوتاه کردن fingerprint برای نمایش داخل `code` (بدون backtick)"""
+    fingerprint = fingerprint.replace('`', "'")
+    return fingerprint if len(fingerprint) <= limit else fingerprint[:limit - 1] + '…'
+
+
+async def show_top_queries(update: Update, context: ContextTypes.DEFAULT_TYPE, order_by: str = 'total'):
+    """نمایش کوئری‌های پرهزینه از پروفایلر"""
+    query = update.callback_query
+    await query.answer()
+    
+    from query_profiler import query_profiler
+    stats = query_profiler.get_stats()
+    rows = query_profiler.top(8, order_by=order_by)
+    
+    order_titles = {'total': 'زمان کل', 'p95': 'p95', 'max': 'max', 'slow': 'تعداد کند'}
+    
+    text = "🐢 **کوئری‌های پرهزینه**\n"
+    text += "═" * 30 + "\n\n"
+    text += f"مرتب‌سازی: {order_titles.get(order_by, order_by)}\n"
+    text += f"├ دستورها: {stats['statements']:,} (نمونه‌برداری {stats['sample_rate'] * 100:.0f}%)\n"
+    text += f"├ کوئری کند (≥ {stats['slow_ms']:.0f}ms): {stats['slow_total']}\n"
+    text += f"└ از: {stats['since']}\n\n"
+    
+    if not rows:
+        text += "هنوز نمونه‌ای ثبت نشده است."
+    
+    for idx, row in enumerate(rows, 1):
+        text += f"**{idx}.** `{_short_sql(row['fingerprint'], 120)}`\n"
+        text += (f"├ ~{row['calls']:,} بار، کل ~{row['total_ms']:,.0f}ms\n"
+                 f"├ p50 {row['p50_ms']}ms \\| p95 {row['p95_ms']}ms\n"
+                 f"└ max {row['max_ms']}ms \\| کند: {row['slow']}\n\n")
+    
+    keyboard = [
+        [
+            InlineKeyboardButton("⏱ زمان کل", callback_data="dash:queries:total"),
+            InlineKeyboardButton("📈 p95", callback_data="dash:queries:p95"),
+            InlineKeyboardButton("🔝 max", callback_data="dash:queries:max"),
+        ],
+        [InlineKeyboardButton("🗑 صفر کردن آمار", callback_data="dash:queries_reset")],
+        [InlineKeyboardButton("🔙 بازگشت", callback_data="dash:analysis")]
+    ]
+    
+    try:
+        await query.edit_message_text(
+            text[:4000],
+            parse_mode='Markdown',
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        )
+    except Exception as e:
+        if "Message is not modified" in str(e):
+            await query.answer("✅ اطلاعات به‌روز است", show_alert=False)
+        else:
+            raise
+
+
+async def queries_reset(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """صفر کردن آمار پروفایلر کوئری"""
+    from query_profiler import query_profiler
+    query_profiler.reset()
+    log_admin_action(update.effective_user.id, "Query Profiler Reset", "آمار کوئری‌ها صفر شد")
+    await show_top_queries(update, context)
+
+
 async def cache_clear(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """پاک کردن کامل کش"""
     query = update.callback_query
@@ -669,12 +854,22 @@ async def handle_dashboard_callback(update: Update, context: ContextTypes.DEFAUL
         await show_users_report_all(update, context)
     elif data == "dash:health":
         await show_health_status(update, context)
+    elif data == "dash:profile":
+        await show_profiler_menu(update, context)
+    elif data.startswith("dash:profile:"):
+        await start_profiling(update, context, int(data.split(":")[-1]))
     elif data == "dash:cache":
         await show_cache_stats(update, context)
     elif data == "dash:errors":
         await show_errors(update, context)
     elif data == "dash:analysis":
         await show_analysis(update, context)
+    elif data == "dash:queries":
+        await show_top_queries(update, context)
+    elif data.startswith("dash:queries:"):
+        await show_top_queries(update, context, data.split(":")[-1])
+    elif data == "dash:queries_reset":
+        await queries_reset(update, context)
     elif data == "dash:refresh":
         await admin_dashboard(update, context)
     elif data == "dash:cache_clear":
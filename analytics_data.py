@@ -0,0 +1,318 @@
+"""
+لایه داده تحلیلی مبتنی بر NumPy
+✅ ستون‌های سفارشات یک‌بار خوانده و در آرایه‌های NumPy نگهداری میشن
+✅ گروه‌بندی زمانی (روز / هفته / ماه / ساعت) به‌صورت برداری
+✅ میانگین متحرک، کوهورت و نرخ خرید مجدد بدون حلقه پایتونی
+"""
+import logging
+from typing import Dict, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SECONDS_PER_DAY = 86400
+
+# کد وضعیت‌ها در آرایه status (به جای رشته)
+STATUS_CODES = {
+    'pending': 0,
+    'waiting_payment': 1,
+    'receipt_sent': 2,
+    'payment_confirmed': 3,
+    'confirmed': 4,
+    'rejected': 5,
+    'shipped': 6,
+}
+OTHER_STATUS = 9
+CONFIRMED_CODES = (STATUS_CODES['payment_confirmed'], STATUS_CODES['confirmed'])
+
+BUCKETS = ('day', 'week', 'month', 'hour')
+
+
+def _status_case_sql() -> str:
+    """عبارت CASE برای تبدیل وضعیت به کد عددی داخل خود SQLite"""
+    whens = " ".join(f"WHEN '{name}' THEN {code}" for name, code in STATUS_CODES.items())
+    return f"CASE status {whens} ELSE {OTHER_STATUS} END"
+
+
+def rolling_mean(values, window: int) -> np.ndarray:
+    """
+    میانگین متحرک با cumsum (ابتدای سری با پنجره ناقص محاسبه میشه)
+
+    Args:
+        values: سری ورودی (معمولاً خروجی OrderFrame.daily_series)
+        window: طول پنجره
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if values.size == 0 or window <= 1:
+        return values.copy()
+
+    csum = np.cumsum(np.insert(values, 0, 0.0))
+    idx = np.arange(1, values.size + 1)
+    start = np.maximum(idx - window, 0)
+    return (csum[idx] - csum[start]) / (idx - start)
+
+
+class OrderFrame:
+    """
+    ستون‌های سفارشات به شکل آرایه‌های NumPy
+
+    Attributes:
+        order_id, user_id, ts (epoch ثانیه UTC), status (کد عددی),
+        total_price, discount_amount, final_price
+    """
+
+    COLUMNS = ('order_id', 'user_id', 'ts', 'status',
+               'total_price', 'discount_amount', 'final_price')
+
+    def __init__(self, order_id, user_id, ts, status,
+                 total_price, discount_amount, final_price):
+        self.order_id = np.asarray(order_id, dtype=np.int64)
+        self.user_id = np.asarray(user_id, dtype=np.int64)
+        self.ts = np.asarray(ts, dtype=np.int64)
+        self.status = np.asarray(status, dtype=np.int8)
+        self.total_price = np.asarray(total_price, dtype=np.float64)
+        self.discount_amount = np.asarray(discount_amount, dtype=np.float64)
+        self.final_price = np.asarray(final_price, dtype=np.float64)
+
+    def __len__(self):
+        return int(self.order_id.size)
+
+    # ==================== بارگذاری ====================
+
+    @classmethod
+    def empty(cls) -> 'OrderFrame':
+        return cls(*([] for _ in cls.COLUMNS))
+
+    @classmethod
+    def load(cls, db, days: Optional[int] = None, chunk_size: int = 50000) -> 'OrderFrame':
+        """
+        خواندن یک‌باره ستون‌های سفارشات از دیتابیس
+
+        Args:
+            db: نمونه Database (یا هر شیء با property ‏cursor)
+            days: فقط سفارشات N روز اخیر (None = همه)
+            chunk_size: اندازه هر دسته fetchmany
+        """
+        # تبدیل تاریخ به epoch و وضعیت به کد عددی داخل SQLite انجام میشه
+        query = f"""
+            SELECT id, COALESCE(user_id, 0),
+                   CAST(strftime('%s', created_at) AS INTEGER),
+                   {_status_case_sql()},
+                   COALESCE(total_price, 0), COALESCE(discount_amount, 0),
+                   COALESCE(final_price, 0)
+            FROM orders
+            WHERE created_at IS NOT NULL
+        """
+        params = ()
+        if days is not None:
+            query += " AND created_at >= DATE('now', ?)"
+            params = (f'-{int(days)} days',)
+        query += " ORDER BY id"
+
+        cursor = db.cursor
+        # تاپل خام به جای sqlite3.Row → تبدیل مستقیم به آرایه
+        cursor.row_factory = None
+        cursor.execute(query, params)
+
+        width = len(cls.COLUMNS)
+        chunks = []
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            flat = np.fromiter((v for row in rows for v in row), dtype=np.float64, count=len(rows) * width)
+            chunks.append(flat.reshape(-1, width))
+
+        if not chunks:
+            return cls.empty()
+
+        data = np.concatenate(chunks)
+        return cls(
+            data[:, 0], data[:, 1], data[:, 2], data[:, 3],
+            data[:, 4], data[:, 5], data[:, 6]
+        )
+
+    # ==================== فیلتر ====================
+
+    def select(self, mask) -> 'OrderFrame':
+        """زیرمجموعه سفارشات با mask بولی"""
+        return OrderFrame(*(getattr(self, col)[mask] for col in self.COLUMNS))
+
+    def confirmed(self) -> 'OrderFrame':
+        """فقط سفارشات تایید شده"""
+        return self.select(np.isin(self.status, CONFIRMED_CODES))
+
+    def since_days(self, days: int, now_ts: Optional[int] = None) -> 'OrderFrame':
+        """سفارشات از ابتدای روز N روز قبل (هم‌ارز DATE('now', '-N days'))"""
+        if now_ts is None:
+            now_ts = int(np.datetime64('now', 's').astype(np.int64))
+        cutoff = (now_ts // SECONDS_PER_DAY - days) * SECONDS_PER_DAY
+        return self.select(self.ts >= cutoff)
+
+    # ==================== گروه‌بندی زمانی ====================
+
+    def bucket_keys(self, bucket: str) -> np.ndarray:
+        """
+        کلید عددی هر سفارش برای گروه‌بندی
+
+        day: شماره روز از epoch | week: شماره روز دوشنبه همان هفته
+        month: شماره ماه از 1970-01 | hour: ساعت روز (0..23)
+        """
+        if bucket == 'day':
+            return self.ts // SECONDS_PER_DAY
+        if bucket == 'week':
+            days = self.ts // SECONDS_PER_DAY
+            # 1970-01-01 پنجشنبه است؛ +3 باعث میشه هفته از دوشنبه شروع بشه
+            return days - (days + 3) % 7
+        if bucket == 'month':
+            return self.ts.astype('datetime64[s]').astype('datetime64[M]').astype(np.int64)
+        if bucket == 'hour':
+            return (self.ts % SECONDS_PER_DAY) // 3600
+        raise ValueError(f"bucket نامعتبر: {bucket}")
+
+    @staticmethod
+    def bucket_labels(keys: np.ndarray, bucket: str) -> np.ndarray:
+        """تبدیل کلیدهای عددی به برچسب datetime64 (یا ساعت)"""
+        if bucket in ('day', 'week'):
+            return keys.astype('datetime64[D]')
+        if bucket == 'month':
+            return keys.astype('datetime64[M]')
+        return keys
+
+    def aggregate(self, bucket: str) -> Dict[str, np.ndarray]:
+        """
+        تعداد و مجموع مبالغ در هر بازه (فقط بازه‌های دارای داده)
+
+        Returns:
+            dict: labels, count, gross, discount, net
+        """
+        keys = self.bucket_keys(bucket)
+        uniq, inverse = np.unique(keys, return_inverse=True)
+        n = uniq.size
+        return {
+            'labels': self.bucket_labels(uniq, bucket),
+            'count': np.bincount(inverse, minlength=n).astype(np.int64),
+            'gross': np.bincount(inverse, weights=self.total_price, minlength=n),
+            'discount': np.bincount(inverse, weights=self.discount_amount, minlength=n),
+            'net': np.bincount(inverse, weights=self.final_price, minlength=n),
+        }
+
+    def hourly_counts(self) -> np.ndarray:
+        """تعداد سفارش در هر ساعت روز (آرایه 24 تایی)"""
+        return np.bincount(self.bucket_keys('hour'), minlength=24)[:24]
+
+    def daily_series(self, start_day: Optional[int] = None, end_day: Optional[int] = None) -> Dict[str, np.ndarray]:
+        """
+        سری روزانه پیوسته (روزهای بدون سفارش = صفر) برای میانگین متحرک
+
+        Args:
+            start_day / end_day: شماره روز از epoch (پیشفرض: بازه داده)
+        """
+        days = self.bucket_keys('day')
+        if start_day is None:
+            start_day = int(days.min()) if days.size else 0
+        if end_day is None:
+            end_day = int(days.max()) if days.size else start_day - 1
+
+        length = max(end_day - start_day + 1, 0)
+        in_range = (days >= start_day) & (days <= end_day)
+        offsets = days[in_range] - start_day
+        return {
+            'labels': np.arange(start_day, start_day + length).astype('datetime64[D]'),
+            'count': np.bincount(offsets, minlength=length)[:length],
+            'net': np.bincount(offsets, weights=self.final_price[in_range], minlength=length)[:length],
+        }
+
+    # ==================== کاربران ====================
+
+    def repeat_stats(self) -> Dict[str, float]:
+        """تعداد خریداران، نرخ تکرار خرید و سهم خریداران تکراری"""
+        if not len(self):
+            return {'buyers': 0, 'orders': 0, 'repeat_rate': 0.0, 'repeat_buyer_share': 0.0}
+
+        _, per_user = np.unique(self.user_id, return_counts=True)
+        buyers = int(per_user.size)
+        orders = int(per_user.sum())
+        return {
+            'buyers': buyers,
+            'orders': orders,
+            'repeat_rate': orders / buyers,
+            'repeat_buyer_share': float(np.count_nonzero(per_user > 1)) / buyers,
+        }
+
+    def cohort_retention(self) -> Dict[str, np.ndarray]:
+        """
+        کوهورت ماهانه: ماه اولین خرید هر کاربر و درصد کاربران فعال در ماه‌های بعد
+
+        Returns:
+            dict: cohorts (datetime64[M])، sizes، retention (ماتریس cohort × فاصله ماه)
+        """
+        if not len(self):
+            return {
+                'cohorts': np.array([], dtype='datetime64[M]'),
+                'sizes': np.array([], dtype=np.int64),
+                'retention': np.zeros((0, 0)),
+            }
+
+        months = self.bucket_keys('month')
+        users, user_idx = np.unique(self.user_id, return_inverse=True)
+
+        # مرتب‌سازی بر اساس (کاربر، ماه) → اولین ردیف هر کاربر ماه اولین خریدشه
+        order = np.lexsort((months, user_idx))
+        sorted_users = user_idx[order]
+        starts = np.flatnonzero(np.r_[True, sorted_users[1:] != sorted_users[:-1]])
+        first_month = months[order][starts]
+
+        cohort_month = first_month[user_idx]
+        offset = months - cohort_month
+
+        cohorts, cohort_idx = np.unique(cohort_month, return_inverse=True)
+        width = int(offset.max()) + 1
+
+        # هر کاربر در هر ماه فقط یک‌بار شمرده میشه
+        cell = user_idx.astype(np.int64) * width + offset
+        _, first_pos = np.unique(cell, return_index=True)
+        flat = cohort_idx[first_pos] * width + offset[first_pos]
+        active = np.bincount(flat, minlength=cohorts.size * width).reshape(cohorts.size, width)
+
+        sizes = active[:, 0]
+        retention = active / np.maximum(sizes, 1)[:, None]
+        return {
+            'cohorts': cohorts.astype('datetime64[M]'),
+            'sizes': sizes,
+            'retention': retention,
+        }
+
+
+def load_product_quantities(db, limit: Optional[int] = None):
+    """
+    محبوب‌ترین محصولات با np.unique + bincount به جای حلقه Counter
+
+    Returns:
+        list of (product_name, total_quantity) مرتب شده نزولی
+    """
+    cursor = db.cursor
+    cursor.row_factory = None
+    cursor.execute("""
+        SELECT COALESCE(json_extract(value, '$.product'), 'Unknown'),
+               COALESCE(CAST(json_extract(value, '$.quantity') AS INTEGER), 0)
+        FROM orders, json_each(orders.items)
+        WHERE status IN ('confirmed', 'payment_confirmed')
+    """)
+    rows = cursor.fetchall()
+    if not rows:
+        return []
+
+    # کد عددی هر نام محصول با dict (سریع‌تر از np.unique روی آرایه object)
+    codes = {}
+    name_idx = np.fromiter((codes.setdefault(r[0], len(codes)) for r in rows), dtype=np.int64, count=len(rows))
+    quantities = np.fromiter((r[1] for r in rows), dtype=np.int64, count=len(rows))
+
+    totals = np.bincount(name_idx, weights=quantities, minlength=len(codes)).astype(np.int64)
+    names = list(codes)
+
+    order = np.argsort(-totals, kind='stable')
+    if limit is not None:
+        order = order[:limit]
+    return [(names[i], int(totals[i])) for i in order]
@@ -0,0 +1,269 @@
+"""
+Snapshot فقط‌خواندنی دیتابیس برای گزارش‌های سنگین
+✅ کپی دوره‌ای دیتابیس زنده با SQLite Backup API (مثل safe_sqlite_backup)
+✅ اتصال‌های query_only با cache_size و mmap_size بزرگ
+✅ مسیریابی گزارش‌ها، نمودارها و export با سقف قدمت قابل تنظیم
+
+گزارش‌ها روی snapshot اجرا میشن تا اسکن‌های طولانی با نوشتن‌های ربات
+رقابت نکنن و reader های WAL جلوی checkpoint رو نگیرن.
+"""
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from backup_scheduler import safe_sqlite_backup
+
+logger = logging.getLogger(__name__)
+
+# تنظیمات اتصال snapshot (فقط خواندن، پس حافظه بیشتر مشکلی نداره)
+SNAPSHOT_CACHE_SIZE_KB = 65536          # 64MB page cache
+SNAPSHOT_MMAP_SIZE = 512 * 1024 * 1024  # 512MB memory-mapped I/O
+
+
+class AnalyticsSnapshot:
+    """
+    کپی فقط‌خواندنی دیتابیس زنده
+
+    رابط cursor / conn / _get_conn مثل Database است تا Analytics،
+    ExportManager و get_cleanup_stats بدون تغییر روی آن کار کنند.
+    """
+
+    def __init__(self, source_db: str, snapshot_path: str, max_age: int = 900):
+        """
+        Args:
+            source_db: مسیر دیتابیس زنده
+            snapshot_path: مسیر فایل snapshot
+            max_age: حداکثر قدمت مجاز (ثانیه) قبل از بروزرسانی اجباری
+        """
+        self.source_db = source_db
+        self.snapshot_path = snapshot_path
+        self.max_age = max_age
+
+        self._local = threading.local()
+        self._refresh_lock = threading.Lock()
+        self._generation = 0
+
+        # ✅ همه اتصال‌های باز (همه thread ها): [(generation, conn)]
+        self._conn_lock = threading.Lock()
+        self._connections: List[Tuple[int, sqlite3.Connection]] = []
+
+        self.last_refresh: Optional[float] = None
+        self.last_duration: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.refresh_count = 0
+
+        # استفاده مجدد از snapshot اجرای قبلی (اگر هنوز تازه باشه)
+        if os.path.exists(snapshot_path):
+            self.last_refresh = os.path.getmtime(snapshot_path)
+
+    # ==================== بروزرسانی ====================
+
+    def refresh(self) -> bool:
+        """
+        ساخت snapshot جدید و جایگزینی اتمیک فایل قبلی
+
+        ⚠️ مسدودکننده است؛ از event loop با asyncio.to_thread صدا زده بشه
+        """
+        with self._refresh_lock:
+            return self._refresh_locked()
+
+    def refresh_if_stale(self) -> bool:
+        """بروزرسانی فقط در صورت کهنه بودن (درخواست‌های همزمان یک‌بار کپی می‌کنن)"""
+        with self._refresh_lock:
+            if self.is_fresh():
+                return True
+            return self._refresh_locked()
+
+    def _refresh_locked(self) -> bool:
+        tmp_path = self.snapshot_path + '.tmp'
+        start = time.time()
+
+        try:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+            safe_sqlite_backup(self.source_db, tmp_path)
+
+            # snapshot به WAL نیاز نداره؛ حالت DELETE اجازه باز کردن با mode=ro رو میده
+            conn = sqlite3.connect(tmp_path)
+            try:
+                conn.execute("PRAGMA journal_mode = DELETE")
+            finally:
+                conn.close()
+
+            os.replace(tmp_path, self.snapshot_path)
+
+            self._generation += 1
+            # اتصال‌های نسل قبل ممکنه هنوز وسط یک گزارش باشن؛ قدیمی‌ترها بسته میشن
+            # تا thread های بیکار فایل‌های جایگزین‌شده رو روی دیسک نگه ندارن
+            self._close_stale(self._generation - 1)
+            self.last_refresh = time.time()
+            self.last_duration = self.last_refresh - start
+            self.last_error = None
+            self.refresh_count += 1
+
+            logger.info(f"📸 Analytics snapshot refreshed in {self.last_duration:.2f}s")
+            return True
+
+        except Exception as e:
+            self.last_error = str(e)
+            logger.error(f"❌ خطا در بروزرسانی snapshot تحلیلی: {e}")
+            try:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            except OSError:
+                pass
+            return False
+
+    def age(self) -> Optional[float]:
+        """قدمت snapshot به ثانیه (None = هنوز ساخته نشده)"""
+        if self.last_refresh is None or not os.path.exists(self.snapshot_path):
+            return None
+        return time.time() - self.last_refresh
+
+    def is_fresh(self, max_age: Optional[int] = None) -> bool:
+        """آیا snapshot در محدوده قدمت مجاز است؟"""
+        age = self.age()
+        if age is None:
+            return False
+        return age <= (self.max_age if max_age is None else max_age)
+
+    # ==================== اتصال ====================
+
+    def get_connection(self) -> sqlite3.Connection:
+        """
+        اتصال فقط‌خواندنی برای thread فعلی
+        بعد از هر refresh اتصال قبلی بسته و به فایل جدید وصل میشه؛ اتصال thread هایی
+        که دیگه صدا نمی‌زنن در refresh بعدی بسته میشه
+        """
+        conn = getattr(self._local, 'connection', None)
+        if conn is not None and self._local.generation == self._generation:
+            return conn
+
+        if conn is not None:
+            self._close_connection(conn)
+
+        uri = Path(self.snapshot_path).absolute().as_uri() + '?mode=ro'
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA query_only = ON")
+        conn.execute(f"PRAGMA cache_size = -{SNAPSHOT_CACHE_SIZE_KB}")
+        conn.execute(f"PRAGMA mmap_size = {SNAPSHOT_MMAP_SIZE}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+
+        self._local.connection = conn
+        self._local.generation = self._generation
+        with self._conn_lock:
+            self._connections.append((self._generation, conn))
+        return conn
+
+    def _close_connection(self, conn: sqlite3.Connection):
+        with self._conn_lock:
+            self._connections = [item for item in self._connections if item[1] is not conn]
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def _close_stale(self, min_generation: int) -> int:
+        """
+        بستن اتصال‌های نسل‌های قبل از min_generation (از هر thread)
+
+        thread صاحب اتصال بسته‌شده در get_connection بعدی دوباره وصل میشه.
+        """
+        with self._conn_lock:
+            stale = [conn for generation, conn in self._connections if generation < min_generation]
+            self._connections = [item for item in self._connections if item[0] >= min_generation]
+        for conn in stale:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        return len(stale)
+
+    def _get_conn(self) -> sqlite3.Connection:
+        return self.get_connection()
+
+    @property
+    def cursor(self):
+        """سازگار با Database.cursor"""
+        return self.get_connection().cursor()
+
+    @property
+    def conn(self):
+        """سازگار با Database.conn"""
+        return self.get_connection()
+
+    def close(self):
+        """بستن اتصال thread فعلی"""
+        conn = getattr(self._local, 'connection', None)
+        if conn is not None:
+            self._close_connection(conn)
+            self._local.connection = None
+
+    def get_stats(self) -> dict:
+        """وضعیت snapshot برای داشبورد/مانیتورینگ"""
+        age = self.age()
+        size = os.path.getsize(self.snapshot_path) if os.path.exists(self.snapshot_path) else 0
+        return {
+            'path': self.snapshot_path,
+            'age_seconds': round(age, 1) if age is not None else None,
+            'max_age': self.max_age,
+            'fresh': self.is_fresh(),
+            'size_mb': round(size / (1024 * 1024), 2),
+            'refresh_count': self.refresh_count,
+            'connections': len(self._connections),
+            'last_duration': round(self.last_duration, 3) if self.last_duration is not None else None,
+            'last_error': self.last_error,
+        }
+
+
+# ==================== Helper ها ====================
+
+def create_analytics_snapshot() -> Optional[AnalyticsSnapshot]:
+    """ساخت snapshot از روی تنظیمات (None اگر غیرفعال باشه)"""
+    from config import (
+        DATABASE_NAME, ANALYTICS_SNAPSHOT_ENABLED,
+        ANALYTICS_SNAPSHOT_PATH, ANALYTICS_SNAPSHOT_MAX_AGE
+    )
+
+    if not ANALYTICS_SNAPSHOT_ENABLED:
+        return None
+
+    return AnalyticsSnapshot(DATABASE_NAME, ANALYTICS_SNAPSHOT_PATH, ANALYTICS_SNAPSHOT_MAX_AGE)
+
+
+async def get_read_db(context):
+    """
+    دیتابیس مناسب برای گزارش‌های سنگین
+
+    اگر snapshot فعال باشه و از سقف قدمت گذشته باشه، اول (در thread جدا)
+    بروزرسانی میشه؛ در صورت خطا به دیتابیس زنده برمی‌گرده.
+    """
+    db = context.bot_data.get('db')
+    snapshot = context.bot_data.get('analytics_snapshot')
+
+    if snapshot is None:
+        return db
+
+    if not snapshot.is_fresh():
+        ok = await asyncio.to_thread(snapshot.refresh_if_stale)
+        if not ok:
+            logger.warning("⚠️ snapshot در دسترس نیست - استفاده از دیتابیس زنده")
+            return db
+
+    return snapshot
+
+
+async def scheduled_snapshot_refresh(context):
+    """Job دوره‌ای بروزرسانی snapshot (کپی در thread جدا اجرا میشه)"""
+    snapshot = context.bot_data.get('analytics_snapshot')
+    if snapshot is None:
+        return
+
+    await asyncio.to_thread(snapshot.refresh)
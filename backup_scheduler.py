@@ -1,31 +1,583 @@
+"""
+بکاپ خودکار و دستی دیتابیس
+✅ کپی مرحله‌ای با SQLite Backup API در thread جدا (event loop و نوشتن‌های ربات بلاک نمیشن)
+✅ فشرده‌سازی جریانی zstd (در صورت نصب) یا gzip + چک‌سام SHA-256
+✅ تقسیم خروجی به قسمت‌های کوچک‌تر از سقف آپلود تلگرام
+✅ گزارش مدت و سرعت بکاپ در پیام ادمین
+✅ بکاپ افزایشی دوره‌ای بین بکاپ‌های کامل (incremental_backup.py)
+✅ تست بازیابی بعد از هر بکاپ: restore در مسیر staging + quick_check در پروسه جدا
+   + مقایسه تعداد ردیف‌ها؛ زمان بازیابی واقعی گزارش و در /metrics ثبت میشه
+"""
+import asyncio
+import gzip
+import hashlib
 import os
+import re
 import sqlite3
 import logging
+import time
+from dataclasses import dataclass
 from datetime import datetime
+from typing import Dict, List, Optional
 from telegram.ext import ContextTypes
-from config import DATABASE_NAME, BACKUP_FOLDER, BACKUP_HOUR, BACKUP_MINUTE, ADMIN_ID
+from backup_verify import run_check_subprocess
+from config import (
+    DATABASE_NAME, BACKUP_FOLDER, BACKUP_HOUR, BACKUP_MINUTE, ADMIN_ID,
+    BACKUP_STEP_PAGES, BACKUP_STEP_SLEEP_MS, BACKUP_COMPRESSION,
+    BACKUP_PART_SIZE_MB, BACKUP_KEEP, BACKUP_INCREMENTAL_MINUTES,
+    BACKUP_VERIFY, BACKUP_STAGING_PATH
+)
+from incremental_backup import (
+    NeedFullBackup, IncrementResult, prepare_full_backup, mark_full_backup,
+    run_incremental_backup, remove_change_capture
+)
+from metrics import registry
+
+# ✅ zstd اختیاری: سریع‌تر و فشرده‌تر از gzip، در نبودش gzip استفاده میشه
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    zstandard = None
+    ZSTD_AVAILABLE = False
 
 logger = logging.getLogger(__name__)
 
+BACKUP_RESTORE_SECONDS = registry.gauge(
+    'bot_backup_restore_seconds', 'Time to restore and check the last full backup')
+BACKUP_VERIFY_FAILURES = registry.counter(
+    'bot_backup_verify_failures_total', 'Backups that failed the restore test')
+BACKUP_LAST_SUCCESS = registry.gauge(
+    'bot_backup_last_success_timestamp_seconds', 'Unix time of the last verified full backup')
+
+# پسوند فایل خروجی برای هر نوع فشرده‌سازی
+CODEC_EXTENSIONS = {'zstd': '.zst', 'gzip': '.gz', 'none': ''}
+
+# اندازه بلوک خواندن/نوشتن جریانی
+CHUNK_SIZE = 1024 * 1024
+
+# اگه نوشتن همزمان کپی مرحله‌ای رو بیشتر از این تعداد بار از اول شروع کنه،
+# یک کپی یک‌مرحله‌ای انجام میشه تا بکاپ زیر بار نوشتن سنگین هم تموم بشه
+MAX_BACKUP_RESTARTS = 3
+
+# مهلت آپلود هر قسمت در تلگرام (ثانیه)
+UPLOAD_TIMEOUT = 300
+
+# جدول‌های کلیدی که تعداد ردیفشون در تست بازیابی مقایسه میشه
+VERIFY_TABLES = ('users', 'products', 'packs', 'orders', 'cart',
+                 'discount_codes', 'wallets', 'wallet_transactions')
+
+# حداکثر زمان quick_check در پروسه جدا (ثانیه)
+VERIFY_TIMEOUT = 600
+
+STAGING_FILENAME = 'restore_staging.db'
+
+# بکاپ کامل و افزایشی همزمان اجرا نمیشن
+_backup_lock = asyncio.Lock()
+
+_BACKUP_NAME_RE = re.compile(r'^(backup_\d{8}_\d{6})')
+_PART_RE = re.compile(r'\.part\d{3}$')
 
-def safe_sqlite_backup(source_db: str, dest_path: str):
+
+class _BackupRestarted(Exception):
+    """کپی مرحله‌ای بیش از حد از اول شروع شد"""
+    pass
+
+
+def safe_sqlite_backup(source_db: str, dest_path: str, pages: int = -1,
+                       step_sleep: float = 0.0, max_restarts: int = MAX_BACKUP_RESTARTS) -> int:
     """
     ✅ FIX #10: بکاپ ایمن با SQLite Backup API
-    
+
     برتری نسبت به shutil.copy2:
     - بکاپ consistent حتی در حین نوشتن
     - سازگار با WAL mode
     - بدون corruption احتمالی
+
+    ✅ حالت مرحله‌ای (pages > 0): هر مرحله فقط pages صفحه کپی می‌کنه و بین مراحل
+    step_sleep ثانیه مکث می‌کنه تا نوشتن‌های ربات قفل بگیرن. پارامتر sleep= خود
+    API فقط وقتی دیتابیس BUSY باشه اعمال میشه، برای همین مکث داخل progress انجام میشه.
+
+    Returns:
+        تعداد دفعاتی که نوشتن یک connection دیگه کپی رو از اول شروع کرد
     """
+    restarts = 0
+    last_remaining = None
+
+    def progress(status, remaining, total):
+        nonlocal restarts, last_remaining
+        # بیشتر شدن remaining یعنی SQLite کپی رو از اول شروع کرده
+        if last_remaining is not None and remaining > last_remaining:
+            restarts += 1
+            if restarts > max_restarts:
+                raise _BackupRestarted()
+        last_remaining = remaining
+        if step_sleep and remaining:
+            time.sleep(step_sleep)
+
     src = sqlite3.connect(source_db)
     dst = sqlite3.connect(dest_path)
     try:
+        if pages and pages > 0:
+            try:
+                src.backup(dst, pages=pages, progress=progress)
+                return restarts
+            except _BackupRestarted:
+                logger.warning(
+                    "⚠️ کپی مرحله‌ای %d بار از اول شروع شد - کپی یک‌مرحله‌ای", restarts
+                )
         src.backup(dst)
+        return restarts
     finally:
         dst.close()
         src.close()
 
 
+def resolve_codec(name: Optional[str] = None) -> str:
+    """انتخاب نوع فشرده‌سازی از تنظیمات (auto = zstd اگه نصب باشه)"""
+    name = (name or BACKUP_COMPRESSION).lower()
+    if name == 'auto':
+        return 'zstd' if ZSTD_AVAILABLE else 'gzip'
+    if name == 'zstd' and not ZSTD_AVAILABLE:
+        logger.warning("⚠️ پکیج zstandard نصب نیست - از gzip استفاده میشه")
+        return 'gzip'
+    if name not in CODEC_EXTENSIONS:
+        logger.warning("⚠️ BACKUP_COMPRESSION نامعتبر (%s) - از gzip استفاده میشه", name)
+        return 'gzip'
+    return name
+
+
+def _codec_from_path(path: str) -> str:
+    path = _PART_RE.sub('', path)
+    for codec, ext in CODEC_EXTENSIONS.items():
+        if ext and path.endswith(ext):
+            return codec
+    return 'none'
+
+
+class _PartWriter:
+    """
+    فایل‌نویس با تقسیم خودکار به قسمت‌های part_size بایتی و محاسبه SHA-256
+
+    خروجی تک‌قسمتی با نام base_path و چندقسمتی با base_path.part001, part002, ...
+    """
+
+    def __init__(self, base_path: str, part_size: int):
+        self.base_path = base_path
+        self.part_size = part_size
+        self.paths: List[str] = []
+        self.part_hashes: List[str] = []
+        self.total = 0
+        self._digest = hashlib.sha256()
+        self._file = None
+        self._part_digest = None
+        self._written = 0
+
+    def _next_part(self):
+        self._close_part()
+        path = f"{self.base_path}.part{len(self.paths) + 1:03d}"
+        self.paths.append(path)
+        self._file = open(path, 'wb')
+        self._part_digest = hashlib.sha256()
+        self._written = 0
+
+    def _close_part(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self.part_hashes.append(self._part_digest.hexdigest())
+
+    def write(self, data) -> int:
+        view = memoryview(data)
+        while view:
+            if self._file is None or self._written >= self.part_size:
+                self._next_part()
+            chunk = view[:self.part_size - self._written]
+            self._file.write(chunk)
+            self._part_digest.update(chunk)
+            self._digest.update(chunk)
+            self._written += len(chunk)
+            self.total += len(chunk)
+            view = view[len(chunk):]
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self) -> List[str]:
+        if self._file is None and not self.paths:
+            self._next_part()
+        self._close_part()
+        if len(self.paths) == 1:
+            os.replace(self.paths[0], self.base_path)
+            self.paths = [self.base_path]
+        return self.paths
+
+    @property
+    def checksum(self) -> str:
+        """SHA-256 کل خروجی فشرده (همه قسمت‌ها پشت سر هم)"""
+        return self._digest.hexdigest()
+
+
+def _compress_file(src_path: str, writer: _PartWriter, codec: str):
+    """کپی جریانی فایل به writer با فشرده‌سازی"""
+    if codec == 'zstd':
+        stream = zstandard.ZstdCompressor(level=3).stream_writer(writer, closefd=False)
+    elif codec == 'gzip':
+        stream = gzip.GzipFile(fileobj=writer, mode='wb', compresslevel=6, mtime=0)
+    else:
+        stream = None
+
+    out = stream if stream is not None else writer
+    with open(src_path, 'rb') as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            out.write(chunk)
+    if stream is not None:
+        stream.close()
+
+
+class _PartReader:
+    """خواندن پشت سر هم چند قسمت به صورت یک جریان (برعکس _PartWriter)"""
+
+    def __init__(self, paths: List[str]):
+        self._paths = list(paths)
+        self._file = None
+
+    def read(self, size: int = -1) -> bytes:
+        while True:
+            if self._file is None:
+                if not self._paths:
+                    return b''
+                self._file = open(self._paths.pop(0), 'rb')
+            data = self._file.read(size)
+            if data or size == 0:
+                return data
+            self._file.close()
+            self._file = None
+
+    def readable(self) -> bool:
+        return True
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def _manifest_path(files: List[str]) -> str:
+    return _PART_RE.sub('', files[0]) + '.sha256'
+
+
+def write_manifest(files: List[str], part_hashes: List[str]) -> str:
+    """فایل چک‌سام قسمت‌ها (سازگار با sha256sum -c)"""
+    path = _manifest_path(files)
+    with open(path, 'w') as f:
+        for file_path, digest in zip(files, part_hashes):
+            f.write(f"{digest}  {os.path.basename(file_path)}\n")
+    return path
+
+
+def read_manifest(files: List[str]) -> Dict[str, str]:
+    """خواندن چک‌سام قسمت‌ها (اگه فایل manifest کنار بکاپ باشه)"""
+    path = _manifest_path(files)
+    if not os.path.exists(path):
+        return {}
+    hashes = {}
+    with open(path) as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 2:
+                hashes[parts[1]] = parts[0]
+    return hashes
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def restore_backup_file(files: List[str], dest_path: str) -> str:
+    """
+    بازسازی فایل دیتابیس از خروجی بکاپ (یک یا چند قسمت، فشرده یا خام)
+
+    Raises:
+        ValueError: اگه چک‌سام یک قسمت با manifest نخونه
+    """
+    files = sorted(files)
+    expected = read_manifest(files)
+    for path in files:
+        digest = expected.get(os.path.basename(path))
+        if digest and _file_sha256(path) != digest:
+            raise ValueError(f"checksum mismatch: {os.path.basename(path)}")
+
+    codec = _codec_from_path(files[0])
+    reader = _PartReader(files)
+    try:
+        if codec == 'zstd':
+            stream = zstandard.ZstdDecompressor().stream_reader(reader)
+        elif codec == 'gzip':
+            stream = gzip.GzipFile(fileobj=reader, mode='rb')
+        else:
+            stream = reader
+
+        with open(dest_path, 'wb') as out:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                out.write(chunk)
+    finally:
+        reader.close()
+    return dest_path
+
+
+@dataclass
+class BackupResult:
+    """نتیجه یک بکاپ"""
+    name: str
+    files: List[str]
+    codec: str
+    db_size: int
+    compressed_size: int
+    checksum: str
+    copy_seconds: float
+    compress_seconds: float
+    restarts: int = 0
+    manifest: Optional[str] = None
+    verification: Optional[Dict] = None
+
+    @property
+    def duration(self) -> float:
+        return self.copy_seconds + self.compress_seconds
+
+    @property
+    def throughput_mb(self) -> float:
+        """سرعت بکاپ (مگابایت دیتابیس در ثانیه)"""
+        if not self.duration:
+            return 0.0
+        return self.db_size / 1024 / 1024 / self.duration
+
+    @property
+    def ratio(self) -> float:
+        if not self.compressed_size:
+            return 0.0
+        return self.db_size / self.compressed_size
+
+    @property
+    def verified(self) -> Optional[bool]:
+        """نتیجه تست بازیابی (None = تست نشده)"""
+        if self.verification is None:
+            return None
+        return self.verification['ok']
+
+
+def _table_counts(path: str, tables) -> Dict[str, Optional[int]]:
+    conn = sqlite3.connect(path)
+    try:
+        existing = {row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table'"
+        )}
+        return {
+            table: conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+            if table in existing else None
+            for table in tables
+        }
+    finally:
+        conn.close()
+
+
+def staging_path_for(folder: str) -> str:
+    """مسیر staging تست بازیابی (پیش‌فرض داخل پوشه بکاپ)"""
+    return BACKUP_STAGING_PATH or os.path.join(folder, STAGING_FILENAME)
+
+
+def verify_backup(files: List[str], expected_counts: Dict[str, Optional[int]],
+                  staging_path: str) -> Dict:
+    """
+    تست بازیابی یک بکاپ: همون مسیری که در یک حادثه واقعی طی میشه
+
+    1. بازسازی فایل .db از قسمت‌های فشرده در staging_path (زمان = زمان بازیابی)
+    2. PRAGMA quick_check و شمارش ردیف‌ها در پروسه جدا
+    3. مقایسه تعداد ردیف‌ها با snapshot اصلی
+    """
+    tables = list(expected_counts)
+    report = {'ok': False, 'error': None, 'mismatches': {}}
+    try:
+        start = time.perf_counter()
+        restore_backup_file(files, staging_path)
+        report['restore_seconds'] = time.perf_counter() - start
+
+        check = run_check_subprocess(staging_path, tables, timeout=VERIFY_TIMEOUT)
+        report['check_seconds'] = time.perf_counter() - start - report['restore_seconds']
+        report['quick_check'] = check['quick_check']
+        report['counts'] = check['counts']
+        report['mismatches'] = {
+            table: (expected, check['counts'].get(table))
+            for table, expected in expected_counts.items()
+            if check['counts'].get(table) != expected
+        }
+        report['ok'] = check['ok'] and not report['mismatches']
+        report['total_seconds'] = time.perf_counter() - start
+    except Exception as e:
+        report['error'] = str(e)
+    finally:
+        if os.path.exists(staging_path):
+            os.remove(staging_path)
+
+    if report['ok']:
+        BACKUP_RESTORE_SECONDS.set(report['total_seconds'])
+        BACKUP_LAST_SUCCESS.set(time.time())
+    else:
+        BACKUP_VERIFY_FAILURES.inc()
+        logger.error("❌ تست بازیابی بکاپ ناموفق: %s", report['error'] or
+                     report['mismatches'] or report.get('quick_check'))
+    return report
+
+
+def run_backup(source_db: Optional[str] = None, folder: Optional[str] = None,
+               codec: Optional[str] = None, part_size: Optional[int] = None,
+               incremental: Optional[bool] = None, verify: Optional[bool] = None) -> BackupResult:
+    """
+    بکاپ کامل همزمان (blocking) - در thread جدا اجرا میشه
+
+    1. کپی مرحله‌ای به فایل موقت با Backup API
+    2. فشرده‌سازی جریانی + تقسیم به قسمت‌ها + SHA-256
+    3. شروع زنجیره افزایشی جدید از روی همین کپی (اگه فعال باشه)
+    4. تست بازیابی خروجی (اگه فعال باشه)
+    5. حذف فایل موقت
+    """
+    source_db = source_db or DATABASE_NAME
+    folder = folder or BACKUP_FOLDER
+    codec = resolve_codec(codec)
+    part_size = part_size or BACKUP_PART_SIZE_MB * 1024 * 1024
+    if incremental is None:
+        incremental = BACKUP_INCREMENTAL_MINUTES > 0
+    if verify is None:
+        verify = BACKUP_VERIFY
+
+    os.makedirs(folder, exist_ok=True)
+    name = f"backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    tmp_path = os.path.join(folder, f"{name}.db.tmp")
+    out_path = os.path.join(folder, f"{name}.db{CODEC_EXTENSIONS[codec]}")
+
+    try:
+        start = time.perf_counter()
+        if incremental:
+            version = prepare_full_backup(source_db)
+        restarts = safe_sqlite_backup(
+            source_db, tmp_path,
+            pages=BACKUP_STEP_PAGES,
+            step_sleep=BACKUP_STEP_SLEEP_MS / 1000
+        )
+        copied = time.perf_counter()
+        db_size = os.path.getsize(tmp_path)
+
+        writer = _PartWriter(out_path, part_size)
+        try:
+            _compress_file(tmp_path, writer, codec)
+        finally:
+            files = writer.close()
+        compressed = time.perf_counter()
+
+        manifest = write_manifest(files, writer.part_hashes)
+        if incremental:
+            mark_full_backup(source_db, tmp_path, folder, name, version)
+
+        verification = None
+        if verify:
+            verification = verify_backup(files, _table_counts(tmp_path, VERIFY_TABLES),
+                                         staging_path_for(folder))
+    except Exception:
+        _remove_backup_set(folder, name)
+        raise
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return BackupResult(
+        name=name,
+        files=files,
+        codec=codec,
+        db_size=db_size,
+        compressed_size=writer.total,
+        checksum=writer.checksum,
+        copy_seconds=copied - start,
+        compress_seconds=compressed - copied,
+        restarts=restarts,
+        manifest=manifest,
+        verification=verification,
+    )
+
+
+def format_backup_report(result: BackupResult) -> str:
+    """متن پیام گزارش بکاپ برای ادمین"""
+    parts_text = f" ({len(result.files)} قسمت)" if len(result.files) > 1 else ""
+    text = (
+        f"✅ **بکاپ خودکار انجام شد**\n\n"
+        f"📅 تاریخ: {datetime.now().strftime('%Y/%m/%d - %H:%M')}\n"
+        f"📦 فایل: `{os.path.basename(_PART_RE.sub('', result.files[0]))}`{parts_text}\n"
+        f"💾 حجم: {result.db_size / 1024 / 1024:.2f} MB → "
+        f"{result.compressed_size / 1024 / 1024:.2f} MB ({result.codec}، ×{result.ratio:.1f})\n"
+        f"⏱ مدت: {result.duration:.1f}s "
+        f"(کپی {result.copy_seconds:.1f}s + فشرده‌سازی {result.compress_seconds:.1f}s)\n"
+        f"🚀 سرعت: {result.throughput_mb:.1f} MB/s\n"
+    )
+    if result.restarts:
+        text += f"🔁 شروع مجدد کپی (نوشتن همزمان): {result.restarts}\n"
+    if result.verified:
+        v = result.verification
+        text += (f"🧪 تست بازیابی: ✅ {v['total_seconds']:.1f}s "
+                 f"(restore {v['restore_seconds']:.1f}s + quick_check {v['check_seconds']:.1f}s)\n")
+    elif result.verified is False:
+        v = result.verification
+        reason = v['error'] or ', '.join(v['mismatches']) or 'quick_check'
+        text += f"🧪 تست بازیابی: ❌ ناموفق ({reason}) - بکاپ‌های قدیمی حذف نشدن\n"
+    text += f"🔐 SHA-256: `{result.checksum}`"
+    return text
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+async def send_backup_files(bot, result: BackupResult):
+    """ارسال قسمت‌های بکاپ به ادمین (خواندن فایل در thread جدا)"""
+    total = len(result.files)
+    for index, path in enumerate(result.files, 1):
+        data = await asyncio.to_thread(_read_file, path)
+        caption = "📦 فایل بکاپ دیتابیس"
+        if total > 1:
+            caption += f" - قسمت {index}/{total}"
+        await bot.send_document(
+            ADMIN_ID,
+            document=data,
+            filename=os.path.basename(path),
+            caption=caption,
+            read_timeout=UPLOAD_TIMEOUT,
+            write_timeout=UPLOAD_TIMEOUT
+        )
+
+    # برای بکاپ چندقسمتی، چک‌سام هر قسمت هم ارسال میشه
+    if total > 1 and result.manifest:
+        data = await asyncio.to_thread(_read_file, result.manifest)
+        await bot.send_document(
+            ADMIN_ID,
+            document=data,
+            filename=os.path.basename(result.manifest),
+            caption="🔐 چک‌سام قسمت‌ها (sha256sum -c)"
+        )
+
+
 def setup_backup_folder():
     """ایجاد پوشه بکاپ اگر وجود نداشته باشد"""
     if not os.path.exists(BACKUP_FOLDER):
@@ -37,45 +589,35 @@ async def create_backup(context: ContextTypes.DEFAULT_TYPE):
     """ایجاد بکاپ از دیتابیس"""
     try:
         setup_backup_folder()
-        
-        # نام فایل با تاریخ و ساعت
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_filename = f"backup_{timestamp}.db"
-        backup_path = os.path.join(BACKUP_FOLDER, backup_filename)
-        
-        # ✅ FIX #10: بکاپ ایمن با SQLite API به جای shutil.copy2
-        safe_sqlite_backup(DATABASE_NAME, backup_path)
-        
-        # حذف بکاپ‌های قدیمی (نگه‌داری فقط 7 بکاپ آخر)
-        cleanup_old_backups(keep_count=7)
-        
-        logger.info(f"✅ بکاپ با موفقیت ایجاد شد: {backup_filename}")
-        
+
+        # ✅ کپی و فشرده‌سازی در thread جدا (event loop آزاد می‌مونه)
+        async with _backup_lock:
+            result = await asyncio.to_thread(run_backup)
+
+        # حذف بکاپ‌های قدیمی (فقط وقتی بکاپ جدید تست بازیابی رو رد نکرده)
+        if result.verified is not False:
+            await asyncio.to_thread(cleanup_old_backups, BACKUP_KEEP)
+
+        logger.info(
+            "✅ بکاپ با موفقیت ایجاد شد: %s (%d قسمت، %.1fs، %.1f MB/s)",
+            result.name, len(result.files), result.duration, result.throughput_mb
+        )
+
         # ارسال پیام به ادمین
-        file_size = os.path.getsize(backup_path) / 1024  # KB
         await context.bot.send_message(
             ADMIN_ID,
-            f"✅ **بکاپ خودکار انجام شد**\n\n"
-            f"📅 تاریخ: {datetime.now().strftime('%Y/%m/%d - %H:%M')}\n"
-            f"📦 فایل: `{backup_filename}`\n"
-            f"💾 حجم: {file_size:.2f} KB",
+            format_backup_report(result),
             parse_mode='Markdown'
         )
-        
+
         # ارسال فایل بکاپ به ادمین
-        with open(backup_path, 'rb') as f:
-            await context.bot.send_document(
-                ADMIN_ID,
-                document=f,
-                filename=backup_filename,
-                caption="📦 فایل بکاپ دیتابیس"
-            )
-        
+        await send_backup_files(context.bot, result)
+
         return True
-        
+
     except Exception as e:
         logger.error(f"❌ خطا در ایجاد بکاپ: {e}")
-        
+
         try:
             await context.bot.send_message(
                 ADMIN_ID,
@@ -85,31 +627,92 @@ async def create_backup(context: ContextTypes.DEFAULT_TYPE):
             )
         except:
             pass
-        
+
+        return False
+
+
+def format_increment_caption(result: IncrementResult) -> str:
+    """کپشن فایل بکاپ افزایشی"""
+    return (
+        f"🧩 بکاپ افزایشی #{result.number}\n"
+        f"📦 پایه: {result.base}\n"
+        f"✏️ ردیف‌ها: {result.upserts} تغییر، {result.deletes} حذف\n"
+        f"💾 حجم: {result.size / 1024:.1f} KB | ⏱ {result.seconds:.2f}s"
+    )
+
+
+async def create_incremental_backup(context: ContextTypes.DEFAULT_TYPE):
+    """
+    ✅ بکاپ افزایشی: فقط ردیف‌های تغییرکرده از آخرین بکاپ
+    اگه زنجیره معتبر نباشه (بکاپ کامل نیست یا schema عوض شده) بکاپ کامل گرفته میشه
+    """
+    try:
+        setup_backup_folder()
+        async with _backup_lock:
+            result = await asyncio.to_thread(run_incremental_backup, DATABASE_NAME, BACKUP_FOLDER)
+    except NeedFullBackup as e:
+        logger.info("ℹ️ بکاپ افزایشی ممکن نیست (%s) - بکاپ کامل", e)
+        return await create_backup(context)
+    except Exception as e:
+        logger.error(f"❌ خطا در بکاپ افزایشی: {e}")
         return False
 
+    if result is None:
+        logger.debug("بکاپ افزایشی: تغییری نبود")
+        return True
+
+    logger.info(
+        "✅ بکاپ افزایشی #%d: %d ردیف، %.1f KB، %.2fs",
+        result.number, result.rows, result.size / 1024, result.seconds
+    )
+
+    try:
+        data = await asyncio.to_thread(_read_file, result.path)
+        await context.bot.send_document(
+            ADMIN_ID,
+            document=data,
+            filename=os.path.basename(result.path),
+            caption=format_increment_caption(result),
+            read_timeout=UPLOAD_TIMEOUT,
+            write_timeout=UPLOAD_TIMEOUT
+        )
+    except Exception as e:
+        logger.error(f"❌ خطا در ارسال بکاپ افزایشی: {e}")
+    return True
+
 
-def cleanup_old_backups(keep_count=7):
-    """حذف بکاپ‌های قدیمی"""
+def backup_sets(folder: str) -> Dict[str, List[str]]:
+    """گروه‌بندی فایل‌های بکاپ (قسمت‌ها، manifest و بکاپ‌های قدیمی .db) بر اساس نام"""
+    sets: Dict[str, List[str]] = {}
+    for filename in os.listdir(folder):
+        match = _BACKUP_NAME_RE.match(filename)
+        if match:
+            sets.setdefault(match.group(1), []).append(os.path.join(folder, filename))
+    return sets
+
+
+def _remove_backup_set(folder: str, name: str):
+    for path in backup_sets(folder).get(name, []):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def cleanup_old_backups(keep_count=BACKUP_KEEP):
+    """حذف بکاپ‌های قدیمی (همه فایل‌های هر بکاپ با هم)"""
     try:
         if not os.path.exists(BACKUP_FOLDER):
             return
-        
-        # لیست فایل‌های بکاپ
-        backups = []
-        for filename in os.listdir(BACKUP_FOLDER):
-            if filename.startswith("backup_") and filename.endswith(".db"):
-                filepath = os.path.join(BACKUP_FOLDER, filename)
-                backups.append((filepath, os.path.getctime(filepath)))
-        
-        # مرتب‌سازی بر اساس تاریخ (جدیدترین اول)
-        backups.sort(key=lambda x: x[1], reverse=True)
-        
+
+        # نام بکاپ شامل تاریخ و ساعته، پس مرتب‌سازی نام = مرتب‌سازی زمانی (جدیدترین اول)
+        sets = backup_sets(BACKUP_FOLDER)
+        names = sorted(sets, reverse=True)
+
         # حذف بکاپ‌های اضافی
-        for filepath, _ in backups[keep_count:]:
-            os.remove(filepath)
-            logger.info(f"🗑 بکاپ قدیمی حذف شد: {os.path.basename(filepath)}")
-            
+        for name in names[keep_count:]:
+            for filepath in sets[name]:
+                os.remove(filepath)
+            logger.info(f"🗑 بکاپ قدیمی حذف شد: {name} ({len(sets[name])} فایل)")
+
     except Exception as e:
         logger.error(f"❌ خطا در پاکسازی بکاپ‌های قدیمی: {e}")
 
@@ -118,11 +721,11 @@ async def manual_backup(update, context):
     """بکاپ دستی توسط ادمین"""
     if update.effective_user.id != ADMIN_ID:
         return
-    
+
     await update.message.reply_text("⏳ در حال ایجاد بکاپ...")
-    
+
     success = await create_backup(context)
-    
+
     if success:
         await update.message.reply_text("✅ بکاپ با موفقیت ایجاد و ارسال شد!")
     else:
@@ -132,12 +735,29 @@ async def manual_backup(update, context):
 def setup_backup_job(application):
     """راه‌اندازی job بکاپ روزانه"""
     from datetime import time
-    
+
     # تنظیم job برای اجرای روزانه
     application.job_queue.run_daily(
         create_backup,
         time=time(hour=BACKUP_HOUR, minute=BACKUP_MINUTE),
         name="daily_backup"
     )
-    
+
     logger.info(f"✅ بکاپ خودکار روزانه فعال شد (ساعت {BACKUP_HOUR}:{BACKUP_MINUTE:02d})")
+
+    if BACKUP_INCREMENTAL_MINUTES > 0:
+        interval = BACKUP_INCREMENTAL_MINUTES * 60
+        application.job_queue.run_repeating(
+            create_incremental_backup,
+            interval=interval,
+            first=interval,
+            name="incremental_backup"
+        )
+        logger.info(f"✅ بکاپ افزایشی فعال شد (هر {BACKUP_INCREMENTAL_MINUTES} دقیقه)")
+    elif os.path.exists(DATABASE_NAME):
+        # trigger های ثبت تغییرات بدون بکاپ افزایشی فقط سربار نوشتن دارن
+        conn = sqlite3.connect(DATABASE_NAME, timeout=30)
+        try:
+            remove_change_capture(conn)
+        finally:
+            conn.close()
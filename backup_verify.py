@@ -0,0 +1,68 @@
+"""
+بررسی سلامت یک فایل دیتابیس بکاپ در پروسه جدا
+✅ PRAGMA quick_check + شمارش ردیف جدول‌های کلیدی
+✅ اجرا در subprocess: حافظه و CPU بررسی از پروسه ربات جداست و یک فایل خراب
+   نمی‌تونه پروسه ربات رو از کار بندازه
+✅ فقط کتابخانه استاندارد (بدون import تنظیمات ربات) تا پروسه سریع بالا بیاد
+
+اجرا:
+    python backup_verify.py restored.db users orders products
+خروجی: یک خط JSON
+"""
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+
+def check_database(path: str, tables: List[str]) -> Dict:
+    """quick_check و شمارش ردیف‌ها (جدول‌های ناموجود None)"""
+    start = time.perf_counter()
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        messages = [row[0] for row in conn.execute("PRAGMA quick_check")]
+        existing = {row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table'"
+        )}
+        counts = {
+            table: conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+            if table in existing else None
+            for table in tables
+        }
+    finally:
+        conn.close()
+
+    return {
+        'ok': messages == ['ok'],
+        'quick_check': messages[:10],
+        'counts': counts,
+        'seconds': time.perf_counter() - start,
+    }
+
+
+def run_check_subprocess(path: str, tables: List[str], timeout: Optional[float] = 600) -> Dict:
+    """
+    اجرای check_database در یک پروسه Python جدا
+
+    Raises:
+        RuntimeError: اگه پروسه با خطا تموم بشه
+        subprocess.TimeoutExpired: اگه از timeout بیشتر طول بکشه
+    """
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), path, *tables],
+        capture_output=True, text=True, timeout=timeout
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else
+                           f"exit code {proc.returncode}")
+    return json.loads(proc.stdout)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(2)
+    print(json.dumps(check_database(sys.argv[1], sys.argv[2:])))
@@ -0,0 +1,240 @@
+"""
+بنچمارک مسیر تحلیلی: SQL + حلقه پایتونی در برابر لایه NumPy (analytics_data)
+
+اجرا:
+    python benchmark_analytics.py              # 1,000,000 سفارش
+    python benchmark_analytics.py --orders 200000 --keep /tmp/bench.db
+
+⚠️ دیتابیس مصنوعی در یک فایل موقت ساخته میشه و به دیتابیس اصلی دست نمی‌زنه
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime
+
+import numpy as np
+
+from analytics_data import OrderFrame, rolling_mean, load_product_quantities
+
+STATUSES = ['confirmed'] * 6 + ['payment_confirmed'] * 2 + ['pending', 'rejected']
+PRODUCTS = [f"مانتو مدل {i}" for i in range(200)]
+
+
+class _BenchDB:
+    """شیء سبک با همان رابط cursor/conn که Analytics استفاده می‌کنه"""
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path)
+
+    @property
+    def cursor(self):
+        return self._conn.cursor()
+
+    @property
+    def conn(self):
+        return self._conn
+
+
+def build_dataset(path: str, orders: int, users: int, days: int, seed: int = 42):
+    """ساخت جدول orders مصنوعی"""
+    rnd = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("""
+        CREATE TABLE orders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            items TEXT,
+            total_price REAL,
+            discount_amount REAL DEFAULT 0,
+            final_price REAL,
+            discount_code TEXT,
+            status TEXT DEFAULT 'pending',
+            receipt_photo TEXT,
+            shipping_method TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            expires_at TIMESTAMP
+        )
+    """)
+    conn.execute("CREATE TABLE users (user_id INTEGER PRIMARY KEY)")
+    conn.executemany("INSERT INTO users VALUES (?)", ((u,) for u in range(1, users + 1)))
+
+    now = int(time.time())
+    span = days * 86400
+
+    def rows():
+        for _ in range(orders):
+            items = [
+                {'product': rnd.choice(PRODUCTS), 'pack': 'پک 6 تایی',
+                 'quantity': rnd.choice((6, 12, 18)), 'price': 300000}
+                for _ in range(rnd.randint(1, 3))
+            ]
+            total = 300000.0 * len(items)
+            discount = rnd.choice((0.0, 0.0, 30000.0))
+            created = datetime.utcfromtimestamp(now - rnd.randrange(span)).strftime('%Y-%m-%d %H:%M:%S')
+            yield (rnd.randint(1, users), json.dumps(items, ensure_ascii=False),
+                   total, discount, total - discount, rnd.choice(STATUSES), created)
+
+    conn.executemany("""
+        INSERT INTO orders (user_id, items, total_price, discount_amount, final_price, status, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, rows())
+    conn.execute("CREATE INDEX idx_orders_status_created ON orders(status, created_at DESC)")
+    conn.execute("CREATE INDEX idx_orders_created_at ON orders(created_at DESC)")
+    conn.commit()
+    conn.close()
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+# ==================== مسیر فعلی: SQL + پایتون ====================
+
+def current_path(db, days: int):
+    from handlers.analytics import Analytics
+
+    analytics = Analytics(db)
+
+    def sales():
+        data = analytics.get_sales_data(days)
+        dates = [datetime.strptime(row[0], '%Y-%m-%d') for row in data]
+        return dates, [row[1] for row in data], [row[2] / 1000000 for row in data]
+
+    def revenue():
+        data = analytics.get_revenue_data(days)
+        dates = [datetime.strptime(row[0], '%Y-%m-%d') for row in data]
+        return dates, [row[1] / 1000000 for row in data], [row[3] / 1000000 for row in data]
+
+    def hourly():
+        hours = {str(i).zfill(2): 0 for i in range(24)}
+        for hour, count in analytics.get_hourly_orders():
+            hours[hour] = count
+        return hours
+
+    def popular():
+        cursor = db.cursor
+        cursor.execute("SELECT items FROM orders WHERE status IN ('confirmed', 'payment_confirmed')")
+        counter = Counter()
+        for (items,) in cursor.fetchall():
+            for item in json.loads(items):
+                counter[item.get('product', 'Unknown')] += item.get('quantity', 0)
+        return counter.most_common(10)
+
+    def repeat():
+        cursor = db.cursor
+        cursor.execute("""
+            SELECT user_id, COUNT(*) FROM orders
+            WHERE status IN ('confirmed', 'payment_confirmed')
+            GROUP BY user_id
+        """)
+        counts = [row[1] for row in cursor.fetchall()]
+        return sum(counts) / len(counts), sum(1 for c in counts if c > 1) / len(counts)
+
+    return {
+        'sales (day)': sales,
+        'revenue (day)': revenue,
+        'hourly': hourly,
+        'popular products': popular,
+        'repeat rate': repeat,
+    }
+
+
+# ==================== مسیر NumPy ====================
+
+def numpy_path(db, days: int):
+    state = {}
+
+    def load():
+        state['all'] = OrderFrame.load(db)
+        state['confirmed'] = state['all'].confirmed()
+        return len(state['all'])
+
+    def sales():
+        frame = state['confirmed'].since_days(days)
+        daily = frame.aggregate('day')
+        return daily['labels'], daily['count'], daily['net'] / 1000000
+
+    def revenue():
+        daily = state['confirmed'].since_days(days).aggregate('day')
+        return daily['labels'], daily['gross'] / 1000000, daily['net'] / 1000000
+
+    def hourly():
+        return state['all'].since_days(30).hourly_counts()
+
+    def weekly_monthly():
+        return state['confirmed'].aggregate('week'), state['confirmed'].aggregate('month')
+
+    def rolling():
+        return rolling_mean(state['confirmed'].since_days(days).daily_series()['net'], 7)
+
+    def repeat():
+        return state['confirmed'].repeat_stats()
+
+    def cohorts():
+        return state['confirmed'].cohort_retention()
+
+    def popular():
+        return load_product_quantities(db, 10)
+
+    return {
+        'load columns (once)': load,
+        'sales (day)': sales,
+        'revenue (day)': revenue,
+        'hourly': hourly,
+        'week + month buckets': weekly_monthly,
+        '7-day rolling avg': rolling,
+        'repeat rate': repeat,
+        'monthly cohorts': cohorts,
+        'popular products': popular,
+    }
+
+
+def run(label, steps):
+    print(f"\n== {label} ==")
+    total = 0.0
+    for name, fn in steps.items():
+        elapsed, _ = _timed(fn)
+        total += elapsed
+        print(f"  {name:<24} {elapsed * 1000:10.1f} ms")
+    print(f"  {'TOTAL':<24} {total * 1000:10.1f} ms")
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--orders', type=int, default=1_000_000)
+    parser.add_argument('--users', type=int, default=50_000)
+    parser.add_argument('--days', type=int, default=365, help='بازه زمانی داده مصنوعی')
+    parser.add_argument('--report-days', type=int, default=90, help='بازه گزارش‌های روزانه')
+    parser.add_argument('--keep', help='مسیر دیتابیس برای نگه داشتن/استفاده مجدد')
+    args = parser.parse_args()
+
+    path = args.keep or os.path.join(tempfile.mkdtemp(prefix='bench_analytics_'), 'bench.db')
+    if not os.path.exists(path):
+        print(f"⏳ ساخت {args.orders:,} سفارش مصنوعی در {path} ...")
+        elapsed, _ = _timed(lambda: build_dataset(path, args.orders, args.users, args.days))
+        print(f"✅ ساخته شد در {elapsed:.1f}s")
+
+    db = _BenchDB(path)
+    try:
+        sql_total = run("SQL + Python (current)", current_path(db, args.report_days))
+        np_total = run("NumPy (analytics_data)", numpy_path(db, args.report_days))
+        print(f"\nspeedup: {sql_total / np_total:.2f}x "
+              f"(NumPy path also computes week/month buckets, rolling avg and cohorts)")
+    finally:
+        db.conn.close()
+        if not args.keep:
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+بنچمارک هزینه dispatch هر callback: CallbackRouter در برابر CallbackQueryHandler های regex
+
+همون مسیرهایی که build_application ثبت می‌کنه، به همون ترتیب، یک بار با router و یک بار
+به شکل قبلی (یک CallbackQueryHandler با pattern برای هر مسیر) تطبیق داده میشن:
+    legacy: check_update هندلرها یکی‌یکی تا اولین match + collect_additional_context
+    router: یک check_update + collect_additional_context
+برای هر مسیر یک callback_data نمونه ساخته میشه (آرگومان int = 12)؛ miss یعنی callback_data
+ثبت‌نشده (مثل entry point های ConversationHandler) که باید از همه رد بشه.
+
+اجرا:
+    python benchmark_callback_router.py
+    python benchmark_callback_router.py --rounds 2000
+
+⚠️ ربات با Bot API آفلاین و دیتابیس موقت ساخته میشه (مثل benchmark_startup)
+"""
+import argparse
+import logging
+import os
+import statistics
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+
+def sample_data(route) -> str:
+    """callback_data نمونه برای یک مسیر"""
+    if route.kind == route.EXACT:
+        return route.name
+    if route.kind == route.PREFIX:
+        return route.name + 'tipax'
+    if route.types:
+        return route.name + ':' + ':'.join('12' for _ in route.types)
+    return route.name + ':main'
+
+
+def _callback_update(bot, data: str):
+    from telegram import Update
+    return Update.de_json({
+        'update_id': 1,
+        'callback_query': {
+            'id': '1',
+            'chat_instance': '1',
+            'data': data,
+            'from': {'id': 424242, 'is_bot': False, 'first_name': 'bench'},
+        },
+    }, bot)
+
+
+def _per_call_us(dispatch: Callable, update, rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        dispatch(update)
+    return (time.perf_counter() - start) / rounds * 1e6
+
+
+def measure(application, router, rounds: int) -> Dict[str, List[float]]:
+    """زمان هر dispatch (میکروثانیه) برای callback_data نمونه همه مسیرها + یک miss"""
+    from telegram.ext import CallbackContext, CallbackQueryHandler
+
+    legacy = [CallbackQueryHandler(route.callback, pattern=route.pattern) for route in router.routes()]
+
+    def legacy_dispatch(update):
+        context = CallbackContext.from_update(update, application)
+        for handler in legacy:
+            result = handler.check_update(update)
+            if result:
+                handler.collect_additional_context(context, update, application, result)
+                return handler
+
+    def router_dispatch(update):
+        context = CallbackContext.from_update(update, application)
+        result = router.check_update(update)
+        if result:
+            router.collect_additional_context(context, update, application, result)
+            return result[0]
+
+    updates = [_callback_update(application.bot, sample_data(route)) for route in router.routes()]
+    for update, route in zip(updates, router.routes()):
+        assert router_dispatch(update) is route, update.callback_query.data
+        assert legacy_dispatch(update) is not None, update.callback_query.data
+    miss = _callback_update(application.bot, 'msg_start_edit:welcome')
+
+    results = {}
+    for name, dispatch in (('legacy', legacy_dispatch), ('router', router_dispatch)):
+        results[name] = [_per_call_us(dispatch, update, rounds) for update in updates]
+        results[name + '_miss'] = [_per_call_us(dispatch, miss, rounds)]
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=500, help='تکرار هر callback_data')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        from benchmark_startup import offline_env, offline_request
+        os.environ.update(offline_env(folder))
+
+        import main as bot_main
+        from callback_router import CallbackRouter
+
+        # لاگ راه‌اندازی و هشدار تنظیمات نمونه خروجی رو شلوغ می‌کنن
+        logging.disable(logging.WARNING)
+        application = bot_main.build_application(request=offline_request())
+        router = next(h for h in application.handlers[0] if isinstance(h, CallbackRouter))
+        results = measure(application, router, args.rounds)
+        application.bot_data['db'].close()
+
+    print(f"\n{len(router)} routes, {args.rounds} rounds each (µs per callback, شامل ساخت CallbackContext)")
+    print(f"{'':8} {'mean':>8} {'p50':>8} {'max':>8} {'miss':>8}")
+    for name in ('legacy', 'router'):
+        values = results[name]
+        print(f"{name:8} {statistics.mean(values):8.2f} {statistics.median(values):8.2f} "
+              f"{max(values):8.2f} {results[name + '_miss'][0]:8.2f}")
+    print(f"speedup (mean): {statistics.mean(results['legacy']) / statistics.mean(results['router']):.1f}x")
+
+
+if __name__ == '__main__':
+    main()
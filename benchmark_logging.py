@@ -0,0 +1,89 @@
+"""
+بنچمارک سربار لاگ به ازای هر آپدیت: handler های همزمان + f-string در برابر
+QueueHandler/QueueListener + فرمت %-style تنبل
+
+اجرا:
+    python benchmark_logging.py
+    python benchmark_logging.py --updates 50000
+
+هر "آپدیت" شبیه‌سازی مسیر واقعی است: یک log_user_action (INFO)، دو
+log_database_operation و سه خط Cache HIT و یک خط rate limiter (DEBUG، خاموش).
+فقط لاگ فایل اندازه‌گیری میشه (کنسول خاموش) و فایل‌ها در پوشه موقت ساخته میشن.
+"""
+import argparse
+import logging
+import shutil
+import tempfile
+import time
+
+import logger as bot_logging
+
+
+def _old_style(log, user_id: int):
+    """مسیر قبلی: f-string حتی وقتی DEBUG خاموشه ساخته میشه"""
+    log.info(f"👤 کاربر {user_id} | عملیات: افزودن به سبد | pack=12")
+    for table in ('cart', 'packs'):
+        log.debug(f"💾 دیتابیس | SELECT | جدول: {table} | ID: {user_id}")
+    for key in ('product:12', 'pack:12', 'cart:%d' % user_id):
+        log.debug(f"📦 Cache HIT: {key} (age: {1.234:.1f}s, hits: {7})")
+    log.debug(f"🔇 Silent rate limit for user {user_id}")
+
+
+def _new_style(log, user_id: int):
+    """مسیر جدید: %-style، رشته فقط در صورت فعال بودن سطح ساخته میشه"""
+    log.info("👤 کاربر %s | عملیات: %s | %s", user_id, "افزودن به سبد", "pack=12")
+    for table in ('cart', 'packs'):
+        log.debug("💾 دیتابیس | %s | جدول: %s | ID: %s", "SELECT", table, user_id)
+    for key in ('product:12', 'pack:12', 'cart:%d' % user_id):
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("📦 Cache HIT: %s (age: %.1fs, hits: %d)", key, 1.234, 7)
+    log.debug("🔇 Silent rate limit for user %s", user_id)
+
+
+def measure(label: str, use_queue: bool, emit, updates: int, folder: str):
+    bot_logging.LOG_FOLDER = folder
+    name = f"bench_{label}"
+    log = bot_logging.setup_logger(name, log_to_console=False, use_queue=use_queue)
+    log.propagate = False
+
+    # گرم کردن (باز شدن فایل‌ها)
+    for uid in range(100):
+        emit(log, uid)
+
+    start = time.perf_counter()
+    for uid in range(updates):
+        emit(log, uid)
+    caller = time.perf_counter() - start
+
+    # زمان خالی شدن صف (کاری که به thread پس‌زمینه منتقل شده)
+    start = time.perf_counter()
+    bot_logging.stop_listeners()
+    drain = time.perf_counter() - start
+
+    for handler in list(log.handlers):
+        handler.close()
+        log.removeHandler(handler)
+
+    print(f"\n== {label} ==")
+    print(f"  per update (event loop)  {caller / updates * 1e6:10.1f} µs")
+    print(f"  background drain         {drain:10.2f} s")
+    return caller / updates
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--updates', type=int, default=20_000)
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp(prefix='bench_logs_')
+    try:
+        print(f"⏳ {args.updates:,} آپدیت شبیه‌سازی‌شده (DEBUG خاموش، INFO روشن)")
+        before = measure("sync handlers + f-string", False, _old_style, args.updates, folder)
+        after = measure("queue listener + lazy %-style", True, _new_style, args.updates, folder)
+        print(f"\nper-update overhead: {before / after:.1f}x lower")
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
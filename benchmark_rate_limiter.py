@@ -0,0 +1,72 @@
+"""
+بنچمارک موتورهای Rate Limiting: پنجره لغزان (RateLimiter) در برابر GCRA
+
+اجرا:
+    python benchmark_rate_limiter.py                 # 100,000 کاربر فعال
+    python benchmark_rate_limiter.py --users 20000 --requests 10
+
+حافظه با tracemalloc (فقط وضعیت limiter) و سرعت با تعداد check در ثانیه اندازه‌گیری میشه.
+"""
+import argparse
+import gc
+import time
+import tracemalloc
+
+from rate_limiter import RateLimiter, GCRARateLimiter
+
+
+def _fill(limiter, users: int, requests: int):
+    """هر کاربر requests درخواست کلی + یک ثبت سفارش"""
+    for _ in range(requests):
+        for uid in range(users):
+            limiter.check_rate_limit(uid, max_requests=20, window_seconds=60)
+    for uid in range(users):
+        limiter.check_action_limit(uid, 'order', max_requests=3, window_seconds=3600)
+    return users * (requests + 1)
+
+
+def measure(label, factory, users: int, requests: int):
+    print(f"\n== {label} ==")
+
+    gc.collect()
+    tracemalloc.start()
+    limiter = factory()
+    start = time.perf_counter()
+    checks = _fill(limiter, users, requests)
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # سرعت بدون سربار tracemalloc
+    limiter = factory()
+    start = time.perf_counter()
+    checks = _fill(limiter, users, requests)
+    fast_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    limiter.cleanup_stale_users(max_idle_seconds=3600)
+    cleanup = time.perf_counter() - start
+
+    print(f"  memory (state)        {current / (1024 * 1024):10.1f} MB  (peak {peak / (1024 * 1024):.1f} MB)")
+    print(f"  bytes per user        {current / users:10.0f}")
+    print(f"  throughput            {checks / fast_elapsed:10,.0f} checks/s  ({elapsed:.2f}s with tracemalloc)")
+    print(f"  cleanup_stale_users   {cleanup * 1000:10.1f} ms")
+    return current, checks / fast_elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--requests', type=int, default=5, help='درخواست کلی برای هر کاربر')
+    args = parser.parse_args()
+
+    print(f"⏳ {args.users:,} کاربر فعال، {args.requests} درخواست + 1 سفارش برای هر کاربر")
+
+    window_mem, window_rate = measure("sliding window (deque)", RateLimiter, args.users, args.requests)
+    gcra_mem, gcra_rate = measure("GCRA", GCRARateLimiter, args.users, args.requests)
+
+    print(f"\nmemory: {window_mem / gcra_mem:.1f}x smaller, throughput: {gcra_rate / window_rate:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+بنچمارک پروفایل‌های کارایی SQLite (durable / balanced / fast)
+
+دو بار کاری روی هر پروفایل، هر کدوم با چند thread همزمان (مثل to_thread های ربات):
+    browse:   لیست محصولات، پک‌های یک محصول، get_product و get_pack (فقط خواندن)
+    checkout: افزودن به سبد، خواندن سبد، ثبت سفارش و خالی کردن سبد (نوشتن)
+
+اجرا:
+    python benchmark_sqlite_profiles.py
+    python benchmark_sqlite_profiles.py --ops 5000 --threads 8 --profiles durable,balanced
+
+⚠️ برای هر پروفایل یک دیتابیس موقت جدا ساخته میشه و به دیتابیس اصلی دست نمی‌زنه
+"""
+import argparse
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, List
+
+from database import Database, SQLITE_PROFILES
+
+
+def _seed(db: Database, products: int, packs: int):
+    """محصولات و پک‌های نمونه"""
+    pack_ids = []
+    for i in range(products):
+        product_id = db.add_product(f"مانتو مدل {i}", "توضیحات " * 20, f"photo_{i}")
+        for j in range(packs):
+            pack_ids.append((product_id, db.add_pack(product_id, f"پک {j + 1}", 6 * (j + 1), 300000.0)))
+    return pack_ids
+
+
+def _browse(db: Database, rnd: random.Random, pack_ids, user_id: int):
+    product_id, pack_id = rnd.choice(pack_ids)
+    db.get_all_products()
+    db.get_packs(product_id)
+    db.get_product(product_id)
+    db.get_pack(pack_id)
+
+
+def _checkout(db: Database, rnd: random.Random, pack_ids, user_id: int):
+    for product_id, pack_id in rnd.sample(pack_ids, 2):
+        db.add_to_cart(user_id, product_id, pack_id, 1)
+    cart = db.get_cart(user_id)
+    items = [{'product': row[1], 'pack': row[2], 'quantity': row[5], 'price': row[4]} for row in cart]
+    db.create_order(user_id, items, sum(row[4] for row in cart))
+    db.clear_cart(user_id)
+
+
+WORKLOADS: Dict[str, Callable] = {'browse': _browse, 'checkout': _checkout}
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run_workload(db: Database, workload: Callable, pack_ids, ops: int, threads: int) -> Dict:
+    """ops عملیات بین threads تقسیم میشه؛ زمان هر عملیات جدا ثبت میشه"""
+    latencies: List[float] = []
+    lock = threading.Lock()
+
+    def worker(index: int):
+        rnd = random.Random(index)
+        local = []
+        for _ in range(ops // threads):
+            start = time.perf_counter()
+            workload(db, rnd, pack_ids, 1000 + index)
+            local.append(time.perf_counter() - start)
+        db.pool.close_connection()
+        with lock:
+            latencies.extend(local)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    return {
+        'ops_per_sec': len(latencies) / elapsed,
+        'p50_ms': _percentile(latencies, 50) * 1000,
+        'p99_ms': _percentile(latencies, 99) * 1000,
+    }
+
+
+def measure(profile: str, ops: int, threads: int, folder: str) -> Dict[str, Dict]:
+    path = os.path.join(folder, f"bench_{profile}.db")
+    db = Database(database_name=path, profile=profile)
+    for user_id in range(1000, 1000 + threads):
+        db.add_user(user_id, None, "bench")
+    pack_ids = _seed(db, products=50, packs=3)
+
+    results = {name: run_workload(db, workload, pack_ids, ops, threads)
+               for name, workload in WORKLOADS.items()}
+    db.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--ops', type=int, default=2000, help='عملیات هر بار کاری (مجموع همه thread ها)')
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--profiles', default=','.join(SQLITE_PROFILES))
+    parser.add_argument('--folder', default=None, help='پوشه دیتابیس‌های موقت (پیش‌فرض: temp سیستم)')
+    args = parser.parse_args()
+
+    # لاگ هر افزودن به سبد و هشدار کوئری کند هم زمان و هم خروجی رو خراب می‌کنن
+    logging.disable(logging.WARNING)
+
+    with tempfile.TemporaryDirectory(dir=args.folder) as folder:
+        print(f"{'profile':10} {'workload':10} {'ops/s':>10} {'p50 ms':>9} {'p99 ms':>9}")
+        for profile in args.profiles.split(','):
+            for name, result in measure(profile.strip(), args.ops, args.threads, folder).items():
+                print(f"{profile:10} {name:10} {result['ops_per_sec']:10,.0f} "
+                      f"{result['p50_ms']:9.2f} {result['p99_ms']:9.2f}")
+
+
+if __name__ == '__main__':
+    main()
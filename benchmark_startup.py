@@ -0,0 +1,192 @@
+"""
+بنچمارک راه‌اندازی سرد ربات
+
+در یک پروسه تازه (مثل ری‌استارت واقعی) اندازه می‌گیره:
+    import:        import main (همه handler ها و ماژول‌های پروژه)
+    build:         build_application (دیتابیس، job ها، ثبت handler ها)
+    first_update:  initialize و پردازش اولین /start تا ارسال پاسخ
+و خلاصه `python -X importtime` (سنگین‌ترین ماژول‌ها، زمان تجمعی) رو چاپ می‌کنه.
+
+اجرا:
+    python benchmark_startup.py
+    python benchmark_startup.py --top 25
+
+⚠️ فراخوانی‌های Bot API آفلاین جواب داده میشن (بدون شبکه) و دیتابیس، لاگ و بکاپ
+در پوشه موقت ساخته میشن؛ داشبورد مانیتورینگ و پیش‌بارگذاری پس‌زمینه خاموشن
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+# ✅ سقف مجاز import + build + اولین update (ثانیه) - test_suite همین رو چک می‌کنه
+STARTUP_BUDGET_SECONDS = 1.5
+
+# ماژول‌های سنگین اختیاری که نباید در مسیر راه‌اندازی import بشن
+HEAVY_MODULES = ('matplotlib', 'openpyxl', 'flask', 'psutil', 'numpy')
+
+RESULT_PREFIX = 'STARTUP_RESULT '
+USER_ID = 424242
+
+
+def offline_request():
+    """BaseRequest بدون شبکه: getMe و send*/edit* با پاسخ ساختگی"""
+    from telegram.request import BaseRequest
+
+    class OfflineRequest(BaseRequest):
+        def __init__(self):
+            self.calls: List[str] = []
+
+        @property
+        def read_timeout(self):
+            return None
+
+        async def initialize(self):
+            pass
+
+        async def shutdown(self):
+            pass
+
+        async def do_request(self, url, method, request_data=None, read_timeout=None,
+                             write_timeout=None, connect_timeout=None, pool_timeout=None) -> Tuple[int, bytes]:
+            endpoint = url.rsplit('/', 1)[-1]
+            self.calls.append(endpoint)
+            if endpoint == 'getMe':
+                result = {'id': 1, 'is_bot': True, 'first_name': 'bench', 'username': 'bench_bot'}
+            elif endpoint.startswith(('send', 'edit')):
+                result = {'message_id': len(self.calls), 'date': int(time.time()),
+                          'chat': {'id': USER_ID, 'type': 'private'}, 'text': ''}
+            else:
+                result = True
+            return 200, json.dumps({'ok': True, 'result': result}).encode()
+
+    return OfflineRequest()
+
+
+def offline_env(folder: str) -> Dict[str, str]:
+    """متغیرهای محیطی ساخت ربات بدون اثر جانبی: دیتابیس/لاگ/بکاپ در folder، بدون داشبورد و پیش‌بارگذاری"""
+    return {
+        'DATABASE_NAME': os.path.join(folder, 'startup.db'),
+        'LOG_FOLDER': os.path.join(folder, 'logs'),
+        'BACKUP_FOLDER': os.path.join(folder, 'backups'),
+        'MONITORING_PORT': '0',
+        'STARTUP_WARMUP_DELAY': '-1',
+    }
+
+
+def _start_update(bot):
+    from telegram import Update
+    return Update.de_json({
+        'update_id': 1,
+        'message': {
+            'message_id': 1,
+            'date': int(time.time()),
+            'chat': {'id': USER_ID, 'type': 'private'},
+            'from': {'id': USER_ID, 'is_bot': False, 'first_name': 'bench'},
+            'text': '/start',
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': 6}],
+        },
+    }, bot)
+
+
+async def _first_update(application) -> List[str]:
+    await application.initialize()
+    try:
+        await application.process_update(_start_update(application.bot))
+    finally:
+        await application.shutdown()
+    return application.bot.request.calls
+
+
+def run_child():
+    """یک بار راه‌اندازی کامل در همین پروسه (پروسه فرزند measure_startup)"""
+    started = time.perf_counter()
+    import main
+    imported = time.perf_counter()
+    loaded_after_import = sorted(m for m in HEAVY_MODULES if m in sys.modules)
+
+    request = offline_request()
+    application = main.build_application(request=request)
+    built = time.perf_counter()
+
+    calls = asyncio.run(_first_update(application))
+    handled = time.perf_counter()
+
+    application.bot_data['db'].close()
+    print(RESULT_PREFIX + json.dumps({
+        'import_seconds': imported - started,
+        'build_seconds': built - imported,
+        'first_update_seconds': handled - built,
+        'total_seconds': handled - started,
+        'heavy_after_import': loaded_after_import,
+        'heavy_after_first_update': sorted(m for m in HEAVY_MODULES if m in sys.modules),
+        'bot_calls': calls,
+    }), flush=True)
+
+
+def parse_importtime(stderr: str) -> List[Tuple[int, str]]:
+    """خطوط `import time:` → [(زمان تجمعی میکروثانیه, نام ماژول)]"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        rows.append((int(cumulative), name.strip()))
+    return rows
+
+
+def measure_startup(importtime: bool = False) -> Dict:
+    """اجرای run_child در پروسه تازه با پوشه موقت؛ importtime = ضمیمه کردن خروجی -X importtime"""
+    with tempfile.TemporaryDirectory() as folder:
+        env = dict(os.environ)
+        env.update(offline_env(folder))
+        args = [sys.executable] + (['-X', 'importtime'] if importtime else [])
+        proc = subprocess.run(
+            args + [os.path.abspath(__file__), '--child'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            env=env, capture_output=True, text=True, timeout=120,
+        )
+
+    lines = [line for line in proc.stdout.splitlines() if line.startswith(RESULT_PREFIX)]
+    if proc.returncode != 0 or not lines:
+        raise RuntimeError(f"startup child failed ({proc.returncode}): {proc.stderr[-2000:]}")
+
+    result = json.loads(lines[-1][len(RESULT_PREFIX):])
+    if importtime:
+        result['imports'] = parse_importtime(proc.stderr)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--top', type=int, default=15, help='تعداد ماژول‌های سنگین در خلاصه importtime')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child()
+        return
+
+    result = measure_startup(importtime=True)
+
+    print(f"{'cumulative ms':>14}  module")
+    for cumulative, name in sorted(result['imports'], reverse=True)[:args.top]:
+        print(f"{cumulative / 1000:14.1f}  {name}")
+
+    print()
+    print(f"import main:   {result['import_seconds']:.3f}s")
+    print(f"build:         {result['build_seconds']:.3f}s")
+    print(f"first update:  {result['first_update_seconds']:.3f}s  ({', '.join(result['bot_calls'])})")
+    status = '✅' if result['total_seconds'] <= STARTUP_BUDGET_SECONDS else '❌'
+    print(f"total:         {result['total_seconds']:.3f}s  {status} budget {STARTUP_BUDGET_SECONDS:.1f}s")
+    print(f"heavy modules after first update: {', '.join(result['heavy_after_first_update']) or '-'}")
+    print("(زمان‌های import با -X importtime کمی بیشتر از اجرای عادیه)")
+
+
+if __name__ == '__main__':
+    main()
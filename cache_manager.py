@@ -12,6 +12,8 @@ import atexit
 from typing import Any, Optional, Dict, Callable
 from functools import wraps
 from datetime import datetime, timedelta
+from expiry_wheel import TimingWheel, expiry_wheel
+from metrics import CACHE_HIT, CACHE_MISS
 
 logger = logging.getLogger(__name__)
 
@@ -38,7 +40,7 @@ class CacheEntry:
 class CacheManager:
     """مدیریت کش"""
     
-    def __init__(self):
+    def __init__(self, expiry: Optional[TimingWheel] = None):
         self._cache: Dict[str, CacheEntry] = {}
         self._stats = {
             'hits': 0,
@@ -47,11 +49,22 @@ class CacheManager:
             'invalidations': 0,
             'expirations': 0
         }
+        
+        # ✅ انقضای تدریجی کلیدها با timing wheel
+        self._expiry = expiry.registry('cache', self._expire_key) if expiry is not None else None
+    
+    def _expire_key(self, key: str):
+        """callback چرخ: حذف کلید در صورت انقضا"""
+        entry = self._cache.get(key)
+        if entry is not None and entry.ttl and entry.get_age() >= entry.ttl:
+            del self._cache[key]
+            self._stats['expirations'] += 1
     
     def get(self, key: str) -> Optional[Any]:
         """دریافت از کش"""
         if key not in self._cache:
             self._stats['misses'] += 1
+            CACHE_MISS.inc()
             return None
         
         entry = self._cache[key]
@@ -60,13 +73,17 @@ class CacheManager:
         if entry.is_expired():
             self._stats['expirations'] += 1
             del self._cache[key]
+            CACHE_MISS.inc()
             return None
         
         # Cache hit
         entry.hits += 1
         self._stats['hits'] += 1
+        CACHE_HIT.inc()
         
-        logger.debug(f"📦 Cache HIT: {key} (age: {entry.get_age():.1f}s, hits: {entry.hits})")
+        # ✅ %-style: وقتی DEBUG خاموشه هیچ رشته‌ای ساخته نمیشه
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("📦 Cache HIT: %s (age: %.1fs, hits: %d)", key, entry.get_age(), entry.hits)
         return entry.value
     
     def set(self, key: str, value: Any, ttl: int = 300):
@@ -77,17 +94,26 @@ class CacheManager:
             value: مقدار
             ttl: مدت اعتبار به ثانیه (0 = بی‌نهایت)
         """
-        self._cache[key] = CacheEntry(value, ttl)
+        entry = CacheEntry(value, ttl)
+        self._cache[key] = entry
         self._stats['sets'] += 1
         
-        logger.debug(f"💾 Cache SET: {key} (ttl: {ttl}s)")
+        if self._expiry is not None:
+            if ttl:
+                self._expiry.schedule(key, entry.created_at + ttl)
+            else:
+                self._expiry.cancel(key)
+        
+        logger.debug("💾 Cache SET: %s (ttl: %ss)", key, ttl)
     
     def invalidate(self, key: str):
         """حذف از کش"""
         if key in self._cache:
             del self._cache[key]
             self._stats['invalidations'] += 1
-            logger.debug(f"🗑 Cache INVALIDATE: {key}")
+            if self._expiry is not None:
+                self._expiry.cancel(key)
+            logger.debug("🗑 Cache INVALIDATE: %s", key)
     
     def invalidate_pattern(self, pattern: str):
         """حذف تمام کش‌های با الگوی مشخص"""
@@ -95,12 +121,14 @@ class CacheManager:
         for key in keys_to_delete:
             self.invalidate(key)
         
-        logger.debug(f"🗑 Cache INVALIDATE PATTERN: {pattern} ({len(keys_to_delete)} items)")
+        logger.debug("🗑 Cache INVALIDATE PATTERN: %s (%d items)", pattern, len(keys_to_delete))
     
     def clear(self):
         """پاک کردن تمام کش"""
         count = len(self._cache)
         self._cache.clear()
+        if self._expiry is not None:
+            self._expiry.clear()
         logger.info(f"🗑 Cache CLEARED: {count} items removed")
     
     def cleanup(self):
@@ -143,7 +171,7 @@ class CacheManager:
 
 # ==================== Cache Manager سراسری ====================
 
-cache_manager = CacheManager()
+cache_manager = CacheManager(expiry=expiry_wheel)
 
 
 # ==================== Cache Decorators ====================
@@ -335,11 +363,13 @@ class CacheCleanupThread(threading.Thread):
         self.cache_manager = cache_manager
         self.interval = interval
         self.running = True
+        # ✅ wait روی Event به جای sleep: stop فوری بیدارش می‌کنه و خروج پروسه تا 5 ثانیه روی join معطل نمی‌مونه
+        self._stop_event = threading.Event()
     
     def run(self):
         """اجرای پاکسازی دوره‌ای"""
         while self.running:
-            time.sleep(self.interval)
+            self._stop_event.wait(self.interval)
             try:
                 if self.running:  # ✅ یک چک دیگه قبل cleanup
                     self.cache_manager.cleanup()
@@ -350,6 +380,7 @@ class CacheCleanupThread(threading.Thread):
         """✅ FIX: توقف thread"""
         logger.info("🛑 Stopping cache cleanup thread...")
         self.running = False
+        self._stop_event.set()
 
 
 # شروع خودکار پاکسازی
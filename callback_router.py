@@ -0,0 +1,184 @@
+"""
+مسیریاب callback_data: یک handler به جای ده‌ها CallbackQueryHandler با regex
+✅ callback_data فقط یک بار به `prefix:args` شکسته میشه و با یک lookup در dict به تابع مقصد می‌رسه
+   (PTB الگوهای CallbackQueryHandler رو یکی‌یکی با re.match امتحان می‌کنه)
+✅ آرگومان‌های نوع‌دار: route('cart_increase', cart_increase, int) فقط `cart_increase:<عدد>` رو می‌گیره
+   و مقدار تبدیل‌شده در context.args قرار می‌گیره
+✅ پیشوندهای بدون ':' (مثل ship_) در یک trie کاراکتری با طولانی‌ترین تطابق
+✅ callback_data ثبت‌نشده match نمیشه و به handler های بعدی (مثل ConversationHandler ها) می‌رسه
+
+مثال:
+    router = CallbackRouter()
+    router.exact('view_cart', view_cart)                 # view_cart
+    router.route('select_pack', handle_pack_selection, int, int)  # select_pack:3:7
+    router.route('dash', handle_dashboard_callback)      # dash:... (هر تعداد آرگومان متنی)
+    router.prefix('ship_', handle_shipping_selection)    # ship_tipax
+    application.add_handler(router)
+"""
+import logging
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from telegram import Update
+from telegram.ext import BaseHandler
+
+logger = logging.getLogger(__name__)
+
+# کلید پایان مسیر در گره‌های trie (کاراکتر callback_data نمی‌تونه None باشه)
+_END = None
+
+
+class Route:
+    """یک مقصد: تابع handler + نحوه تطبیق و تبدیل آرگومان‌ها"""
+    __slots__ = ('kind', 'name', 'callback', 'types')
+
+    EXACT = 'exact'
+    ARGS = 'args'
+    PREFIX = 'prefix'
+
+    def __init__(self, kind: str, name: str, callback: Callable, types: Tuple[Callable, ...] = ()):
+        self.kind = kind
+        self.name = name
+        self.callback = callback
+        self.types = types
+
+    def parse(self, rest: str) -> Optional[List[Any]]:
+        """
+        آرگومان‌های بعد از `name:`؛ None = match نمیشه
+
+        بدون types هر تعداد آرگومان متنی قبوله؛ با types تعداد باید برابر باشه و
+        هر آرگومان با تابع نوعش تبدیل بشه (ValueError = match نمیشه، مثل regex \\d+)
+        """
+        parts = rest.split(':')
+        if not self.types:
+            return parts
+        if len(parts) != len(self.types):
+            return None
+        try:
+            return [convert(part) for convert, part in zip(self.types, parts)]
+        except (TypeError, ValueError):
+            return None
+
+    @property
+    def pattern(self) -> str:
+        """الگوی regex معادل برای CallbackQueryHandler (بنچمارک و مستندات)"""
+        if self.kind == Route.EXACT:
+            return f"^{self.name}$"
+        if self.kind == Route.PREFIX:
+            return f"^{self.name}"
+        if self.types:
+            return f"^{self.name}:" + ':'.join(r'\d+' if t is int else '[^:]*' for t in self.types) + '$'
+        return f"^{self.name}:"
+
+    def __repr__(self):
+        return f"Route({self.pattern!r} → {getattr(self.callback, '__name__', self.callback)})"
+
+
+class CallbackRouter(BaseHandler[Update, Any]):
+    """
+    Handler واحد برای همه callback query های ثبت‌شده
+
+    ترتیب بررسی: تطابق کامل، بعد `prefix:args` (dict)، بعد پیشوندهای trie.
+    instrument_application هر Route رو جدا با نام تابع خودش اندازه می‌گیره.
+    """
+
+    def __init__(self, block: bool = True):
+        super().__init__(self._dispatch, block=block)
+        self._exact: Dict[str, Route] = {}
+        self._args: Dict[str, Route] = {}
+        self._trie: Dict = {}
+        self._order: List[Route] = []
+
+    # ==================== ثبت مسیرها ====================
+
+    def _add(self, table: Dict[str, Route], route: Route) -> Route:
+        if route.name in table:
+            raise ValueError(f"duplicate callback route: {route.pattern}")
+        table[route.name] = route
+        self._order.append(route)
+        return route
+
+    def exact(self, data: str, callback: Callable) -> Route:
+        """callback_data دقیقاً برابر data (مثل pattern='^data$')"""
+        return self._add(self._exact, Route(Route.EXACT, data, callback))
+
+    def route(self, name: str, callback: Callable, *types: Callable) -> Route:
+        """
+        callback_data به شکل `name:arg1:arg2...`
+
+        Args:
+            types: تابع تبدیل هر آرگومان (int، str، ...)؛ خالی = هر تعداد آرگومان متنی
+        """
+        if ':' in name:
+            raise ValueError(f"route name must not contain ':' ({name})")
+        return self._add(self._args, Route(Route.ARGS, name, callback, types))
+
+    def prefix(self, prefix: str, callback: Callable) -> Route:
+        """callback_data که با prefix شروع میشه (مثل pattern='^prefix')؛ باقی‌مانده در context.args[0]"""
+        node = self._trie
+        for char in prefix:
+            node = node.setdefault(char, {})
+        if _END in node:
+            raise ValueError(f"duplicate callback prefix: {prefix}")
+        route = Route(Route.PREFIX, prefix, callback)
+        node[_END] = route
+        self._order.append(route)
+        return route
+
+    def routes(self) -> Iterator[Route]:
+        """مسیرها به ترتیب ثبت"""
+        return iter(self._order)
+
+    def __len__(self):
+        return len(self._order)
+
+    # ==================== تطبیق ====================
+
+    def resolve(self, data: Optional[str]) -> Optional[Tuple[Route, List[Any]]]:
+        """(Route، آرگومان‌ها) برای callback_data؛ None اگه مسیری نداشته باشه"""
+        if not isinstance(data, str):
+            return None
+
+        route = self._exact.get(data)
+        if route is not None:
+            return route, []
+
+        name, sep, rest = data.partition(':')
+        if sep:
+            route = self._args.get(name)
+            if route is not None:
+                args = route.parse(rest)
+                if args is not None:
+                    return route, args
+
+        # طولانی‌ترین پیشوند ثبت‌شده در trie
+        node = self._trie
+        match = None
+        for char in data:
+            node = node.get(char)
+            if node is None:
+                break
+            match = node.get(_END, match)
+        if match is not None:
+            return match, [data[len(match.name):]]
+        return None
+
+    def check_update(self, update: object) -> Optional[Tuple[Route, List[Any]]]:
+        if isinstance(update, Update) and update.callback_query:
+            return self.resolve(update.callback_query.data)
+        return None
+
+    def collect_additional_context(self, context, update, application, check_result) -> None:
+        context.args = check_result[1]
+
+    async def handle_update(self, update, application, check_result, context):
+        self.collect_additional_context(context, update, application, check_result)
+        return await check_result[0].callback(update, context)
+
+    async def _dispatch(self, update: Update, context):
+        """callback خود handler (برای فراخوانی مستقیم): تطبیق دوباره و اجرای مقصد"""
+        resolved = self.check_update(update)
+        if resolved is None:
+            logger.warning("⚠️ No callback route for update")
+            return None
+        context.args = resolved[1]
+        return await resolved[0].callback(update, context)
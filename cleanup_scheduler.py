@@ -2,6 +2,7 @@
 پاکسازی خودکار دیتابیس
 
 """
+import asyncio
 import logging
 from datetime import datetime, time
 from telegram.ext import ContextTypes
@@ -28,8 +29,8 @@ async def scheduled_cleanup(context: ContextTypes.DEFAULT_TYPE):
             logger.error("❌ دیتابیس در دسترس نیست!")
             return
         
-        # پاکسازی سفارشات قدیمی (بیشتر از 7 روز)
-        report = db.cleanup_old_orders(days_old=7)
+        # پاکسازی سفارشات قدیمی (بیشتر از 7 روز) - دسته‌ای در thread جدا
+        report = await asyncio.to_thread(db.cleanup_old_orders, 7)
         
         if report.get('success'):
             deleted_count = report.get('deleted_count', 0)
@@ -42,6 +43,8 @@ async def scheduled_cleanup(context: ContextTypes.DEFAULT_TYPE):
                 message = (
                     "🤖 **گزارش پاکسازی خودکار**\n\n"
                     f"🗑 تعداد حذف شده: **{deleted_count}** سفارش\n"
+                    f"🗄 آرشیو شده: **{report['archived_count']}** سفارش\n"
+                    f"📦 دسته‌ها: {report['batches']} (بیشترین قفل {report['max_batch_ms']}ms)\n"
                     f"📅 سفارشات قدیمی‌تر از: **{report['days_old']}** روز\n"
                     f"⏰ زمان: {jalali_date} - {now.strftime('%H:%M:%S')}\n\n"
                     f"✅ پاکسازی با موفقیت انجام شد.\n\n"
@@ -113,8 +116,8 @@ async def manual_cleanup(update, context: ContextTypes.DEFAULT_TYPE):
             await processing_msg.edit_text("❌ خطا: دیتابیس در دسترس نیست!")
             return
         
-        # پاکسازی سفارشات قدیمی (بیشتر از 7 روز)
-        report = db.cleanup_old_orders(days_old=7)
+        # پاکسازی سفارشات قدیمی (بیشتر از 7 روز) - دسته‌ای در thread جدا
+        report = await asyncio.to_thread(db.cleanup_old_orders, 7)
         
         if report.get('success'):
             deleted_count = report.get('deleted_count', 0)
@@ -124,6 +127,7 @@ async def manual_cleanup(update, context: ContextTypes.DEFAULT_TYPE):
                 message = (
                     "✅ **پاکسازی موفقیت‌آمیز بود!**\n\n"
                     f"🗑 تعداد حذف شده: **{deleted_count}** سفارش\n"
+                    f"🗄 آرشیو شده: **{report['archived_count']}** سفارش\n"
                     f"📅 سفارشات قدیمی‌تر از: **{days_old}** روز\n\n"
                     f"📊 **جزئیات:**\n"
                     f"✓ سفارشات رد شده قدیمی حذف شدند\n"
@@ -254,7 +258,9 @@ async def send_cleanup_report(context: ContextTypes.DEFAULT_TYPE):
         if not db:
             return
         
-        stats = get_cleanup_stats(db)
+        # ✅ شمارش‌ها روی snapshot فقط‌خواندنی (در صورت فعال بودن)
+        from analytics_snapshot import get_read_db
+        stats = get_cleanup_stats(await get_read_db(context))
         if not stats:
             return
         
@@ -51,6 +51,69 @@ BACKUP_FOLDER = get_env('BACKUP_FOLDER', default='backups', required=False)
 BACKUP_HOUR = int(get_env('BACKUP_HOUR', default='3', required=False))
 BACKUP_MINUTE = int(get_env('BACKUP_MINUTE', default='0', required=False))
 
+# ✅ بکاپ مرحله‌ای و فشرده
+# تعداد صفحه کپی‌شده در هر مرحله Backup API و مکث بین مراحل (میلی‌ثانیه)
+BACKUP_STEP_PAGES = int(get_env('BACKUP_STEP_PAGES', default='1024', required=False))
+BACKUP_STEP_SLEEP_MS = float(get_env('BACKUP_STEP_SLEEP_MS', default='5', required=False))
+# فشرده‌سازی: auto (zstd اگه نصب باشه، وگرنه gzip) / zstd / gzip / none
+BACKUP_COMPRESSION = get_env('BACKUP_COMPRESSION', default='auto', required=False).lower()
+# حداکثر حجم هر قسمت ارسالی به تلگرام (مگابایت - سقف آپلود بات 50MB)
+BACKUP_PART_SIZE_MB = int(get_env('BACKUP_PART_SIZE_MB', default='45', required=False))
+# تعداد بکاپ‌های نگه‌داشته‌شده
+BACKUP_KEEP = int(get_env('BACKUP_KEEP', default='7', required=False))
+# فاصله بکاپ افزایشی (دقیقه) بین بکاپ‌های کامل روزانه - 0 = غیرفعال
+BACKUP_INCREMENTAL_MINUTES = int(get_env('BACKUP_INCREMENTAL_MINUTES', default='60', required=False))
+# تست بازیابی بعد از هر بکاپ کامل (quick_check + مقایسه تعداد ردیف‌ها)
+BACKUP_VERIFY = get_env('BACKUP_VERIFY', default='true', required=False).lower() in ('1', 'true', 'yes')
+# مسیر فایل موقت تست بازیابی (خالی = restore_staging.db داخل پوشه بکاپ)
+BACKUP_STAGING_PATH = get_env('BACKUP_STAGING_PATH', default='', required=False)
+
+# ✅ snapshot فقط‌خواندنی برای گزارش‌ها و export (جدا از دیتابیس زنده)
+ANALYTICS_SNAPSHOT_ENABLED = get_env('ANALYTICS_SNAPSHOT_ENABLED', default='false', required=False).lower() in ('1', 'true', 'yes')
+ANALYTICS_SNAPSHOT_PATH = get_env(
+    'ANALYTICS_SNAPSHOT_PATH',
+    default=os.path.splitext(DATABASE_NAME)[0] + '_analytics.db',
+    required=False
+)
+# حداکثر قدمت مجاز snapshot برای گزارش‌ها (ثانیه)
+ANALYTICS_SNAPSHOT_MAX_AGE = int(get_env('ANALYTICS_SNAPSHOT_MAX_AGE', default='900', required=False))
+# فاصله بروزرسانی دوره‌ای snapshot (ثانیه)
+ANALYTICS_SNAPSHOT_INTERVAL = int(get_env('ANALYTICS_SNAPSHOT_INTERVAL', default='600', required=False))
+
+
+# ✅ پاکسازی دسته‌ای سفارشات قدیمی
+# تعداد سفارش در هر دسته و مکث بین دسته‌ها (میلی‌ثانیه)
+CLEANUP_BATCH_SIZE = int(get_env('CLEANUP_BATCH_SIZE', default='500', required=False))
+CLEANUP_BATCH_PAUSE_MS = float(get_env('CLEANUP_BATCH_PAUSE_MS', default='50', required=False))
+# سقف مدت قفل نوشتن هر دسته (میلی‌ثانیه) - دسته‌های کندتر کوچک‌تر میشن
+CLEANUP_MAX_LOCK_MS = float(get_env('CLEANUP_MAX_LOCK_MS', default='10', required=False))
+# انتقال سفارشات پاک‌شده به دیتابیس آرشیو (جدول ماهانه) به جای حذف کامل
+ORDER_ARCHIVE_ENABLED = get_env('ORDER_ARCHIVE_ENABLED', default='false', required=False).lower() in ('1', 'true', 'yes')
+ORDER_ARCHIVE_PATH = get_env(
+    'ORDER_ARCHIVE_PATH',
+    default=os.path.splitext(DATABASE_NAME)[0] + '_archive.db',
+    required=False
+)
+
+
+# ✅ پروفایل کارایی SQLite: durable / balanced / fast (جزئیات در database.SQLITE_PROFILES)
+SQLITE_PROFILE = get_env('SQLITE_PROFILE', default='balanced', required=False).lower()
+
+
+# ✅ نگه‌داری خودکار دیتابیس (incremental vacuum، checkpoint WAL، optimize)
+# فاصله اجرای نگه‌داری (ثانیه)
+DB_MAINTENANCE_INTERVAL = int(get_env('DB_MAINTENANCE_INTERVAL', default='300', required=False))
+# بودجه هر مرحله incremental_vacuum (صفحه) و حداقل صفحات آزاد برای شروع
+DB_VACUUM_PAGES = int(get_env('DB_VACUUM_PAGES', default='256', required=False))
+DB_VACUUM_MIN_FREE_PAGES = int(get_env('DB_VACUUM_MIN_FREE_PAGES', default='64', required=False))
+# checkpoint PASSIVE از این حجم WAL به بالا و TRUNCATE (کوچک کردن فایل) از این حجم به بالا (مگابایت)
+DB_WAL_CHECKPOINT_MB = float(get_env('DB_WAL_CHECKPOINT_MB', default='16', required=False))
+DB_WAL_TRUNCATE_MB = float(get_env('DB_WAL_TRUNCATE_MB', default='64', required=False))
+# فاصله PRAGMA optimize (ساعت)
+DB_OPTIMIZE_HOURS = float(get_env('DB_OPTIMIZE_HOURS', default='6', required=False))
+# حداکثر حجم دیتابیس برای migration خودکار auto_vacuum هنگام راه‌اندازی (مگابایت)
+DB_AUTO_VACUUM_MIGRATE_MAX_MB = float(get_env('DB_AUTO_VACUUM_MIGRATE_MAX_MB', default='256', required=False))
+
 
 # ==================== Payment Configuration ====================
 
@@ -189,6 +252,49 @@ CONTACT_INFO = {
 
 # ==================== ✅ NEW: Limits & Constraints ====================
 
+# موتور Rate Limiting:
+#   sqlite - GCRA با وضعیت پایدار و مشترک بین process ها (پیش‌فرض)
+#   gcra   - GCRA فقط در حافظه
+#   window - پنجره لغزان قدیمی
+RATE_LIMIT_ENGINE = get_env('RATE_LIMIT_ENGINE', default='sqlite', required=False).lower()
+# فایل وضعیت Rate Limiting (همه process های ربات باید به یک فایل اشاره کنن)
+RATE_LIMIT_DB_PATH = get_env(
+    'RATE_LIMIT_DB_PATH',
+    default=os.path.splitext(DATABASE_NAME)[0] + '_ratelimit.db',
+    required=False
+)
+# عملیاتی که هر بررسی‌شان مستقیم و اتمیک در فایل ثبت میشه (با کاما جدا)
+RATE_LIMIT_DURABLE_ACTIONS = tuple(
+    action.strip()
+    for action in get_env('RATE_LIMIT_DURABLE_ACTIONS', default='order', required=False).split(',')
+    if action.strip()
+)
+# فاصله ذخیره دسته‌ای باقی محدودیت‌ها (ثانیه)
+RATE_LIMIT_FLUSH_INTERVAL = int(get_env('RATE_LIMIT_FLUSH_INTERVAL', default='5', required=False))
+
+# قفل سبد خرید: 0 = یک قفل برای هر کاربر فعال (حذف بعد از آزاد شدن)،
+# N = تعداد ثابت قفل مشترک (سقف حافظه ثابت)
+CART_LOCK_STRIPES = int(get_env('CART_LOCK_STRIPES', default='0', required=False))
+
+# پروفایلر کوئری: آستانه کوئری کند (میلی‌ثانیه) و نسبت نمونه‌برداری (0 تا 1)
+SLOW_QUERY_MS = float(get_env('SLOW_QUERY_MS', default='100', required=False))
+QUERY_PROFILE_SAMPLE_RATE = float(get_env('QUERY_PROFILE_SAMPLE_RATE', default='0.1', required=False))
+
+# مانیتور event loop: فاصله نمونه‌برداری (ثانیه)، آستانه بلاک (میلی‌ثانیه)
+# و حالت debug برای ثبت پشته callback بلاک‌کننده
+LOOP_LAG_INTERVAL = float(get_env('LOOP_LAG_INTERVAL', default='0.5', required=False))
+LOOP_BLOCK_THRESHOLD_MS = float(get_env('LOOP_BLOCK_THRESHOLD_MS', default='250', required=False))
+LOOP_BLOCK_DEBUG = get_env('LOOP_BLOCK_DEBUG', default='false', required=False).lower() in ('1', 'true', 'yes')
+
+# فاصله نمونه‌برداری پس‌زمینه Health Check (ثانیه)
+HEALTH_SAMPLE_INTERVAL = float(get_env('HEALTH_SAMPLE_INTERVAL', default='15', required=False))
+
+# پورت داشبورد مانیتورینگ (0 = غیرفعال، Flask اصلاً import نمیشه)
+MONITORING_PORT = int(get_env('MONITORING_PORT', default='5000', required=False))
+
+# تأخیر پیش‌بارگذاری ماژول‌های سنگین (matplotlib، openpyxl) در پس‌زمینه بعد از شروع (ثانیه، منفی = غیرفعال)
+STARTUP_WARMUP_DELAY = float(get_env('STARTUP_WARMUP_DELAY', default='30', required=False))
+
 LIMITS = {
     # Rate Limits
     'RATE_LIMIT_REQUESTS': 20,
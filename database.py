@@ -5,12 +5,20 @@
 import sqlite3
 import json
 import threading
+import time
 import atexit
 from logger import log_database_operation, log_error
 from datetime import datetime, timedelta, timezone
-from typing import Optional, List
+from typing import Optional, List, Dict, Tuple
 from contextlib import contextmanager
-from config import DATABASE_NAME
+from config import (
+    DATABASE_NAME, CLEANUP_BATCH_SIZE, CLEANUP_BATCH_PAUSE_MS, CLEANUP_MAX_LOCK_MS,
+    ORDER_ARCHIVE_ENABLED, ORDER_ARCHIVE_PATH, SQLITE_PROFILE
+)
+from metrics import DB_QUERY_LATENCY, sql_operation
+from query_profiler import query_profiler
+import queries as Q
+from migrations import run_migrations
 import logging
 import pytz
 
@@ -24,11 +32,188 @@ def get_tehran_now():
     return datetime.now(TEHRAN_TZ)
 
 
+def _observe_query(sql: str, elapsed: float):
+    """ثبت زمان دستور در متریک bot_db_query_seconds و پروفایلر کوئری"""
+    DB_QUERY_LATENCY.labels(sql_operation(sql)).observe(elapsed)
+    query_profiler.observe(sql, elapsed)
+
+
+class TimedCursor(sqlite3.Cursor):
+    """
+    Cursor با ثبت زمان هر دستور (متریک + پروفایلر کوئری‌های کند)
+    
+    زمان دستوری که ردیف برمی‌گردونه شامل fetch ها و پیمایش ردیف‌ها هم هست (SQLite
+    ردیف‌ها رو موقع fetch می‌خونه و اسکن‌های بزرگ بیشتر زمانشون اونجاست). چنین
+    دستوری تا تموم شدن ردیف‌ها، execute بعدی، close یا آزاد شدن cursor باز می‌مونه
+    و بعد یک بار با مجموع زمان‌ها ثبت میشه (زمان بیکار بین fetch ها حساب نمیشه).
+    """
+    
+    _pending_sql = None
+    _pending_elapsed = 0.0
+    
+    def _finish(self):
+        """ثبت دستور باز با مجموع زمان execute و fetch ها"""
+        sql = self._pending_sql
+        if sql is not None:
+            self._pending_sql = None
+            _observe_query(sql, self._pending_elapsed)
+    
+    def _timed(self, run, sql, parameters):
+        self._finish()
+        start = time.perf_counter()
+        try:
+            result = run(sql, parameters)
+        except BaseException:
+            _observe_query(sql, time.perf_counter() - start)
+            raise
+        
+        elapsed = time.perf_counter() - start
+        if self.description is None:
+            _observe_query(sql, elapsed)
+        else:
+            self._pending_sql = sql
+            self._pending_elapsed = elapsed
+        return result
+    
+    def execute(self, sql, parameters=()):
+        return self._timed(super().execute, sql, parameters)
+    
+    def executemany(self, sql, seq_of_parameters):
+        return self._timed(super().executemany, sql, seq_of_parameters)
+    
+    def fetchone(self):
+        if self._pending_sql is None:
+            return super().fetchone()
+        start = time.perf_counter()
+        try:
+            row = super().fetchone()
+        finally:
+            self._pending_elapsed += time.perf_counter() - start
+        if row is None:
+            self._finish()
+        return row
+    
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        if self._pending_sql is None:
+            return super().fetchmany(size)
+        start = time.perf_counter()
+        try:
+            rows = super().fetchmany(size)
+        finally:
+            self._pending_elapsed += time.perf_counter() - start
+        if len(rows) < size:
+            self._finish()
+        return rows
+    
+    def fetchall(self):
+        if self._pending_sql is None:
+            return super().fetchall()
+        start = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            self._pending_elapsed += time.perf_counter() - start
+            self._finish()
+    
+    def __next__(self):
+        if self._pending_sql is None:
+            return super().__next__()
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._pending_elapsed += time.perf_counter() - start
+            self._finish()
+            raise
+        self._pending_elapsed += time.perf_counter() - start
+        return row
+    
+    def close(self):
+        self._finish()
+        super().close()
+    
+    def __del__(self):
+        # cursor هایی مثل conn.execute(...).fetchone() که تا آخر خونده نمیشن
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+
+class TimedConnection(sqlite3.Connection):
+    """Connection که همه cursor هاش TimedCursor هستن (شامل conn.execute)"""
+    
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+    
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+    
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+# ✅ پروفایل‌های کارایی SQLite (انتخاب با SQLITE_PROFILE در .env)
+# همه تنظیمات per-connection هستن و روی هر connection جدید pool اعمال میشن
+# synchronous در حالت WAL:
+#   FULL: هر commit تا دیسک fsync میشه (بدون از دست رفتن داده با قطع برق)
+#   NORMAL: fsync فقط هنگام checkpoint؛ با قطع برق آخرین تراکنش‌ها ممکنه برگردن ولی دیتابیس خراب نمیشه
+#   OFF: بدون fsync؛ با قطع برق سیستم‌عامل احتمال خرابی دیتابیس هست
+SQLITE_PROFILES: Dict[str, Dict] = {
+    'durable': {
+        'synchronous': 'FULL',
+        'cache_size_kb': 8 * 1024,
+        'mmap_size': 0,
+        'temp_store': 'DEFAULT',
+        'busy_timeout_ms': 60000,
+        'wal_autocheckpoint': 1000,
+    },
+    'balanced': {
+        'synchronous': 'NORMAL',
+        'cache_size_kb': 32 * 1024,
+        'mmap_size': 128 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+        'busy_timeout_ms': 60000,
+        'wal_autocheckpoint': 1000,
+    },
+    'fast': {
+        'synchronous': 'OFF',
+        'cache_size_kb': 64 * 1024,
+        'mmap_size': 256 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+        'busy_timeout_ms': 15000,
+        'wal_autocheckpoint': 4000,
+    },
+}
+DEFAULT_SQLITE_PROFILE = 'balanced'
+
+
+def resolve_sqlite_profile(name: Optional[str] = None) -> Tuple[str, Dict]:
+    """نام و تنظیمات پروفایل (نام نامعتبر → پروفایل پیش‌فرض با هشدار)"""
+    name = (name or SQLITE_PROFILE or DEFAULT_SQLITE_PROFILE).lower()
+    if name not in SQLITE_PROFILES:
+        logger.warning("⚠️ Unknown SQLITE_PROFILE %r, using %s", name, DEFAULT_SQLITE_PROFILE)
+        name = DEFAULT_SQLITE_PROFILE
+    return name, SQLITE_PROFILES[name]
+
+
+def apply_sqlite_profile(conn: sqlite3.Connection, profile: Dict):
+    """اعمال تنظیمات پروفایل روی یک connection"""
+    conn.execute(f"PRAGMA synchronous = {profile['synchronous']}")
+    conn.execute(f"PRAGMA cache_size = -{int(profile['cache_size_kb'])}")
+    conn.execute(f"PRAGMA mmap_size = {int(profile['mmap_size'])}")
+    conn.execute(f"PRAGMA temp_store = {profile['temp_store']}")
+    conn.execute(f"PRAGMA busy_timeout = {int(profile['busy_timeout_ms'])}")
+    conn.execute(f"PRAGMA wal_autocheckpoint = {int(profile['wal_autocheckpoint'])}")
+
+
 class DatabaseConnectionPool:
     """مدیریت Connection Pool برای دیتابیس"""
     
-    def __init__(self, database_name: str):
+    def __init__(self, database_name: str, profile: Optional[str] = None):
         self.database_name = database_name
+        self.profile_name, self.profile = resolve_sqlite_profile(profile)
         self._local = threading.local()
         self._lock = threading.Lock()
         self._active_connections = []
@@ -41,25 +226,43 @@ class DatabaseConnectionPool:
             try:
                 conn = sqlite3.connect(
                     self.database_name,
-                    timeout=60.0,  # ✅ FIX #6: افزایش timeout برای production
-                    check_same_thread=False
+                    timeout=self.profile['busy_timeout_ms'] / 1000,  # ✅ از پروفایل SQLite
+                    check_same_thread=False,
+                    factory=TimedConnection,  # ✅ زمان هر query برای /metrics
+                    cached_statements=Q.STATEMENT_CACHE_SIZE  # ✅ LRU دستورهای آماده
                 )
                 conn.row_factory = sqlite3.Row
                 conn.execute("PRAGMA foreign_keys = ON")
+                # ✅ دیتابیس جدید از اول با incremental vacuum ساخته میشه (قبل از WAL و جدول‌ها)
+                conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
                 conn.execute("PRAGMA journal_mode = WAL")
+                apply_sqlite_profile(conn, self.profile)
                 
                 self._local.connection = conn
                 
                 with self._lock:
                     self._active_connections.append(conn)
                 
-                logger.debug(f"✅ Connection created for thread {threading.current_thread().name}")
+                logger.debug("✅ Connection created for thread %s", threading.current_thread().name)
             except sqlite3.Error as e:
                 logger.error(f"❌ Failed to create connection: {e}")
                 raise
         
         return self._local.connection
     
+    def get_cursor(self) -> sqlite3.Cursor:
+        """
+        cursor مشترک thread فعلی برای خواندن‌های داغ (بدون ساخت cursor در هر فراخوانی)
+        
+        ⚠️ فقط برای دستورهایی که نتیجه رو کامل می‌خونن؛ بیرون از Database داده نمیشه
+        """
+        conn = self.get_connection()
+        cursor = getattr(self._local, 'cursor', None)
+        if cursor is None or cursor.connection is not conn:
+            cursor = conn.cursor()
+            self._local.cursor = cursor
+        return cursor
+    
     def close_connection(self):
         """بستن connection thread فعلی"""
         if hasattr(self._local, 'connection') and self._local.connection is not None:
@@ -70,11 +273,12 @@ class DatabaseConnectionPool:
                     if self._local.connection in self._active_connections:
                         self._active_connections.remove(self._local.connection)
                 
-                logger.debug(f"✅ Connection closed for thread {threading.current_thread().name}")
+                logger.debug("✅ Connection closed for thread %s", threading.current_thread().name)
             except sqlite3.Error as e:
                 logger.error(f"❌ Failed to close connection: {e}")
             finally:
                 self._local.connection = None
+                self._local.cursor = None
     
     def cleanup_all(self):
         """بستن تمام connection‌های فعال"""
@@ -101,18 +305,38 @@ class DatabaseError(Exception):
 class Database:
     """کلاس مدیریت دیتابیس با امنیت بالا"""
 
-    def __init__(self, cache_manager=None):
-        """✅ FIX: حذف self.conn و self.cursor سراسری"""
-        self.pool = DatabaseConnectionPool(DATABASE_NAME)
+    def __init__(self, cache_manager=None, database_name: Optional[str] = None,
+                 profile: Optional[str] = None):
+        """
+        ✅ FIX: حذف self.conn و self.cursor سراسری
+        
+        Args:
+            database_name: مسیر فایل دیتابیس (پیش‌فرض DATABASE_NAME)
+            profile: پروفایل کارایی SQLite (پیش‌فرض SQLITE_PROFILE)
+        """
+        self.pool = DatabaseConnectionPool(database_name or DATABASE_NAME, profile)
         self.cache_manager = cache_manager
         self.create_tables()
         
-        logger.info("✅ Database initialized successfully")
+        logger.info("✅ Database initialized successfully (profile: %s)", self.pool.profile_name)
     
     def _get_conn(self) -> sqlite3.Connection:
         """دریافت connection برای thread فعلی"""
         return self.pool.get_connection()
     
+    def _fetch_one(self, sql: str, params=()):
+        """
+        اجرای دستور خواندنی رجیستری روی cursor مشترک thread و برگردوندن یک ردیف
+        
+        ⚠️ فقط برای جستجو با کلید یکتا: fetchone بعد از تنها ردیف به انتهای دستور می‌رسه و
+        دستور reset میشه؛ با چند ردیف، دستور نیمه‌کاره تراکنش خواندن رو باز نگه می‌داشت
+        """
+        return self.pool.get_cursor().execute(sql, params).fetchone()
+    
+    def _fetch_all(self, sql: str, params=()):
+        """اجرای دستور خواندنی رجیستری روی cursor مشترک thread"""
+        return self.pool.get_cursor().execute(sql, params).fetchall()
+    
     def _sanitize_text_input(self, text: str, max_length: int = None) -> str:
         """
         ✅ NEW: پاکسازی ورودی متنی
@@ -184,278 +408,14 @@ class Database:
             return 0
     
     def create_tables(self):
-        """ایجاد جداول دیتابیس"""
-        conn = self._get_conn()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS products (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                description TEXT,
-                photo_id TEXT,
-                channel_message_id INTEGER,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS packs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                product_id INTEGER,
-                name TEXT NOT NULL,
-                quantity INTEGER NOT NULL,
-                price REAL NOT NULL,
-                FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE
-            )
-        """)
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                user_id INTEGER PRIMARY KEY,
-                username TEXT,
-                first_name TEXT,
-                full_name TEXT,
-                phone TEXT,
-                landline_phone TEXT,
-                address TEXT,
-                shop_name TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS cart (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                product_id INTEGER,
-                pack_id INTEGER,
-                quantity INTEGER DEFAULT 1,
-                FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE,
-                FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE,
-                FOREIGN KEY (pack_id) REFERENCES packs(id) ON DELETE CASCADE,
-                UNIQUE(user_id, pack_id)
-            )
-        """)
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS orders (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                items TEXT,
-                total_price REAL,
-                discount_amount REAL DEFAULT 0,
-                final_price REAL,
-                discount_code TEXT,
-                status TEXT DEFAULT 'pending',
-                receipt_photo TEXT,
-                shipping_method TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                expires_at TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(user_id)
-            )
-        """)
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS discount_codes (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                code TEXT UNIQUE NOT NULL,
-                type TEXT NOT NULL,
-                value REAL NOT NULL,
-                min_purchase REAL DEFAULT 0,
-                max_discount REAL,
-                usage_limit INTEGER,
-                used_count INTEGER DEFAULT 0,
-                per_user_limit INTEGER,
-                start_date TIMESTAMP,
-                end_date TIMESTAMP,
-                is_active INTEGER DEFAULT 1,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS discount_usage (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                discount_code TEXT,
-                order_id INTEGER,
-                used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(user_id),
-                FOREIGN KEY (order_id) REFERENCES orders(id)
-            )
-        """)
-        
-        # ✅ NEW: جدول جدید برای ذخیره تخفیف‌های موقت
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS temp_discount_codes (
-                user_id INTEGER PRIMARY KEY,
-                discount_code TEXT NOT NULL,
-                discount_amount REAL NOT NULL,
-                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                expires_at TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
-            )
-        """)
-
-        # ==================== Wallet Tables ====================
-
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS wallets (
-                user_id INTEGER PRIMARY KEY,
-                balance REAL NOT NULL DEFAULT 0,
-                expires_at TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS wallet_transactions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                amount REAL NOT NULL,
-                type TEXT NOT NULL,
-                description TEXT,
-                order_id INTEGER,
-                admin_id INTEGER,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS bot_settings (
-                key TEXT PRIMARY KEY,
-                value TEXT,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        conn.commit()
-        self._create_indexes()
-        self._migrate_existing_data()
-    
-    def _migrate_existing_data(self):
-        """
-        ✅ اضافه کردن ستون‌های جدید و migrate کردن سفارشات قدیمی
         """
-        try:
-            conn = self._get_conn()
-            cursor = conn.cursor()
-            
-            # چک کردن وجود ستون per_user_limit
-            cursor.execute("PRAGMA table_info(discount_codes)")
-            columns = [col[1] for col in cursor.fetchall()]
-            
-            if 'per_user_limit' not in columns:
-                logger.info("🔄 اضافه کردن ستون per_user_limit به جدول discount_codes...")
-                cursor.execute("ALTER TABLE discount_codes ADD COLUMN per_user_limit INTEGER")
-                conn.commit()
-                logger.info("✅ ستون per_user_limit اضافه شد")
-            
-            # چک کردن وجود ستون expires_at در orders
-            cursor.execute("PRAGMA table_info(orders)")
-            columns = [col[1] for col in cursor.fetchall()]
-            
-            if 'expires_at' not in columns:
-                logger.info("🔄 اضافه کردن ستون expires_at...")
-                cursor.execute("ALTER TABLE orders ADD COLUMN expires_at TIMESTAMP")
-                conn.commit()
-                
-                # ✅ FIX: فقط یکبار وقتی ستون اضافه میشه، migration رو اجرا کن
-                # و با 1 ساعت (نه 1 روز)
-                logger.info("🔄 Migration سفارشات قدیمی به 1 ساعت...")
-                cursor.execute("""
-                    UPDATE orders 
-                    SET expires_at = datetime(created_at, '+1 hour')
-                    WHERE expires_at IS NULL
-                """)
-                conn.commit()
-                logger.info("✅ Migration سفارشات قدیمی انجام شد")
-            
-            logger.info("✅ بررسی migration‌ها تمام شد")
-
-            # ✅ اطمینان از وجود جدول bot_settings
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS bot_settings (
-                    key TEXT PRIMARY KEY,
-                    value TEXT,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            conn.commit()
-
-            # ✅ اگه جدول wallets با FOREIGN KEY ساخته شده، بازسازی بدون constraint
-            cursor.execute("PRAGMA foreign_key_list(wallets)")
-            fk_list = cursor.fetchall()
-            if fk_list:
-                logger.info("🔄 بازسازی جدول wallets بدون FOREIGN KEY...")
-                cursor.execute("ALTER TABLE wallets RENAME TO wallets_old")
-                cursor.execute("""
-                    CREATE TABLE wallets (
-                        user_id INTEGER PRIMARY KEY,
-                        balance REAL NOT NULL DEFAULT 0,
-                        expires_at TIMESTAMP,
-                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-                cursor.execute("INSERT INTO wallets SELECT * FROM wallets_old")
-                cursor.execute("DROP TABLE wallets_old")
-                conn.commit()
-                logger.info("✅ جدول wallets بازسازی شد")
-
-            # ✅ اگه جدول wallet_transactions با FOREIGN KEY ساخته شده، بازسازی بدون constraint
-            cursor.execute("PRAGMA foreign_key_list(wallet_transactions)")
-            fk_list2 = cursor.fetchall()
-            if fk_list2:
-                logger.info("🔄 بازسازی جدول wallet_transactions بدون FOREIGN KEY...")
-                cursor.execute("ALTER TABLE wallet_transactions RENAME TO wallet_transactions_old")
-                cursor.execute("""
-                    CREATE TABLE wallet_transactions (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        user_id INTEGER NOT NULL,
-                        amount REAL NOT NULL,
-                        type TEXT NOT NULL,
-                        description TEXT,
-                        order_id INTEGER,
-                        admin_id INTEGER,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-                cursor.execute("INSERT INTO wallet_transactions SELECT * FROM wallet_transactions_old")
-                cursor.execute("DROP TABLE wallet_transactions_old")
-                conn.commit()
-                logger.info("✅ جدول wallet_transactions بازسازی شد")
-        except Exception as e:
-            logger.error(f"❌ خطا در مهاجرت: {e}")
-    
-    def _create_indexes(self):
-        """ایجاد Index ها برای بهبود سرعت"""
-        conn = self._get_conn()
-        cursor = conn.cursor()
-        
-        indexes = [
-            "CREATE INDEX IF NOT EXISTS idx_orders_user_id ON orders(user_id)",
-            "CREATE INDEX IF NOT EXISTS idx_orders_status ON orders(status)",
-            "CREATE INDEX IF NOT EXISTS idx_orders_created_at ON orders(created_at DESC)",
-            "CREATE INDEX IF NOT EXISTS idx_orders_status_created ON orders(status, created_at DESC)",
-            "CREATE INDEX IF NOT EXISTS idx_orders_expires_at ON orders(expires_at)",
-            "CREATE INDEX IF NOT EXISTS idx_cart_user_id ON cart(user_id)",
-            "CREATE UNIQUE INDEX IF NOT EXISTS idx_cart_user_pack ON cart(user_id, pack_id)",
-            "CREATE INDEX IF NOT EXISTS idx_discount_code ON discount_codes(code)",
-            "CREATE INDEX IF NOT EXISTS idx_packs_product_id ON packs(product_id)",
-            "CREATE INDEX IF NOT EXISTS idx_temp_discount_user ON temp_discount_codes(user_id)",
-            "CREATE INDEX IF NOT EXISTS idx_discount_usage_user_code ON discount_usage(user_id, discount_code)",
-            "CREATE INDEX IF NOT EXISTS idx_wallet_transactions_user ON wallet_transactions(user_id)",
-            "CREATE INDEX IF NOT EXISTS idx_wallet_transactions_created ON wallet_transactions(created_at DESC)",
-        ]
-        
-        for index_sql in indexes:
-            try:
-                cursor.execute(index_sql)
-            except sqlite3.Error as e:
-                logger.warning(f"⚠️ Failed to create index: {e}")
+        ایجاد / ارتقای جداول با migration های نسخه‌دار (migrations.py)
         
-        conn.commit()
+        ✅ اگه schema به‌روز باشه فقط یک SELECT روی schema_version اجرا میشه (بدون DDL)
+        """
+        applied = run_migrations(self._get_conn())
+        if applied:
+            logger.info("✅ Schema upgraded to version %d", applied[-1])
     
     # ==================== محصولات ====================
     
@@ -477,16 +437,10 @@ class Database:
             raise
     
     def get_product(self, product_id):
-        conn = self._get_conn()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM products WHERE id = ?", (product_id,))
-        return cursor.fetchone()
+        return self._fetch_one(Q.GET_PRODUCT, (product_id,))
     
     def get_all_products(self):
-        conn = self._get_conn()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM products ORDER BY created_at DESC")
-        return cursor.fetchall()
+        return self._fetch_all(Q.GET_ALL_PRODUCTS)
     
     def get_products_paginated(self, page: int = 1, per_page: int = 10):
         """
@@ -579,16 +533,10 @@ class Database:
         return pack_id
     
     def get_packs(self, product_id: int):
-        conn = self._get_conn()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM packs WHERE product_id = ?", (product_id,))
-        return cursor.fetchall()
+        return self._fetch_all(Q.GET_PACKS, (product_id,))
     
     def get_pack(self, pack_id: int):
-        conn = self._get_conn()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM packs WHERE id = ?", (pack_id,))
-        return cursor.fetchone()
+        return self._fetch_one(Q.GET_PACK, (pack_id,))
     
     def update_pack(self, pack_id: int, name: str, quantity: int, price: float):
         pack = self.get_pack(pack_id)
@@ -651,10 +599,7 @@ class Database:
         self._invalidate_cache(f"user:{user_id}")
     
     def get_user(self, user_id: int):
-        conn = self._get_conn()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM users WHERE user_id = ?", (user_id,))
-        return cursor.fetchone()
+        return self._fetch_one(Q.GET_USER, (user_id,))
     
     def get_all_users(self):
         conn = self._get_conn()
@@ -680,15 +625,10 @@ class Database:
             actual_quantity = quantity * pack_quantity
             
             with self.transaction() as cursor:
-                cursor.execute("""
-                    INSERT INTO cart (user_id, product_id, pack_id, quantity) 
-                    VALUES (?, ?, ?, ?)
-                    ON CONFLICT(user_id, pack_id) DO UPDATE 
-                    SET quantity = quantity + excluded.quantity
-                """, (user_id, product_id, pack_id, actual_quantity))
+                cursor.execute(Q.UPSERT_CART_ITEM, (user_id, product_id, pack_id, actual_quantity))
             
             self._invalidate_cache(f"cart:{user_id}")
-            logger.info(f"✅ Cart updated: user={user_id}, pack={pack_id}, qty={actual_quantity}")
+            logger.info("✅ Cart updated: user=%s, pack=%s, qty=%s", user_id, pack_id, actual_quantity)
             
         except Exception as e:
             logger.error(f"❌ Cart error: {e}")
@@ -696,20 +636,11 @@ class Database:
     
     def get_cart(self, user_id: int):
         """✅ FIXED: حذف clean_invalid_cart_items"""
-        conn = self._get_conn()
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT c.id, p.name, pk.name, pk.quantity, pk.price, c.quantity
-            FROM cart c
-            JOIN products p ON c.product_id = p.id
-            JOIN packs pk ON c.pack_id = pk.id
-            WHERE c.user_id = ?
-        """, (user_id,))
-        return cursor.fetchall()
+        return self._fetch_all(Q.GET_CART, (user_id,))
     
     def clear_cart(self, user_id: int):
         with self.transaction() as cursor:
-            cursor.execute("DELETE FROM cart WHERE user_id = ?", (user_id,))
+            cursor.execute(Q.CLEAR_CART, (user_id,))
         self._invalidate_cache(f"cart:{user_id}")
     
     def remove_from_cart(self, cart_id: int):
@@ -740,21 +671,15 @@ class Database:
         expires_at = now_tehran + timedelta(hours=1)  # ۱ ساعت
         
         with self.transaction() as cursor:
-            cursor.execute("""
-                INSERT INTO orders 
-                (user_id, items, total_price, discount_amount, final_price, discount_code, expires_at) 
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (user_id, items_json, total_price, discount_amount, final_price, discount_code, expires_at))
+            cursor.execute(Q.INSERT_ORDER, (user_id, items_json, total_price, discount_amount,
+                                            final_price, discount_code, expires_at))
             order_id = cursor.lastrowid
             
         self._invalidate_cache("stats:")
         return order_id
     
     def get_order(self, order_id: int):
-        conn = self._get_conn()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM orders WHERE id = ?", (order_id,))
-        return cursor.fetchone()
+        return self._fetch_one(Q.GET_ORDER, (order_id,))
     
     def update_order_status(self, order_id: int, status: str):
         with self.transaction() as cursor:
@@ -834,58 +759,188 @@ class Database:
         
         return get_tehran_now() > expires_at
     
-    def cleanup_old_orders(self, days_old: int = 7) -> dict:
-        """پاکسازی سفارشات قدیمی (با timezone تهران)"""
+    # ✅ شرط سفارش قابل پاکسازی: مقایسه مستقیم ستون‌ها (بدون datetime()) تا index
+    # created_at / expires_at استفاده بشه. تاریخ‌ها به صورت متن ISO ذخیره شدن و
+    # مقایسه متنی با "YYYY-MM-DD HH:MM:SS" ترتیب زمانی رو حفظ می‌کنه.
+    # سفارش‌هایی که در discount_usage ثبت شدن حذف نمیشن (کلید خارجی).
+    _CLEANUP_PREDICATE = """
+        created_at < ?
+        AND (
+            status = 'rejected'
+            OR (expires_at < ? AND status NOT IN ('payment_confirmed', 'confirmed'))
+        )
+        AND NOT EXISTS (SELECT 1 FROM discount_usage du WHERE du.order_id = orders.id)
+    """
+    
+    def _open_maintenance_conn(self) -> sqlite3.Connection:
+        """connection جدا برای کارهای نگه‌داری (بدون تراکنش ضمنی، جدا از pool)"""
+        conn = sqlite3.connect(
+            self.pool.database_name,
+            timeout=60.0,
+            isolation_level=None,
+            check_same_thread=False,
+            factory=TimedConnection
+        )
+        conn.execute("PRAGMA foreign_keys = ON")
+        return conn
+    
+    def _ensure_archive_table(self, conn: sqlite3.Connection, table: str) -> List[str]:
+        """ایجاد جدول ماهانه آرشیو با ستون‌های orders (و اضافه کردن ستون‌های جدید)"""
+        columns = [(row[1], row[2]) for row in conn.execute("PRAGMA main.table_info(orders)")]
+        existing = {row[1] for row in conn.execute(f'PRAGMA archive.table_info("{table}")')}
+        
+        if not existing:
+            definitions = ', '.join(
+                f'"{name}" {type_}' + (' PRIMARY KEY' if name == 'id' else '')
+                for name, type_ in columns
+            )
+            conn.execute(f'CREATE TABLE archive."{table}" ({definitions}, archived_at TIMESTAMP)')
+        else:
+            for name, type_ in columns:
+                if name not in existing:
+                    conn.execute(f'ALTER TABLE archive."{table}" ADD COLUMN "{name}" {type_}')
+        
+        return [name for name, _ in columns]
+    
+    def _archive_orders(self, conn: sqlite3.Connection, months: dict, archived_at: str) -> int:
+        """
+        کپی سفارشات به جدول ماهانه archive.orders_YYYYMM
+        
+        در تراکنش جدا و قبل از حذف commit میشه (WAL بین دو فایل اتمیک نیست)؛
+        اگه بین کپی و حذف قطع بشه، اجرای بعدی با INSERT OR REPLACE تکراری نمی‌سازه.
+        """
+        archived = 0
+        conn.execute("BEGIN")
         try:
-            conn = self._get_conn()
-            cursor = conn.cursor()
-            
-            cutoff_date = get_tehran_now() - timedelta(days=days_old)
-            
-            # FIX: مقایسه با localtime چون expires_at به وقت تهران ذخیره شده
-            cursor.execute("""
-                SELECT COUNT(*) FROM orders 
-                WHERE (
-                    status = 'rejected' 
-                    OR (datetime(expires_at) < datetime('now', 'localtime') AND status NOT IN ('payment_confirmed', 'confirmed'))
-                )
-                AND datetime(created_at) < datetime(?)
-            """, (cutoff_date,))
-            
-            count_before = cursor.fetchone()[0]
-            
-            cursor.execute("""
-                DELETE FROM orders 
-                WHERE (
-                    status = 'rejected' 
-                    OR (datetime(expires_at) < datetime('now', 'localtime') AND status NOT IN ('payment_confirmed', 'confirmed'))
-                )
-                AND datetime(created_at) < datetime(?)
-            """, (cutoff_date,))
+            for month, ids in months.items():
+                table = f"orders_{month.replace('-', '')}"
+                columns = ', '.join(f'"{name}"' for name in self._ensure_archive_table(conn, table))
+                placeholders = ','.join('?' * len(ids))
+                cursor = conn.execute(f"""
+                    INSERT OR REPLACE INTO archive."{table}" ({columns}, archived_at)
+                    SELECT {columns}, ? FROM main.orders WHERE id IN ({placeholders})
+                """, (archived_at, *ids))
+                archived += cursor.rowcount
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return archived
+    
+    def cleanup_old_orders(self, days_old: int = 7, batch_size: Optional[int] = None,
+                           pause: Optional[float] = None, archive: Optional[bool] = None) -> dict:
+        """
+        پاکسازی سفارشات قدیمی (با timezone تهران)
+        
+        ✅ دسته‌ای: سفارشات به ترتیب id در دسته‌های batch_size تایی حذف میشن؛
+        هر دسته یک تراکنش کوتاه (چند میلی‌ثانیه) و بین دسته‌ها pause ثانیه مکث
+        تا نوشتن‌های ربات (ثبت سفارش، سبد خرید) منتظر نمونن. اگه قفل یک دسته از
+        CLEANUP_MAX_LOCK_MS بیشتر بشه دسته بعدی نصف میشه.
+        ✅ آرشیو: با archive=True سفارشات قبل از حذف به ORDER_ARCHIVE_PATH
+        (جدول ماهانه orders_YYYYMM) منتقل میشن.
+        
+        ⚠️ به خاطر مکث بین دسته‌ها blocking است؛ از event loop با asyncio.to_thread صدا بزنید.
+        """
+        batch_size = batch_size or CLEANUP_BATCH_SIZE
+        pause = CLEANUP_BATCH_PAUSE_MS / 1000 if pause is None else pause
+        archive = ORDER_ARCHIVE_ENABLED if archive is None else archive
+        max_lock = CLEANUP_MAX_LOCK_MS / 1000
+        
+        now = get_tehran_now()
+        cutoff_date = now - timedelta(days=days_old)
+        # created_at با CURRENT_TIMESTAMP به UTC ذخیره شده ولی expires_at به وقت تهران
+        params = (cutoff_date.astimezone(pytz.UTC).strftime('%Y-%m-%d %H:%M:%S'),
+                  now.strftime('%Y-%m-%d %H:%M:%S'))
+        
+        started = time.perf_counter()
+        deleted_count = archived_count = batches = 0
+        max_batch_ms = 0.0
+        last_id = 0
+        
+        conn = None
+        try:
+            conn = self._open_maintenance_conn()
+            if archive:
+                conn.execute("ATTACH DATABASE ? AS archive", (ORDER_ARCHIVE_PATH,))
             
-            conn.commit()
-            deleted_count = cursor.rowcount
+            while True:
+                # انتخاب دسته بعدی (فقط خواندن - در WAL نوشتن‌ها رو بلاک نمی‌کنه)
+                rows = conn.execute(f"""
+                    SELECT id, COALESCE(substr(created_at, 1, 7), '0000-00')
+                    FROM orders
+                    WHERE id > ? AND {self._CLEANUP_PREDICATE}
+                    ORDER BY id
+                    LIMIT ?
+                """, (last_id, *params, batch_size)).fetchall()
+                if not rows:
+                    break
+                
+                ids = [row[0] for row in rows]
+                last_id = ids[-1]
+                
+                if archive:
+                    months = {}
+                    for order_id, month in rows:
+                        months.setdefault(month, []).append(order_id)
+                    archived_count += self._archive_orders(conn, months, now.strftime('%Y-%m-%d %H:%M:%S'))
+                
+                # حذف دسته در یک تراکنش کوتاه (شرط دوباره چک میشه چون وضعیت ممکنه عوض شده باشه)
+                placeholders = ','.join('?' * len(ids))
+                lock_start = time.perf_counter()
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    cursor = conn.execute(f"""
+                        DELETE FROM orders
+                        WHERE id IN ({placeholders}) AND {self._CLEANUP_PREDICATE}
+                    """, (*ids, *params))
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+                lock_time = time.perf_counter() - lock_start
+                
+                deleted_count += cursor.rowcount
+                batches += 1
+                max_batch_ms = max(max_batch_ms, lock_time * 1000)
+                
+                if lock_time > max_lock and batch_size > 10:
+                    batch_size //= 2
+                
+                if len(rows) < batch_size:
+                    break
+                time.sleep(pause)
             
-            logger.info(f"🧹 پاکسازی: {deleted_count} سفارش قدیمی حذف شد")
+            logger.info(
+                "🧹 پاکسازی: %d سفارش قدیمی حذف شد (%d آرشیو، %d دسته، بیشترین قفل %.1fms)",
+                deleted_count, archived_count, batches, max_batch_ms
+            )
             
             report = {
                 'deleted_count': deleted_count,
+                'archived_count': archived_count,
+                'batches': batches,
+                'max_batch_ms': round(max_batch_ms, 2),
+                'seconds': round(time.perf_counter() - started, 3),
                 'days_old': days_old,
                 'cutoff_date': cutoff_date.isoformat(),
                 'success': True
             }
             
-            self._invalidate_cache("stats:")
-            
             return report
             
         except Exception as e:
             logger.error(f"❌ خطا در پاکسازی سفارشات: {e}")
             return {
-                'deleted_count': 0,
+                'deleted_count': deleted_count,
+                'archived_count': archived_count,
                 'success': False,
                 'error': str(e)
             }
+        finally:
+            if conn is not None:
+                conn.close()
+            if deleted_count:
+                self._invalidate_cache("stats:")
     
     # ==================== تخفیف ====================
     
@@ -1233,6 +1288,51 @@ class Database:
             logger.error(f"❌ خطا در set_setting({key}): {e}")
             return False
 
+    # ==================== Export Jobs ====================
+
+    EXPORT_JOB_FIELDS = ('status', 'rows_count', 'size_bytes', 'parts', 'error', 'finished_at')
+
+    def create_export_job(self, admin_id: int, export_type: str, fmt: str, filters: dict = None) -> int:
+        """ثبت یک کار export جدید"""
+        with self.transaction() as cursor:
+            cursor.execute("""
+                INSERT INTO export_jobs (admin_id, export_type, format, filters, status, created_at)
+                VALUES (?, ?, ?, ?, 'running', ?)
+            """, (admin_id, export_type, fmt,
+                  json.dumps(filters or {}, ensure_ascii=False), get_tehran_now()))
+            return cursor.lastrowid
+
+    def update_export_job(self, job_id: int, **fields) -> bool:
+        """بروزرسانی وضعیت/حجم یک کار export"""
+        fields = {k: v for k, v in fields.items() if k in self.EXPORT_JOB_FIELDS}
+        if not fields:
+            return False
+
+        try:
+            assignments = ", ".join(f"{k} = ?" for k in fields)
+            with self.transaction() as cursor:
+                cursor.execute(
+                    f"UPDATE export_jobs SET {assignments} WHERE id = ?",
+                    (*fields.values(), job_id)
+                )
+            return True
+        except Exception as e:
+            logger.error(f"❌ خطا در update_export_job({job_id}): {e}")
+            return False
+
+    def get_export_jobs(self, limit: int = 10):
+        """آخرین کارهای export"""
+        conn = self._get_conn()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT id, export_type, format, filters, status, rows_count,
+                   size_bytes, parts, error, created_at, finished_at
+            FROM export_jobs
+            ORDER BY id DESC
+            LIMIT ?
+        """, (limit,))
+        return cursor.fetchall()
+
     # ==================== آمار ====================
     
     def get_statistics(self):
@@ -1290,7 +1390,12 @@ class Database:
     
     @property
     def cursor(self):
-        """برای backward compatibility"""
+        """
+        برای backward compatibility: یک cursor مستقل جدید
+        
+        ⚠️ عمداً cursor مشترک thread نیست: گزارش‌ها row_factory رو روی همین cursor عوض می‌کنن
+        و با fetchmany روش stream می‌کنن؛ یک بار بگیرید و در متغیر نگه دارید
+        """
         return self._get_conn().cursor()
     
     @property  
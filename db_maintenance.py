@@ -0,0 +1,284 @@
+"""
+نگه‌داری خودکار فایل دیتابیس
+✅ auto_vacuum=INCREMENTAL (با migration یک‌باره برای دیتابیس‌های قدیمی)
+✅ incremental_vacuum با بودجه صفحه‌ای کوچک: فضای ردیف‌های حذف‌شده (مثلاً پاکسازی
+   سفارشات) بدون قفل طولانی به سیستم‌عامل برمی‌گرده
+✅ checkpoint تطبیقی WAL: PASSIVE وقتی WAL بزرگ شده و TRUNCATE برای کوچک کردن فایل
+   وقتی همه فریم‌ها منتقل شدن (WAL در حین گزارش‌ها و export های طولانی رشد می‌کنه)
+✅ PRAGMA optimize دوره‌ای (و ANALYZE اولیه) برای آمار query planner
+
+همه کارها در thread جدا و با connection اختصاصی با busy_timeout کوتاه اجرا میشن،
+پس اگه دیتابیس مشغول باشه همون مرحله رد میشه و دور بعد دوباره تلاش میشه.
+"""
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+from config import (
+    DATABASE_NAME, DB_VACUUM_PAGES, DB_VACUUM_MIN_FREE_PAGES, DB_WAL_CHECKPOINT_MB,
+    DB_WAL_TRUNCATE_MB, DB_OPTIMIZE_HOURS, DB_AUTO_VACUUM_MIGRATE_MAX_MB
+)
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+AUTO_VACUUM_MODES = {0: 'none', 1: 'full', 2: 'incremental'}
+
+# حداکثر تعداد مرحله incremental_vacuum در هر دور (هر مرحله = DB_VACUUM_PAGES صفحه)
+MAX_VACUUM_STEPS = 8
+
+# مکث بین مراحل vacuum تا نوشتن‌های ربات قفل بگیرن (ثانیه)
+VACUUM_STEP_PAUSE = 0.05
+
+# busy_timeout connection نگه‌داری (میلی‌ثانیه) - ترجیحاً رد شدن به جای منتظر گذاشتن ربات
+MAINTENANCE_BUSY_TIMEOUT_MS = 50
+
+# سقف صفحات خوانده‌شده در هر ANALYZE (PRAGMA analysis_limit)
+ANALYSIS_LIMIT = 400
+
+
+def _wal_path(db_path: str) -> str:
+    return db_path + '-wal'
+
+
+def wal_size(db_path: str) -> int:
+    """حجم فعلی فایل WAL (بایت)"""
+    try:
+        return os.path.getsize(_wal_path(db_path))
+    except OSError:
+        return 0
+
+
+def get_file_stats(conn: sqlite3.Connection, db_path: str) -> Dict:
+    """WAL، صفحات آزاد و حالت auto_vacuum (فقط PRAGMA های سبک)"""
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    freelist = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+    return {
+        'wal_mb': round(wal_size(db_path) / 1024 / 1024, 2),
+        'freelist_pages': freelist,
+        'freelist_mb': round(freelist * page_size / 1024 / 1024, 2),
+        'auto_vacuum': AUTO_VACUUM_MODES.get(mode, str(mode)),
+    }
+
+
+class DatabaseMaintenance:
+    """
+    زمان‌بند نگه‌داری دیتابیس
+
+    Args:
+        db_path: مسیر فایل دیتابیس
+        vacuum_pages: بودجه هر مرحله incremental_vacuum (صفحه)
+        min_free_pages: vacuum فقط وقتی صفحات آزاد بیشتر از این باشه
+        wal_checkpoint_mb: از این حجم WAL به بالا checkpoint PASSIVE
+        wal_truncate_mb: از این حجم WAL به بالا (بعد از checkpoint کامل) TRUNCATE
+        optimize_hours: فاصله PRAGMA optimize
+    """
+
+    def __init__(self, db_path: str, vacuum_pages: int = 256, min_free_pages: int = 64,
+                 wal_checkpoint_mb: float = 16, wal_truncate_mb: float = 64,
+                 optimize_hours: float = 6):
+        self.db_path = db_path
+        self.vacuum_pages = vacuum_pages
+        self.min_free_pages = min_free_pages
+        self.wal_checkpoint_bytes = wal_checkpoint_mb * 1024 * 1024
+        self.wal_truncate_bytes = wal_truncate_mb * 1024 * 1024
+        self.optimize_interval = optimize_hours * 3600
+
+        self.last_optimize = 0.0
+        self.last_run: Optional[str] = None
+        self.last_report: Dict = {}
+        self.totals = {'vacuumed_pages': 0, 'checkpoints': 0, 'truncates': 0,
+                       'checkpoint_blocked': 0, 'optimizes': 0, 'skipped_busy': 0}
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=MAINTENANCE_BUSY_TIMEOUT_MS / 1000,
+                               isolation_level=None)
+        conn.execute(f"PRAGMA busy_timeout = {MAINTENANCE_BUSY_TIMEOUT_MS}")
+        return conn
+
+    # ==================== auto_vacuum ====================
+
+    def ensure_incremental_auto_vacuum(self, max_mb: Optional[float] = None) -> str:
+        """
+        Migration یک‌باره: تبدیل auto_vacuum به INCREMENTAL
+
+        تغییر از NONE فقط با VACUUM کامل اعمال میشه (بازنویسی کل فایل و قفل انحصاری)،
+        پس فقط هنگام راه‌اندازی و برای دیتابیس‌های کوچک‌تر از max_mb انجام میشه؛
+        دیتابیس‌های بزرگ‌تر با migrate_database.py (با ربات خاموش) تبدیل میشن.
+
+        Returns:
+            حالت auto_vacuum بعد از اجرا
+        """
+        max_mb = DB_AUTO_VACUUM_MIGRATE_MAX_MB if max_mb is None else max_mb
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            mode = AUTO_VACUUM_MODES.get(conn.execute("PRAGMA auto_vacuum").fetchone()[0])
+            if mode == 'incremental':
+                return mode
+
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            if mode == 'full':
+                # بین FULL و INCREMENTAL بدون VACUUM قابل تغییره
+                return AUTO_VACUUM_MODES.get(conn.execute("PRAGMA auto_vacuum").fetchone()[0])
+
+            size_mb = os.path.getsize(self.db_path) / 1024 / 1024
+            if size_mb > max_mb:
+                logger.warning(
+                    "⚠️ auto_vacuum=NONE و حجم دیتابیس %.0f MB - برای فعال‌سازی "
+                    "incremental vacuum با ربات خاموش migrate_database.py را اجرا کنید", size_mb
+                )
+                return mode
+
+            start = time.perf_counter()
+            conn.execute("VACUUM")
+            mode = AUTO_VACUUM_MODES.get(conn.execute("PRAGMA auto_vacuum").fetchone()[0])
+            logger.info("✅ auto_vacuum=%s (VACUUM %.0f MB در %.1fs)",
+                        mode, size_mb, time.perf_counter() - start)
+            return mode
+        finally:
+            conn.close()
+
+    def incremental_vacuum(self, conn: sqlite3.Connection) -> int:
+        """
+        برگردوندن صفحات آزاد به سیستم‌عامل در مراحل کوچک
+
+        Returns:
+            تعداد صفحات آزادشده
+        """
+        if AUTO_VACUUM_MODES.get(conn.execute("PRAGMA auto_vacuum").fetchone()[0]) != 'incremental':
+            return 0
+
+        freed = 0
+        for step in range(MAX_VACUUM_STEPS):
+            free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if free < (self.min_free_pages if step == 0 else 1):
+                break
+            # ⚠️ incremental_vacuum هر صفحه رو در یک step آزاد می‌کنه و execute فقط یک step
+            # اجرا می‌کنه (بدون ردیف خروجی)؛ executescript تا آخر اجرا می‌کنه
+            conn.executescript(f"PRAGMA incremental_vacuum({self.vacuum_pages})")
+            freed += free - conn.execute("PRAGMA freelist_count").fetchone()[0]
+            time.sleep(VACUUM_STEP_PAUSE)
+        return freed
+
+    # ==================== WAL ====================
+
+    def checkpoint(self, conn: sqlite3.Connection) -> Optional[Dict]:
+        """
+        checkpoint تطبیقی بر اساس حجم WAL
+
+        Returns:
+            نتیجه (mode, busy, log, checkpointed) یا None اگه WAL کوچیکه
+        """
+        size = wal_size(self.db_path)
+        if size < self.wal_checkpoint_bytes:
+            return None
+
+        busy, log, done = conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+        result = {'mode': 'passive', 'busy': busy, 'log': log, 'checkpointed': done,
+                  'wal_mb_before': round(size / 1024 / 1024, 2)}
+        self.totals['checkpoints'] += 1
+
+        if log >= 0 and done < log:
+            # یک خواننده طولانی (گزارش / export) جلوی انتقال فریم‌ها رو گرفته
+            self.totals['checkpoint_blocked'] += 1
+            logger.warning("⚠️ WAL checkpoint ناقص (%d/%d فریم) - خواننده طولانی فعال است", done, log)
+        elif size >= self.wal_truncate_bytes:
+            # همه فریم‌ها منتقل شدن: کوچک کردن فایل WAL (اگه مشغول باشه رد میشه)
+            busy, log, done = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+            if not busy:
+                result['mode'] = 'truncate'
+                self.totals['truncates'] += 1
+
+        result['wal_mb_after'] = round(wal_size(self.db_path) / 1024 / 1024, 2)
+        return result
+
+    # ==================== ANALYZE ====================
+
+    def optimize(self, conn: sqlite3.Connection, force: bool = False) -> bool:
+        """PRAGMA optimize (و ANALYZE محدود اگه هنوز آماری نیست)"""
+        if not force and time.time() - self.last_optimize < self.optimize_interval:
+            return False
+
+        conn.execute(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+        has_stats = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'"
+        ).fetchone()
+        if not has_stats:
+            conn.execute("ANALYZE")
+        conn.execute("PRAGMA optimize").fetchall()
+
+        self.last_optimize = time.time()
+        self.totals['optimizes'] += 1
+        return True
+
+    # ==================== دور نگه‌داری ====================
+
+    def run_cycle(self) -> Dict:
+        """یک دور کامل نگه‌داری (blocking - در thread جدا اجرا میشه)"""
+        start = time.perf_counter()
+        report: Dict = {}
+        conn = self._connect()
+        try:
+            for name, step in (('checkpoint', self.checkpoint),
+                               ('vacuumed_pages', self.incremental_vacuum),
+                               ('optimized', self.optimize)):
+                try:
+                    report[name] = step(conn)
+                except sqlite3.OperationalError as e:
+                    # دیتابیس مشغوله: این مرحله دور بعد
+                    self.totals['skipped_busy'] += 1
+                    report[name] = None
+                    logger.debug("maintenance step %s skipped: %s", name, e)
+
+            self.totals['vacuumed_pages'] += report.get('vacuumed_pages') or 0
+            report.update(get_file_stats(conn, self.db_path))
+        finally:
+            conn.close()
+
+        report['seconds'] = round(time.perf_counter() - start, 3)
+        self.last_run = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self.last_report = report
+
+        if report.get('vacuumed_pages') or (report.get('checkpoint') or {}).get('mode') == 'truncate':
+            logger.info("🧹 نگه‌داری دیتابیس: %d صفحه آزاد شد، WAL %.1f MB",
+                        report.get('vacuumed_pages') or 0, report['wal_mb'])
+        return report
+
+    def get_stats(self) -> Dict:
+        """وضعیت نگه‌داری برای Health Check و داشبورد"""
+        return {
+            'last_run': self.last_run,
+            'last_optimize': (datetime.fromtimestamp(self.last_optimize).strftime('%Y-%m-%d %H:%M:%S')
+                              if self.last_optimize else None),
+            **self.totals,
+        }
+
+
+# ==================== نمونه سراسری ====================
+
+db_maintenance = DatabaseMaintenance(
+    DATABASE_NAME,
+    vacuum_pages=DB_VACUUM_PAGES,
+    min_free_pages=DB_VACUUM_MIN_FREE_PAGES,
+    wal_checkpoint_mb=DB_WAL_CHECKPOINT_MB,
+    wal_truncate_mb=DB_WAL_TRUNCATE_MB,
+    optimize_hours=DB_OPTIMIZE_HOURS,
+)
+
+registry.gauge('bot_db_wal_bytes', 'Size of the SQLite WAL file').set_function(
+    lambda: wal_size(db_maintenance.db_path))
+registry.gauge('bot_db_freelist_pages', 'Free pages at the last maintenance run').set_function(
+    lambda: db_maintenance.last_report.get('freelist_pages', 0))
+
+
+async def scheduled_maintenance(context):
+    """Job دوره‌ای نگه‌داری دیتابیس (در thread جدا)"""
+    try:
+        await asyncio.to_thread(db_maintenance.run_cycle)
+    except Exception as e:
+        logger.error(f"❌ خطا در نگه‌داری دیتابیس: {e}")
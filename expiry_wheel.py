@@ -0,0 +1,226 @@
+"""
+Timing Wheel برای انقضای تدریجی وضعیت‌های درون‌حافظه‌ای
+✅ یک چرخ مشترک برای RateLimiter، CacheManager و alert ها
+✅ هر tick فقط bucket های سررسیدشده پردازش میشن (O(1) سرشکن، بدون اسکن کامل)
+✅ بودجه کار در هر tick تا event loop بلاک نشه
+✅ backlog (موارد سررسید پردازش‌نشده) برای آمار سلامت
+
+زمان‌بندی مجدد lazy است: اگه مهلت یک کلید عقب بره فقط در dict ثبت میشه و
+وقتی bucket قبلی‌اش سررسید شد، به bucket جدید منتقل میشه؛ پس هر درخواست
+فقط یک بروزرسانی dict هزینه داره.
+"""
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class ExpiryRegistry:
+    """
+    یک فضای نام در چرخ (مثلاً 'cache' یا 'rate_limiter')
+    on_expire(key) بعد از رسیدن مهلت کلید، خارج از قفل چرخ صدا زده میشه
+    """
+    __slots__ = ('wheel', 'name', 'on_expire', 'deadlines', 'expired')
+
+    def __init__(self, wheel: 'TimingWheel', name: str, on_expire: Callable[[Hashable], Any]):
+        self.wheel = wheel
+        self.name = name
+        self.on_expire = on_expire
+        self.deadlines: Dict[Hashable, float] = {}
+        self.expired = 0
+
+    def schedule(self, key: Hashable, deadline: float, extend_only: bool = False):
+        """
+        تنظیم مهلت انقضای کلید
+
+        Args:
+            key: کلید
+            deadline: زمان انقضا (epoch)
+            extend_only: فقط اگه مهلت جدید دیرتر باشه اعمال بشه
+        """
+        self.wheel._schedule(self, key, deadline, extend_only)
+
+    def cancel(self, key: Hashable):
+        """لغو انقضای کلید (ورودی bucket بعداً نادیده گرفته میشه)"""
+        self.deadlines.pop(key, None)
+
+    def clear(self):
+        """لغو همه کلیدها"""
+        self.deadlines.clear()
+
+    def __len__(self):
+        return len(self.deadlines)
+
+
+class TimingWheel:
+    """
+    Hashed Timing Wheel با slots خانه و دقت tick ثانیه
+
+    مهلت‌های دورتر از افق چرخ (slots * tick) در دور اول بررسی و دوباره
+    در bucket درست قرار می‌گیرن.
+    """
+
+    def __init__(self, tick: float = 1.0, slots: int = 4096):
+        self.tick = tick
+        self.slots = slots
+
+        # هر bucket: {registry: set(keys)} یا None
+        self._buckets: List[Optional[Dict[ExpiryRegistry, Set[Hashable]]]] = [None] * slots
+        self._registries: List[ExpiryRegistry] = []
+        self._cursor = int(time.time() // tick)  # اولین tick پردازش‌نشده
+        self._lock = threading.RLock()
+
+        self.expired_total = 0
+        self.last_advance_ms = 0.0
+        self.last_advance_items = 0
+
+    def registry(self, name: str, on_expire: Callable[[Hashable], Any]) -> ExpiryRegistry:
+        """ساخت یک فضای نام جدید در چرخ"""
+        reg = ExpiryRegistry(self, name, on_expire)
+        with self._lock:
+            self._registries.append(reg)
+        return reg
+
+    def _bucket_for(self, tick_no: int) -> Dict[ExpiryRegistry, Set[Hashable]]:
+        idx = tick_no % self.slots
+        bucket = self._buckets[idx]
+        if bucket is None:
+            bucket = self._buckets[idx] = {}
+        return bucket
+
+    def _add(self, reg: ExpiryRegistry, key: Hashable, deadline: float, min_tick: int):
+        tick_no = max(int(deadline // self.tick), min_tick)
+        bucket = self._bucket_for(tick_no)
+        keys = bucket.get(reg)
+        if keys is None:
+            keys = bucket[reg] = set()
+        keys.add(key)
+
+    def _schedule(self, reg: ExpiryRegistry, key: Hashable, deadline: float, extend_only: bool):
+        with self._lock:
+            current = reg.deadlines.get(key)
+            if current is not None:
+                if deadline == current or (extend_only and deadline < current):
+                    return
+                reg.deadlines[key] = deadline
+                # مهلت دیرتر: ورودی فعلی زودتر سررسید میشه و همون موقع جابجا میشه
+                if deadline > current:
+                    return
+            else:
+                reg.deadlines[key] = deadline
+
+            self._add(reg, key, deadline, self._cursor)
+
+    def advance(self, now: Optional[float] = None, budget: int = 10000) -> int:
+        """
+        پردازش bucket های سررسیدشده تا زمان now
+
+        Args:
+            now: زمان فعلی (پیش‌فرض time.time())
+            budget: حداکثر تعداد ورودی در این فراخوانی؛ باقی‌مانده در backlog
+                    می‌مونه و در tick بعدی پردازش میشه
+
+        Returns:
+            int: تعداد کلیدهای منقضی‌شده
+        """
+        start = time.perf_counter()
+        now = time.time() if now is None else now
+        target = int(now // self.tick)
+        expired: List[Tuple[ExpiryRegistry, Hashable]] = []
+        processed = 0
+
+        with self._lock:
+            while self._cursor <= target and processed < budget:
+                idx = self._cursor % self.slots
+                bucket = self._buckets[idx]
+
+                if bucket:
+                    # جدا کردن bucket تا ورودی‌های جابجاشده به همین خانه (دور بعد) پاک نشن
+                    self._buckets[idx] = None
+
+                    for reg in list(bucket):
+                        keys = bucket[reg]
+                        while keys and processed < budget:
+                            key = keys.pop()
+                            processed += 1
+
+                            deadline = reg.deadlines.get(key)
+                            if deadline is None:
+                                continue  # لغو شده
+                            if deadline > now:
+                                # هنوز وقتش نشده (مهلت تمدید شده یا دورتر از افق چرخ)
+                                self._add(reg, key, deadline, self._cursor + 1)
+                                continue
+
+                            del reg.deadlines[key]
+                            expired.append((reg, key))
+
+                        if not keys:
+                            del bucket[reg]
+
+                    if bucket:
+                        # بودجه تموم شد؛ باقی‌مانده برمی‌گرده و در فراخوانی بعدی ادامه پیدا می‌کنه
+                        slot = self._bucket_for(self._cursor)
+                        for reg, keys in bucket.items():
+                            slot.setdefault(reg, set()).update(keys)
+                        break
+
+                self._cursor += 1
+
+        for reg, key in expired:
+            reg.expired += 1
+            try:
+                reg.on_expire(key)
+            except Exception as e:
+                logger.error(f"❌ Expiry callback failed ({reg.name}): {e}")
+
+        self.expired_total += len(expired)
+        self.last_advance_items = processed
+        self.last_advance_ms = (time.perf_counter() - start) * 1000
+        return len(expired)
+
+    def backlog(self, now: Optional[float] = None) -> int:
+        """تعداد ورودی‌های سررسیدشده‌ای که هنوز پردازش نشدن"""
+        now = time.time() if now is None else now
+        target = int(now // self.tick)
+
+        with self._lock:
+            lag = min(target - self._cursor + 1, self.slots)
+            total = 0
+            for offset in range(max(lag, 0)):
+                bucket = self._buckets[(self._cursor + offset) % self.slots]
+                if bucket:
+                    total += sum(len(keys) for keys in bucket.values())
+            return total
+
+    def get_stats(self) -> Dict:
+        """آمار چرخ برای Health Check و مانیتورینگ"""
+        now = time.time()
+        registries: Dict[str, int] = {}
+        for reg in self._registries:
+            registries[reg.name] = registries.get(reg.name, 0) + len(reg)
+
+        return {
+            'pending': sum(registries.values()),
+            'backlog': self.backlog(now),
+            'lag_ticks': max(int(now // self.tick) - self._cursor + 1, 0),
+            'expired_total': self.expired_total,
+            'last_advance_ms': round(self.last_advance_ms, 2),
+            'last_advance_items': self.last_advance_items,
+            'registries': registries,
+        }
+
+
+# ==================== Timing Wheel سراسری ====================
+
+expiry_wheel = TimingWheel()
+
+# حداکثر ورودی پردازش‌شده در هر tick
+EXPIRY_TICK_BUDGET = 5000
+
+
+async def expiry_tick(context):
+    """Job هر ثانیه: پیشروی چرخ با بودجه محدود"""
+    expiry_wheel.advance(budget=EXPIRY_TICK_BUDGET)
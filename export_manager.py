@@ -2,29 +2,73 @@
 ✅ FEATURE #4: Export Manager (نسخه Fix شده)
 دانلود گزارشات به صورت Excel/CSV
 """
+import asyncio
+import csv
+import gzip
+import itertools
 import logging
 import os
 import tempfile
+import time
 from datetime import datetime, timedelta
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-from openpyxl.utils import get_column_letter
+from functools import partial
 import json
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 from config import ADMIN_ID
+from database import get_tehran_now
 
 logger = logging.getLogger(__name__)
 
+# ✅ openpyxl (و NumPy که خودش لود می‌کنه) فقط موقع ساخت فایل Excel import میشه، نه راه‌اندازی ربات
+
+# اندازه هر دسته fetchmany در export جریانی
+EXPORT_CHUNK_SIZE = 1000
+# تعداد ردیف‌های نمونه برای محاسبه عرض ستون‌ها
+WIDTH_SAMPLE_ROWS = 200
+# حداقل فاصله بین پیام‌های پیشرفت (ثانیه)
+PROGRESS_INTERVAL = 3
+# بازه‌های بلندتر از این (روز) به فایل‌های ماهانه تقسیم میشن
+PARTITION_THRESHOLD_DAYS = 31
+
+# فرمت‌های خروجی -> پسوند فایل
+EXPORT_FORMATS = {
+    'xlsx': '.xlsx',
+    'csv': '.csv',
+    'csv.gz': '.csv.gz',
+}
+
+# فیلترهای بازه زمانی منوی export (روز؛ None = همه)
+EXPORT_RANGES = {
+    '7': ("7 روز", 7),
+    '30': ("30 روز", 30),
+    '90': ("90 روز", 90),
+    '365': ("1 سال", 365),
+    'all': ("همه", None),
+}
+
+# فیلترهای وضعیت سفارش
+EXPORT_STATUS_FILTERS = {
+    'all': ("همه", None),
+    'confirmed': ("تایید شده", ('confirmed', 'payment_confirmed')),
+    'pending': ("در انتظار", ('pending', 'waiting_payment', 'receipt_sent')),
+    'rejected': ("رد/منقضی", ('rejected', 'expired')),
+}
+
+DEFAULT_EXPORT_OPTIONS = {'range': '30', 'status': 'all', 'format': 'xlsx'}
+
 
 class ExportManager:
     """مدیریت export گزارشات"""
     
     def __init__(self, db):
         self.db = db
+        self.last_export_rows = 0  # تعداد ردیف‌های آخرین export
     
     def _style_header(self, ws):
         """استایل دادن به header"""
+        from openpyxl.styles import Font, PatternFill, Alignment
+        
         header_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
         header_font = Font(bold=True, color="FFFFFF", size=12)
         
@@ -35,6 +79,8 @@ class ExportManager:
     
     def _auto_width(self, ws):
         """تنظیم خودکار عرض ستون‌ها"""
+        from openpyxl.utils import get_column_letter
+        
         for column in ws.columns:
             max_length = 0
             column_letter = get_column_letter(column[0].column)
@@ -49,50 +95,229 @@ class ExportManager:
             adjusted_width = min(max_length + 2, 50)
             ws.column_dimensions[column_letter].width = adjusted_width
     
-    def export_orders(self, start_date=None, end_date=None, status=None):
+    # ==================== Streaming Export ====================
+    
+    def _header_cells(self, ws, headers):
+        """سلول‌های header با استایل (در حالت write_only باید قبل از append ساخته بشن)"""
+        from openpyxl.cell import WriteOnlyCell
+        from openpyxl.styles import Font, PatternFill, Alignment
+        
+        header_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
+        header_font = Font(bold=True, color="FFFFFF", size=12)
+        alignment = Alignment(horizontal='center', vertical='center')
+        
+        cells = []
+        for header in headers:
+            cell = WriteOnlyCell(ws, value=header)
+            cell.fill = header_fill
+            cell.font = header_font
+            cell.alignment = alignment
+            cells.append(cell)
+        return cells
+    
+    def _sample_widths(self, ws, headers, sample_rows):
+        """
+        عرض ستون‌ها از روی header و چند ردیف اول
+        (به جای _auto_width که روی تک‌تک سلول‌ها راه میره)
+        """
+        from openpyxl.utils import get_column_letter
+        
+        widths = [len(str(h)) for h in headers]
+        for row in sample_rows:
+            for i, value in enumerate(row[:len(widths)]):
+                widths[i] = max(widths[i], len(str(value)))
+        
+        for i, width in enumerate(widths, 1):
+            ws.column_dimensions[get_column_letter(i)].width = min(width + 2, 50)
+    
+    def _format_rows(self, rows, format_row, kind):
+        """فرمت امن ردیف‌ها؛ ردیف خراب لاگ و رد میشه"""
+        formatted = []
+        for row in rows:
+            try:
+                formatted.append(format_row(row))
+            except Exception as e:
+                logger.error(f"Error processing {kind} row: {e}")
+        return formatted
+    
+    def _iter_chunks(self, cursor, format_row, kind, total, progress_callback):
+        """خواندن دسته‌ای ردیف‌ها با fetchmany و گزارش پیشرفت"""
+        written = 0
+        while True:
+            rows = cursor.fetchmany(EXPORT_CHUNK_SIZE)
+            if not rows:
+                break
+            
+            chunk = self._format_rows(rows, format_row, kind)
+            yield chunk
+            
+            written += len(chunk)
+            if progress_callback:
+                progress_callback(written, total)
+    
+    def _write_xlsx(self, filepath, sheet_title, headers, chunks):
+        """نوشتن Excel با Workbook(write_only=True)"""
+        from openpyxl import Workbook
+        
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet(title=sheet_title)
+        
+        written = 0
+        first = next(chunks, [])
+        
+        # عرض ستون‌ها باید قبل از نوشتن اولین ردیف تنظیم بشه
+        self._sample_widths(ws, headers, first[:WIDTH_SAMPLE_ROWS])
+        ws.append(self._header_cells(ws, headers))
+        
+        for chunk in itertools.chain([first], chunks):
+            for row in chunk:
+                ws.append(row)
+            written += len(chunk)
+        
+        wb.save(filepath)
+        return written
+    
+    def _write_csv(self, filepath, headers, chunks, compress=False):
+        """
+        نوشتن CSV (اختیاری gzip)
+        utf-8-sig تا Excel متن فارسی رو درست نشون بده
+        """
+        opener = gzip.open if compress else open
+        
+        written = 0
+        with opener(filepath, 'wt', encoding='utf-8-sig', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(headers)
+            for chunk in chunks:
+                writer.writerows(chunk)
+                written += len(chunk)
+        
+        return written
+    
+    def _stream_export(self, kind, sheet_title, headers, query, params, format_row,
+                       count_query=None, progress_callback=None, fmt='xlsx', file_label=None):
+        """
+        ✅ Export جریانی: fetchmany + نوشتن دسته‌ای (xlsx / csv / csv.gz)
+        مصرف حافظه به تعداد ردیف‌ها بستگی نداره
+        
+        Args:
+            kind: نام نوع export (برای نام فایل و لاگ)
+            sheet_title: عنوان شیت
+            headers: عناوین ستون‌ها
+            query / params: کوئری داده‌ها
+            format_row: تابع تبدیل هر ردیف دیتابیس به لیست مقادیر
+            count_query: کوئری شمارش برای نمایش پیشرفت (اختیاری)
+            progress_callback: تابع (done, total) برای گزارش پیشرفت
+            fmt: یکی از EXPORT_FORMATS
+            file_label: برچسب اضافه در نام فایل (مثلاً ماه پارتیشن)
+        
+        Returns:
+            tuple: (مسیر فایل، تعداد ردیف‌ها)
+        """
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"فرمت نامعتبر: {fmt}")
+        
+        conn = self.db._get_conn()
+        cursor = conn.cursor()
+        
+        total = None
+        if count_query:
+            cursor.execute(count_query, params)
+            total = cursor.fetchone()[0]
+        
+        cursor.execute(query, params)
+        chunks = self._iter_chunks(cursor, format_row, kind, total, progress_callback)
+        
+        # ✅ ذخیره در temp directory
+        temp_dir = tempfile.gettempdir()
+        label = f"_{file_label}" if file_label else ""
+        filename = f"{kind}_export{label}_{datetime.now().strftime('%Y%m%d_%H%M%S')}{EXPORT_FORMATS[fmt]}"
+        filepath = os.path.join(temp_dir, filename)
+        
+        if fmt == 'xlsx':
+            written = self._write_xlsx(filepath, sheet_title, headers, chunks)
+        else:
+            written = self._write_csv(filepath, headers, chunks, compress=(fmt == 'csv.gz'))
+        
+        self.last_export_rows = written
+        logger.info(f"✅ Exported {written} {kind} to {filename}")
+        return filepath, written
+    
+    @staticmethod
+    def _format_date(value, fmt):
+        """فرمت تاریخ متنی دیتابیس"""
+        if value and isinstance(value, str):
+            try:
+                dt = datetime.fromisoformat(value.replace('Z', '+00:00'))
+                return dt.strftime(fmt)
+            except ValueError:
+                pass
+        return value
+    
+    @staticmethod
+    def _format_items(value):
+        """تبدیل items (JSON) به متن خوانا"""
+        try:
+            items = json.loads(value)
+            return ", ".join([f"{item.get('product', '?')} ({item.get('quantity', '?')})" for item in items])
+        except (TypeError, ValueError):
+            return value
+    
+    @staticmethod
+    def _orders_where(start_date=None, end_date=None, status=None):
         """
-        Export سفارشات به Excel
+        شرط WHERE فیلترهای سفارش
+        
+        مرزها فقط تاریخ (YYYY-MM-DD) هستن تا با هر دو قالب ذخیره created_at
+        ('T' یا فاصله، با/بدون timezone) درست مقایسه بشن؛ end_date انحصاری است.
+        """
+        where = " WHERE 1=1"
+        params = []
+        
+        if start_date:
+            where += " AND created_at >= ?"
+            params.append(start_date.strftime('%Y-%m-%d'))
+        
+        if end_date:
+            where += " AND created_at < ?"
+            params.append(end_date.strftime('%Y-%m-%d'))
+        
+        if status:
+            statuses = (status,) if isinstance(status, str) else tuple(status)
+            where += f" AND status IN ({','.join('?' * len(statuses))})"
+            params.extend(statuses)
+        
+        return where, params
+    
+    def first_order_date(self):
+        """تاریخ اولین سفارش (برای بازه «همه»)"""
+        cursor = self.db._get_conn().cursor()
+        cursor.execute("SELECT MIN(created_at) FROM orders")
+        value = cursor.fetchone()[0]
+        if not value:
+            return None
+        return datetime.strptime(str(value)[:10], '%Y-%m-%d')
+    
+    def export_orders(self, start_date=None, end_date=None, status=None,
+                      progress_callback=None, fmt='xlsx', file_label=None):
+        """
+        Export سفارشات
         
         Args:
             start_date: تاریخ شروع (datetime)
-            end_date: تاریخ پایان (datetime)
-            status: فیلتر وضعیت (str)
+            end_date: تاریخ پایان - انحصاری (datetime)
+            status: فیلتر وضعیت (str یا tuple)
+            progress_callback: تابع (done, total) برای گزارش پیشرفت
+            fmt: 'xlsx'، 'csv' یا 'csv.gz'
+            file_label: برچسب اضافه در نام فایل
         
         Returns:
             str: مسیر فایل ایجاد شده
         """
         try:
-            # دریافت سفارشات
-            conn = self.db._get_conn()
-            cursor = conn.cursor()
-            
-            # ✅ Query ساده بدون JOIN
-            query = "SELECT * FROM orders WHERE 1=1"
-            params = []
-            
-            if start_date:
-                query += " AND created_at >= ?"
-                params.append(start_date.isoformat())
-            
-            if end_date:
-                query += " AND created_at <= ?"
-                params.append(end_date.isoformat())
+            # ✅ Query ساده بدون JOIN (ستون‌ها صریح، هم‌ترتیب با header)
+            where, params = self._orders_where(start_date, end_date, status)
             
-            if status:
-                query += " AND status = ?"
-                params.append(status)
-            
-            query += " ORDER BY created_at DESC"
-            
-            cursor.execute(query, params)
-            orders = cursor.fetchall()
-            
-            # ساخت Workbook
-            wb = Workbook()
-            ws = wb.active
-            ws.title = "سفارشات"
-            
-            # Header
             headers = [
                 "شماره سفارش",
                 "کاربر ID",
@@ -105,176 +330,78 @@ class ExportManager:
                 "نحوه ارسال",
                 "تاریخ ثبت"
             ]
-            ws.append(headers)
-            
-            # داده‌ها
-            for order in orders:
-                try:
-                    # خواندن ستون‌ها به صورت امن
-                    row_data = []
-                    for i, header in enumerate(headers):
-                        try:
-                            value = order[i] if i < len(order) else "-"
-                            
-                            # فرمت کردن تاریخ
-                            if i == len(headers) - 1 and value and value != "-":  # ستون تاریخ
-                                try:
-                                    if isinstance(value, str):
-                                        dt = datetime.fromisoformat(value.replace('Z', '+00:00'))
-                                        value = dt.strftime('%Y-%m-%d %H:%M')
-                                except:
-                                    pass
-                            
-                            # فرمت کردن items (JSON)
-                            if i == 2 and value and value != "-":  # ستون محصولات
-                                try:
-                                    items = json.loads(value)
-                                    value = ", ".join([f"{item.get('product', '?')} ({item.get('quantity', '?')})" for item in items])
-                                except:
-                                    pass
-                            
-                            row_data.append(value if value is not None else "-")
-                        except:
-                            row_data.append("-")
-                    
-                    ws.append(row_data)
-                except Exception as e:
-                    logger.error(f"Error processing order row: {e}")
-                    continue
-            
-            # استایل
-            self._style_header(ws)
-            self._auto_width(ws)
             
-            # ✅ ذخیره در temp directory
-            temp_dir = tempfile.gettempdir()
-            filename = f"orders_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-            filepath = os.path.join(temp_dir, filename)
-            
-            wb.save(filepath)
-            
-            logger.info(f"✅ Exported {len(orders)} orders to {filename}")
+            def format_row(order):
+                row = [value if value is not None else "-" for value in order]
+                if order[2]:
+                    row[2] = self._format_items(order[2])
+                row[9] = self._format_date(row[9], '%Y-%m-%d %H:%M')
+                return row
+            
+            filepath, _ = self._stream_export(
+                "orders", "سفارشات", headers,
+                """
+                    SELECT id, user_id, items, total_price, discount_amount, final_price,
+                           discount_code, status, shipping_method, created_at
+                    FROM orders
+                """ + where + " ORDER BY created_at DESC",
+                params, format_row,
+                count_query="SELECT COUNT(*) FROM orders" + where,
+                progress_callback=progress_callback,
+                fmt=fmt, file_label=file_label
+            )
             return filepath
         
         except Exception as e:
             logger.error(f"❌ Error exporting orders: {e}", exc_info=True)
             raise
     
-    def export_products(self):
-        """Export محصولات به Excel"""
+    def export_products(self, progress_callback=None, fmt='xlsx'):
+        """Export محصولات"""
         try:
-            conn = self.db._get_conn()
-            cursor = conn.cursor()
-            
-            # ✅ Query ساده
-            cursor.execute("SELECT * FROM products ORDER BY created_at DESC")
-            products = cursor.fetchall()
-            
-            # ساخت Workbook
-            wb = Workbook()
-            ws = wb.active
-            ws.title = "محصولات"
-            
-            # Header
             headers = ["ID", "نام محصول", "توضیحات", "تاریخ ایجاد"]
-            ws.append(headers)
-            
-            # داده‌ها
-            for product in products:
-                try:
-                    row_data = []
-                    for i in range(min(4, len(product))):
-                        value = product[i]
-                        
-                        # فرمت تاریخ
-                        if i == 3 and value:
-                            try:
-                                if isinstance(value, str):
-                                    dt = datetime.fromisoformat(value.replace('Z', '+00:00'))
-                                    value = dt.strftime('%Y-%m-%d')
-                            except:
-                                pass
-                        
-                        row_data.append(value if value is not None else "-")
-                    
-                    ws.append(row_data)
-                except Exception as e:
-                    logger.error(f"Error processing product row: {e}")
-                    continue
-            
-            # استایل
-            self._style_header(ws)
-            self._auto_width(ws)
-            
-            # ✅ ذخیره در temp
-            temp_dir = tempfile.gettempdir()
-            filename = f"products_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-            filepath = os.path.join(temp_dir, filename)
-            
-            wb.save(filepath)
             
-            logger.info(f"✅ Exported {len(products)} products to {filename}")
+            def format_row(product):
+                row = [value if value is not None else "-" for value in product]
+                row[3] = self._format_date(row[3], '%Y-%m-%d')
+                return row
+            
+            filepath, _ = self._stream_export(
+                "products", "محصولات", headers,
+                "SELECT id, name, description, created_at FROM products ORDER BY created_at DESC",
+                (), format_row,
+                count_query="SELECT COUNT(*) FROM products",
+                progress_callback=progress_callback,
+                fmt=fmt
+            )
             return filepath
         
         except Exception as e:
             logger.error(f"❌ Error exporting products: {e}", exc_info=True)
             raise
     
-    def export_users(self):
-        """Export کاربران به Excel"""
+    def export_users(self, progress_callback=None, fmt='xlsx'):
+        """Export کاربران"""
         try:
-            conn = self.db._get_conn()
-            cursor = conn.cursor()
-            
-            # ✅ Query ساده بدون JOIN
-            # FIX: ستون created_at است نه joined_at
-            cursor.execute("SELECT * FROM users ORDER BY created_at DESC")
-            users = cursor.fetchall()
-            
-            # ساخت Workbook
-            wb = Workbook()
-            ws = wb.active
-            ws.title = "کاربران"
-            
-            # Header
             headers = ["User ID", "Username", "نام", "موبایل", "تاریخ عضویت"]
-            ws.append(headers)
             
-            # داده‌ها
-            for user in users:
-                try:
-                    row_data = []
-                    for i in range(min(5, len(user))):
-                        value = user[i]
-                        
-                        # فرمت تاریخ
-                        if i == 4 and value:
-                            try:
-                                if isinstance(value, str):
-                                    dt = datetime.fromisoformat(value.replace('Z', '+00:00'))
-                                    value = dt.strftime('%Y-%m-%d')
-                            except:
-                                pass
-                        
-                        row_data.append(value if value is not None else "-")
-                    
-                    ws.append(row_data)
-                except Exception as e:
-                    logger.error(f"Error processing user row: {e}")
-                    continue
-            
-            # استایل
-            self._style_header(ws)
-            self._auto_width(ws)
+            def format_row(user):
+                row = [value if value is not None else "-" for value in user]
+                row[4] = self._format_date(row[4], '%Y-%m-%d')
+                return row
             
-            # ✅ ذخیره در temp
-            temp_dir = tempfile.gettempdir()
-            filename = f"users_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-            filepath = os.path.join(temp_dir, filename)
-            
-            wb.save(filepath)
-            
-            logger.info(f"✅ Exported {len(users)} users to {filename}")
+            # FIX: ستون created_at است نه joined_at
+            filepath, _ = self._stream_export(
+                "users", "کاربران", headers,
+                """
+                    SELECT user_id, username, COALESCE(full_name, first_name), phone, created_at
+                    FROM users ORDER BY created_at DESC
+                """,
+                (), format_row,
+                count_query="SELECT COUNT(*) FROM users",
+                progress_callback=progress_callback,
+                fmt=fmt
+            )
             return filepath
         
         except Exception as e:
@@ -317,8 +444,11 @@ class ExportManager:
             """, (start_date.isoformat(),))
             
             stats = cursor.fetchone()
+            # ✅ rows_count در export_jobs = تعداد سفارش‌های گزارش
+            self.last_export_rows = stats[0] or 0
             
             # ساخت Workbook
+            from openpyxl import Workbook
             wb = Workbook()
             ws = wb.active
             ws.title = "خلاصه"
@@ -349,31 +479,196 @@ class ExportManager:
             raise
 
 
+def month_partitions(start_date, end_date):
+    """
+    تقسیم بازه [start_date, end_date) به ماه‌های تقویمی
+    
+    Returns:
+        list: [(برچسب 'YYYY-MM'، شروع، پایان انحصاری), ...]
+    """
+    partitions = []
+    current = datetime(start_date.year, start_date.month, start_date.day)
+    end = datetime(end_date.year, end_date.month, end_date.day)
+    
+    while current < end:
+        if current.month == 12:
+            next_month = datetime(current.year + 1, 1, 1)
+        else:
+            next_month = datetime(current.year, current.month + 1, 1)
+        
+        partitions.append((current.strftime('%Y-%m'), current, min(next_month, end)))
+        current = next_month
+    
+    return partitions
+
+
 # ==================== Handler Functions ====================
 
-async def export_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """منوی export"""
-    # چک کردن ادمین
-    if not update.effective_user or update.effective_user.id != ADMIN_ID:
-        return
+def _make_progress_reporter(status_msg, loop):
+    """
+    ساخت progress_callback برای export های جریانی
+    از thread کاری صدا زده میشه و ویرایش پیام رو به event loop می‌سپاره
+    (حداکثر هر PROGRESS_INTERVAL ثانیه یک بار)
+    """
+    last_update = [0.0]
     
+    def report(done, total):
+        now = time.monotonic()
+        if now - last_update[0] < PROGRESS_INTERVAL:
+            return
+        last_update[0] = now
+        
+        if total:
+            text = f"⏳ در حال ساخت فایل...\n\n{done:,} از {total:,} ردیف ({done * 100 // total}%)"
+        else:
+            text = f"⏳ در حال ساخت فایل...\n\n{done:,} ردیف"
+        
+        asyncio.run_coroutine_threadsafe(status_msg.edit_text(text), loop)
+    
+    return report
+
+
+def _get_export_options(context):
+    """تنظیمات export ادمین (بازه، وضعیت، فرمت) در user_data"""
+    options = context.user_data.setdefault('export_options', dict(DEFAULT_EXPORT_OPTIONS))
+    for key, value in DEFAULT_EXPORT_OPTIONS.items():
+        options.setdefault(key, value)
+    return options
+
+
+def _mark(selected):
+    return "✅ " if selected else ""
+
+
+def _export_menu_content(options):
+    """متن و کیبورد منوی اصلی export"""
     keyboard = [
-        [InlineKeyboardButton("📦 سفارشات", callback_data="export:orders")],
+        [InlineKeyboardButton("📦 سفارشات (فیلتر و بازه)", callback_data="export:orders_menu")],
         [InlineKeyboardButton("📦 محصولات", callback_data="export:products")],
         [InlineKeyboardButton("👥 کاربران", callback_data="export:users")],
         [InlineKeyboardButton("📊 گزارش فروش (هفته)", callback_data="export:sales_week")],
         [InlineKeyboardButton("📊 گزارش فروش (ماه)", callback_data="export:sales_month")],
+        [
+            InlineKeyboardButton(f"{_mark(options['format'] == fmt)}{fmt}", callback_data=f"export:fmt:{fmt}")
+            for fmt in EXPORT_FORMATS
+        ],
+        [InlineKeyboardButton("📋 کارهای اخیر", callback_data="export:jobs")],
         [InlineKeyboardButton("🔙 بازگشت", callback_data="back_to_admin")]
     ]
     
-    await update.message.reply_text(
+    text = (
         "📥 **دانلود گزارشات**\n\n"
-        "یکی از گزینه‌های زیر را انتخاب کنید:",
-        reply_markup=InlineKeyboardMarkup(keyboard),
+        f"فرمت خروجی: `{options['format']}`\n\n"
+        "یکی از گزینه‌های زیر را انتخاب کنید:"
+    )
+    return text, InlineKeyboardMarkup(keyboard)
+
+
+def _orders_menu_content(options):
+    """متن و کیبورد فیلترهای export سفارشات"""
+    keyboard = [
+        [
+            InlineKeyboardButton(f"{_mark(options['range'] == key)}{label}", callback_data=f"export:range:{key}")
+            for key, (label, _) in EXPORT_RANGES.items()
+        ],
+        [
+            InlineKeyboardButton(f"{_mark(options['status'] == key)}{label}", callback_data=f"export:status:{key}")
+            for key, (label, _) in EXPORT_STATUS_FILTERS.items()
+        ],
+        [
+            InlineKeyboardButton(f"{_mark(options['format'] == fmt)}{fmt}", callback_data=f"export:ofmt:{fmt}")
+            for fmt in EXPORT_FORMATS
+        ],
+        [InlineKeyboardButton("📥 شروع Export", callback_data="export:orders")],
+        [InlineKeyboardButton("🔙 بازگشت", callback_data="export:menu")]
+    ]
+    
+    range_label, days = EXPORT_RANGES[options['range']]
+    partitioned = days is None or days > PARTITION_THRESHOLD_DAYS
+    
+    text = (
+        "📦 **Export سفارشات**\n\n"
+        f"📅 بازه: {range_label}\n"
+        f"🔖 وضعیت: {EXPORT_STATUS_FILTERS[options['status']][0]}\n"
+        f"📄 فرمت: `{options['format']}`\n"
+    )
+    if partitioned:
+        text += "\n🗂 بازه طولانی: هر ماه در یک فایل جدا ارسال میشه"
+    return text, InlineKeyboardMarkup(keyboard)
+
+
+def _format_size(size_bytes):
+    if size_bytes >= 1024 * 1024:
+        return f"{size_bytes / (1024 * 1024):.1f} MB"
+    return f"{size_bytes / 1024:.1f} KB"
+
+
+def _export_jobs_text(db):
+    """لیست آخرین کارهای export"""
+    jobs = db.get_export_jobs(10)
+    if not jobs:
+        return "📋 هنوز کار export ثبت نشده است."
+    
+    status_icons = {'running': '⏳', 'done': '✅', 'failed': '❌', 'empty': '⚪️'}
+    
+    text = "📋 کارهای اخیر Export\n\n"
+    for job in jobs:
+        job_id, export_type, fmt, _, status, rows_count, size_bytes, parts, error, created_at, _ = job
+        text += (
+            f"{status_icons.get(status, '❔')} #{job_id} {export_type} ({fmt})\n"
+            f"   {rows_count:,} ردیف | {_format_size(size_bytes or 0)} | {parts} پارت\n"
+            f"   🕐 {str(created_at)[:16]}\n"
+        )
+        if error:
+            text += f"   ⚠️ {error[:60]}\n"
+    return text
+
+
+async def export_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """منوی export"""
+    # چک کردن ادمین
+    if not update.effective_user or update.effective_user.id != ADMIN_ID:
+        return
+    
+    text, markup = _export_menu_content(_get_export_options(context))
+    
+    await update.message.reply_text(
+        text,
+        reply_markup=markup,
         parse_mode='Markdown'
     )
 
 
+def _resolve_orders_range(exporter, options):
+    """بازه تاریخ و پارتیشن‌های export سفارشات از روی تنظیمات"""
+    _, days = EXPORT_RANGES[options['range']]
+    end_date = datetime.now() + timedelta(days=1)
+    
+    if days is None:
+        start_date = exporter.first_order_date()
+        if start_date is None:
+            return []
+    else:
+        start_date = datetime.now() - timedelta(days=days)
+    
+    if days is not None and days <= PARTITION_THRESHOLD_DAYS:
+        return [(None, start_date, end_date)]
+    
+    return month_partitions(start_date, end_date)
+
+
+async def _send_export_file(message, filepath, caption):
+    """ارسال فایل و برگرداندن حجم آن"""
+    size = os.path.getsize(filepath)
+    with open(filepath, 'rb') as f:
+        await message.reply_document(
+            document=f,
+            filename=os.path.basename(filepath),
+            caption=caption
+        )
+    return size
+
+
 async def handle_export(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """پردازش export"""
     query = update.callback_query
@@ -383,48 +678,137 @@ async def handle_export(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not update.effective_user or update.effective_user.id != ADMIN_ID:
         return
     
-    export_type = query.data.split(':')[1]
+    parts = query.data.split(':')
+    export_type = parts[1]
+    options = _get_export_options(context)
+    
+    db = context.bot_data.get('db')
+    if not db:
+        await query.message.reply_text("❌ خطا: دیتابیس در دسترس نیست!")
+        return
     
-    await query.message.reply_text("⏳ در حال آماده‌سازی فایل...\n\nلطفاً کمی صبر کنید...")
+    # ==================== منوها و فیلترها ====================
     
+    if export_type in ('menu', 'fmt'):
+        if export_type == 'fmt' and parts[2] in EXPORT_FORMATS:
+            options['format'] = parts[2]
+        text, markup = _export_menu_content(options)
+        await query.edit_message_text(text, reply_markup=markup, parse_mode='Markdown')
+        return
+    
+    if export_type in ('orders_menu', 'range', 'status', 'ofmt'):
+        if export_type == 'range' and parts[2] in EXPORT_RANGES:
+            options['range'] = parts[2]
+        elif export_type == 'status' and parts[2] in EXPORT_STATUS_FILTERS:
+            options['status'] = parts[2]
+        elif export_type == 'ofmt' and parts[2] in EXPORT_FORMATS:
+            options['format'] = parts[2]
+        text, markup = _orders_menu_content(options)
+        await query.edit_message_text(text, reply_markup=markup, parse_mode='Markdown')
+        return
+    
+    if export_type == 'jobs':
+        await query.message.reply_text(_export_jobs_text(db))
+        return
+    
+    if export_type not in ('orders', 'products', 'users', 'sales_week', 'sales_month'):
+        await query.message.reply_text("❌ نوع export نامعتبر است!")
+        return
+    
+    # ==================== اجرای کار export ====================
+    
+    fmt = 'xlsx' if export_type.startswith('sales') else options['format']
+    filters = {'range': options['range'], 'status': options['status']} if export_type == 'orders' else {}
+    job_id = db.create_export_job(update.effective_user.id, export_type, fmt, filters)
+    
+    status_msg = await query.message.reply_text("⏳ در حال آماده‌سازی فایل...\n\nلطفاً کمی صبر کنید...")
+    
+    # ✅ ساخت و ارسال در پس‌زمینه تا handler و آپدیت‌های بقیه کاربران منتظر export نمونن
+    context.application.create_task(
+        _run_export_job(context, query.message, status_msg, db, job_id, export_type, fmt, dict(options)),
+        update=update
+    )
+
+
+async def _run_export_job(context, message, status_msg, db, job_id: int, export_type: str,
+                          fmt: str, options: dict):
+    """ساخت، ارسال و ثبت وضعیت یک کار export (task پس‌زمینه handle_export)"""
+    total_rows = 0
+    total_size = 0
+    sent_parts = 0
     filepath = None
     
     try:
-        db = context.bot_data.get('db')
-        if not db:
-            await query.message.reply_text("❌ خطا: دیتابیس در دسترس نیست!")
-            return
-        
-        exporter = ExportManager(db)
+        # ✅ export روی snapshot فقط‌خواندنی (در صورت فعال بودن)
+        from analytics_snapshot import get_read_db
+        exporter = ExportManager(await get_read_db(context))
+        progress = _make_progress_reporter(status_msg, asyncio.get_running_loop())
         
         if export_type == 'orders':
-            filepath = exporter.export_orders()
-        elif export_type == 'products':
-            filepath = exporter.export_products()
-        elif export_type == 'users':
-            filepath = exporter.export_users()
-        elif export_type == 'sales_week':
-            filepath = exporter.export_sales_report('week')
-        elif export_type == 'sales_month':
-            filepath = exporter.export_sales_report('month')
-        else:
-            await query.message.reply_text("❌ نوع export نامعتبر است!")
-            return
-        
-        # ارسال فایل
-        if filepath and os.path.exists(filepath):
-            with open(filepath, 'rb') as f:
-                await query.message.reply_document(
-                    document=f,
-                    filename=os.path.basename(filepath),
-                    caption="✅ فایل آماده شد!"
+            status = EXPORT_STATUS_FILTERS[options['status']][1]
+            partitions = await asyncio.to_thread(_resolve_orders_range, exporter, options)
+            
+            # ✅ هر پارتیشن جدا ساخته، ارسال و حذف میشه (بدون فایل غول‌پیکر)
+            for label, start_date, end_date in partitions:
+                filepath = await asyncio.to_thread(
+                    exporter.export_orders, start_date, end_date, status,
+                    progress, fmt, label
                 )
+                rows = exporter.last_export_rows
+                if rows == 0:
+                    # ماه بدون سفارش ارسال نمیشه
+                    os.remove(filepath)
+                    filepath = None
+                    continue
+                
+                caption = f"✅ سفارشات {label}" if label else "✅ فایل آماده شد!"
+                total_size += await _send_export_file(message, filepath, caption)
+                total_rows += rows
+                sent_parts += 1
+                
+                os.remove(filepath)
+                filepath = None
+                db.update_export_job(job_id, rows_count=total_rows, size_bytes=total_size, parts=sent_parts)
+            
+            if sent_parts == 0:
+                db.update_export_job(job_id, status='empty', finished_at=get_tehran_now())
+                await message.reply_text("ℹ️ سفارشی با این فیلترها پیدا نشد.")
+                return
+        
         else:
-            await query.message.reply_text("❌ خطا در ساخت فایل!")
+            if export_type == 'products':
+                job = partial(exporter.export_products, progress_callback=progress, fmt=fmt)
+            elif export_type == 'users':
+                job = partial(exporter.export_users, progress_callback=progress, fmt=fmt)
+            elif export_type == 'sales_week':
+                job = partial(exporter.export_sales_report, 'week')
+            else:
+                job = partial(exporter.export_sales_report, 'month')
+            
+            # ✅ ساخت فایل در thread جدا تا event loop بلاک نشه
+            filepath = await asyncio.to_thread(job)
+            
+            if not filepath or not os.path.exists(filepath):
+                raise RuntimeError("فایل ساخته نشد")
+            
+            total_size = await _send_export_file(message, filepath, "✅ فایل آماده شد!")
+            total_rows = exporter.last_export_rows
+            sent_parts = 1
+        
+        db.update_export_job(
+            job_id, status='done', rows_count=total_rows, size_bytes=total_size,
+            parts=sent_parts, finished_at=get_tehran_now()
+        )
+        
+        if sent_parts > 1:
+            await message.reply_text(
+                f"✅ Export کامل شد: {sent_parts} فایل، {total_rows:,} ردیف، {_format_size(total_size)}"
+            )
         
     except Exception as e:
         logger.error(f"❌ Error in export: {e}", exc_info=True)
-        await query.message.reply_text(
+        db.update_export_job(job_id, status='failed', error=str(e)[:500], finished_at=get_tehran_now())
+        await message.reply_text(
             f"❌ خطا در ساخت فایل:\n\n"
             f"```\n{str(e)[:200]}\n```",
             parse_mode='Markdown'
@@ -230,10 +230,10 @@ from handlers.admin_pack_management import (
     delete_pack_final
 )
 
-2. اضافه کردن handler ها:
-app.add_handler(CallbackQueryHandler(manage_packs_menu, pattern=r"^manage_packs:"))
-app.add_handler(CallbackQueryHandler(confirm_delete_pack, pattern=r"^confirm_delete_pack:"))
-app.add_handler(CallbackQueryHandler(delete_pack_final, pattern=r"^delete_pack_final:"))
+2. اضافه کردن مسیرها به callback_router:
+callback_router.route("manage_packs", manage_packs_menu, int)
+callback_router.route("confirm_delete_pack", confirm_delete_pack, int, int)
+callback_router.route("delete_pack_final", delete_pack_final, int, int)
 
 3. در keyboards.py باید دکمه "مدیریت پک‌ها" به product_management_keyboard اضافه شود:
 InlineKeyboardButton("📦 مدیریت پک‌ها", callback_data=f"manage_packs:{product_id}")
@@ -9,64 +9,63 @@ from datetime import datetime, timedelta
 from telegram import Update
 from telegram.ext import ContextTypes
 from config import ADMIN_ID
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-from matplotlib import font_manager
-import matplotlib.dates as mdates
 from collections import defaultdict, Counter
 
-# تنظیم فونت فارسی
-plt.rcParams['font.family'] = 'DejaVu Sans'
-plt.rcParams['axes.unicode_minus'] = False
+# ✅ matplotlib و NumPy (analytics_data) سنگین‌ترین import های ربات هستن؛ اولین نمودار
+# (یا warm-up پس‌زمینه main.py) لودشون می‌کنه نه راه‌اندازی
+_plt = None
+
+
+def get_pyplot():
+    """matplotlib.pyplot با backend بدون نمایشگر (import و تنظیم فقط بار اول)"""
+    global _plt
+    if _plt is None:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+        
+        # تنظیم فونت فارسی
+        plt.rcParams['font.family'] = 'DejaVu Sans'
+        plt.rcParams['axes.unicode_minus'] = False
+        _plt = plt
+    return _plt
 
 
 class Analytics:
     """کلاس تحلیل و گزارش‌گیری - بهینه شده"""
     
-    def __init__(self, db):
+    def __init__(self, db, read_db=None):
+        """
+        ✅ بدون DDL: جدول product_stats و trigger هاش با migration ساخته میشن (migrations.py)
+        
+        Args:
+            db: دیتابیس زنده (برای نوشتن و جدول product_stats)
+            read_db: منبع کوئری‌های سنگین (snapshot تحلیلی؛ پیشفرض همان db)
+        """
         self.db = db
-        self._ensure_stats_table()
-    
-    def _ensure_stats_table(self):
-        """ایجاد جدول آماری اگر وجود نداشته باشد"""
-        try:
-            self.db.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS product_stats (
-                    product_name TEXT PRIMARY KEY,
-                    total_sold INTEGER DEFAULT 0,
-                    total_revenue REAL DEFAULT 0,
-                    last_order_date TIMESTAMP,
-                    last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Index برای سرعت بیشتر
-            self.db.cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_product_stats_sold 
-                ON product_stats(total_sold DESC)
-            """)
-            
-            self.db.conn.commit()
-        except Exception as e:
-            print(f"⚠️ خطا در ایجاد جدول آمار: {e}")
+        self.read_db = read_db or db
     
     def cleanup_old_stats(self, days=90):
         """
         🔴 FIX باگ 2: پاکسازی آمار قدیمی
         این تابع باید دوره‌ای (مثلاً هر شب) اجرا بشه
         
+        ✅ چون آمار به‌صورت تدریجی نگهداری میشه، حذف ردیف‌های زنده باعث
+        از دست رفتن مجموع‌ها میشه؛ فقط ردیف‌هایی که به صفر رسیدن پاک میشن
+        
         Args:
             days: نگهداری آمار چند روز اخیر (پیشفرض: 90 روز)
         """
         try:
-            # حذف آمار قدیمی‌تر از X روز
-            self.db.cursor.execute("""
+            cursor = self.db.cursor
+            # حذف آمار صفر شده قدیمی‌تر از X روز
+            cursor.execute("""
                 DELETE FROM product_stats 
-                WHERE last_updated < DATE('now', '-{} days')
-            """.format(days))
+                WHERE total_sold <= 0
+                  AND last_updated < DATE('now', ?)
+            """, (f'-{int(days)} days',))
             
-            deleted = self.db.cursor.rowcount
+            deleted = cursor.rowcount
             self.db.conn.commit()
             
             if deleted > 0:
@@ -83,8 +82,9 @@ class Analytics:
         🔴 FIX: چک کردن سایز جدول آمار
         """
         try:
-            self.db.cursor.execute("SELECT COUNT(*) FROM product_stats")
-            count = self.db.cursor.fetchone()[0]
+            cursor = self.db.cursor
+            cursor.execute("SELECT COUNT(*) FROM product_stats")
+            count = cursor.fetchone()[0]
             
             # تخمین سایز (هر رکورد ~1KB)
             size_kb = count * 1
@@ -98,46 +98,147 @@ class Analytics:
             print(f"❌ خطا در get_table_size: {e}")
             return None
     
-    def update_product_stats(self):
+    # کلید high-water mark آخرین تغییر پردازش شده در bot_settings
+    STATS_HWM_KEY = 'product_stats_last_change_id'
+    
+    def update_product_stats(self, batch_size=5000):
         """
-        🔴 FIX باگ 11: به‌روزرسانی جدول آماری
+        🔴 FIX باگ 11: به‌روزرسانی تدریجی جدول آماری
         این تابع باید دوره‌ای (مثلاً هر ساعت) اجرا بشه
+        
+        ✅ فقط تغییرات جدید (بعد از high-water mark) اعمال میشن، پس هزینه
+        به تعداد سفارشات جدید بستگی داره نه کل تاریخچه.
+        اگر هنوز بازسازی کامل انجام نشده باشه، یک‌بار rebuild اجرا میشه.
+        
+        Args:
+            batch_size: حداکثر تعداد تغییرات در هر دور
         """
         try:
-            # پاک کردن آمار قبلی
-            self.db.cursor.execute("DELETE FROM product_stats")
+            if self.db.get_setting(self.STATS_HWM_KEY) is None:
+                return self.rebuild_product_stats()
             
-            # محاسبه آمار از سفارشات موفق
-            query = """
-                SELECT 
-                    json_extract(value, '$.product') as product_name,
-                    SUM(CAST(json_extract(value, '$.quantity') AS INTEGER)) as total_sold,
-                    SUM(CAST(json_extract(value, '$.price') AS REAL)) as total_revenue,
-                    MAX(o.created_at) as last_order_date
-                FROM orders o,
-                     json_each(o.items)
-                WHERE o.status IN ('confirmed', 'payment_confirmed')
-                GROUP BY product_name
-            """
+            applied_total = 0
+            while True:
+                with self.db.transaction() as cursor:
+                    cursor.execute(
+                        "SELECT value FROM bot_settings WHERE key = ?",
+                        (self.STATS_HWM_KEY,)
+                    )
+                    last_id = int(cursor.fetchone()[0])
+                    
+                    cursor.execute("""
+                        SELECT MAX(id), COUNT(*) FROM (
+                            SELECT id FROM product_stats_changes
+                            WHERE id > ?
+                            ORDER BY id
+                            LIMIT ?
+                        )
+                    """, (last_id, batch_size))
+                    upto_id, change_count = cursor.fetchone()
+                    
+                    if not change_count:
+                        break
+                    
+                    # محاسبه delta برای هر محصول از تغییرات این دور
+                    cursor.execute("""
+                        SELECT 
+                            json_extract(value, '$.product') as product_name,
+                            SUM(c.sign * CAST(json_extract(value, '$.quantity') AS INTEGER)) as sold_delta,
+                            SUM(c.sign * CAST(json_extract(value, '$.price') AS REAL)) as revenue_delta,
+                            MAX(CASE WHEN c.sign > 0 THEN c.order_created_at END) as last_order_date
+                        FROM product_stats_changes c,
+                             json_each(c.items)
+                        WHERE c.id > ? AND c.id <= ?
+                        GROUP BY product_name
+                    """, (last_id, upto_id))
+                    deltas = [
+                        (name, sold or 0, revenue or 0, last_order)
+                        for name, sold, revenue, last_order in cursor.fetchall()
+                    ]
+                    
+                    cursor.executemany("""
+                        INSERT INTO product_stats 
+                        (product_name, total_sold, total_revenue, last_order_date, last_updated)
+                        VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+                        ON CONFLICT(product_name) DO UPDATE SET
+                            total_sold = total_sold + excluded.total_sold,
+                            total_revenue = total_revenue + excluded.total_revenue,
+                            last_order_date = CASE
+                                WHEN excluded.last_order_date IS NULL THEN last_order_date
+                                WHEN last_order_date IS NULL THEN excluded.last_order_date
+                                ELSE MAX(last_order_date, excluded.last_order_date)
+                            END,
+                            last_updated = CURRENT_TIMESTAMP
+                    """, deltas)
+                    
+                    cursor.execute(
+                        "DELETE FROM product_stats_changes WHERE id <= ?", (upto_id,)
+                    )
+                    cursor.execute(
+                        "UPDATE bot_settings SET value = ?, updated_at = CURRENT_TIMESTAMP WHERE key = ?",
+                        (str(upto_id), self.STATS_HWM_KEY)
+                    )
+                
+                applied_total += change_count
+                if change_count < batch_size:
+                    break
             
-            self.db.cursor.execute(query)
-            results = self.db.cursor.fetchall()
+            if applied_total:
+                print(f"✅ آمار محصولات به‌روزرسانی شد: {applied_total} تغییر")
+            return True
             
-            # Insert در جدول آمار
-            for row in results:
-                product_name, total_sold, total_revenue, last_order = row
-                self.db.cursor.execute("""
+        except Exception as e:
+            print(f"❌ خطا در به‌روزرسانی آمار: {e}")
+            return False
+    
+    def rebuild_product_stats(self):
+        """
+        بازسازی کامل جدول آماری از روی همه سفارشات تایید شده
+        ⚠️ روی کل تاریخچه اسکن می‌کنه؛ فقط به‌صورت دستی یا اولین اجرا صدا زده میشه
+        """
+        try:
+            with self.db.transaction() as cursor:
+                # پاک کردن آمار قبلی (قفل نوشتن از همین‌جا گرفته میشه)
+                cursor.execute("DELETE FROM product_stats")
+                
+                # محاسبه آمار از سفارشات موفق
+                cursor.execute("""
+                    SELECT 
+                        json_extract(value, '$.product') as product_name,
+                        SUM(CAST(json_extract(value, '$.quantity') AS INTEGER)) as total_sold,
+                        SUM(CAST(json_extract(value, '$.price') AS REAL)) as total_revenue,
+                        MAX(o.created_at) as last_order_date
+                    FROM orders o,
+                         json_each(o.items)
+                    WHERE o.status IN ('confirmed', 'payment_confirmed')
+                    GROUP BY product_name
+                """)
+                results = [
+                    (name, sold or 0, revenue or 0, last_order)
+                    for name, sold, revenue, last_order in cursor.fetchall()
+                ]
+                
+                cursor.executemany("""
                     INSERT INTO product_stats 
                     (product_name, total_sold, total_revenue, last_order_date, last_updated)
                     VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
-                """, (product_name, total_sold or 0, total_revenue or 0, last_order))
+                """, results)
+                
+                # تغییرات ثبت شده تا این لحظه در rebuild لحاظ شدن
+                cursor.execute("SELECT COALESCE(MAX(id), 0) FROM product_stats_changes")
+                hwm = cursor.fetchone()[0]
+                cursor.execute("DELETE FROM product_stats_changes WHERE id <= ?", (hwm,))
+                cursor.execute("""
+                    INSERT INTO bot_settings (key, value, updated_at)
+                    VALUES (?, ?, CURRENT_TIMESTAMP)
+                    ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at
+                """, (self.STATS_HWM_KEY, str(hwm)))
             
-            self.db.conn.commit()
-            print(f"✅ آمار محصولات به‌روزرسانی شد: {len(results)} محصول")
+            print(f"✅ آمار محصولات بازسازی شد: {len(results)} محصول")
             return True
             
         except Exception as e:
-            print(f"❌ خطا در به‌روزرسانی آمار: {e}")
+            print(f"❌ خطا در بازسازی آمار: {e}")
             return False
     
     def get_sales_data(self, days=30):
@@ -153,8 +254,9 @@ class Analytics:
             ORDER BY date
         """.format(days)
         
-        self.db.cursor.execute(query)
-        return self.db.cursor.fetchall()
+        cursor = self.read_db.cursor
+        cursor.execute(query)
+        return cursor.fetchall()
     
     def get_popular_products(self, limit=10, use_cache=True):
         """
@@ -164,6 +266,8 @@ class Analytics:
             limit: تعداد محصولات
             use_cache: استفاده از جدول آماری (پیشنهادی)
         """
+        cursor = self.db.cursor
+        
         if use_cache:
             # استفاده از جدول آماری - خیلی سریع‌تر!
             query = """
@@ -173,38 +277,21 @@ class Analytics:
                 LIMIT ?
             """
             
-            self.db.cursor.execute(query, (limit,))
-            results = self.db.cursor.fetchall()
+            cursor.execute(query, (limit,))
+            results = cursor.fetchall()
             
             # اگر جدول آمار خالی بود، اول به‌روزرسانی کن
             if not results:
                 self.update_product_stats()
-                self.db.cursor.execute(query, (limit,))
-                results = self.db.cursor.fetchall()
+                cursor.execute(query, (limit,))
+                results = cursor.fetchall()
             
             return results
         
         else:
-            # روش قدیمی - برای مقایسه
-            # ⚠️ این روش با داده زیاد خیلی کنده!
-            query = """
-                SELECT items FROM orders 
-                WHERE status IN ('confirmed', 'payment_confirmed')
-            """
-            
-            self.db.cursor.execute(query)
-            orders = self.db.cursor.fetchall()
-            
-            product_counter = Counter()
-            
-            for order in orders:
-                items = json.loads(order[0])
-                for item in items:
-                    product_name = item.get('product', 'Unknown')
-                    quantity = item.get('quantity', 0)
-                    product_counter[product_name] += quantity
-            
-            return product_counter.most_common(limit)
+            # ✅ بدون جدول آماری: تجمیع برداری با NumPy به جای حلقه Counter
+            from analytics_data import load_product_quantities
+            return load_product_quantities(self.read_db, limit)
     
     def get_popular_products_fast(self, limit=10):
         """
@@ -224,8 +311,9 @@ class Analytics:
                 LIMIT ?
             """
             
-            self.db.cursor.execute(query, (limit,))
-            return self.db.cursor.fetchall()
+            cursor = self.read_db.cursor
+            cursor.execute(query, (limit,))
+            return cursor.fetchall()
             
         except Exception as e:
             print(f"❌ خطا در get_popular_products_fast: {e}")
@@ -243,28 +331,31 @@ class Analytics:
             ORDER BY hour
         """
         
-        self.db.cursor.execute(query)
-        return self.db.cursor.fetchall()
+        cursor = self.read_db.cursor
+        cursor.execute(query)
+        return cursor.fetchall()
     
     def get_conversion_rate(self):
         """نرخ تبدیل - بهینه شده"""
+        cursor = self.read_db.cursor
+        
         # تعداد کل کاربران
-        self.db.cursor.execute("SELECT COUNT(*) FROM users")
-        total_users = self.db.cursor.fetchone()[0]
+        cursor.execute("SELECT COUNT(*) FROM users")
+        total_users = cursor.fetchone()[0]
         
         # تعداد کاربران خریدار
-        self.db.cursor.execute("""
+        cursor.execute("""
             SELECT COUNT(DISTINCT user_id) FROM orders
             WHERE status IN ('confirmed', 'payment_confirmed')
         """)
-        buyers = self.db.cursor.fetchone()[0]
+        buyers = cursor.fetchone()[0]
         
         # تعداد سفارشات
-        self.db.cursor.execute("""
+        cursor.execute("""
             SELECT COUNT(*) FROM orders
             WHERE status IN ('confirmed', 'payment_confirmed')
         """)
-        orders = self.db.cursor.fetchone()[0]
+        orders = cursor.fetchone()[0]
         
         conversion_rate = (buyers / total_users * 100) if total_users > 0 else 0
         repeat_rate = (orders / buyers) if buyers > 0 else 0
@@ -278,6 +369,16 @@ class Analytics:
             'repeat_rate': repeat_rate
         }
     
+    def load_frame(self, days=None):
+        """
+        ✅ بارگذاری ستون‌های سفارشات در آرایه‌های NumPy برای نمودارها
+        
+        Args:
+            days: فقط سفارشات N روز اخیر (None = همه)
+        """
+        from analytics_data import OrderFrame
+        return OrderFrame.load(self.read_db, days)
+    
     def get_revenue_data(self, days=30):
         """داده‌های درآمد - بهینه شده"""
         query = """
@@ -292,8 +393,9 @@ class Analytics:
             ORDER BY date
         """.format(days)
         
-        self.db.cursor.execute(query)
-        return self.db.cursor.fetchall()
+        cursor = self.read_db.cursor
+        cursor.execute(query)
+        return cursor.fetchall()
 
 
 # ==================== تابع برای پاکسازی خودکار ====================
@@ -335,17 +437,26 @@ async def scheduled_cleanup(context):
 
 def create_sales_chart(analytics, period='weekly'):
     """نمودار فروش"""
+    plt = get_pyplot()
+    import matplotlib.dates as mdates
+    from analytics_data import rolling_mean
+    
     days_map = {'daily': 7, 'weekly': 30, 'monthly': 90}
     days = days_map.get(period, 30)
     
-    data = analytics.get_sales_data(days)
+    frame = analytics.load_frame(days).confirmed()
     
-    if not data:
+    if not len(frame):
         return None
     
-    dates = [datetime.strptime(row[0], '%Y-%m-%d') for row in data]
-    order_counts = [row[1] for row in data]
-    sales = [row[2]/1000000 for row in data]
+    daily = frame.aggregate('day')
+    dates = daily['labels']
+    order_counts = daily['count']
+    sales = daily['net'] / 1000000
+    
+    # میانگین متحرک 7 روزه روی سری پیوسته (روزهای بدون فروش = صفر)
+    dense = frame.daily_series()
+    sales_avg = rolling_mean(dense['net'], 7) / 1000000
     
     fig, ax1 = plt.subplots(figsize=(12, 6))
     
@@ -360,6 +471,8 @@ def create_sales_chart(analytics, period='weekly'):
     color2 = '#2ecc71'
     ax2.set_ylabel('Sales (Million Toman)', color=color2, fontsize=12)
     ax2.plot(dates, sales, color=color2, marker='s', linewidth=2, label='Sales')
+    if period != 'daily':
+        ax2.plot(dense['labels'], sales_avg, color=color2, linestyle='--', alpha=0.6, label='7-day Avg')
     ax2.tick_params(axis='y', labelcolor=color2)
     
     if period == 'daily':
@@ -384,6 +497,8 @@ def create_sales_chart(analytics, period='weekly'):
 
 def create_popular_products_chart(analytics):
     """🔴 FIX باگ 11: نمودار محبوب‌ترین محصولات - بهینه شده"""
+    plt = get_pyplot()
+    
     # استفاده از روش سریع
     products = analytics.get_popular_products_fast(10)
     
@@ -418,17 +533,15 @@ def create_popular_products_chart(analytics):
 
 def create_hourly_orders_chart(analytics):
     """نمودار ساعات شلوغی"""
-    data = analytics.get_hourly_orders()
+    plt = get_pyplot()
     
-    if not data:
-        return None
+    frame = analytics.load_frame(30)
     
-    hours_dict = {str(i).zfill(2): 0 for i in range(24)}
-    for hour, count in data:
-        hours_dict[hour] = count
+    if not len(frame):
+        return None
     
     hours = list(range(24))
-    counts = [hours_dict[str(h).zfill(2)] for h in hours]
+    counts = frame.hourly_counts().tolist()
     
     fig, ax = plt.subplots(figsize=(14, 6))
     
@@ -463,18 +576,21 @@ def create_hourly_orders_chart(analytics):
 
 def create_revenue_chart(analytics, period='monthly'):
     """نمودار درآمد"""
+    plt = get_pyplot()
+    import matplotlib.dates as mdates
+    
     days_map = {'weekly': 30, 'monthly': 90}
     days = days_map.get(period, 30)
     
-    data = analytics.get_revenue_data(days)
+    frame = analytics.load_frame(days).confirmed()
     
-    if not data:
+    if not len(frame):
         return None
     
-    dates = [datetime.strptime(row[0], '%Y-%m-%d') for row in data]
-    gross = [row[1]/1000000 for row in data]
-    discounts = [row[2]/1000000 for row in data]
-    net = [row[3]/1000000 for row in data]
+    daily = frame.aggregate('day')
+    dates = daily['labels']
+    gross = daily['gross'] / 1000000
+    net = daily['net'] / 1000000
     
     fig, ax = plt.subplots(figsize=(14, 7))
     
@@ -503,6 +619,8 @@ def create_revenue_chart(analytics, period='monthly'):
 
 def create_conversion_chart(analytics):
     """نمودار نرخ تبدیل"""
+    plt = get_pyplot()
+    
     data = analytics.get_conversion_rate()
     
     fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(14, 6))
@@ -568,12 +686,24 @@ async def handle_analytics_report(update: Update, context: ContextTypes.DEFAULT_
     
     report_type = query.data.split(":")[1]
     
+    db = context.bot_data['db']
+    
+    # ✅ بازسازی کامل آمار فقط به درخواست ادمین
+    if report_type == 'rebuild_stats':
+        await query.message.reply_text("⏳ در حال بازسازی کامل آمار محصولات...")
+        if Analytics(db).rebuild_product_stats():
+            await query.message.reply_text("✅ آمار محصولات از ابتدا بازسازی شد")
+        else:
+            await query.message.reply_text("❌ خطا در بازسازی آمار محصولات!")
+        return
+    
     await query.message.reply_text("⏳ در حال تولید گزارش...\nلطفاً صبر کنید...")
     
-    db = context.bot_data['db']
-    analytics = Analytics(db)
+    # ✅ کوئری‌های سنگین روی snapshot فقط‌خواندنی (در صورت فعال بودن)
+    from analytics_snapshot import get_read_db
+    analytics = Analytics(db, read_db=await get_read_db(context))
     
-    # 🔴 FIX باگ 11: به‌روزرسانی آمار قبل از نمایش گزارش محصولات
+    # 🔴 FIX باگ 11: به‌روزرسانی آمار قبل از نمایش گزارش محصولات (فقط تغییرات جدید)
     if report_type == 'popular':
         analytics.update_product_stats()
     
@@ -12,6 +12,8 @@ from validators import Validators
 from logger import log_user_action, log_order, log_discount_usage
 from states import FULL_NAME, ADDRESS_TEXT, PHONE_NUMBER
 from rate_limiter import rate_limit, action_limit
+from keyed_lock import KeyedLockManager
+from config import CART_LOCK_STRIPES
 from keyboards import (
     user_main_keyboard,
     product_inline_keyboard,
@@ -24,7 +26,8 @@ from keyboards import (
 logger = logging.getLogger(__name__)
 
 # ✅ Lock برای جلوگیری از Race Condition در cart operations
-cart_locks = {}  # به ازای هر کاربر یک Lock
+# قفل هر کاربر بعد از آزاد شدن حذف میشه (یا با CART_LOCK_STRIPES سقف ثابت)
+cart_locks = KeyedLockManager('cart', stripes=CART_LOCK_STRIPES)
 
 
 # ==================== HELPER FUNCTIONS ====================
@@ -49,12 +52,8 @@ async def _update_cart_item_quantity(update: Update, context: ContextTypes.DEFAU
     user_id = update.effective_user.id
     db = context.bot_data['db']
     
-    # ✅ اگه این کاربر قفل نداره، بساز
-    if user_id not in cart_locks:
-        cart_locks[user_id] = asyncio.Lock()
-    
     # ✅ قفل کن تا کار قبلی تموم شه
-    async with cart_locks[user_id]:
+    async with cart_locks.lock(user_id):
         try:
             # دریافت اطلاعات cart item
             conn = db._get_conn()
@@ -314,12 +313,8 @@ async def handle_pack_selection(update: Update, context: ContextTypes.DEFAULT_TY
     user_id = update.effective_user.id
     db = context.bot_data['db']
     
-    # ✅ اگه این کاربر قفل نداره، بساز
-    if user_id not in cart_locks:
-        cart_locks[user_id] = asyncio.Lock()
-    
     # ✅ قفل کن - صبر کن تا کار قبلی تموم شه
-    async with cart_locks[user_id]:
+    async with cart_locks.lock(user_id):
         # ثبت کاربر اگه قبلاً ثبت نشده
         user = update.effective_user
         db.add_user(user.id, user.username, user.first_name)
@@ -483,12 +478,8 @@ async def remove_from_cart(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     db = context.bot_data['db']
     
-    # ✅ اگه این کاربر قفل نداره، بساز
-    if user_id not in cart_locks:
-        cart_locks[user_id] = asyncio.Lock()
-    
     # ✅ قفل کن
-    async with cart_locks[user_id]:
+    async with cart_locks.lock(user_id):
         try:
             db.remove_from_cart(cart_id)
         except Exception as e:
@@ -511,12 +502,8 @@ async def clear_cart(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     db = context.bot_data['db']
     
-    # ✅ اگه این کاربر قفل نداره، بساز
-    if user_id not in cart_locks:
-        cart_locks[user_id] = asyncio.Lock()
-    
     # ✅ قفل کن
-    async with cart_locks[user_id]:
+    async with cart_locks.lock(user_id):
         try:
             db.clear_cart(user_id)
         except Exception as e:
@@ -783,12 +770,8 @@ async def create_order(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     db = context.bot_data['db']
     
-    # ✅ اگه این کاربر قفل نداره، بساز
-    if user_id not in cart_locks:
-        cart_locks[user_id] = asyncio.Lock()
-    
     # ✅ قفل کن - این خیلی مهمه چون cart رو خالی میکنیم
-    async with cart_locks[user_id]:
+    async with cart_locks.lock(user_id):
         cart = db.get_cart(user_id)
         if not cart:
             await query.message.reply_text("سبد خرید شما خالی است!")
@@ -915,12 +898,8 @@ async def create_order_from_message(update: Update, context: ContextTypes.DEFAUL
     user_id = update.effective_user.id
     db = context.bot_data['db']
     
-    # ✅ اگه این کاربر قفل نداره، بساز
-    if user_id not in cart_locks:
-        cart_locks[user_id] = asyncio.Lock()
-    
     # ✅ قفل کن
-    async with cart_locks[user_id]:
+    async with cart_locks.lock(user_id):
         cart = db.get_cart(user_id)
         if not cart:
             await update.message.reply_text("سبد خرید شما خالی است!")
@@ -4,17 +4,36 @@
 ✅ مصرف RAM و CPU
 ✅ آمار کاربران و سفارشات
 ✅ آخرین خطاها
+✅ تأخیر event loop و callback های بلاک‌کننده
+✅ نمونه‌بردار پس‌زمینه: بررسی‌های سنگین در thread جدا، خواندن وضعیت فوری
+✅ روند min/avg/max در پنجره‌های 1/5/15 دقیقه
+✅ حجم WAL و صفحات آزاد دیتابیس
 """
-import psutil
 import os
 import logging
+import threading
 import time
+from collections import deque
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, asdict, field
+
+from db_maintenance import get_file_stats
 
 logger = logging.getLogger(__name__)
 
+# پنجره‌های روند (دقیقه)
+TREND_WINDOWS = (1, 5, 15)
+
+# متریک‌های عددی روند: نام → (بخش، کلید)
+TREND_METRICS = {
+    'memory_mb': ('memory', 'process_mb'),
+    'cpu_percent': ('cpu', 'percent'),
+    'db_size_mb': ('database', 'size_mb'),
+    'db_wal_mb': ('database', 'wal_mb'),
+    'pending_orders': ('orders', 'pending'),
+}
+
 
 @dataclass
 class HealthStatus:
@@ -28,6 +47,10 @@ class HealthStatus:
     users: Dict
     orders: Dict
     errors: List[Dict]
+    expiry: Dict = field(default_factory=dict)
+    event_loop: Dict = field(default_factory=dict)
+    trends: Dict = field(default_factory=dict)
+    sampled_at: Optional[str] = None
     
     def to_dict(self):
         return asdict(self)
@@ -41,6 +64,24 @@ class HealthChecker:
         self.start_time = start_time
         self.last_errors: List[Dict] = []
         self.max_errors = 50  # نگهداری آخرین 50 خطا
+        
+        # ✅ Process کش‌شده: cpu_percent(None) مصرف از فراخوانی قبلی رو بدون sleep میده
+        # (ساخت تنبل: psutil اولین بار در thread نمونه‌بردار import میشه، نه موقع راه‌اندازی)
+        self._psutil_process = None
+        
+        # نمونه‌بردار پس‌زمینه (ring buffer نمونه‌ها)
+        self.sample_interval = 0.0
+        self._samples = deque()
+        self._sampler_thread: Optional[threading.Thread] = None
+        self._sampler_stop = threading.Event()
+    
+    @property
+    def _process(self):
+        if self._psutil_process is None:
+            import psutil
+            self._psutil_process = psutil.Process(os.getpid())
+            self._psutil_process.cpu_percent(interval=None)
+        return self._psutil_process
     
     def add_error(self, error_type: str, error_message: str, user_id: Optional[int] = None):
         """اضافه کردن خطا به لیست"""
@@ -69,9 +110,9 @@ class HealthChecker:
             if not result or result[0] != 1:
                 raise Exception("Database connection test failed")
             
-            # اندازه دیتابیس
-            from config import DATABASE_NAME
-            db_size = os.path.getsize(DATABASE_NAME) / (1024 * 1024)  # MB
+            # اندازه دیتابیس (فایل واقعی pool)
+            db_path = self.db.pool.database_name
+            db_size = os.path.getsize(db_path) / (1024 * 1024)  # MB
             
             # تعداد جداول
             cursor.execute(
@@ -79,10 +120,15 @@ class HealthChecker:
             )
             table_count = cursor.fetchone()[0]
             
+            # ✅ WAL و صفحات آزاد (رشد فایل - db_maintenance)
+            file_stats = get_file_stats(conn, db_path)
+            
             return {
                 'status': 'connected',
                 'size_mb': round(db_size, 2),
                 'tables': table_count,
+                'profile': self.db.pool.profile_name,
+                **file_stats,
                 'healthy': True
             }
         except Exception as e:
@@ -96,13 +142,13 @@ class HealthChecker:
     def check_memory(self) -> Dict:
         """بررسی مصرف حافظه"""
         try:
-            process = psutil.Process(os.getpid())
-            memory_info = process.memory_info()
+            memory_info = self._process.memory_info()
             
             # مصرف RAM
             ram_used_mb = memory_info.rss / (1024 * 1024)
             
             # مصرف کل سیستم
+            import psutil
             system_memory = psutil.virtual_memory()
             
             # وضعیت
@@ -133,13 +179,11 @@ class HealthChecker:
     def check_cpu(self) -> Dict:
         """بررسی مصرف CPU"""
         try:
-            process = psutil.Process(os.getpid())
-            
-            # CPU درصد
-            cpu_percent = process.cpu_percent(interval=0.1)
+            # ✅ CPU درصد از آخرین فراخوانی (بدون بلاک کردن با interval)
+            cpu_percent = self._process.cpu_percent(interval=None)
             
             # تعداد threadها
-            num_threads = process.num_threads()
+            num_threads = self._process.num_threads()
             
             # وضعیت
             if cpu_percent > 80:
@@ -255,17 +299,157 @@ class HealthChecker:
                 'healthy': False
             }
     
+    def check_expiry(self) -> Dict:
+        """وضعیت timing wheel انقضا (backlog = موارد سررسید پردازش‌نشده)"""
+        try:
+            from expiry_wheel import expiry_wheel
+            stats = expiry_wheel.get_stats()
+            
+            # backlog بزرگ یعنی tick ها عقب افتادن (event loop شلوغه)
+            if stats['backlog'] > 50000:
+                status = 'warning'
+            else:
+                status = 'good'
+            
+            return {**stats, 'status': status, 'healthy': True}
+        except Exception as e:
+            logger.error(f"❌ Expiry health check failed: {e}")
+            return {
+                'error': str(e),
+                'healthy': False
+            }
+    
+    def check_event_loop(self) -> Dict:
+        """تأخیر event loop (lag) و تعداد دفعات بلاک شدن"""
+        try:
+            from loop_monitor import loop_monitor
+            stats = loop_monitor.get_stats()
+            
+            if not stats['running']:
+                status = 'unknown'
+            elif stats['p95_ms'] > stats['threshold_ms']:
+                status = 'critical'
+            elif stats['p99_ms'] > stats['threshold_ms'] or stats['window_max_ms'] > stats['threshold_ms']:
+                status = 'warning'
+            else:
+                status = 'good'
+            
+            return {**stats, 'status': status, 'healthy': status != 'critical'}
+        except Exception as e:
+            logger.error(f"❌ Event loop health check failed: {e}")
+            return {
+                'error': str(e),
+                'healthy': False
+            }
+    
+    # ==================== نمونه‌بردار پس‌زمینه ====================
+    
+    def collect_sample(self) -> Dict:
+        """اجرای بررسی‌های سنگین (دیتابیس، حافظه، CPU، شمارش‌ها) و ثبت در ring buffer"""
+        sample = {
+            'time': time.time(),
+            'database': self.check_database(),
+            'memory': self.check_memory(),
+            'cpu': self.check_cpu(),
+            'users': self.check_users(),
+            'orders': self.check_orders(),
+        }
+        self._samples.append(sample)
+        
+        # نگهداری فقط بزرگ‌ترین پنجره روند
+        horizon = sample['time'] - max(TREND_WINDOWS) * 60
+        while self._samples and self._samples[0]['time'] < horizon:
+            self._samples.popleft()
+        
+        return sample
+    
+    def start_sampler(self, interval: float = 15.0):
+        """شروع thread نمونه‌برداری (هر interval ثانیه)"""
+        if self._sampler_thread is not None and self._sampler_thread.is_alive():
+            return
+        
+        self.sample_interval = interval
+        self._sampler_stop.clear()
+        self._sampler_thread = threading.Thread(
+            target=self._sampler_loop, daemon=True, name="HealthSampler"
+        )
+        self._sampler_thread.start()
+        logger.info(f"✅ Health sampler started (every {interval}s)")
+    
+    def stop_sampler(self):
+        """توقف thread نمونه‌برداری"""
+        self._sampler_stop.set()
+        if self._sampler_thread is not None:
+            self._sampler_thread.join(timeout=5)
+            self._sampler_thread = None
+    
+    def _sampler_loop(self):
+        while True:
+            try:
+                self.collect_sample()
+            except Exception as e:
+                logger.error(f"❌ Health sampling failed: {e}")
+            if self._sampler_stop.wait(self.sample_interval):
+                break
+    
+    def latest_sample(self) -> Optional[Dict]:
+        """آخرین نمونه اگه هنوز تازه باشه (کمتر از 3 بازه)"""
+        if not self._samples or not self.sample_interval:
+            return None
+        sample = self._samples[-1]
+        if time.time() - sample['time'] > self.sample_interval * 3:
+            return None
+        return sample
+    
+    def get_trends(self, now: Optional[float] = None) -> Dict:
+        """
+        min/avg/max هر متریک در پنجره‌های 1/5/15 دقیقه
+        
+        Returns:
+            {'memory_mb': {'1m': {'min':..,'avg':..,'max':..}, ...}, ...}
+        """
+        now = time.time() if now is None else now
+        samples = list(self._samples)
+        trends = {}
+        
+        for name, (section, key) in TREND_METRICS.items():
+            windows = {}
+            for minutes in TREND_WINDOWS:
+                start = now - minutes * 60
+                values = [
+                    s[section][key] for s in samples
+                    if s['time'] >= start and isinstance(s[section].get(key), (int, float))
+                ]
+                if values:
+                    windows[f'{minutes}m'] = {
+                        'min': round(min(values), 2),
+                        'avg': round(sum(values) / len(values), 2),
+                        'max': round(max(values), 2),
+                        'samples': len(values),
+                    }
+            if windows:
+                trends[name] = windows
+        
+        return trends
+    
     def get_health_status(self) -> HealthStatus:
-        """دریافت وضعیت کامل سلامت"""
+        """
+        دریافت وضعیت کامل سلامت
+        ✅ با نمونه‌بردار فعال: از آخرین نمونه (فوری، بدون query یا sleep)
+        در غیر این صورت بررسی‌ها همزمان اجرا میشن
+        """
         # محاسبه uptime
         uptime = time.time() - self.start_time
         
-        # بررسی تمام سیستم‌ها
-        db_status = self.check_database()
-        memory_status = self.check_memory()
-        cpu_status = self.check_cpu()
-        users_status = self.check_users()
-        orders_status = self.check_orders()
+        # بررسی‌های سنگین از نمونه‌بردار؛ موارد درون‌حافظه‌ای همیشه زنده
+        sample = self.latest_sample() or self.collect_sample()
+        db_status = sample['database']
+        memory_status = sample['memory']
+        cpu_status = sample['cpu']
+        users_status = sample['users']
+        orders_status = sample['orders']
+        expiry_status = self.check_expiry()
+        loop_status = self.check_event_loop()
         
         # تعیین وضعیت کلی
         all_healthy = all([
@@ -273,12 +457,15 @@ class HealthChecker:
             memory_status.get('healthy', False),
             cpu_status.get('healthy', False),
             users_status.get('healthy', False),
-            orders_status.get('healthy', False)
+            orders_status.get('healthy', False),
+            loop_status.get('healthy', False)
         ])
         
         has_warning = (
             memory_status.get('status') == 'warning' or
-            cpu_status.get('status') == 'warning'
+            cpu_status.get('status') == 'warning' or
+            expiry_status.get('status') == 'warning' or
+            loop_status.get('status') == 'warning'
         )
         
         if not all_healthy:
@@ -297,7 +484,11 @@ class HealthChecker:
             cpu=cpu_status,
             users=users_status,
             orders=orders_status,
-            errors=self.last_errors[-10:]  # آخرین 10 خطا
+            errors=self.last_errors[-10:],  # آخرین 10 خطا
+            expiry=expiry_status,
+            event_loop=loop_status,
+            trends=self.get_trends(),
+            sampled_at=datetime.fromtimestamp(sample['time']).isoformat()
         )
     
     def get_health_report(self) -> str:
@@ -324,13 +515,20 @@ class HealthChecker:
         
         report = f"{emoji} **وضعیت سیستم: {status.status.upper()}**\n\n"
         report += f"⏱ Uptime: {uptime_str}\n"
-        report += f"📅 {status.timestamp[:16]}\n\n"
+        report += f"📅 {status.timestamp[:16]}\n"
+        if status.sampled_at:
+            report += f"🔬 آخرین نمونه: {status.sampled_at[11:19]}\n"
+        report += "\n"
         
         # دیتابیس
         report += "**💾 دیتابیس:**\n"
         if status.database.get('healthy'):
             report += f"✅ متصل - حجم: {status.database['size_mb']} MB\n"
-            report += f"📊 جداول: {status.database['tables']}\n"
+            report += f"📊 جداول: {status.database['tables']} | پروفایل: {status.database.get('profile', '-')}\n"
+            if 'wal_mb' in status.database:
+                report += (f"📝 WAL: {status.database['wal_mb']} MB | "
+                           f"صفحات آزاد: {status.database['freelist_pages']} "
+                           f"({status.database['freelist_mb']} MB، vacuum: {status.database['auto_vacuum']})\n")
         else:
             report += f"❌ خطا: {status.database.get('error', 'Unknown')}\n"
         report += "\n"
@@ -378,6 +576,38 @@ class HealthChecker:
             report += f"❌ خطا: {status.orders.get('error', 'Unknown')}\n"
         report += "\n"
         
+        # انقضای درون‌حافظه‌ای
+        if status.expiry.get('healthy'):
+            registries = status.expiry.get('registries', {})
+            expiry_emoji = '✅' if status.expiry.get('status') == 'good' else '⚠️'
+            report += "**⏳ انقضای حافظه:**\n"
+            report += f"{expiry_emoji} در صف: {status.expiry['pending']} | عقب‌افتاده: {status.expiry['backlog']}\n"
+            report += f"🗑 منقضی‌شده: {status.expiry['expired_total']} | آخرین tick: {status.expiry['last_advance_ms']}ms\n"
+            if registries:
+                report += "📋 " + " | ".join(f"{name}: {count}" for name, count in registries.items()) + "\n"
+            report += "\n"
+        
+        # روند (از نمونه‌بردار)
+        if status.trends:
+            titles = {'memory_mb': '🧠 RAM (MB)', 'cpu_percent': '⚡ CPU (%)'}
+            report += "**📈 روند (میانگین / بیشترین):**\n"
+            for name, title in titles.items():
+                windows = status.trends.get(name)
+                if windows:
+                    parts = [f"{w}: {v['avg']}/{v['max']}" for w, v in windows.items()]
+                    report += f"{title} — " + " | ".join(parts) + "\n"
+            report += "\n"
+        
+        # event loop
+        if status.event_loop.get('running'):
+            loop_emoji = {'good': '✅', 'warning': '⚠️', 'critical': '🔴'}.get(status.event_loop['status'], '❓')
+            report += "**🔁 Event Loop:**\n"
+            report += f"{loop_emoji} lag p50: {status.event_loop['p50_ms']}ms | p99: {status.event_loop['p99_ms']}ms\n"
+            report += f"🐌 بیشترین: {status.event_loop['max_ms']}ms | بلاک (≥{status.event_loop['threshold_ms']:.0f}ms): {status.event_loop['blocked_total']}\n"
+            if status.event_loop.get('last_block'):
+                report += f"🕒 آخرین بلاک: {status.event_loop['last_block'][11:]}\n"
+            report += "\n"
+        
         # خطاها
         if status.errors:
             report += f"**⚠️ آخرین خطاها:** ({len(status.errors)})\n"
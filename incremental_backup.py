@@ -0,0 +1,441 @@
+"""
+بکاپ افزایشی (incremental) با جدول تغییرات ردیف‌ها
+✅ trigger های INSERT/UPDATE/DELETE روی همه جدول‌ها rowid ردیف تغییرکرده رو در
+   backup_changelog ثبت می‌کنن (هر ردیف فقط یک بار، با آخرین شماره تغییر)
+✅ هر increment وضعیت فعلی ردیف‌های تغییرکرده (یا علامت حذف) از یک snapshot
+   سازگار رو به صورت JSON Lines فشرده ذخیره می‌کنه
+✅ بازیابی = بکاپ کامل + اعمال increment ها به ترتیب (restore_backup.py)
+✅ تغییرات به ترتیب seq ثبت و اعمال میشن و trigger های خود برنامه موقع اعمال
+   خاموشن (ردیف‌هایی که ساختن، مثل product_stats_changes، خودشون در increment هستن)
+
+پیوستگی زنجیره با شماره تغییر (seq) تضمین میشه: هر increment از to_seq قبلی
+شروع میشه و بکاپ کامل base_seq رو از روی خود کپی ثبت می‌کنه. تغییر schema
+(migration، جدول جدید) زنجیره رو می‌شکنه و بکاپ کامل بعدی اجباری میشه.
+
+هزینه روی نوشتن‌ها: یک INSERT OR REPLACE در جدول کوچک changelog برای هر ردیف.
+"""
+import base64
+import gzip
+import json
+import logging
+import os
+import sqlite3
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CHANGELOG_TABLE = 'backup_changelog'
+STATE_FILE = 'incremental_state.json'
+TRIGGER_PREFIX = 'trg_backup_'
+
+# تعداد rowid در هر کوئری خواندن ردیف‌ها
+FETCH_CHUNK = 500
+
+
+class NeedFullBackup(Exception):
+    """زنجیره افزایشی معتبر نیست (بکاپ کامل پایه وجود نداره یا schema عوض شده)"""
+    pass
+
+
+@dataclass
+class IncrementResult:
+    """نتیجه یک بکاپ افزایشی"""
+    path: str
+    base: str
+    number: int
+    from_seq: int
+    to_seq: int
+    upserts: int
+    deletes: int
+    size: int
+    seconds: float
+
+    @property
+    def rows(self) -> int:
+        return self.upserts + self.deletes
+
+
+# ==================== Change Capture ====================
+
+def capture_tables(conn: sqlite3.Connection) -> List[str]:
+    """جدول‌های کاربری دارای rowid (به جز خود changelog)"""
+    names = [row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' "
+        "AND name NOT LIKE 'sqlite_%' AND name != ? ORDER BY name",
+        (CHANGELOG_TABLE,)
+    )]
+    tables = []
+    for name in names:
+        try:
+            conn.execute(f'SELECT rowid FROM "{name}" LIMIT 0')
+            tables.append(name)
+        except sqlite3.OperationalError:
+            # WITHOUT ROWID
+            logger.warning("⚠️ جدول %s بدون rowid است و در بکاپ افزایشی ثبت نمی‌شود", name)
+    return tables
+
+
+def install_change_capture(conn: sqlite3.Connection) -> int:
+    """
+    ایجاد جدول changelog و trigger های جدول‌هایی که هنوز ندارن
+
+    Returns:
+        تعداد جدول‌های تحت پوشش
+    """
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {CHANGELOG_TABLE} (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            tbl TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            UNIQUE (tbl, row_id)
+        )
+    """)
+
+    tables = capture_tables(conn)
+    for table in tables:
+        record = (f"INSERT OR REPLACE INTO {CHANGELOG_TABLE} (tbl, row_id) "
+                  f"VALUES ('{table}', {{}}.rowid);")
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS "{TRIGGER_PREFIX}{table}_ins"
+            AFTER INSERT ON "{table}"
+            BEGIN {record.format('NEW')} END
+        """)
+        # اگه rowid عوض بشه، rowid قبلی هم (به عنوان حذف‌شده) ثبت میشه
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS "{TRIGGER_PREFIX}{table}_upd"
+            AFTER UPDATE ON "{table}"
+            BEGIN
+                {record.format('NEW')}
+                INSERT OR REPLACE INTO {CHANGELOG_TABLE} (tbl, row_id)
+                SELECT '{table}', OLD.rowid WHERE OLD.rowid != NEW.rowid;
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS "{TRIGGER_PREFIX}{table}_del"
+            AFTER DELETE ON "{table}"
+            BEGIN {record.format('OLD')} END
+        """)
+    conn.commit()
+    return len(tables)
+
+
+def remove_change_capture(conn: sqlite3.Connection):
+    """حذف trigger ها و changelog (وقتی بکاپ افزایشی غیرفعال میشه)"""
+    triggers = [row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE ?",
+        (TRIGGER_PREFIX + '%',)
+    )]
+    for name in triggers:
+        conn.execute(f'DROP TRIGGER IF EXISTS "{name}"')
+    conn.execute(f"DROP TABLE IF EXISTS {CHANGELOG_TABLE}")
+    conn.commit()
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA schema_version").fetchone()[0]
+
+
+def last_seq(conn: sqlite3.Connection) -> int:
+    try:
+        return conn.execute(f"SELECT COALESCE(MAX(seq), 0) FROM {CHANGELOG_TABLE}").fetchone()[0]
+    except sqlite3.OperationalError:
+        return 0
+
+
+def _prune_changelog(source_db: str, upto_seq: int):
+    """حذف تغییرات ثبت‌شده تا upto_seq (ردیف‌هایی که بعداً دوباره تغییر کردن seq جدید دارن)"""
+    conn = sqlite3.connect(source_db, timeout=30)
+    try:
+        conn.execute(f"DELETE FROM {CHANGELOG_TABLE} WHERE seq <= ?", (upto_seq,))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+# ==================== State ====================
+
+def load_state(folder: str) -> Optional[Dict]:
+    path = os.path.join(folder, STATE_FILE)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning("⚠️ وضعیت بکاپ افزایشی قابل خواندن نیست: %s", e)
+        return None
+
+
+def save_state(folder: str, state: Dict):
+    """ذخیره اتمیک وضعیت زنجیره"""
+    path = os.path.join(folder, STATE_FILE)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+
+def prepare_full_backup(source_db: str) -> int:
+    """
+    قبل از کپی کامل: نصب trigger ها (تا changelog در خود کپی باشه)
+
+    Returns:
+        schema_version دیتابیس زنده (Backup API نسخه schema کپی رو عوض می‌کنه،
+        پس از کپی قابل خوندن نیست)
+    """
+    conn = sqlite3.connect(source_db, timeout=30)
+    try:
+        install_change_capture(conn)
+        return schema_version(conn)
+    finally:
+        conn.close()
+
+
+def mark_full_backup(source_db: str, snapshot_path: str, folder: str, name: str, version: int):
+    """
+    بعد از کپی کامل: شروع زنجیره جدید از روی همون snapshot
+
+    base_seq از خود کپی خونده میشه، پس تغییرات بعد از لحظه کپی دقیقاً از
+    base_seq + 1 شروع میشن.
+    """
+    conn = sqlite3.connect(snapshot_path)
+    try:
+        base_seq = last_seq(conn)
+    finally:
+        conn.close()
+
+    conn = sqlite3.connect(source_db, timeout=30)
+    try:
+        # schema در حین کپی عوض شده: زنجیره نامعتبر و بکاپ کامل بعدی اجباری
+        if schema_version(conn) != version:
+            version = None
+    finally:
+        conn.close()
+
+    save_state(folder, {
+        'base': name,
+        'base_seq': base_seq,
+        'last_seq': base_seq,
+        'schema_version': version,
+        'increments': 0,
+    })
+    _prune_changelog(source_db, base_seq)
+
+
+# ==================== Capture ====================
+
+def _encode(value):
+    if isinstance(value, bytes):
+        return {'$b64': base64.b64encode(value).decode('ascii')}
+    raise TypeError(f"unsupported type: {type(value).__name__}")
+
+
+def _decode(obj):
+    if len(obj) == 1 and '$b64' in obj:
+        return base64.b64decode(obj['$b64'])
+    return obj
+
+
+def _fetch_rows(conn: sqlite3.Connection, table: str, row_ids: List[int]) -> Dict[int, Dict]:
+    rows = {}
+    for i in range(0, len(row_ids), FETCH_CHUNK):
+        chunk = row_ids[i:i + FETCH_CHUNK]
+        placeholders = ','.join('?' * len(chunk))
+        cursor = conn.execute(
+            f'SELECT rowid AS __rowid__, * FROM "{table}" WHERE rowid IN ({placeholders})', chunk
+        )
+        columns = [d[0] for d in cursor.description]
+        for values in cursor:
+            row = dict(zip(columns, values))
+            rows[row.pop('__rowid__')] = row
+    return rows
+
+
+def increment_path(folder: str, base: str, number: int) -> str:
+    """نام increment با پیشوند بکاپ پایه (پاکسازی همراه بکاپ کامل حذفش می‌کنه)"""
+    stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    return os.path.join(folder, f"{base}.inc{number:04d}_{stamp}.jsonl.gz")
+
+
+def list_increments(folder: str, base: str) -> List[str]:
+    """increment های یک بکاپ پایه به ترتیب"""
+    prefix = f"{base}.inc"
+    return sorted(
+        os.path.join(folder, name) for name in os.listdir(folder)
+        if name.startswith(prefix) and name.endswith('.jsonl.gz')
+    )
+
+
+def _base_exists(folder: str, base: str) -> bool:
+    return any(name.startswith(f"{base}.db") and not name.endswith('.tmp')
+               for name in os.listdir(folder))
+
+
+def run_incremental_backup(source_db: str, folder: str) -> Optional[IncrementResult]:
+    """
+    ثبت تغییرات از آخرین بکاپ (blocking - در thread جدا اجرا میشه)
+
+    Returns:
+        نتیجه، یا None اگه تغییری نبوده
+
+    Raises:
+        NeedFullBackup: اگه بکاپ کامل پایه نباشه یا schema عوض شده باشه
+    """
+    state = load_state(folder)
+    if not state or not _base_exists(folder, state['base']):
+        raise NeedFullBackup("no base backup")
+
+    start = time.perf_counter()
+    tmp_path = None
+    conn = sqlite3.connect(source_db, timeout=30, isolation_level=None)
+    try:
+        if schema_version(conn) != state['schema_version']:
+            raise NeedFullBackup("schema changed since base backup")
+
+        # ✅ همه خواندن‌ها در یک تراکنش = snapshot سازگار (WAL)
+        conn.execute("BEGIN")
+        try:
+            from_seq = state['last_seq']
+            changes = conn.execute(
+                f"SELECT seq, tbl, row_id FROM {CHANGELOG_TABLE} WHERE seq > ? ORDER BY seq",
+                (from_seq,)
+            ).fetchall()
+            if not changes:
+                return None
+            to_seq = changes[-1][0]
+
+            # خواندن دسته‌ای برای هر جدول، ولی نوشتن به ترتیب seq
+            by_table: Dict[str, List[int]] = {}
+            for _, table, row_id in changes:
+                by_table.setdefault(table, []).append(row_id)
+            rows = {table: _fetch_rows(conn, table, row_ids) for table, row_ids in by_table.items()}
+
+            number = state['increments'] + 1
+            path = increment_path(folder, state['base'], number)
+            tmp_path = path + '.tmp'
+            upserts = deletes = 0
+            with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+                f.write(json.dumps({
+                    'base': state['base'], 'number': number,
+                    'from_seq': from_seq, 'to_seq': to_seq,
+                    'schema_version': state['schema_version'],
+                    'created': datetime.now().isoformat(timespec='seconds'),
+                }) + '\n')
+                for _, table, row_id in changes:
+                    row = rows[table].get(row_id)
+                    if row is None:
+                        deletes += 1
+                    else:
+                        upserts += 1
+                    f.write(json.dumps({'t': table, 'r': row_id, 'row': row},
+                                       ensure_ascii=False, default=_encode) + '\n')
+        except Exception:
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        finally:
+            conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+    os.replace(tmp_path, path)
+    state.update(last_seq=to_seq, increments=number)
+    save_state(folder, state)
+    _prune_changelog(source_db, to_seq)
+
+    return IncrementResult(
+        path=path, base=state['base'], number=number,
+        from_seq=from_seq, to_seq=to_seq,
+        upserts=upserts, deletes=deletes,
+        size=os.path.getsize(path),
+        seconds=time.perf_counter() - start,
+    )
+
+
+# ==================== Replay ====================
+
+def read_increment(path: str) -> Tuple[Dict, List[Dict]]:
+    """خواندن header و تغییرات یک increment"""
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        header = json.loads(f.readline())
+        changes = [json.loads(line, object_hook=_decode) for line in f if line.strip()]
+    return header, changes
+
+
+def _app_triggers(conn: sqlite3.Connection) -> List[Tuple[str, str]]:
+    """trigger های خود برنامه (به جز trigger های changelog): [(name, sql)]"""
+    return [(name, sql) for name, sql in conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'trigger' ORDER BY name"
+    ) if not name.startswith(TRIGGER_PREFIX) and sql]
+
+
+def apply_increment(conn: sqlite3.Connection, changes: List[Dict]) -> int:
+    """
+    اعمال تغییرات یک increment روی دیتابیس بازیابی‌شده (در یک تراکنش)
+
+    trigger های برنامه (مثل trg_product_stats_order_*) در همین تراکنش حذف و بعد
+    از روی sqlite_master دوباره ساخته میشن؛ وگرنه ردیف‌های اضافه می‌ساختن.
+    """
+    triggers = _app_triggers(conn)
+    with conn:
+        if not conn.in_transaction:
+            conn.execute("BEGIN")
+        for name, _ in triggers:
+            conn.execute(f'DROP TRIGGER "{name}"')
+        for change in changes:
+            table, row_id, row = change['t'], change['r'], change['row']
+            if row is None:
+                conn.execute(f'DELETE FROM "{table}" WHERE rowid = ?', (row_id,))
+                continue
+            columns = ', '.join(['rowid'] + [f'"{name}"' for name in row])
+            placeholders = ', '.join('?' * (len(row) + 1))
+            conn.execute(
+                f'INSERT OR REPLACE INTO "{table}" ({columns}) VALUES ({placeholders})',
+                [row_id, *row.values()]
+            )
+        for _, sql in triggers:
+            conn.execute(sql)
+    return len(changes)
+
+
+def replay_increments(db_path: str, increments: List[str], base: str,
+                      until: Optional[int] = None) -> Dict:
+    """
+    اعمال increment ها به ترتیب روی کپی بکاپ کامل
+
+    base_seq از changelog داخل خود کپی خونده میشه، پس برای بازیابی فقط
+    فایل‌های بکاپ لازمه (نه فایل وضعیت سرور).
+
+    Args:
+        until: آخرین شماره increment برای اعمال (بازیابی به یک نقطه زمانی قبل‌تر)
+
+    Raises:
+        ValueError: اگه زنجیره ناقص باشه یا increment مال بکاپ دیگه‌ای باشه
+    """
+    conn = sqlite3.connect(db_path)
+    applied = rows = 0
+    try:
+        expected_seq = last_seq(conn)
+        for path in increments:
+            header, changes = read_increment(path)
+            if until is not None and header['number'] > until:
+                break
+            if header['base'] != base:
+                raise ValueError(f"increment belongs to {header['base']}: {os.path.basename(path)}")
+            if header['from_seq'] != expected_seq:
+                raise ValueError(f"missing increment before {os.path.basename(path)}")
+            rows += apply_increment(conn, changes)
+            expected_seq = header['to_seq']
+            applied += 1
+
+        # تغییرات اعمال‌شده روی کپی بازیابی‌شده نباید دوباره ثبت بشن
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (CHANGELOG_TABLE,)).fetchone():
+            conn.execute(f"DELETE FROM {CHANGELOG_TABLE}")
+            conn.commit()
+    finally:
+        conn.close()
+
+    return {'increments': applied, 'rows': rows, 'last_seq': expected_seq}
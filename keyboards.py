@@ -328,6 +328,7 @@ def analytics_menu_keyboard():
         [InlineKeyboardButton("⏰ ساعات شلوغی", callback_data="analytics:hourly")],
         [InlineKeyboardButton("💰 تحلیل درآمد", callback_data="analytics:revenue")],
         [InlineKeyboardButton("📈 نرخ تبدیل", callback_data="analytics:conversion")],
+        [InlineKeyboardButton("🔄 بازسازی کامل آمار محصولات", callback_data="analytics:rebuild_stats")],
     ]
     return InlineKeyboardMarkup(keyboard)
 
@@ -0,0 +1,125 @@
+"""
+مدیریت قفل به ازای هر کلید (مثلاً هر کاربر) برای جلوگیری از Race Condition
+✅ قفل‌های refcount شده: بعد از آزاد شدن آخرین استفاده‌کننده حذف میشن
+✅ حالت striped: تعداد ثابت قفل (سقف حافظه ثابت، چند کلید ممکنه یک قفل مشترک داشته باشن)
+✅ آمار رقابت (زمان انتظار، طول صف) برای داشبورد مانیتورینگ
+
+مثال:
+    cart_locks = KeyedLockManager('cart')
+
+    async with cart_locks.lock(user_id):
+        ...
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Hashable
+
+
+class _LockEntry:
+    """یک قفل + تعداد استفاده‌کننده‌های فعلی (نگه‌دارنده + منتظرها)"""
+    __slots__ = ('lock', 'refs')
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.refs = 0
+
+
+class KeyedLockManager:
+    """
+    قفل async به ازای هر کلید
+
+    Args:
+        name: نام (برای آمار)
+        stripes: 0 = یک قفل refcount شده برای هر کلید فعال؛
+                 N > 0 = N قفل ثابت و نگاشت کلید با hash
+    """
+
+    def __init__(self, name: str = 'locks', stripes: int = 0):
+        self.name = name
+        self.stripes = stripes
+
+        self._entries: Dict[Hashable, _LockEntry] = {}
+        self._stripe_entries = [_LockEntry() for _ in range(stripes)] if stripes else None
+
+        # آمار رقابت
+        self.acquisitions = 0
+        self.contended = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.waiting = 0
+        self.max_waiting = 0
+        self.active = 0
+
+    def _ref(self, key: Hashable) -> _LockEntry:
+        if self._stripe_entries is not None:
+            entry = self._stripe_entries[hash(key) % self.stripes]
+        else:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _LockEntry()
+        entry.refs += 1
+        return entry
+
+    def _unref(self, key: Hashable, entry: _LockEntry):
+        entry.refs -= 1
+        if self._stripe_entries is None and entry.refs == 0:
+            # ✅ آخرین استفاده‌کننده: قفل بیکار حذف میشه
+            self._entries.pop(key, None)
+
+    @asynccontextmanager
+    async def lock(self, key: Hashable):
+        """گرفتن قفل کلید (async context manager)"""
+        entry = self._ref(key)
+        start = time.perf_counter()
+        contended = entry.lock.locked()
+
+        if contended:
+            self.waiting += 1
+            self.max_waiting = max(self.max_waiting, self.waiting)
+
+        try:
+            await entry.lock.acquire()
+        except BaseException:
+            self._unref(key, entry)
+            raise
+        finally:
+            if contended:
+                self.waiting -= 1
+
+        wait = time.perf_counter() - start
+        self.acquisitions += 1
+        if contended:
+            self.contended += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            entry.lock.release()
+            self._unref(key, entry)
+
+    def __len__(self):
+        """تعداد کلیدهایی که الان قفل دارن یا منتظر قفل هستن"""
+        if self._stripe_entries is not None:
+            return sum(1 for entry in self._stripe_entries if entry.refs)
+        return len(self._entries)
+
+    def get_stats(self) -> Dict:
+        """آمار رقابت برای مانیتورینگ"""
+        return {
+            'name': self.name,
+            'mode': f'striped({self.stripes})' if self.stripes else 'refcounted',
+            'tracked_locks': len(self),
+            'active': self.active,
+            'waiting': self.waiting,
+            'max_waiting': self.max_waiting,
+            'acquisitions': self.acquisitions,
+            'contended': self.contended,
+            'contention_rate': round(self.contended / self.acquisitions * 100, 2) if self.acquisitions else 0,
+            'avg_wait_ms': round(self.total_wait / self.contended * 1000, 2) if self.contended else 0,
+            'max_wait_ms': round(self.max_wait * 1000, 2),
+        }
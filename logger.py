@@ -3,10 +3,17 @@
 🔴 مرحله 3: Logging
 ✅ ثبت رویدادها، خطاها، و عملیات مهم
 ✅ FIX باگ 10: بهبود Log Rotation با backup بیشتر
+✅ QueueHandler/QueueListener: فرمت و نوشتن روی دیسک در thread پس‌زمینه
+✅ نمونه‌برداری لاگ‌های DEBUG پرحجم (LOG_DEBUG_SAMPLING)
 """
+import atexit
+import itertools
 import logging
 import os
-from logging.handlers import RotatingFileHandler, TimedRotatingFileHandler
+import queue
+from logging.handlers import (
+    RotatingFileHandler, TimedRotatingFileHandler, QueueHandler, QueueListener
+)
 from datetime import datetime
 from functools import wraps
 from typing import Optional
@@ -25,6 +32,121 @@ MAX_LOG_SIZE = 20 * 1024 * 1024
 BACKUP_COUNT = 10
 
 
+# نمونه‌برداری DEBUG: 'cache_manager=0.01,rate_limiter=0.1'
+# (پیشوند نام logger = نسبت نگه‌داری؛ فقط روی سطح DEBUG اعمال میشه)
+DEBUG_SAMPLING = os.getenv('LOG_DEBUG_SAMPLING', '')
+
+# listener های فعال (برای خالی کردن صف در خروج)
+_listeners = []
+
+# نوع‌هایی که نگه داشتن‌شون در args تا زمان فرمت در thread پس‌زمینه امنه
+_IMMUTABLE_ARGS = (str, int, float, bool, type(None), bytes)
+
+
+# ==================== صف و نمونه‌برداری ====================
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    QueueHandler درون‌process که فرمت کردن رو به thread listener می‌سپاره
+
+    QueueHandler استاندارد در prepare() پیام رو فرمت و exc_info رو حذف می‌کنه
+    (برای صف بین process ها). اینجا record همون‌طور میره؛ فقط اگه args شیء
+    تغییرپذیر داشته باشه پیام همین‌جا ساخته میشه تا مقدار لحظه لاگ ثبت بشه.
+    """
+    
+    def prepare(self, record):
+        args = record.args
+        if args and not (isinstance(args, tuple) and all(isinstance(a, _IMMUTABLE_ARGS) for a in args)):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+class DebugSamplingFilter(logging.Filter):
+    """
+    نگه داشتن فقط بخشی از لاگ‌های DEBUG دسته‌های پرحجم
+    
+    Args:
+        rates: {پیشوند نام logger: نسبت نگه‌داری بین 0 و 1}
+    """
+    
+    def __init__(self, rates: dict):
+        super().__init__()
+        # طولانی‌ترین پیشوند اول تطبیق داده میشه
+        self.rates = sorted(rates.items(), key=lambda item: -len(item[0]))
+        self._counters = {prefix: itertools.count() for prefix, _ in self.rates}
+    
+    def filter(self, record):
+        if record.levelno > logging.DEBUG:
+            return True
+        for prefix, rate in self.rates:
+            if record.name.startswith(prefix):
+                if rate <= 0:
+                    return False
+                every = max(int(round(1 / rate)), 1)
+                return next(self._counters[prefix]) % every == 0
+        return True
+
+
+def parse_sampling(spec: str) -> dict:
+    """تبدیل 'cache_manager=0.01,rate_limiter=0.1' به dict"""
+    rates = {}
+    for part in spec.split(','):
+        if '=' not in part:
+            continue
+        name, rate = part.split('=', 1)
+        try:
+            rates[name.strip()] = float(rate)
+        except ValueError:
+            continue
+    return rates
+
+
+def attach_queue(logger: logging.Logger, handlers, sampling: str = DEBUG_SAMPLING) -> QueueListener:
+    """
+    انتقال handler ها پشت یک صف: logger فقط record رو در صف می‌ذاره و
+    یک thread پس‌زمینه فرمت و نوشتن رو انجام میده
+    """
+    log_queue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    
+    rates = parse_sampling(sampling)
+    if rates:
+        queue_handler.addFilter(DebugSamplingFilter(rates))
+    
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    _listeners.append(listener)
+    
+    logger.addHandler(queue_handler)
+    return listener
+
+
+def install_root_queue():
+    """
+    انتقال handler های root logger (مثلاً basicConfig در main.py) پشت صف
+    تا لاگ ماژول‌ها هم روی event loop روی کنسول/دیسک ننویسن
+    """
+    root = logging.getLogger()
+    handlers = [h for h in root.handlers if not isinstance(h, QueueHandler)]
+    if not handlers:
+        return None
+    for handler in handlers:
+        root.removeHandler(handler)
+    return attach_queue(root, handlers)
+
+
+@atexit.register
+def stop_listeners():
+    """خالی کردن صف‌ها و بستن thread های listener"""
+    while _listeners:
+        listener = _listeners.pop()
+        try:
+            listener.stop()
+        except Exception:
+            pass
+
+
 # ==================== ایجاد پوشه لاگ ====================
 
 def setup_log_folder():
@@ -40,7 +162,8 @@ def setup_logger(
     name: str = "bot",
     level: int = logging.INFO,
     log_to_console: bool = True,
-    log_to_file: bool = True
+    log_to_file: bool = True,
+    use_queue: bool = True
 ) -> logging.Logger:
     """
     ایجاد و تنظیم logger
@@ -51,6 +174,7 @@ def setup_logger(
         level: سطح لاگ (DEBUG, INFO, WARNING, ERROR, CRITICAL)
         log_to_console: لاگ در کنسول
         log_to_file: لاگ در فایل
+        use_queue: نوشتن در thread پس‌زمینه (False = همزمان، برای بنچمارک)
     
     Returns:
         logger تنظیم شده
@@ -66,12 +190,15 @@ def setup_logger(
     
     formatter = logging.Formatter(LOG_FORMAT, datefmt=DATE_FORMAT)
     
+    # ✅ handler ها پشت صف قرار می‌گیرن (پایین تابع)
+    handlers = []
+    
     # ==================== Console Handler ====================
     if log_to_console:
         console_handler = logging.StreamHandler()
         console_handler.setLevel(logging.INFO)
         console_handler.setFormatter(formatter)
-        logger.addHandler(console_handler)
+        handlers.append(console_handler)
     
     # ==================== File Handler - All Logs ====================
     if log_to_file:
@@ -85,7 +212,7 @@ def setup_logger(
         )
         all_handler.setLevel(logging.DEBUG)
         all_handler.setFormatter(formatter)
-        logger.addHandler(all_handler)
+        handlers.append(all_handler)
         
         # ==================== File Handler - Errors Only ====================
         # فایل جداگانه برای خطاها
@@ -98,7 +225,7 @@ def setup_logger(
         )
         error_handler.setLevel(logging.ERROR)
         error_handler.setFormatter(formatter)
-        logger.addHandler(error_handler)
+        handlers.append(error_handler)
         
         # ==================== File Handler - Daily Rotation ====================
         # ✅ FIX باگ 10: لاگ روزانه با backup بیشتر (60 روز)
@@ -113,7 +240,14 @@ def setup_logger(
         daily_handler.setLevel(logging.INFO)
         daily_handler.setFormatter(formatter)
         daily_handler.suffix = "%Y-%m-%d"  # فرمت: bot_daily.log.2024-12-25
-        logger.addHandler(daily_handler)
+        handlers.append(daily_handler)
+    
+    # ✅ نوشتن در thread پس‌زمینه؛ thread فراخواننده فقط record رو در صف می‌ذاره
+    if handlers and use_queue:
+        attach_queue(logger, handlers)
+    else:
+        for handler in handlers:
+            logger.addHandler(handler)
     
     return logger
 
@@ -178,7 +312,7 @@ def log_function_call(logger: Optional[logging.Logger] = None):
 
 def log_user_action(user_id: int, action: str, details: str = ""):
     """لاگ عملیات کاربر"""
-    bot_logger.info(f"👤 کاربر {user_id} | عملیات: {action} | {details}")
+    bot_logger.info("👤 کاربر %s | عملیات: %s | %s", user_id, action, details)
 
 
 def log_order(order_id: int, user_id: int, status: str, amount: float):
@@ -191,7 +325,7 @@ def log_order(order_id: int, user_id: int, status: str, amount: float):
 
 def log_payment(order_id: int, user_id: int, status: str):
     """لاگ پرداخت"""
-    bot_logger.info(f"💳 پرداخت سفارش #{order_id} | کاربر: {user_id} | وضعیت: {status}")
+    bot_logger.info("💳 پرداخت سفارش #%s | کاربر: %s | وضعیت: %s", order_id, user_id, status)
 
 
 def log_discount_usage(user_id: int, code: str, amount: float):
@@ -202,16 +336,21 @@ def log_discount_usage(user_id: int, code: str, amount: float):
 def log_database_operation(operation: str, table: str, record_id: Optional[int] = None):
     """لاگ عملیات دیتابیس"""
     if record_id:
-        bot_logger.debug(f"💾 دیتابیس | {operation} | جدول: {table} | ID: {record_id}")
+        bot_logger.debug("💾 دیتابیس | %s | جدول: %s | ID: %s", operation, table, record_id)
     else:
-        bot_logger.debug(f"💾 دیتابیس | {operation} | جدول: {table}")
+        bot_logger.debug("💾 دیتابیس | %s | جدول: %s", operation, table)
+
+
+def log_slow_query(duration_ms: float, fingerprint: str):
+    """لاگ کوئری کند"""
+    bot_logger.warning("🐢 Slow Query | %.1fms | %s", duration_ms, fingerprint[:300])
 
 
 def log_rate_limit(user_id: int, action: str, remaining_time: int):
     """لاگ محدودیت درخواست"""
     bot_logger.warning(
-        f"⚠️ Rate Limit | کاربر: {user_id} | عملیات: {action} | "
-        f"زمان باقیمانده: {remaining_time}s"
+        "⚠️ Rate Limit | کاربر: %s | عملیات: %s | زمان باقیمانده: %ss",
+        user_id, action, remaining_time
     )
 
 
@@ -225,7 +364,7 @@ def log_error(error_type: str, error_message: str, user_id: Optional[int] = None
 
 def log_admin_action(admin_id: int, action: str, details: str = ""):
     """لاگ عملیات ادمین"""
-    bot_logger.info(f"👨‍💼 ادمین {admin_id} | {action} | {details}")
+    bot_logger.info("👨‍💼 ادمین %s | %s | %s", admin_id, action, details)
 
 
 def log_broadcast(admin_id: int, success: int, failed: int, total: int):
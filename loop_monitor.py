@@ -0,0 +1,198 @@
+"""
+مانیتور تأخیر event loop و تشخیص callback های بلاک‌کننده
+✅ یک task سبک که هر interval ثانیه می‌خوابه و تأخیر بیدار شدن (lag) رو اندازه می‌گیره
+✅ lag بیشتر از آستانه = یک callback همزمان (SQLite، matplotlib، فایل...) loop رو بلاک کرده
+✅ حالت debug: یک thread نگهبان اگه heartbeat loop دیر کنه پشته thread loop رو ثبت می‌کنه
+✅ گزارش در Health Check، /api/stats و /api/loop و متریک‌های /metrics
+
+هزینه: یک بیدار شدن در هر interval روی loop؛ thread نگهبان فقط در حالت debug
+و با فاصله threshold/2 بیدار میشه.
+"""
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from config import LOOP_LAG_INTERVAL, LOOP_BLOCK_THRESHOLD_MS, LOOP_BLOCK_DEBUG
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+LOOP_LAG = registry.histogram(
+    'bot_event_loop_lag_seconds', 'Event loop scheduling delay',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+LOOP_BLOCKED = registry.counter(
+    'bot_event_loop_blocked_total', 'Times the event loop was blocked longer than the threshold')
+
+# تعداد نمونه lag نگه‌داشته‌شده (با interval 0.5s ≈ 5 دقیقه)
+LAG_WINDOW = 600
+
+# تعداد رویداد بلاک اخیر (با پشته) برای گزارش
+MAX_BLOCK_EVENTS = 20
+
+# حداکثر قاب ثبت‌شده از پشته
+STACK_LIMIT = 25
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(int(round(pct / 100 * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[idx]
+
+
+class LoopLagMonitor:
+    """
+    نمونه‌بردار تأخیر event loop
+
+    Args:
+        interval: فاصله نمونه‌برداری (ثانیه)
+        threshold_ms: آستانه بلاک شدن loop (میلی‌ثانیه)
+        capture_stacks: فعال کردن thread نگهبان برای ثبت پشته callback بلاک‌کننده
+    """
+
+    def __init__(self, interval: float = 0.5, threshold_ms: float = 250, capture_stacks: bool = False):
+        self.interval = interval
+        self.threshold = threshold_ms / 1000
+        self.capture_stacks = capture_stacks
+
+        self._lags = deque(maxlen=LAG_WINDOW)
+        self.events = deque(maxlen=MAX_BLOCK_EVENTS)
+        self.blocked_total = 0
+        self.max_lag = 0.0
+        self.last_lag = 0.0
+
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._loop_thread_id: Optional[int] = None
+        self._heartbeat = time.perf_counter()
+        self._pending_event: Optional[Dict] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """شروع task نمونه‌برداری (باید داخل event loop صدا زده بشه)"""
+        if self.running:
+            return
+        self._stop.clear()
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.perf_counter()
+        self._task = asyncio.get_running_loop().create_task(self._run(), name="loop_lag_monitor")
+
+        if self.capture_stacks:
+            self._watchdog = threading.Thread(target=self._watch, daemon=True, name="LoopWatchdog")
+            self._watchdog.start()
+
+        logger.info(f"✅ Loop lag monitor started (interval={self.interval}s, "
+                    f"threshold={self.threshold * 1000:.0f}ms, stacks={self.capture_stacks})")
+
+    def stop(self):
+        """توقف task و thread نگهبان"""
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.record(loop.time() - start - self.interval)
+
+    def record(self, lag: float):
+        """ثبت یک نمونه lag (از task نمونه‌برداری)"""
+        lag = max(lag, 0.0)
+        self._heartbeat = time.perf_counter()
+        self._lags.append(lag)
+        self.last_lag = lag
+        self.max_lag = max(self.max_lag, lag)
+        LOOP_LAG.observe(lag)
+
+        if lag < self.threshold:
+            return
+
+        self.blocked_total += 1
+        LOOP_BLOCKED.inc()
+
+        event = self._pending_event
+        self._pending_event = None
+        if event is None:
+            # بدون حالت debug (یا بلاک کوتاه‌تر از بازه نگهبان): فقط مدت ثبت میشه
+            event = {'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 'stack': None}
+            self.events.append(event)
+        event['blocked_ms'] = round(lag * 1000, 1)
+
+        logger.warning(f"⚠️ Event loop blocked for {lag * 1000:.0f}ms")
+
+    def _watch(self):
+        """thread نگهبان: ثبت پشته thread loop وقتی heartbeat دیر کرده"""
+        check_every = max(self.threshold / 2, 0.01)
+        captured_for = None
+
+        while not self._stop.wait(check_every):
+            beat = self._heartbeat
+            overdue = time.perf_counter() - beat - self.interval
+            if overdue < self.threshold or captured_for == beat:
+                continue
+
+            # یک بار برای هر بلاک
+            captured_for = beat
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+
+            stack = ''.join(traceback.format_stack(frame, limit=STACK_LIMIT))
+            event = {
+                'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'blocked_ms': round(overdue * 1000, 1),  # تا لحظه ثبت؛ بعداً دقیق میشه
+                'stack': stack,
+            }
+            self._pending_event = event
+            self.events.append(event)
+            logger.warning(f"⚠️ Event loop blocked > {overdue * 1000:.0f}ms, stack:\n{stack}")
+
+    def get_stats(self) -> Dict:
+        """آمار lag در پنجره اخیر"""
+        lags = sorted(self._lags)
+        return {
+            'running': self.running,
+            'interval_ms': round(self.interval * 1000, 1),
+            'threshold_ms': round(self.threshold * 1000, 1),
+            'capture_stacks': self.capture_stacks,
+            'samples': len(lags),
+            'last_ms': round(self.last_lag * 1000, 2),
+            'p50_ms': round(_percentile(lags, 50) * 1000, 2),
+            'p95_ms': round(_percentile(lags, 95) * 1000, 2),
+            'p99_ms': round(_percentile(lags, 99) * 1000, 2),
+            'window_max_ms': round((lags[-1] if lags else 0) * 1000, 2),
+            'max_ms': round(self.max_lag * 1000, 2),
+            'blocked_total': self.blocked_total,
+            'last_block': self.events[-1]['time'] if self.events else None,
+        }
+
+    def get_block_events(self) -> List[Dict]:
+        """رویدادهای بلاک اخیر (با پشته در حالت debug)"""
+        return list(self.events)
+
+
+# ==================== مانیتور سراسری ====================
+
+loop_monitor = LoopLagMonitor(
+    interval=LOOP_LAG_INTERVAL,
+    threshold_ms=LOOP_BLOCK_THRESHOLD_MS,
+    capture_stacks=LOOP_BLOCK_DEBUG,
+)
+
+
+async def start_loop_monitor(context):
+    """Job یک‌باره: شروع مانیتور داخل event loop بات"""
+    loop_monitor.start()
@@ -1,6 +1,7 @@
 """
 ربات فروشگاه مانتو تلگرام
 """
+import asyncio
 import logging
 import signal
 import sys
@@ -27,10 +28,14 @@ from logger import (
     log_startup, 
     log_shutdown, 
     log_user_action,
-    log_error
+    log_error,
+    install_root_queue
 )
 
-from rate_limiter import rate_limiter
+from rate_limiter import get_rate_limiter, install_rate_limiter, flush_rate_limits
+from expiry_wheel import expiry_wheel, expiry_tick
+from metrics import instrument_application, create_instrumented_request
+from callback_router import CallbackRouter
 from states import *
 
 # 🆕 ایمپورت ماژول‌های جدید
@@ -49,6 +54,8 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     level=logging.INFO
 )
+# ✅ handler root هم پشت صف: نوشتن روی کنسول در thread پس‌زمینه
+install_root_queue()
 logger = logging.getLogger(__name__)
 
 # ✅ Feature #1: Monitoring Dashboard
@@ -248,12 +255,14 @@ async def manual_cleanup(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     try:
         db = context.bot_data['db']
-        report = db.cleanup_old_orders(days_old=7)
+        # ✅ پاکسازی دسته‌ای در thread جدا (event loop آزاد می‌مونه)
+        report = await asyncio.to_thread(db.cleanup_old_orders, 7)
         
         if report['success']:
             message = (
                 "✅ **پاکسازی موفقیت‌آمیز بود!**\n\n"
                 f"🗑 تعداد حذف شده: {report['deleted_count']} سفارش\n"
+                f"🗄 آرشیو شده: {report['archived_count']} سفارش\n"
                 f"📅 سفارشات قدیمی‌تر از: {report['days_old']} روز\n\n"
                 f"📊 سفارشات تکمیل شده حفظ شدند.\n"
                 f"🔥 فقط سفارشات رد شده و منقضی شده حذف شدند."
@@ -312,7 +321,7 @@ async def global_rate_limit_check(update: Update, context: ContextTypes.DEFAULT_
         return
     
     # ✅ FIX: حالا 3 تا مقدار برمیگردونه
-    allowed, remaining_time, show_alert = rate_limiter.check_rate_limit(
+    allowed, remaining_time, show_alert = get_rate_limiter().check_rate_limit(
         user_id,
         max_requests=20,
         window_seconds=60
@@ -365,10 +374,31 @@ def setup_signal_handlers(application, db):
     logger.info("✅ Signal handlers registered")
 
 
-def main():
-    """تابع اصلی"""
-    log_startup()
-    
+def _warm_up_heavy_modules():
+    """import ماژول‌های سنگین اختیاری که راه‌اندازی منتظرشون نمی‌مونه (در thread جدا)"""
+    from handlers.analytics import get_pyplot
+    get_pyplot()
+    import openpyxl  # noqa: F401 (export_manager موقع ساخت Excel)
+
+
+async def warm_up_imports(context: ContextTypes.DEFAULT_TYPE):
+    """✅ پیش‌بارگذاری پس‌زمینه: اولین نمودار یا خروجی Excel معطل import نمی‌مونه"""
+    started = time.perf_counter()
+    try:
+        await asyncio.to_thread(_warm_up_heavy_modules)
+        logger.info(f"✅ Heavy modules warmed up in {time.perf_counter() - started:.2f}s")
+    except Exception as e:
+        logger.warning(f"⚠️ خطا در پیش‌بارگذاری ماژول‌ها: {e}")
+
+
+def build_application(request=None) -> Application:
+    """
+    ساخت Application کامل (دیتابیس، job ها و همه handler ها) بدون شروع polling
+    
+    Args:
+        request: BaseRequest جایگزین برای فراخوانی‌های Bot API
+                 (پیش‌فرض: درخواست instrument شده؛ benchmark_startup نسخه آفلاین میده)
+    """
     # FIX: validate_config اینجا صدا زده میشه نه موقع import
     from config import validate_config
     try:
@@ -457,22 +487,39 @@ def main():
     # ایجاد دیتابیس
     db = Database()
     
+    # ✅ auto_vacuum=INCREMENTAL برای دیتابیس‌های قدیمی (یک‌باره، قبل از شروع ربات)
+    from db_maintenance import db_maintenance, scheduled_maintenance
+    try:
+        db_maintenance.ensure_incremental_auto_vacuum()
+    except Exception as e:
+        logger.warning(f"⚠️ خطا در فعال‌سازی incremental vacuum: {e}")
+    
     db_cache = DatabaseCache(db, cache_manager)
     health_checker = HealthChecker(db, start_time)
     enhanced_error_handler = EnhancedErrorHandler(health_checker)
     
+    # ✅ بررسی‌های سنگین سلامت در thread پس‌زمینه (خواندن وضعیت فوری میشه)
+    from config import HEALTH_SAMPLE_INTERVAL
+    health_checker.start_sampler(HEALTH_SAMPLE_INTERVAL)
+    
     # ساخت اپلیکیشن
     try:
         application = (
             Application.builder()
             .token(BOT_TOKEN)
             .job_queue(JobQueue())
+            .request(request or create_instrumented_request(connection_pool_size=256))  # ✅ زمان فراخوانی‌های Bot API
             .build()
         )
         logger.info("✅ Application با JobQueue ساخته شد")
     except Exception as e:
         logger.warning(f"⚠️ خطا در ساخت JobQueue: {e}")
-        application = Application.builder().token(BOT_TOKEN).build()
+        application = (
+            Application.builder()
+            .token(BOT_TOKEN)
+            .request(request or create_instrumented_request(connection_pool_size=256))
+            .build()
+        )
     
     # ذخیره در bot_data
     application.bot_data['db'] = db
@@ -480,6 +527,15 @@ def main():
     application.bot_data['cache_manager'] = cache_manager
     application.bot_data['health_checker'] = health_checker
     application.bot_data['error_handler'] = enhanced_error_handler
+    
+    # ✅ قفل‌های سبد خرید (برای آمار رقابت در مانیتورینگ)
+    from handlers.user import cart_locks
+    application.bot_data['cart_locks'] = cart_locks
+    
+    # ✅ snapshot فقط‌خواندنی برای گزارش‌ها و export
+    from analytics_snapshot import create_analytics_snapshot, scheduled_snapshot_refresh
+    analytics_snapshot = create_analytics_snapshot()
+    application.bot_data['analytics_snapshot'] = analytics_snapshot
 
     # ✅ بارگذاری تنظیمات کش‌بک از دیتابیس (پس از ریستارت هم حفظ می‌شه)
     try:
@@ -493,10 +549,11 @@ def main():
     setup_signal_handlers(application, db)
     
     # ✅ Feature #1: شروع داشبورد مانیتورینگ
-    if MONITORING_AVAILABLE:
+    from config import MONITORING_PORT
+    if MONITORING_AVAILABLE and MONITORING_PORT:
         try:
-            # شروع سرور مانیتورینگ در پورت 5000
-            start_monitoring_dashboard(port=5000, host='0.0.0.0')
+            # شروع سرور مانیتورینگ (Flask داخل thread سرور import میشه)
+            start_monitoring_dashboard(port=MONITORING_PORT, host='0.0.0.0')
             logger.info("✅ Monitoring dashboard started successfully")
             
             # تنظیم job برای بروزرسانی آمار (هر 30 ثانیه)
@@ -504,9 +561,8 @@ def main():
                 async def update_monitoring_stats(context):
                     """بروزرسانی آمار مانیتورینگ"""
                     try:
-                        # دریافت cart_locks از bot_data
-                        cart_locks = context.bot_data.get('cart_locks', {})
-                        update_stats(db, cart_locks)
+                        # مدیر قفل‌های سبد (برای آمار رقابت)
+                        update_stats(db, context.bot_data.get('cart_locks'))
                     except Exception as e:
                         logger.error(f"Error updating monitoring stats: {e}")
                 
@@ -522,7 +578,8 @@ def main():
     else:
         logger.warning("⚠️ Monitoring dashboard is disabled")
     
-    # اضافه کردن Global Rate Limiter
+    # اضافه کردن Global Rate Limiter (موتور پایدار همین‌جا ساخته میشه، نه موقع import)
+    install_rate_limiter()
     application.add_handler(
         TypeHandler(Update, global_rate_limit_check),
         group=-1
@@ -571,21 +628,68 @@ def main():
     except Exception as e:
         logger.warning(f"⚠️ خطا در راه‌اندازی به‌روزرسانی آمار: {e}")
     
-    # 🆕 FIX #5: پاکسازی خودکار RateLimiter (هر ساعت) - جلوگیری از Memory Leak
+    # ✅ بروزرسانی دوره‌ای snapshot تحلیلی
+    try:
+        if analytics_snapshot and hasattr(application, 'job_queue') and application.job_queue is not None:
+            from config import ANALYTICS_SNAPSHOT_INTERVAL
+            application.job_queue.run_repeating(
+                scheduled_snapshot_refresh,
+                interval=ANALYTICS_SNAPSHOT_INTERVAL,
+                first=30,
+                name="analytics_snapshot_refresh"
+            )
+            logger.info(f"✅ snapshot تحلیلی فعال شد (هر {ANALYTICS_SNAPSHOT_INTERVAL} ثانیه)")
+    except Exception as e:
+        logger.warning(f"⚠️ خطا در راه‌اندازی snapshot تحلیلی: {e}")
+    
+    # ✅ ذخیره دسته‌ای (write-behind) وضعیت Rate Limiting در backend پایدار
     try:
         if hasattr(application, 'job_queue') and application.job_queue is not None:
-            async def cleanup_rate_limiter(context):
-                rate_limiter.cleanup_stale_users(max_idle_seconds=3600)
-            
+            from config import RATE_LIMIT_FLUSH_INTERVAL
             application.job_queue.run_repeating(
-                cleanup_rate_limiter,
-                interval=3600,
+                flush_rate_limits,
+                interval=RATE_LIMIT_FLUSH_INTERVAL,
+                first=RATE_LIMIT_FLUSH_INTERVAL,
+                name="rate_limit_flush"
+            )
+    except Exception as e:
+        logger.warning(f"⚠️ خطا در راه‌اندازی ذخیره Rate Limiting: {e}")
+    
+    # ✅ انقضای تدریجی RateLimiter، کش و alert ها با timing wheel
+    # (جایگزین اسکن کامل ساعتی cleanup_stale_users)
+    try:
+        if hasattr(application, 'job_queue') and application.job_queue is not None:
+            application.job_queue.run_repeating(
+                expiry_tick,
+                interval=expiry_wheel.tick,
+                first=5,
+                name="expiry_wheel_tick"
+            )
+            logger.info("✅ Timing wheel انقضا فعال شد (هر 1 ثانیه)")
+    except Exception as e:
+        logger.warning(f"⚠️ خطا در راه‌اندازی timing wheel: {e}")
+    
+    # ✅ نگه‌داری دوره‌ای دیتابیس (checkpoint WAL، incremental vacuum، optimize)
+    try:
+        if hasattr(application, 'job_queue') and application.job_queue is not None:
+            from config import DB_MAINTENANCE_INTERVAL
+            application.job_queue.run_repeating(
+                scheduled_maintenance,
+                interval=DB_MAINTENANCE_INTERVAL,
                 first=60,
-                name="rate_limiter_cleanup"
+                name="db_maintenance"
             )
-            logger.info("✅ پاکسازی خودکار RateLimiter فعال شد (هر 1 ساعت)")
+            logger.info(f"✅ نگه‌داری خودکار دیتابیس فعال شد (هر {DB_MAINTENANCE_INTERVAL} ثانیه)")
+    except Exception as e:
+        logger.warning(f"⚠️ خطا در راه‌اندازی نگه‌داری دیتابیس: {e}")
+    
+    # ✅ مانیتور تأخیر event loop (شروع داخل loop بات)
+    try:
+        if hasattr(application, 'job_queue') and application.job_queue is not None:
+            from loop_monitor import start_loop_monitor
+            application.job_queue.run_once(start_loop_monitor, when=1, name="loop_lag_monitor_start")
     except Exception as e:
-        logger.warning(f"⚠️ خطا در راه‌اندازی پاکسازی RateLimiter: {e}")
+        logger.warning(f"⚠️ خطا در راه‌اندازی مانیتور event loop: {e}")
     
     # ==================== ConversationHandler ها ====================
     
@@ -749,8 +853,13 @@ def main():
     application.add_handler(add_pack_conv)
     application.add_handler(product_search_conv)
     
-    # ✅ کل محصولات (CallbackQueryHandler نه ConversationHandler چون فقط یه action هست)
-    application.add_handler(CallbackQueryHandler(product_list_all, pattern="^product_list:all$"))
+    # ✅ همه callback های ساده از یک مسیریاب: یک lookup به جای امتحان ده‌ها regex پشت سر هم
+    # (entry point های ConversationHandler ها جدا می‌مونن؛ پیشوندهاشون با مسیرها هم‌پوشانی نداره)
+    callback_router = CallbackRouter()
+    application.add_handler(callback_router)
+    
+    # ✅ کل محصولات (مسیر ساده نه ConversationHandler چون فقط یه action هست)
+    callback_router.exact("product_list:all", product_list_all)
     application.add_handler(edit_product_name_conv)
     application.add_handler(edit_product_desc_conv)
     application.add_handler(edit_product_photo_conv)
@@ -764,67 +873,67 @@ def main():
     application.add_handler(edit_user_info_conv)
     application.add_handler(final_edit_conv)
     
-    application.add_handler(CallbackQueryHandler(handle_dashboard_callback, pattern="^dash:"))
+    callback_router.route("dash", handle_dashboard_callback)
     
     # CallbackQuery هندلر
     # CallbackQuery هندلرها
-    application.add_handler(CallbackQueryHandler(handle_pack_selection, pattern="^select_pack:"))
-    application.add_handler(CallbackQueryHandler(back_to_packs, pattern="^back_to_packs:"))
-    application.add_handler(CallbackQueryHandler(edit_product_menu, pattern="^edit_product:"))
-    application.add_handler(CallbackQueryHandler(view_packs_with_edit, pattern="^view_packs:"))
-    application.add_handler(CallbackQueryHandler(get_channel_link, pattern="^send_to_channel:"))
-    application.add_handler(CallbackQueryHandler(edit_in_channel, pattern="^edit_in_channel:"))
-    application.add_handler(CallbackQueryHandler(delete_product, pattern="^delete_product:"))
-    application.add_handler(CallbackQueryHandler(delete_pack_confirm, pattern="^delete_pack:"))
-    application.add_handler(CallbackQueryHandler(back_to_product, pattern="^back_to_product:"))
-    
-    application.add_handler(CallbackQueryHandler(manage_packs_menu, pattern="^manage_packs:"))
-    application.add_handler(CallbackQueryHandler(confirm_delete_pack, pattern="^confirm_delete_pack:"))
-    application.add_handler(CallbackQueryHandler(delete_pack_final, pattern="^delete_pack_final:"))
-    
-    application.add_handler(CallbackQueryHandler(view_cart, pattern="^view_cart$"))
-    application.add_handler(CallbackQueryHandler(remove_from_cart, pattern="^remove_cart:"))
-    application.add_handler(CallbackQueryHandler(clear_cart, pattern="^clear_cart$"))
-    application.add_handler(CallbackQueryHandler(cart_increase, pattern=r"^cart_increase:\d+$"))
-    application.add_handler(CallbackQueryHandler(cart_decrease, pattern=r"^cart_decrease:\d+$"))
-    
-    application.add_handler(CallbackQueryHandler(handle_shipping_selection, pattern="^ship_"))
-    application.add_handler(CallbackQueryHandler(final_confirm_order, pattern="^final_confirm$"))
-    application.add_handler(CallbackQueryHandler(use_wallet_in_invoice, pattern="^use_wallet_invoice:"))
-    application.add_handler(CallbackQueryHandler(use_wallet_cart, pattern="^use_wallet_cart$"))
-    application.add_handler(CallbackQueryHandler(use_old_address, pattern="^use_old_address$"))
-    application.add_handler(CallbackQueryHandler(use_new_address, pattern="^use_new_address$"))
-    application.add_handler(CallbackQueryHandler(confirm_user_info, pattern="^confirm_user_info$"))
-    
-    application.add_handler(CallbackQueryHandler(confirm_order, pattern="^confirm_order:"))
-    application.add_handler(CallbackQueryHandler(reject_order, pattern="^reject_order:"))
-    application.add_handler(CallbackQueryHandler(modify_order_items, pattern="^modify_order:"))
-    application.add_handler(CallbackQueryHandler(remove_item_from_order, pattern="^remove_item:"))
-    application.add_handler(CallbackQueryHandler(reject_full_order, pattern="^reject_full:"))
-    application.add_handler(CallbackQueryHandler(back_to_order_review, pattern="^back_to_order:"))
-    application.add_handler(CallbackQueryHandler(confirm_modified_order, pattern="^confirm_modified:"))
-    application.add_handler(CallbackQueryHandler(confirm_payment, pattern="^confirm_payment:"))
-    application.add_handler(CallbackQueryHandler(reject_payment, pattern="^reject_payment:"))
+    callback_router.route("select_pack", handle_pack_selection, int, int)
+    callback_router.route("back_to_packs", back_to_packs)
+    callback_router.route("edit_product", edit_product_menu, int)
+    callback_router.route("view_packs", view_packs_with_edit, int)
+    callback_router.route("send_to_channel", get_channel_link, int)
+    callback_router.route("edit_in_channel", edit_in_channel, int)
+    callback_router.route("delete_product", delete_product, int)
+    callback_router.route("delete_pack", delete_pack_confirm, int)
+    callback_router.route("back_to_product", back_to_product, int)
+    
+    callback_router.route("manage_packs", manage_packs_menu, int)
+    callback_router.route("confirm_delete_pack", confirm_delete_pack, int, int)
+    callback_router.route("delete_pack_final", delete_pack_final, int, int)
+    
+    callback_router.exact("view_cart", view_cart)
+    callback_router.route("remove_cart", remove_from_cart, int)
+    callback_router.exact("clear_cart", clear_cart)
+    callback_router.route("cart_increase", cart_increase, int)
+    callback_router.route("cart_decrease", cart_decrease, int)
+    
+    callback_router.prefix("ship_", handle_shipping_selection)
+    callback_router.exact("final_confirm", final_confirm_order)
+    callback_router.route("use_wallet_invoice", use_wallet_in_invoice, int)
+    callback_router.exact("use_wallet_cart", use_wallet_cart)
+    callback_router.exact("use_old_address", use_old_address)
+    callback_router.exact("use_new_address", use_new_address)
+    callback_router.exact("confirm_user_info", confirm_user_info)
+    
+    callback_router.route("confirm_order", confirm_order, int)
+    callback_router.route("reject_order", reject_order, int)
+    callback_router.route("modify_order", modify_order_items, int)
+    callback_router.route("remove_item", remove_item_from_order, int, int)
+    callback_router.route("reject_full", reject_full_order, int)
+    callback_router.route("back_to_order", back_to_order_review, int)
+    callback_router.route("confirm_modified", confirm_modified_order, int)
+    callback_router.route("confirm_payment", confirm_payment, int)
+    callback_router.route("reject_payment", reject_payment, int)
     
     # 🆕 Handler ارسال شدن سفارش
     from handlers.order import mark_order_shipped, admin_delete_not_shipped_order
-    application.add_handler(CallbackQueryHandler(mark_order_shipped, pattern="^mark_shipped:"))
-    application.add_handler(CallbackQueryHandler(admin_delete_not_shipped_order, pattern="^admin_delete_order:"))
-    application.add_handler(CallbackQueryHandler(handle_continue_payment, pattern="^continue_payment:"))
-    application.add_handler(CallbackQueryHandler(handle_delete_order, pattern="^delete_order:"))
+    callback_router.route("mark_shipped", mark_order_shipped, int)
+    callback_router.route("admin_delete_order", admin_delete_not_shipped_order, int)
+    callback_router.route("continue_payment", handle_continue_payment, int)
+    callback_router.route("delete_order", handle_delete_order, int)
     
-    application.add_handler(CallbackQueryHandler(increase_item_quantity, pattern="^increase_item:"))
-    application.add_handler(CallbackQueryHandler(decrease_item_quantity, pattern="^decrease_item:"))
+    callback_router.route("increase_item", increase_item_quantity, int, int)
+    callback_router.route("decrease_item", decrease_item_quantity, int, int)
     
-    application.add_handler(CallbackQueryHandler(list_discounts, pattern="^list_discounts$"))
-    application.add_handler(CallbackQueryHandler(view_discount, pattern="^view_discount:"))
-    application.add_handler(CallbackQueryHandler(toggle_discount, pattern="^toggle_discount:"))
-    application.add_handler(CallbackQueryHandler(delete_discount, pattern="^delete_discount:"))
+    callback_router.exact("list_discounts", list_discounts)
+    callback_router.route("view_discount", view_discount, int)
+    callback_router.route("toggle_discount", toggle_discount, int)
+    callback_router.route("delete_discount", delete_discount, int)
     
-    application.add_handler(CallbackQueryHandler(confirm_broadcast, pattern="^confirm_broadcast$"))
-    application.add_handler(CallbackQueryHandler(cancel_broadcast, pattern="^cancel_broadcast$"))
+    callback_router.exact("confirm_broadcast", confirm_broadcast)
+    callback_router.exact("cancel_broadcast", cancel_broadcast)
     
-    application.add_handler(CallbackQueryHandler(handle_analytics_report, pattern="^analytics:"))
+    callback_router.route("analytics", handle_analytics_report)
     
     # ✅ Handler برای بازگشت به منوی ادمین
     async def back_to_admin_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -847,7 +956,7 @@ def main():
         except Exception as e:
             logger.warning(f"Could not delete message: {e}")
     
-    application.add_handler(CallbackQueryHandler(back_to_admin_handler, pattern="^back_to_admin$"))
+    callback_router.exact("back_to_admin", back_to_admin_handler)
 
     # ==================== Wallet Handlers ====================
     from handlers.wallet_system import (
@@ -896,16 +1005,16 @@ def main():
     )
     application.add_handler(wallet_cashback_conv)
 
-    application.add_handler(CallbackQueryHandler(view_wallet,         pattern="^wallet:view$"))
-    application.add_handler(CallbackQueryHandler(view_wallet_history, pattern="^wallet:history$"))
-    application.add_handler(CallbackQueryHandler(use_wallet_in_order, pattern="^use_wallet:"))
-    application.add_handler(CallbackQueryHandler(admin_wallet_menu,   pattern="^wallet_admin:menu$"))
-    application.add_handler(CallbackQueryHandler(admin_wallet_report, pattern="^wallet_admin:report$"))
+    callback_router.exact("wallet:view", view_wallet)
+    callback_router.exact("wallet:history", view_wallet_history)
+    callback_router.route("use_wallet", use_wallet_in_order, int)
+    callback_router.exact("wallet_admin:menu", admin_wallet_menu)
+    callback_router.exact("wallet_admin:report", admin_wallet_report)
     
     # ✅ Feature #4: Export handlers
     if EXPORT_AVAILABLE:
         try:
-            application.add_handler(CallbackQueryHandler(handle_export, pattern="^export:"))
+            callback_router.route("export", handle_export)
             logger.info("✅ Export handlers added")
         except Exception as e:
             logger.error(f"❌ Failed to add export handlers: {e}")
@@ -914,17 +1023,11 @@ def main():
     if MESSAGE_CUSTOMIZER_AVAILABLE:
         try:
             # ✅ اول callback handlerهای ساده
-            application.add_handler(CallbackQueryHandler(show_category_messages, pattern="^msg_cat:"))
-            application.add_handler(CallbackQueryHandler(show_message_preview, pattern="^msg_edit:"))
-            application.add_handler(CallbackQueryHandler(reset_message, pattern="^msg_reset:"))
-            application.add_handler(CallbackQueryHandler(
-                lambda u, c: customize_messages_menu(u, c),
-                pattern="^msg_back_to_list$"
-            ))
-            application.add_handler(CallbackQueryHandler(
-                lambda u, c: customize_messages_menu(u, c),
-                pattern="^msg_back_to_categories$"
-            ))
+            callback_router.route("msg_cat", show_category_messages)
+            callback_router.route("msg_edit", show_message_preview)
+            callback_router.route("msg_reset", reset_message)
+            callback_router.exact("msg_back_to_list", customize_messages_menu)
+            callback_router.exact("msg_back_to_categories", customize_messages_menu)
             
             # ✅ بعد ConversationHandler (برای msg_start_edit:)
             application.add_handler(get_message_customizer_conversation())
@@ -947,6 +1050,23 @@ def main():
     # ✅ فقط یه بار ثبت میشه
     application.add_error_handler(error_handler_with_monitoring)
     
+    # ✅ پیش‌بارگذاری matplotlib/openpyxl بعد از شروع (نه در مسیر راه‌اندازی)
+    from config import STARTUP_WARMUP_DELAY
+    if STARTUP_WARMUP_DELAY >= 0 and application.job_queue is not None:
+        application.job_queue.run_once(warm_up_imports, when=STARTUP_WARMUP_DELAY, name="warm_up_imports")
+    
+    # ✅ Metrics middleware: پوشاندن همه handler ها (باید بعد از آخرین add_handler باشه)
+    instrument_application(application)
+    
+    return application
+
+
+def main():
+    """تابع اصلی"""
+    log_startup()
+    
+    application = build_application()
+    
     # شروع ربات
     logger.info("🤖 ربات با قابلیت‌های جدید شروع به کار کرد!")
     logger.info("✅ Health Check فعال")
@@ -968,7 +1088,7 @@ def main():
         logger.error(f"❌ Fatal error: {e}", exc_info=True)
     finally:
         try:
-            db.close()
+            application.bot_data['db'].close()
         except:
             pass
         log_shutdown()
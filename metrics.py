@@ -0,0 +1,503 @@
+"""
+رجیستری متریک به سبک Prometheus
+✅ Counter / Gauge / Histogram با bucket های ثابت
+✅ مسیر داغ بدون قفل: هر thread شارد خودش رو داره، جمع‌زدن فقط موقع scrape
+✅ middleware برای اندازه‌گیری زمان هر handler و هر پیشوند callback
+✅ خروجی text exposition format برای route /metrics
+
+مثال:
+    from metrics import HANDLER_LATENCY
+    HANDLER_LATENCY.labels('view_cart').observe(0.012)
+"""
+import bisect
+import functools
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# bucket های پیش‌فرض (ثانیه) - از 1ms تا 10s
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# سقف تعداد ترکیب label برای هر متریک؛ بقیه در 'other' جمع میشن
+MAX_LABEL_SETS = 200
+
+OVERFLOW_LABEL = 'other'
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _format_value(value: float) -> str:
+    if value != value:
+        return 'NaN'
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Sharded(ABC):
+    """
+    مقدار با یک شارد برای هر thread
+
+    هر thread فقط روی شارد خودش می‌نویسه؛ قفل فقط برای ثبت شارد جدید
+    (یک بار برای هر thread) و موقع خواندن گرفته میشه.
+    """
+    __slots__ = ('_local', '_shards', '_lock')
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards: List[list] = []
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def _new_shard(self) -> list:
+        """شارد خالی یک thread"""
+
+    def _shard(self) -> list:
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = self._new_shard()
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    def _snapshot(self) -> List[list]:
+        with self._lock:
+            return [list(shard) for shard in self._shards]
+
+
+class _CounterChild(_Sharded):
+    __slots__ = ()
+
+    def _new_shard(self):
+        return [0.0]
+
+    def inc(self, amount: float = 1.0):
+        self._shard()[0] += amount
+
+    def get(self) -> float:
+        return sum(shard[0] for shard in self._snapshot())
+
+
+class _GaugeChild:
+    __slots__ = ('value', 'function')
+
+    def __init__(self):
+        self.value = 0.0
+        self.function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+    def set_function(self, function: Callable[[], float]):
+        """مقدار موقع scrape از تابع خونده میشه"""
+        self.function = function
+
+    def get(self) -> float:
+        if self.function is not None:
+            try:
+                return float(self.function())
+            except Exception as e:
+                logger.error(f"❌ Gauge callback failed: {e}")
+                return float('nan')
+        return self.value
+
+
+class _HistogramChild(_Sharded):
+    # شارد: [count bucket 0, ..., count +Inf, sum]
+    __slots__ = ('buckets',)
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        super().__init__()
+        self.buckets = buckets
+
+    def _new_shard(self):
+        return [0] * (len(self.buckets) + 1) + [0.0]
+
+    def observe(self, value: float):
+        shard = self._shard()
+        shard[bisect.bisect_left(self.buckets, value)] += 1
+        shard[-1] += value
+
+    def time(self):
+        """context manager برای اندازه‌گیری زمان یک بلاک"""
+        return _Timer(self)
+
+    def get(self) -> Tuple[List[int], float]:
+        """(تعداد غیرتجمعی هر bucket + Inf, مجموع)"""
+        counts = [0] * (len(self.buckets) + 1)
+        total = 0.0
+        for shard in self._snapshot():
+            for i in range(len(counts)):
+                counts[i] += shard[i]
+            total += shard[-1]
+        return counts, total
+
+
+class _Timer:
+    __slots__ = ('child', 'start')
+
+    def __init__(self, child):
+        self.child = child
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.child.observe(time.perf_counter() - self.start)
+        return False
+
+
+class _Metric(ABC):
+    """پایه متریک‌ها: نگهداری child به ازای هر ترکیب label"""
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def _new_child(self):
+        """child جدید برای یک ترکیب label"""
+
+    def labels(self, *values):
+        """child مربوط به مقادیر label (ترکیب‌های بیش از سقف → 'other')"""
+        child = self._children.get(values)
+        if child is not None:
+            return child
+
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is not None:
+            return child
+
+        if len(key) != len(self.labelnames):
+            raise ValueError(f"{self.name}: expected labels {self.labelnames}, got {key}")
+
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                if len(self._children) >= MAX_LABEL_SETS:
+                    key = (OVERFLOW_LABEL,) * len(self.labelnames)
+                    child = self._children.get(key)
+                if child is None:
+                    child = self._children[key] = self._new_child()
+        return child
+
+    def _default(self):
+        return self.labels()
+
+    def children(self) -> List[Tuple[Tuple[str, ...], object]]:
+        with self._lock:
+            return list(self._children.items())
+
+    def collect(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for values, child in self.children():
+            lines.extend(self._collect_child(values, child))
+        return lines
+
+    def _collect_child(self, values, child) -> List[str]:
+        labels = _format_labels(self.labelnames, values)
+        return [f'{self.name}{labels} {_format_value(child.get())}']
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self._default().inc(amount)
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float):
+        self._default().set(value)
+
+    def set_function(self, function: Callable[[], float]):
+        self._default().set_function(function)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._default().observe(value)
+
+    def _collect_child(self, values, child) -> List[str]:
+        counts, total = child.get()
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, values, f'le="{_format_value(bound)}"')
+            lines.append(f'{self.name}_bucket{labels} {cumulative}')
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+        lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+    def summary(self, *values) -> Dict:
+        """تعداد، میانگین و p95 تقریبی (از روی bucket ها) برای گزارش‌های داخلی"""
+        counts, total = self.labels(*values).get()
+        count = sum(counts)
+        if not count:
+            return {'count': 0, 'avg_ms': 0, 'p95_ms': 0}
+
+        target = count * 0.95
+        cumulative = 0
+        p95 = self.buckets[-1]
+        for bound, c in zip(self.buckets, counts):
+            cumulative += c
+            if cumulative >= target:
+                p95 = bound
+                break
+
+        return {
+            'count': count,
+            'avg_ms': round(total / count * 1000, 2),
+            'p95_ms': round(p95 * 1000, 2),
+        }
+
+
+class MetricsRegistry:
+    """مجموعه متریک‌ها + خروجی text exposition format"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def exposition(self) -> str:
+        """خروجی برای scrape پرومتئوس"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.collect())
+        return '\n'.join(lines) + '\n'
+
+
+# ==================== رجیستری و متریک‌های سراسری ====================
+
+registry = MetricsRegistry()
+
+PROCESS_START_TIME = registry.gauge(
+    'bot_process_start_time_seconds', 'Start time of the bot process (unix epoch)')
+PROCESS_START_TIME.set(time.time())
+
+HANDLER_LATENCY = registry.histogram(
+    'bot_handler_latency_seconds', 'Handler execution time', ('handler',))
+HANDLER_ERRORS = registry.counter(
+    'bot_handler_errors_total', 'Exceptions raised by handlers', ('handler',))
+CALLBACK_LATENCY = registry.histogram(
+    'bot_callback_latency_seconds', 'Callback query handling time by callback_data prefix', ('prefix',))
+
+DB_QUERY_LATENCY = registry.histogram(
+    'bot_db_query_seconds', 'SQLite statement time (execute + row fetches)', ('operation',),
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0))
+
+CACHE_REQUESTS = registry.counter(
+    'bot_cache_requests_total', 'Cache lookups', ('result',))
+
+TELEGRAM_API_LATENCY = registry.histogram(
+    'bot_telegram_api_seconds', 'Outbound Telegram Bot API call time', ('method',))
+TELEGRAM_API_ERRORS = registry.counter(
+    'bot_telegram_api_errors_total', 'Failed outbound Telegram Bot API calls', ('method',))
+
+# child های پرتکرار از قبل ساخته میشن تا مسیر داغ فقط یک شمارنده باشه
+CACHE_HIT = CACHE_REQUESTS.labels('hit')
+CACHE_MISS = CACHE_REQUESTS.labels('miss')
+
+_SQL_OPERATIONS = frozenset((
+    'SELECT', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'WITH', 'PRAGMA',
+    'BEGIN', 'COMMIT', 'ROLLBACK', 'CREATE', 'DROP', 'ALTER', 'VACUUM', 'ANALYZE',
+))
+
+
+def sql_operation(sql: str) -> str:
+    """نوع دستور SQL برای label (مقادیر محدود)"""
+    head = sql.lstrip()[:10].split(None, 1)
+    op = head[0].upper() if head else ''
+    return op if op in _SQL_OPERATIONS else 'OTHER'
+
+
+def callback_prefix(data: Optional[str]) -> str:
+    """پیشوند callback_data (قبل از ':' یا '_' اعداد) برای label"""
+    if not data:
+        return 'none'
+    prefix = data.split(':', 1)[0]
+    return prefix.rstrip('0123456789_') or 'none'
+
+
+# ==================== Middleware برای handler ها ====================
+
+def _handler_name(callback) -> str:
+    name = getattr(callback, '__name__', None) or type(callback).__name__
+    return name
+
+
+def instrument_callback(callback, name: Optional[str] = None):
+    """پوشاندن callback یک handler با اندازه‌گیری زمان و خطا"""
+    if getattr(callback, '__metrics_wrapped__', False):
+        return callback
+
+    from telegram.ext import ApplicationHandlerStop
+
+    name = name or _handler_name(callback)
+    latency = HANDLER_LATENCY.labels(name)
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        start = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except ApplicationHandlerStop:
+            raise
+        except Exception:
+            HANDLER_ERRORS.labels(name).inc()
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            latency.observe(elapsed)
+            query = getattr(update, 'callback_query', None)
+            if query is not None:
+                CALLBACK_LATENCY.labels(callback_prefix(query.data)).observe(elapsed)
+
+    wrapper.__metrics_wrapped__ = True
+    return wrapper
+
+
+def _instrument_handler(handler, seen: set) -> int:
+    if id(handler) in seen:
+        return 0
+    seen.add(id(handler))
+
+    from telegram.ext import ConversationHandler
+    from callback_router import CallbackRouter
+
+    if isinstance(handler, CallbackRouter):
+        # هر مسیر با نام تابع مقصد خودش (نه یک label مشترک برای router)
+        for route in handler.routes():
+            route.callback = instrument_callback(route.callback)
+        return len(handler)
+
+    if isinstance(handler, ConversationHandler):
+        count = 0
+        nested = list(handler.entry_points) + list(handler.fallbacks)
+        for state_handlers in handler.states.values():
+            nested.extend(state_handlers)
+        for inner in nested:
+            count += _instrument_handler(inner, seen)
+        return count
+
+    callback = getattr(handler, 'callback', None)
+    if callback is None:
+        return 0
+    handler.callback = instrument_callback(callback)
+    return 1
+
+
+def instrument_application(application) -> int:
+    """
+    پوشاندن همه handler های ثبت‌شده (شامل handler های داخل ConversationHandler)
+    باید بعد از آخرین add_handler صدا زده بشه
+
+    Returns:
+        int: تعداد handler های پوشانده‌شده
+    """
+    seen = set()
+    count = 0
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            count += _instrument_handler(handler, seen)
+    logger.info(f"✅ Metrics middleware: {count} handlers instrumented")
+    return count
+
+
+# ==================== درخواست‌های خروجی به Telegram API ====================
+
+def create_instrumented_request(**kwargs):
+    """
+    HTTPXRequest با اندازه‌گیری زمان هر متد Bot API
+    (long polling getUpdates جدا و بدون اندازه‌گیری می‌مونه)
+    """
+    from telegram.request import HTTPXRequest
+
+    class InstrumentedHTTPXRequest(HTTPXRequest):
+        async def do_request(self, url, method, request_data=None, **timeouts):
+            # دانلود فایل: مسیر فایل نباید label بشه
+            api_method = 'file_download' if '/file/bot' in url else url.rsplit('/', 1)[-1]
+            start = time.perf_counter()
+            try:
+                status, payload = await super().do_request(url, method, request_data, **timeouts)
+            except Exception:
+                TELEGRAM_API_ERRORS.labels(api_method).inc()
+                raise
+            else:
+                if status >= 400:
+                    TELEGRAM_API_ERRORS.labels(api_method).inc()
+                return status, payload
+            finally:
+                TELEGRAM_API_LATENCY.labels(api_method).observe(time.perf_counter() - start)
+
+    return InstrumentedHTTPXRequest(**kwargs)
@@ -1,17 +1,22 @@
 """
-اسکریپت Migration برای به‌روزرسانی دیتابیس
-✅ اضافه کردن Indexes
-✅ اضافه کردن ستون‌های جدید
-✅ پاکسازی داده‌های قدیمی
+اسکریپت Migration برای به‌روزرسانی دیتابیس (با ربات خاموش)
+✅ اجرای migration های نسخه‌دار باقی‌مانده (migrations.py - همون که ربات هنگام راه‌اندازی اجرا می‌کنه)
+✅ پاکسازی داده‌های قدیمی و بهینه‌سازی (اختیاری)
+✅ تصحیح یک‌باره تاریخ سفارشات قدیمی UTC به وقت تهران (--fix-datetimes، قبلاً fix_all_datetime_issues.py)
 
 استفاده:
     python migrate_database.py
+    python migrate_database.py --status
+    python migrate_database.py --fix-datetimes
 """
+import argparse
 import sqlite3
 import logging
 import sys
-from datetime import datetime
+from datetime import datetime, timedelta
+import pytz
 from config import DATABASE_NAME
+from migrations import LATEST_VERSION, get_schema_version, pending_migrations, run_migrations
 
 logging.basicConfig(
     level=logging.INFO,
@@ -19,6 +24,12 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Timezone تهران
+TEHRAN_TZ = pytz.timezone('Asia/Tehran')
+
+# کلید bot_settings برای جلوگیری از اجرای دوباره تصحیح تاریخ‌ها (جابجایی دوباره 3:30 ساعت)
+DATETIME_FIX_KEY = 'datetime_fix_applied_at'
+
 
 def create_backup():
     """ایجاد بکاپ قبل از migration"""
@@ -35,60 +46,6 @@ def create_backup():
         return False
 
 
-def add_indexes(cursor):
-    """اضافه کردن Indexes برای بهبود Performance"""
-    logger.info("📊 اضافه کردن Indexes...")
-    
-    indexes = [
-        ("idx_orders_user_id", "CREATE INDEX IF NOT EXISTS idx_orders_user_id ON orders(user_id)"),
-        ("idx_orders_status", "CREATE INDEX IF NOT EXISTS idx_orders_status ON orders(status)"),
-        ("idx_orders_created_at", "CREATE INDEX IF NOT EXISTS idx_orders_created_at ON orders(created_at DESC)"),
-        ("idx_cart_user_id", "CREATE INDEX IF NOT EXISTS idx_cart_user_id ON cart(user_id)"),
-        ("idx_discount_code", "CREATE INDEX IF NOT EXISTS idx_discount_code ON discount_codes(code)"),
-        ("idx_products_channel_msg", "CREATE INDEX IF NOT EXISTS idx_products_channel_msg ON products(channel_message_id)"),
-        ("idx_packs_product_id", "CREATE INDEX IF NOT EXISTS idx_packs_product_id ON packs(product_id)"),
-        ("idx_orders_status_created", "CREATE INDEX IF NOT EXISTS idx_orders_status_created ON orders(status, created_at DESC)"),
-    ]
-    
-    created_count = 0
-    for name, sql in indexes:
-        try:
-            cursor.execute(sql)
-            logger.info(f"  ✅ {name}")
-            created_count += 1
-        except sqlite3.Error as e:
-            logger.warning(f"  ⚠️ {name}: {e}")
-    
-    logger.info(f"✅ {created_count}/{len(indexes)} Index اضافه شد")
-
-
-def add_missing_columns(cursor):
-    """اضافه کردن ستون‌های جدید"""
-    logger.info("📋 بررسی ستون‌های جدید...")
-    
-    # چک کردن ستون per_user_limit در discount_codes
-    cursor.execute("PRAGMA table_info(discount_codes)")
-    columns = [col[1] for col in cursor.fetchall()]
-    
-    if 'per_user_limit' not in columns:
-        logger.info("  🔄 اضافه کردن per_user_limit...")
-        cursor.execute("ALTER TABLE discount_codes ADD COLUMN per_user_limit INTEGER")
-        logger.info("  ✅ per_user_limit اضافه شد")
-    else:
-        logger.info("  ℹ️ per_user_limit قبلاً وجود دارد")
-    
-    # چک کردن ستون expires_at در orders
-    cursor.execute("PRAGMA table_info(orders)")
-    columns = [col[1] for col in cursor.fetchall()]
-    
-    if 'expires_at' not in columns:
-        logger.info("  🔄 اضافه کردن expires_at...")
-        cursor.execute("ALTER TABLE orders ADD COLUMN expires_at TIMESTAMP")
-        logger.info("  ✅ expires_at اضافه شد")
-    else:
-        logger.info("  ℹ️ expires_at قبلاً وجود دارد")
-
-
 def cleanup_old_data(cursor, days_old=30):
     """پاکسازی داده‌های قدیمی"""
     logger.info(f"🧹 پاکسازی داده‌های قدیمی‌تر از {days_old} روز...")
@@ -172,6 +129,10 @@ def optimize_database(conn):
     logger.info("⚡ بهینه‌سازی دیتابیس...")
     
     try:
+        # ✅ auto_vacuum=INCREMENTAL فقط با VACUUM کامل اعمال میشه؛ بعد از این
+        # db_maintenance فضای آزاد رو تدریجی و بدون قفل طولانی برمی‌گردونه
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        
         # VACUUM برای بازیابی فضا
         conn.execute("VACUUM")
         logger.info("  ✅ VACUUM انجام شد")
@@ -186,6 +147,60 @@ def optimize_database(conn):
         return False
 
 
+def fix_order_datetimes(conn) -> int:
+    """
+    تصحیح یک‌باره سفارشات قدیمی: created_at از UTC به تهران و expires_at = created_at + 1 ساعت
+    
+    ⚠️ غیر idempotent (هر اجرا 3:30 ساعت جابجا می‌کنه)؛ زمان اجرا در bot_settings ثبت میشه
+    و اجرای دوباره رد میشه
+    
+    Returns:
+        تعداد سفارشات تصحیح شده (-1 اگه قبلاً اجرا شده)
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT value FROM bot_settings WHERE key = ?", (DATETIME_FIX_KEY,))
+    row = cursor.fetchone()
+    if row:
+        logger.warning(f"⚠️ تصحیح تاریخ‌ها قبلاً در {row[0]} انجام شده - رد شد")
+        return -1
+    
+    cursor.execute("SELECT id, created_at FROM orders")
+    fixed_count = 0
+    for order_id, created_at_str in cursor.fetchall():
+        try:
+            created_at_utc = datetime.fromisoformat(str(created_at_str).replace('Z', '+00:00'))
+            # اگر timezone نداره، فرض می‌کنیم UTC هست
+            if created_at_utc.tzinfo is None:
+                created_at_utc = pytz.UTC.localize(created_at_utc)
+            
+            created_at_tehran = created_at_utc.astimezone(TEHRAN_TZ)
+            expires_at_tehran = created_at_tehran + timedelta(hours=1)
+            
+            # naive datetime (بدون timezone) برای ذخیره در SQLite
+            conn.execute(
+                "UPDATE orders SET created_at = ?, expires_at = ? WHERE id = ?",
+                (created_at_tehran.replace(tzinfo=None), expires_at_tehran.replace(tzinfo=None), order_id)
+            )
+            fixed_count += 1
+        except (ValueError, TypeError) as e:
+            logger.error(f"  ❌ خطا در سفارش #{order_id}: {e}")
+    
+    conn.execute(
+        "INSERT OR REPLACE INTO bot_settings (key, value, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP)",
+        (DATETIME_FIX_KEY, datetime.now(TEHRAN_TZ).strftime('%Y-%m-%d %H:%M:%S'))
+    )
+    conn.commit()
+    logger.info(f"✅ {fixed_count} سفارش تصحیح شد")
+    return fixed_count
+
+
+def show_status(conn):
+    """نمایش نسخه schema و migration های باقی‌مانده"""
+    logger.info(f"📋 نسخه schema: {get_schema_version(conn)} (آخرین نسخه: {LATEST_VERSION})")
+    for version, name in pending_migrations(conn):
+        logger.info(f"  ⏳ {version:03d} {name}")
+
+
 def migrate_database():
     """اجرای کامل Migration"""
     logger.info("="*60)
@@ -209,18 +224,10 @@ def migrate_database():
         # فعال کردن Foreign Keys
         cursor.execute("PRAGMA foreign_keys = ON")
         
-        # شروع Transaction
-        cursor.execute("BEGIN")
-        
-        # اضافه کردن Indexes
-        add_indexes(cursor)
-        
-        # اضافه کردن ستون‌های جدید
-        add_missing_columns(cursor)
-        
-        # Commit تغییرات
-        conn.commit()
-        logger.info("✅ تغییرات commit شد")
+        # migration های نسخه‌دار (هر کدوم در تراکنش جدا)
+        show_status(conn)
+        applied = run_migrations(conn)
+        logger.info(f"✅ {len(applied)} migration اجرا شد - نسخه schema: {get_schema_version(conn)}")
         
         # پاکسازی داده‌های قدیمی (اختیاری)
         response = input("\n🧹 پاکسازی داده‌های قدیمی؟ (yes/no): ")
@@ -257,17 +264,35 @@ def migrate_database():
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--status', action='store_true', help="فقط نمایش نسخه schema")
+    parser.add_argument('--fix-datetimes', action='store_true',
+                        help="تصحیح یک‌باره تاریخ سفارشات قدیمی UTC به تهران")
+    args = parser.parse_args()
+    
     print("\n" + "="*60)
     print("📦 Database Migration Script")
     print("="*60)
     print(f"Database: {DATABASE_NAME}")
     print("="*60 + "\n")
     
+    if args.status:
+        status_conn = sqlite3.connect(DATABASE_NAME)
+        show_status(status_conn)
+        status_conn.close()
+        sys.exit(0)
+    
     response = input("⚠️ آیا مطمئن هستید؟ (yes/no): ")
     
-    if response.lower() == 'yes':
-        success = migrate_database()
-        sys.exit(0 if success else 1)
-    else:
+    if response.lower() != 'yes':
         logger.info("❌ Migration لغو شد")
         sys.exit(0)
+    
+    success = migrate_database()
+    if success and args.fix_datetimes:
+        fix_conn = sqlite3.connect(DATABASE_NAME)
+        try:
+            fix_order_datetimes(fix_conn)
+        finally:
+            fix_conn.close()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,425 @@
+"""
+Migration های نسخه‌دار دیتابیس
+✅ جدول schema_version: هر migration یک بار و به ترتیب شماره اجرا میشه
+✅ راه‌اندازی وقتی schema به‌روزه فقط یک SELECT اجرا می‌کنه (بدون هیچ DDL)
+✅ هر migration در یک تراکنش BEGIN IMMEDIATE جدا، با چک دوباره نسخه داخل تراکنش
+   (دو process همزمان یک migration رو دو بار اجرا نمی‌کنن)
+✅ migration های 1 تا 5 idempotent هستن: دیتابیس‌های قدیمی بدون schema_version
+   (که جدول‌هاشون با create_tables قبلی ساخته شده) بدون خطا به نسخه آخر می‌رسن
+
+اضافه کردن migration جدید: یک تابع (conn) بنویسید و با شماره بعدی به انتهای MIGRATIONS
+اضافه کنید. شماره‌ها و migration های اجراشده هرگز عوض یا حذف نمی‌شن.
+اجرای دستی (با بکاپ قبلش): python migrate_database.py
+"""
+import logging
+import sqlite3
+import time
+from typing import Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class MigrationError(Exception):
+    """خطا در اجرای یک migration (تراکنش همون migration rollback شده)"""
+    pass
+
+
+SCHEMA_VERSION_TABLE = """
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        duration_ms REAL
+    )
+"""
+
+
+# ==================== Migration ها ====================
+
+def _base_tables(conn: sqlite3.Connection):
+    """جدول‌های اصلی ربات"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS products (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            description TEXT,
+            photo_id TEXT,
+            channel_message_id INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS packs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            product_id INTEGER,
+            name TEXT NOT NULL,
+            quantity INTEGER NOT NULL,
+            price REAL NOT NULL,
+            FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE
+        )
+    """)
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            full_name TEXT,
+            phone TEXT,
+            landline_phone TEXT,
+            address TEXT,
+            shop_name TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS cart (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            product_id INTEGER,
+            pack_id INTEGER,
+            quantity INTEGER DEFAULT 1,
+            FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE,
+            FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE,
+            FOREIGN KEY (pack_id) REFERENCES packs(id) ON DELETE CASCADE,
+            UNIQUE(user_id, pack_id)
+        )
+    """)
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS orders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            items TEXT,
+            total_price REAL,
+            discount_amount REAL DEFAULT 0,
+            final_price REAL,
+            discount_code TEXT,
+            status TEXT DEFAULT 'pending',
+            receipt_photo TEXT,
+            shipping_method TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            expires_at TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(user_id)
+        )
+    """)
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS discount_codes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            code TEXT UNIQUE NOT NULL,
+            type TEXT NOT NULL,
+            value REAL NOT NULL,
+            min_purchase REAL DEFAULT 0,
+            max_discount REAL,
+            usage_limit INTEGER,
+            used_count INTEGER DEFAULT 0,
+            per_user_limit INTEGER,
+            start_date TIMESTAMP,
+            end_date TIMESTAMP,
+            is_active INTEGER DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS discount_usage (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            discount_code TEXT,
+            order_id INTEGER,
+            used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(user_id),
+            FOREIGN KEY (order_id) REFERENCES orders(id)
+        )
+    """)
+
+    # تخفیف‌های موقت
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS temp_discount_codes (
+            user_id INTEGER PRIMARY KEY,
+            discount_code TEXT NOT NULL,
+            discount_amount REAL NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            expires_at TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
+        )
+    """)
+
+    # کیف پول
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS wallets (
+            user_id INTEGER PRIMARY KEY,
+            balance REAL NOT NULL DEFAULT 0,
+            expires_at TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS wallet_transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            amount REAL NOT NULL,
+            type TEXT NOT NULL,
+            description TEXT,
+            order_id INTEGER,
+            admin_id INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS bot_settings (
+            key TEXT PRIMARY KEY,
+            value TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # پیگیری کارهای export (وضعیت، حجم و تعداد پارت‌ها)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS export_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            admin_id INTEGER,
+            export_type TEXT NOT NULL,
+            format TEXT NOT NULL,
+            filters TEXT,
+            status TEXT DEFAULT 'pending',
+            rows_count INTEGER DEFAULT 0,
+            size_bytes INTEGER DEFAULT 0,
+            parts INTEGER DEFAULT 0,
+            error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    """)
+
+
+def _columns(conn: sqlite3.Connection, table: str) -> List[str]:
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def _added_columns(conn: sqlite3.Connection):
+    """ستون‌هایی که بعد از نسخه اول به جدول‌ها اضافه شدن"""
+    if 'per_user_limit' not in _columns(conn, 'discount_codes'):
+        logger.info("🔄 اضافه کردن ستون per_user_limit به جدول discount_codes...")
+        conn.execute("ALTER TABLE discount_codes ADD COLUMN per_user_limit INTEGER")
+
+    if 'expires_at' not in _columns(conn, 'orders'):
+        logger.info("🔄 اضافه کردن ستون expires_at و انقضای 1 ساعته سفارشات قدیمی...")
+        conn.execute("ALTER TABLE orders ADD COLUMN expires_at TIMESTAMP")
+        conn.execute("""
+            UPDATE orders
+            SET expires_at = datetime(created_at, '+1 hour')
+            WHERE expires_at IS NULL
+        """)
+
+
+def _wallets_without_foreign_keys(conn: sqlite3.Connection):
+    """بازسازی جدول‌های کیف پول قدیمی که با FOREIGN KEY ساخته شده بودن"""
+    if conn.execute("PRAGMA foreign_key_list(wallets)").fetchall():
+        logger.info("🔄 بازسازی جدول wallets بدون FOREIGN KEY...")
+        conn.execute("ALTER TABLE wallets RENAME TO wallets_old")
+        conn.execute("""
+            CREATE TABLE wallets (
+                user_id INTEGER PRIMARY KEY,
+                balance REAL NOT NULL DEFAULT 0,
+                expires_at TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        conn.execute("INSERT INTO wallets SELECT * FROM wallets_old")
+        conn.execute("DROP TABLE wallets_old")
+
+    if conn.execute("PRAGMA foreign_key_list(wallet_transactions)").fetchall():
+        logger.info("🔄 بازسازی جدول wallet_transactions بدون FOREIGN KEY...")
+        conn.execute("ALTER TABLE wallet_transactions RENAME TO wallet_transactions_old")
+        conn.execute("""
+            CREATE TABLE wallet_transactions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                amount REAL NOT NULL,
+                type TEXT NOT NULL,
+                description TEXT,
+                order_id INTEGER,
+                admin_id INTEGER,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        conn.execute("INSERT INTO wallet_transactions SELECT * FROM wallet_transactions_old")
+        conn.execute("DROP TABLE wallet_transactions_old")
+
+
+def _indexes(conn: sqlite3.Connection):
+    """Index های کوئری‌های پرتکرار"""
+    indexes = [
+        "CREATE INDEX IF NOT EXISTS idx_orders_user_id ON orders(user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_orders_status ON orders(status)",
+        "CREATE INDEX IF NOT EXISTS idx_orders_created_at ON orders(created_at DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_orders_status_created ON orders(status, created_at DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_orders_expires_at ON orders(expires_at)",
+        "CREATE INDEX IF NOT EXISTS idx_cart_user_id ON cart(user_id)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_cart_user_pack ON cart(user_id, pack_id)",
+        "CREATE INDEX IF NOT EXISTS idx_discount_code ON discount_codes(code)",
+        "CREATE INDEX IF NOT EXISTS idx_products_channel_msg ON products(channel_message_id)",
+        "CREATE INDEX IF NOT EXISTS idx_packs_product_id ON packs(product_id)",
+        "CREATE INDEX IF NOT EXISTS idx_temp_discount_user ON temp_discount_codes(user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_discount_usage_user_code ON discount_usage(user_id, discount_code)",
+        "CREATE INDEX IF NOT EXISTS idx_discount_usage_order ON discount_usage(order_id)",
+        "CREATE INDEX IF NOT EXISTS idx_wallet_transactions_user ON wallet_transactions(user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_wallet_transactions_created ON wallet_transactions(created_at DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_export_jobs_created ON export_jobs(created_at DESC)",
+    ]
+
+    for index_sql in indexes:
+        try:
+            conn.execute(index_sql)
+        except sqlite3.Error as e:
+            # مثلاً index یکتای سبد روی داده تکراری قدیمی - بقیه index ها ساخته میشن
+            logger.warning(f"⚠️ Failed to create index: {e}")
+
+
+def _product_stats(conn: sqlite3.Connection):
+    """
+    جدول آمار محصولات گزارش‌های تحلیلی و صف تغییرات آن (قبلاً در سازنده Analytics)
+
+    هر تغییر سفارش تایید شده دو ردیف در صف می‌سازه: -1 برای حالت قبلی و +1 برای حالت جدید
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS product_stats (
+            product_name TEXT PRIMARY KEY,
+            total_sold INTEGER DEFAULT 0,
+            total_revenue REAL DEFAULT 0,
+            last_order_date TIMESTAMP,
+            last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_product_stats_sold
+        ON product_stats(total_sold DESC)
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS product_stats_changes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            order_id INTEGER NOT NULL,
+            sign INTEGER NOT NULL,
+            items TEXT,
+            order_created_at TIMESTAMP
+        )
+    """)
+
+    counted = "('confirmed', 'payment_confirmed')"
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_product_stats_order_insert
+        AFTER INSERT ON orders
+        WHEN NEW.status IN {counted}
+        BEGIN
+            INSERT INTO product_stats_changes (order_id, sign, items, order_created_at)
+            VALUES (NEW.id, 1, NEW.items, NEW.created_at);
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_product_stats_order_update
+        AFTER UPDATE OF status, items ON orders
+        WHEN (OLD.status IN {counted} OR NEW.status IN {counted})
+         AND (OLD.status IS NOT NEW.status OR OLD.items IS NOT NEW.items)
+        BEGIN
+            INSERT INTO product_stats_changes (order_id, sign, items, order_created_at)
+            SELECT OLD.id, -1, OLD.items, OLD.created_at WHERE OLD.status IN {counted};
+            INSERT INTO product_stats_changes (order_id, sign, items, order_created_at)
+            SELECT NEW.id, 1, NEW.items, NEW.created_at WHERE NEW.status IN {counted};
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_product_stats_order_delete
+        AFTER DELETE ON orders
+        WHEN OLD.status IN {counted}
+        BEGIN
+            INSERT INTO product_stats_changes (order_id, sign, items, order_created_at)
+            VALUES (OLD.id, -1, OLD.items, OLD.created_at);
+        END
+    """)
+
+
+# (شماره، نام، تابع) - فقط به انتها اضافه کنید
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Connection], None]]] = [
+    (1, 'base_tables', _base_tables),
+    (2, 'added_columns', _added_columns),
+    (3, 'wallets_without_foreign_keys', _wallets_without_foreign_keys),
+    (4, 'indexes', _indexes),
+    (5, 'product_stats', _product_stats),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+# ==================== اجرا ====================
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    """نسخه فعلی schema (0 = دیتابیس جدید یا قدیمی بدون schema_version)"""
+    try:
+        return conn.execute("SELECT MAX(version) FROM schema_version").fetchone()[0] or 0
+    except sqlite3.OperationalError:
+        return 0
+
+
+def pending_migrations(conn: sqlite3.Connection) -> List[Tuple[int, str]]:
+    """migration های اجرانشده (شماره، نام)"""
+    current = get_schema_version(conn)
+    return [(version, name) for version, name, _ in MIGRATIONS if version > current]
+
+
+def run_migrations(conn: sqlite3.Connection, target: Optional[int] = None) -> List[int]:
+    """
+    اجرای migration های باقی‌مانده به ترتیب
+
+    Args:
+        target: آخرین نسخه برای اجرا (پیش‌فرض LATEST_VERSION)
+
+    Returns:
+        شماره migration های اجراشده (خالی اگه schema به‌روز بود)
+
+    Raises:
+        MigrationError: اگه یک migration خطا بده (migration های قبلی commit شده می‌مونن)
+    """
+    target = LATEST_VERSION if target is None else target
+    current = get_schema_version(conn)
+    if current >= target:
+        if current > LATEST_VERSION:
+            logger.warning("⚠️ نسخه schema (%d) جدیدتر از کد (%d) است", current, LATEST_VERSION)
+        return []
+
+    conn.execute(SCHEMA_VERSION_TABLE)
+    conn.commit()
+
+    applied = []
+    for version, name, migrate in MIGRATIONS:
+        if version <= current or version > target:
+            continue
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # یک process دیگه ممکنه همزمان همین migration رو اجرا کرده باشه
+            if get_schema_version(conn) >= version:
+                conn.rollback()
+                continue
+
+            start = time.perf_counter()
+            migrate(conn)
+            duration_ms = (time.perf_counter() - start) * 1000
+            conn.execute(
+                "INSERT INTO schema_version (version, name, duration_ms) VALUES (?, ?, ?)",
+                (version, name, round(duration_ms, 2))
+            )
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"❌ Migration {version:03d} ({name}) failed: {e}")
+            raise MigrationError(f"migration {version:03d} ({name}): {e}") from e
+
+        applied.append(version)
+        logger.info("✅ Migration %03d %s (%.1f ms)", version, name, duration_ms)
+
+    return applied
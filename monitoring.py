@@ -4,8 +4,11 @@
 """
 import logging
 from datetime import datetime
-from flask import Flask, jsonify, render_template_string
 import threading
+from expiry_wheel import expiry_wheel
+from metrics import registry
+from query_profiler import query_profiler
+from loop_monitor import loop_monitor
 
 logger = logging.getLogger(__name__)
 
@@ -15,10 +18,12 @@ total_users = 0
 total_orders = 0
 pending_orders = 0
 active_cart_users = 0
+cart_lock_stats = {}
 last_error = None
 error_count = 0
 
-app = Flask(__name__)
+# ✅ Flask (~130ms با werkzeug/jinja2) فقط وقتی داشبورد واقعاً اجرا میشه import میشه
+_app = None
 
 # HTML Template ساده
 HTML_TEMPLATE = """
@@ -114,6 +119,21 @@ HTML_TEMPLATE = """
             color: #333;
             font-family: monospace;
         }
+        .query-table {
+            width: 100%;
+            border-collapse: collapse;
+            direction: ltr;
+            font-size: 0.85em;
+        }
+        .query-table th, .query-table td {
+            padding: 8px;
+            border-bottom: 1px solid #eee;
+            text-align: left;
+        }
+        .query-table td:first-child {
+            font-family: monospace;
+            word-break: break-all;
+        }
         .refresh-btn {
             background: #667eea;
             color: white;
@@ -197,8 +217,32 @@ HTML_TEMPLATE = """
                 <span class="info-value" id="error-count">0</span>
             </div>
             
+            <div class="info-row">
+                <span class="info-label">Cart Lock Contention</span>
+                <span class="info-value" id="cart-locks">-</span>
+            </div>
+            
+            <div class="info-row">
+                <span class="info-label">Event Loop Lag</span>
+                <span class="info-value" id="loop-lag">-</span>
+            </div>
+            
             <button class="refresh-btn" onclick="loadStats()">🔄 Refresh Data</button>
         </div>
+        
+        <div class="info-card" style="margin-top: 20px;">
+            <h2 style="margin-bottom: 20px; color: #667eea;">🐢 Top Queries</h2>
+            <div class="info-row">
+                <span class="info-label">Profiler</span>
+                <span class="info-value" id="profiler-info">-</span>
+            </div>
+            <table class="query-table">
+                <thead>
+                    <tr><th>Query</th><th>Calls</th><th>Total ms</th><th>p50</th><th>p95</th><th>Max</th><th>Slow</th></tr>
+                </thead>
+                <tbody id="top-queries"></tbody>
+            </table>
+        </div>
     </div>
     
     <script>
@@ -214,32 +258,66 @@ HTML_TEMPLATE = """
                     document.getElementById('start-time').textContent = data.start_time || '-';
                     document.getElementById('last-error').textContent = data.last_error || 'None';
                     document.getElementById('error-count').textContent = data.error_count || '0';
+                    const locks = data.cart_locks || {};
+                    document.getElementById('cart-locks').textContent = locks.acquisitions !== undefined
+                        ? `${locks.contention_rate}% | wait avg ${locks.avg_wait_ms}ms, max ${locks.max_wait_ms}ms | queue ${locks.waiting} (max ${locks.max_waiting})`
+                        : '-';
+                    const lag = data.event_loop || {};
+                    document.getElementById('loop-lag').textContent = lag.running
+                        ? `p50 ${lag.p50_ms}ms | p99 ${lag.p99_ms}ms | max ${lag.max_ms}ms | blocked ${lag.blocked_total}`
+                        : '-';
                 })
                 .catch(error => {
                     console.error('Error loading stats:', error);
                 });
         }
         
+        function loadQueries() {
+            fetch('/api/queries')
+                .then(response => response.json())
+                .then(data => {
+                    const p = data.profiler;
+                    document.getElementById('profiler-info').textContent =
+                        `${p.statements} statements | sample ${p.sample_rate * 100}% | slow (>= ${p.slow_ms}ms): ${p.slow_total}`;
+                    const body = document.getElementById('top-queries');
+                    body.innerHTML = '';
+                    data.queries.forEach(q => {
+                        const row = document.createElement('tr');
+                        [q.fingerprint, q.calls, q.total_ms, q.p50_ms, q.p95_ms, q.max_ms, q.slow].forEach(value => {
+                            const cell = document.createElement('td');
+                            cell.textContent = value;
+                            row.appendChild(cell);
+                        });
+                        body.appendChild(row);
+                    });
+                })
+                .catch(error => {
+                    console.error('Error loading queries:', error);
+                });
+        }
+        
         // بارگذاری اولیه
         loadStats();
+        loadQueries();
         
         // بروزرسانی خودکار هر 10 ثانیه
         setInterval(loadStats, 10000);
+        setInterval(loadQueries, 10000);
     </script>
 </body>
 </html>
 """
 
 
-@app.route('/')
 def index():
     """صفحه اصلی داشبورد"""
+    from flask import render_template_string
     return render_template_string(HTML_TEMPLATE)
 
 
-@app.route('/health')
 def health_check():
     """Health check endpoint ساده"""
+    from flask import jsonify
     global bot_start_time
     
     if bot_start_time:
@@ -254,11 +332,11 @@ def health_check():
     })
 
 
-@app.route('/api/stats')
 def get_stats():
     """API برای دریافت آمار کامل"""
+    from flask import jsonify
     global bot_start_time, total_users, total_orders, pending_orders
-    global active_cart_users, last_error, error_count
+    global active_cart_users, cart_lock_stats, last_error, error_count
     
     if bot_start_time:
         uptime = str(datetime.now() - bot_start_time).split('.')[0]
@@ -275,17 +353,90 @@ def get_stats():
         'total_orders': total_orders,
         'pending_orders': pending_orders,
         'active_cart_users': active_cart_users,
+        'cart_locks': cart_lock_stats,
         'last_error': last_error,
-        'error_count': error_count
+        'error_count': error_count,
+        'expiry': expiry_wheel.get_stats(),
+        'event_loop': loop_monitor.get_stats()
+    })
+
+
+def get_top_queries():
+    """API کوئری‌های پرهزینه (پروفایلر SQLite)"""
+    from flask import jsonify, request
+    order_by = request.args.get('order_by', 'total')
+    limit = min(request.args.get('limit', 20, type=int), 100)
+    return jsonify({
+        'profiler': query_profiler.get_stats(),
+        'queries': query_profiler.top(limit, order_by=order_by),
     })
 
 
-def update_stats(db, cart_locks_dict):
+def get_loop_stats():
+    """API تأخیر event loop + رویدادهای بلاک اخیر (با پشته در حالت debug)"""
+    from flask import jsonify
+    return jsonify({
+        'stats': loop_monitor.get_stats(),
+        'blocks': loop_monitor.get_block_events(),
+    })
+
+
+def metrics():
+    """خروجی متریک‌ها برای Prometheus (text exposition format)"""
+    from flask import Response
+    return Response(registry.exposition(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
+ROUTES = (
+    ('/', index),
+    ('/health', health_check),
+    ('/api/stats', get_stats),
+    ('/api/queries', get_top_queries),
+    ('/api/loop', get_loop_stats),
+    ('/metrics', metrics),
+)
+
+
+def get_app():
+    """اپ Flask داشبورد (ساخت و ثبت مسیرها فقط بار اول)"""
+    global _app
+    if _app is None:
+        from flask import Flask
+        app = Flask(__name__)
+        for rule, view in ROUTES:
+            app.add_url_rule(rule, view_func=view)
+        _app = app
+    return _app
+
+
+def __getattr__(name):
+    """سازگاری با `from monitoring import app` (ساخت تنبل)"""
+    if name == 'app':
+        return get_app()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# ✅ آمار سراسری همین ماژول به صورت gauge (موقع scrape خونده میشن)
+registry.gauge('bot_users', 'Registered users').set_function(lambda: total_users)
+registry.gauge('bot_orders', 'Total orders').set_function(lambda: total_orders)
+registry.gauge('bot_pending_orders', 'Orders waiting for review or payment').set_function(lambda: pending_orders)
+registry.gauge('bot_active_carts', 'Users with items in cart').set_function(lambda: active_cart_users)
+registry.gauge('bot_cart_lock_waiting', 'Tasks waiting for a cart lock').set_function(
+    lambda: cart_lock_stats.get('waiting', 0))
+registry.gauge('bot_expiry_pending', 'Keys scheduled in the expiry timing wheel').set_function(
+    lambda: expiry_wheel.get_stats()['pending'])
+
+
+def update_stats(db, cart_locks=None):
     """
     بروزرسانی آمار از دیتابیس
     این تابع از main.py صدا زده میشه
+    
+    Args:
+        db: دیتابیس
+        cart_locks: KeyedLockManager سبد خرید (برای آمار رقابت قفل‌ها)
     """
-    global total_users, total_orders, pending_orders, active_cart_users
+    global total_users, total_orders, pending_orders, active_cart_users, cart_lock_stats
     
     try:
         # تعداد کاربران
@@ -303,8 +454,13 @@ def update_stats(db, cart_locks_dict):
         cursor.execute("SELECT COUNT(*) FROM orders WHERE status IN ('pending', 'waiting_payment')")
         pending_orders = cursor.fetchone()[0]
         
-        # سبدهای فعال
-        active_cart_users = len(cart_locks_dict)
+        # ✅ FIX: سبدهای فعال = کاربرانی که آیتم در سبد دارن
+        # (قبلاً از dict قفل‌ها خونده میشد که هیچ‌وقت پر نمیشد)
+        cursor.execute("SELECT COUNT(DISTINCT user_id) FROM cart")
+        active_cart_users = cursor.fetchone()[0]
+        
+        if cart_locks is not None:
+            cart_lock_stats = cart_locks.get_stats()
         
     except Exception as e:
         logger.error(f"Error updating monitoring stats: {e}")
@@ -330,7 +486,7 @@ def run_monitoring_server(port=5000, host='0.0.0.0'):
     flask_log.setLevel(flask_logging.ERROR)
     
     try:
-        app.run(host=host, port=port, debug=False, use_reloader=False)
+        get_app().run(host=host, port=port, debug=False, use_reloader=False)
     except Exception as e:
         logger.error(f"❌ Failed to start monitoring server: {e}")
 
@@ -352,5 +508,8 @@ def start_monitoring_dashboard(port=5000, host='0.0.0.0'):
     logger.info(f"   - Dashboard: http://{host}:{port}/")
     logger.info(f"   - Health Check: http://{host}:{port}/health")
     logger.info(f"   - Stats API: http://{host}:{port}/api/stats")
+    logger.info(f"   - Metrics: http://{host}:{port}/metrics")
+    logger.info(f"   - Top Queries: http://{host}:{port}/api/queries")
+    logger.info(f"   - Event Loop: http://{host}:{port}/api/loop")
     
     return monitoring_thread
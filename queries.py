@@ -0,0 +1,51 @@
+"""
+رجیستری دستورهای SQL پرتکرار دیتابیس
+
+✅ هر دستور یک ثابت با نام مشخص: cache دستورهای آماده sqlite3 (cached_statements)
+   با متن دقیق SQL کلید می‌خوره، پس همه فراخوانی‌ها از یک دستور parse شده استفاده می‌کنن
+✅ همین متن ثابت کلید cache اثرانگشت پروفایلر کوئری (query_profiler) هم هست
+"""
+
+# اندازه LRU دستورهای آماده هر connection (پیش‌فرض sqlite3 = 128)
+# database.py به‌تنهایی بیش از 100 دستور متفاوت داره؛ دستورهای پویا (UPDATE با ستون‌های متغیر،
+# گزارش‌ها) هم جا می‌گیرن و دستورهای داغ از cache بیرون نمی‌افتن
+STATEMENT_CACHE_SIZE = 256
+
+
+# ==================== محصولات ====================
+
+GET_PRODUCT = "SELECT * FROM products WHERE id = ?"
+GET_ALL_PRODUCTS = "SELECT * FROM products ORDER BY created_at DESC"
+
+# ==================== پک‌ها ====================
+
+GET_PACK = "SELECT * FROM packs WHERE id = ?"
+GET_PACKS = "SELECT * FROM packs WHERE product_id = ?"
+
+# ==================== کاربران ====================
+
+GET_USER = "SELECT * FROM users WHERE user_id = ?"
+
+# ==================== سبد خرید ====================
+
+GET_CART = (
+    "SELECT c.id, p.name, pk.name, pk.quantity, pk.price, c.quantity "
+    "FROM cart c "
+    "JOIN products p ON c.product_id = p.id "
+    "JOIN packs pk ON c.pack_id = pk.id "
+    "WHERE c.user_id = ?"
+)
+UPSERT_CART_ITEM = (
+    "INSERT INTO cart (user_id, product_id, pack_id, quantity) VALUES (?, ?, ?, ?) "
+    "ON CONFLICT(user_id, pack_id) DO UPDATE SET quantity = quantity + excluded.quantity"
+)
+CLEAR_CART = "DELETE FROM cart WHERE user_id = ?"
+
+# ==================== سفارشات ====================
+
+GET_ORDER = "SELECT * FROM orders WHERE id = ?"
+INSERT_ORDER = (
+    "INSERT INTO orders "
+    "(user_id, items, total_price, discount_amount, final_price, discount_code, expires_at) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?)"
+)
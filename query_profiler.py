@@ -0,0 +1,192 @@
+"""
+پروفایلر کوئری‌های SQLite و لاگ کوئری‌های کند
+✅ زمان هر دستور از TimedCursor (database.py) میاد - شامل fetch و پیمایش ردیف‌ها
+✅ نرمال‌سازی SQL به fingerprint (literal ها و لیست IN → ?)
+✅ p50 / p95 / max برای هر fingerprint از روی نمونه‌های اخیر
+✅ نمونه‌برداری (هر N دستور یکی) تا در production روشن بمونه
+✅ کوئری‌های کندتر از آستانه همیشه لاگ و شمرده میشن
+
+نمونه‌ها بدون سوگیری انتخاب میشن (مستقل از کند بودن)، پس صدک‌ها تخمین
+درستی از کل ترافیک هستن؛ max و تعداد کندها روی همه دستورها دقیقه.
+"""
+import re
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+from config import SLOW_QUERY_MS, QUERY_PROFILE_SAMPLE_RATE
+from logger import log_slow_query
+
+# تعداد نمونه نگه‌داشته‌شده برای محاسبه صدک هر fingerprint
+RESERVOIR_SIZE = 256
+
+# سقف تعداد fingerprint (بقیه در یک ردیف مشترک جمع میشن)
+MAX_FINGERPRINTS = 500
+
+OVERFLOW_FINGERPRINT = '<other>'
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST_RE = re.compile(r'\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)', re.IGNORECASE)
+_VALUES_RE = re.compile(r'\bVALUES\s*(\([^()]*\))(?:\s*,\s*\([^()]*\))+', re.IGNORECASE)
+_SPACE_RE = re.compile(r'\s+')
+
+
+def fingerprint(sql: str) -> str:
+    """
+    نرمال‌سازی SQL: literal ها → ?، لیست IN و VALUES چندتایی → یک نمونه،
+    فاصله‌ها یکی
+    """
+    fp = _STRING_RE.sub('?', sql)
+    fp = _NUMBER_RE.sub('?', fp)
+    fp = _IN_LIST_RE.sub('IN (...)', fp)
+    fp = _VALUES_RE.sub(r'VALUES \1, ...', fp)
+    return _SPACE_RE.sub(' ', fp).strip()
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(int(round(pct / 100 * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[idx]
+
+
+class QueryStats:
+    """آمار یک fingerprint"""
+    __slots__ = ('fingerprint', 'sampled', 'total', 'max', 'slow', 'samples', 'last_seen')
+
+    def __init__(self, fp: str):
+        self.fingerprint = fp
+        self.sampled = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.slow = 0
+        self.samples = deque(maxlen=RESERVOIR_SIZE)
+        self.last_seen = 0.0
+
+
+class QueryProfiler:
+    """
+    جمع‌آوری آمار کوئری‌ها
+
+    Args:
+        sample_rate: نسبت دستورهای نمونه‌برداری‌شده (0 = فقط کوئری‌های کند)
+        slow_ms: آستانه کوئری کند (میلی‌ثانیه)
+    """
+
+    def __init__(self, sample_rate: float = 0.1, slow_ms: float = 100):
+        self.configure(sample_rate, slow_ms)
+        self._stats: Dict[str, QueryStats] = {}
+        self._fp_cache: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._seen = 0
+        self.slow_total = 0
+        self.started_at = time.time()
+
+    def configure(self, sample_rate: float, slow_ms: float):
+        """تغییر نرخ نمونه‌برداری و آستانه (در زمان اجرا)"""
+        self.sample_rate = max(0.0, min(float(sample_rate), 1.0))
+        # هر چندمین دستور نمونه‌برداری بشه (0 = هیچ)
+        self.sample_every = round(1 / self.sample_rate) if self.sample_rate else 0
+        self.slow_ms = slow_ms
+        self.slow_seconds = slow_ms / 1000
+
+    def observe(self, sql: str, elapsed: float):
+        """
+        مسیر داغ: برای هر دستور صدا زده میشه
+        در حالت عادی فقط یک جمع و یک باقی‌مانده هزینه داره
+        """
+        self._seen += 1
+        sampled = bool(self.sample_every) and self._seen % self.sample_every == 0
+        slow = elapsed >= self.slow_seconds
+        if sampled or slow:
+            self._record(sql, elapsed, sampled, slow)
+
+    def _fingerprint(self, sql: str) -> str:
+        fp = self._fp_cache.get(sql)
+        if fp is None:
+            fp = fingerprint(sql)
+            if len(self._fp_cache) >= MAX_FINGERPRINTS * 4:
+                self._fp_cache.clear()
+            self._fp_cache[sql] = fp
+        return fp
+
+    def _record(self, sql: str, elapsed: float, sampled: bool, slow: bool):
+        fp = self._fingerprint(sql)
+
+        with self._lock:
+            stats = self._stats.get(fp)
+            if stats is None:
+                if len(self._stats) >= MAX_FINGERPRINTS:
+                    fp = OVERFLOW_FINGERPRINT
+                    stats = self._stats.get(fp)
+                if stats is None:
+                    stats = self._stats[fp] = QueryStats(fp)
+
+            if sampled:
+                stats.sampled += 1
+                stats.total += elapsed
+                stats.samples.append(elapsed)
+            if slow:
+                stats.slow += 1
+                self.slow_total += 1
+            stats.max = max(stats.max, elapsed)
+            stats.last_seen = time.time()
+
+        if slow:
+            log_slow_query(elapsed * 1000, fp)
+
+    def top(self, limit: int = 10, order_by: str = 'total') -> List[Dict]:
+        """
+        پرهزینه‌ترین کوئری‌ها
+
+        Args:
+            order_by: 'total' (زمان کل تخمینی)، 'p95'، 'max' یا 'slow'
+        """
+        with self._lock:
+            rows = [(s.fingerprint, s.sampled, s.total, s.max, s.slow, sorted(s.samples))
+                    for s in self._stats.values()]
+
+        scale = self.sample_every or 0
+        result = []
+        for fp, sampled, total, max_, slow, samples in rows:
+            result.append({
+                'fingerprint': fp,
+                'calls': sampled * scale,  # تخمین از روی نمونه‌ها
+                'sampled': sampled,
+                'slow': slow,
+                'total_ms': round(total * scale * 1000, 1),
+                'avg_ms': round(total / sampled * 1000, 3) if sampled else 0,
+                'p50_ms': round(_percentile(samples, 50) * 1000, 3),
+                'p95_ms': round(_percentile(samples, 95) * 1000, 3),
+                'max_ms': round(max_ * 1000, 3),
+            })
+
+        key = {'total': 'total_ms', 'p95': 'p95_ms', 'max': 'max_ms', 'slow': 'slow'}.get(order_by, 'total_ms')
+        result.sort(key=lambda row: (row[key], row['max_ms']), reverse=True)
+        return result[:limit]
+
+    def reset(self):
+        """پاک کردن آمار"""
+        with self._lock:
+            self._stats.clear()
+            self.slow_total = 0
+            self._seen = 0
+            self.started_at = time.time()
+
+    def get_stats(self) -> Dict:
+        """خلاصه وضعیت پروفایلر"""
+        return {
+            'statements': self._seen,
+            'fingerprints': len(self._stats),
+            'sample_rate': self.sample_rate,
+            'slow_ms': self.slow_ms,
+            'slow_total': self.slow_total,
+            'since': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.started_at)),
+        }
+
+
+# ==================== پروفایلر سراسری ====================
+
+query_profiler = QueryProfiler(sample_rate=QUERY_PROFILE_SAMPLE_RATE, slow_ms=SLOW_QUERY_MS)
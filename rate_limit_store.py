@@ -0,0 +1,205 @@
+"""
+Backend ذخیره‌سازی وضعیت Rate Limiting (برای چند process و بعد از restart)
+✅ رابط RateLimitStore برای backend های مختلف
+✅ SQLiteRateLimitStore: یک جدول TAT مشترک بین process ها (WAL)
+✅ check-and-increment اتمیک با BEGIN IMMEDIATE
+✅ پنجره لغزان دقیق برای عملیات با سقف کوچک (سفارش): زمان هر درخواست ذخیره و شمرده میشه
+✅ ذخیره دسته‌ای (write-behind) برای محدودیت‌های پرتکرار
+"""
+import logging
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from typing import Iterable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitStore(ABC):
+    """
+    رابط backend وضعیت Rate Limiting
+
+    هر ردیف: (name, user_id, tat) که name شامل پارامترهای محدودیت است
+    (مثلاً 'order:3:3600') تا محدودیت‌های مختلف با هم قاطی نشن.
+    check_window به جای TAT زمان تک‌تک درخواست‌ها رو نگه می‌داره.
+    backend ناقص همون موقع ساخت TypeError میده، نه اولین سفارش.
+    """
+
+    @abstractmethod
+    def check_and_increment(self, name: str, user_id: int, interval: float,
+                            tolerance: float, now: float) -> Tuple[bool, float]:
+        """
+        یک قدم GCRA به صورت اتمیک بین همه process ها
+
+        Returns:
+            (allowed, tat): TAT جدید در صورت مجاز بودن، وگرنه TAT فعلی
+        """
+
+    @abstractmethod
+    def check_window(self, name: str, user_id: int, max_requests: int,
+                     window_seconds: int, now: float) -> Tuple[bool, List[float]]:
+        """
+        پنجره لغزان دقیق به صورت اتمیک بین همه process ها:
+        مجاز فقط اگه کمتر از max_requests درخواست در window_seconds اخیر ثبت شده باشه
+
+        Returns:
+            (allowed, hits): زمان درخواست‌های داخل پنجره به ترتیب (شامل درخواست جدید اگه مجاز بود)
+        """
+
+    @abstractmethod
+    def save_many(self, rows: Iterable[Tuple[str, int, float]]):
+        """ذخیره دسته‌ای TAT ها (مقدار بزرگ‌تر می‌مونه)"""
+
+    @abstractmethod
+    def load_active(self, now: float) -> List[Tuple[str, int, float]]:
+        """ردیف‌هایی که هنوز TAT آن‌ها نگذشته"""
+
+    @abstractmethod
+    def delete_user(self, user_id: int):
+        """حذف تمام وضعیت یک کاربر"""
+
+    @abstractmethod
+    def purge_expired(self, now: float) -> int:
+        """حذف ردیف‌های منقضی‌شده"""
+
+    def close(self):
+        pass
+
+
+class SQLiteRateLimitStore(RateLimitStore):
+    """
+    Backend مبتنی بر SQLite (فایل جدا از دیتابیس اصلی)
+
+    همه process هایی که به یک فایل وصل میشن سهمیه مشترک دارن؛ قفل
+    RESERVED در BEGIN IMMEDIATE خواندن + نوشتن TAT رو اتمیک می‌کنه.
+    """
+
+    def __init__(self, path: str, busy_timeout: float = 2.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+
+    def _get_conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'connection', None)
+        if conn is not None:
+            return conn
+
+        # isolation_level=None: تراکنش‌ها دستی با BEGIN IMMEDIATE مدیریت میشن
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout,
+                               isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS rate_limit_state (
+                name TEXT NOT NULL,
+                user_id INTEGER NOT NULL,
+                tat REAL NOT NULL,
+                PRIMARY KEY (name, user_id)
+            ) WITHOUT ROWID
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_rate_limit_state_tat ON rate_limit_state(tat)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS rate_limit_hits (
+                name TEXT NOT NULL,
+                user_id INTEGER NOT NULL,
+                ts REAL NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_rate_limit_hits_user ON rate_limit_hits(name, user_id, ts)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_rate_limit_hits_expires ON rate_limit_hits(expires_at)")
+
+        self._local.connection = conn
+        return conn
+
+    def check_and_increment(self, name, user_id, interval, tolerance, now):
+        conn = self._get_conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT tat FROM rate_limit_state WHERE name = ? AND user_id = ?",
+                (name, user_id)
+            ).fetchone()
+
+            tat = max(row[0], now) if row else now
+
+            if tat - now > tolerance + 1e-9:
+                conn.execute("COMMIT")
+                return False, tat
+
+            new_tat = tat + interval
+            conn.execute("""
+                INSERT INTO rate_limit_state (name, user_id, tat) VALUES (?, ?, ?)
+                ON CONFLICT(name, user_id) DO UPDATE SET tat = excluded.tat
+            """, (name, user_id, new_tat))
+            conn.execute("COMMIT")
+            return True, new_tat
+
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def check_window(self, name, user_id, max_requests, window_seconds, now):
+        conn = self._get_conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            hits = [row[0] for row in conn.execute(
+                "SELECT ts FROM rate_limit_hits WHERE name = ? AND user_id = ? AND ts > ? ORDER BY ts",
+                (name, user_id, now - window_seconds)
+            )]
+
+            if len(hits) >= max_requests:
+                conn.execute("COMMIT")
+                return False, hits
+
+            conn.execute(
+                "INSERT INTO rate_limit_hits (name, user_id, ts, expires_at) VALUES (?, ?, ?, ?)",
+                (name, user_id, now, now + window_seconds)
+            )
+            conn.execute("COMMIT")
+            hits.append(now)
+            return True, hits
+
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def save_many(self, rows):
+        rows = list(rows)
+        if not rows:
+            return
+
+        conn = self._get_conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("""
+                INSERT INTO rate_limit_state (name, user_id, tat) VALUES (?, ?, ?)
+                ON CONFLICT(name, user_id) DO UPDATE SET tat = MAX(tat, excluded.tat)
+            """, rows)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def load_active(self, now):
+        conn = self._get_conn()
+        return conn.execute(
+            "SELECT name, user_id, tat FROM rate_limit_state WHERE tat > ?", (now,)
+        ).fetchall()
+
+    def delete_user(self, user_id):
+        conn = self._get_conn()
+        conn.execute("DELETE FROM rate_limit_state WHERE user_id = ?", (user_id,))
+        conn.execute("DELETE FROM rate_limit_hits WHERE user_id = ?", (user_id,))
+
+    def purge_expired(self, now):
+        conn = self._get_conn()
+        removed = conn.execute("DELETE FROM rate_limit_state WHERE tat <= ?", (now,)).rowcount
+        removed += conn.execute("DELETE FROM rate_limit_hits WHERE expires_at <= ?", (now,)).rowcount
+        return removed
+
+    def close(self):
+        conn = getattr(self._local, 'connection', None)
+        if conn is not None:
+            conn.close()
+            self._local.connection = None
@@ -7,16 +7,25 @@
 - 20 پیام در دقیقه (سراسری)
 - 3 سفارش در ساعت
 - 5 امتحان کد تخفیف در دقیقه
+⚡ موتور GCRA (یک عدد برای هر کاربر)؛ پنجره لغزان با RATE_LIMIT_ENGINE=window
+✅ عملیات با سقف کوچک (مثل 3 سفارش در ساعت) در همه موتورها با پنجره لغزان دقیق بررسی میشن
+💾 پیش‌فرض: GCRA با backend SQLite (پایدار بعد از restart و مشترک بین process ها)
 """
+import asyncio
+import atexit
+import math
 import time
 import logging
 from functools import wraps
 from logger import log_rate_limit
 from collections import defaultdict, deque
-from typing import Callable, Dict, Tuple
+from typing import Callable, Dict, Optional, Tuple
 from telegram import Update
 from telegram.ext import ContextTypes
-from config import ADMIN_ID
+from config import (
+    ADMIN_ID, RATE_LIMIT_ENGINE, RATE_LIMIT_DB_PATH, RATE_LIMIT_DURABLE_ACTIONS
+)
+from expiry_wheel import TimingWheel, expiry_wheel
 
 logger = logging.getLogger(__name__)
 
@@ -24,7 +33,7 @@ logger = logging.getLogger(__name__)
 class RateLimiter:
     """کلاس مدیریت Rate Limiting با Smart Alert"""
     
-    def __init__(self):
+    def __init__(self, expiry: Optional[TimingWheel] = None):
         # ذخیره زمان‌های درخواست هر کاربر
         self._user_requests: Dict[int, deque] = defaultdict(lambda: deque(maxlen=100))
         
@@ -37,6 +46,13 @@ class RateLimiter:
         
         # ✅ FIX: حداقل فاصله بین alertها (ثانیه)
         self.ALERT_COOLDOWN = 10
+        
+        # ✅ انقضای تدریجی با timing wheel (به جای اسکن کامل ساعتی)
+        self._user_expiry = self._action_expiry = self._alert_expiry = None
+        if expiry is not None:
+            self._user_expiry = expiry.registry('rate_limiter', lambda uid: self._user_requests.pop(uid, None))
+            self._action_expiry = expiry.registry('rate_limiter', lambda key: self._action_requests.pop(key, None))
+            self._alert_expiry = expiry.registry('rate_limit_alerts', lambda uid: self._last_alert.pop(uid, None))
     
     def _cleanup_old_requests(self, user_id: int, window_seconds: int):
         """حذف درخواست‌های قدیمی خارج از بازه زمانی"""
@@ -69,6 +85,8 @@ class RateLimiter:
         # اگه cooldown گذشته یا اولین باره
         if current_time - last_alert >= self.ALERT_COOLDOWN:
             self._last_alert[user_id] = current_time
+            if self._alert_expiry is not None:
+                self._alert_expiry.schedule(user_id, current_time + self.ALERT_COOLDOWN)
             return True
         
         return False
@@ -104,7 +122,10 @@ class RateLimiter:
             return False, remaining_time, show_alert
         
         # ثبت درخواست جدید
-        self._user_requests[user_id].append(time.time())
+        now = time.time()
+        self._user_requests[user_id].append(now)
+        if self._user_expiry is not None:
+            self._user_expiry.schedule(user_id, now + window_seconds, extend_only=True)
         return True, 0, False
     
     def check_action_limit(self, user_id: int, action: str, 
@@ -140,7 +161,10 @@ class RateLimiter:
             return False, remaining_time, show_alert
         
         # ثبت درخواست جدید
-        self._action_requests[key].append(time.time())
+        now = time.time()
+        self._action_requests[key].append(now)
+        if self._action_expiry is not None:
+            self._action_expiry.schedule(key, now + window_seconds, extend_only=True)
         return True, 0, False
     
     def reset_user(self, user_id: int):
@@ -155,6 +179,12 @@ class RateLimiter:
         if user_id in self._last_alert:
             del self._last_alert[user_id]
         
+        if self._user_expiry is not None:
+            self._user_expiry.cancel(user_id)
+            self._alert_expiry.cancel(user_id)
+            for key in keys_to_delete:
+                self._action_expiry.cancel(key)
+        
         logger.info(f"✅ Rate limits reset for user {user_id}")
     
     def cleanup_stale_users(self, max_idle_seconds: int = 3600):
@@ -206,8 +236,550 @@ class RateLimiter:
         return stats
 
 
-# نمونه سراسری
-rate_limiter = RateLimiter()
+class _GcraLimit:
+    """
+    وضعیت یک محدودیت GCRA: پارامترها + یک عدد (TAT) برای هر کاربر
+    
+    TAT (Theoretical Arrival Time) زمانی است که اگه کاربر از حالا درخواستی
+    نفرسته، ظرفیتش کامل پر شده. کلیدی که TAT آن گذشته هیچ اطلاعاتی نداره.
+    """
+    __slots__ = ('interval', 'tolerance', 'tat')
+    
+    def __init__(self, max_requests: int, window_seconds: int):
+        # فاصله انتشار: هر interval ثانیه یک درخواست به ظرفیت برمی‌گرده
+        self.interval = window_seconds / max_requests
+        # تحمل burst: تا max_requests درخواست پشت سر هم مجازه
+        self.tolerance = window_seconds - self.interval
+        self.tat: Dict[int, float] = {}
+
+
+class _WindowLimit:
+    """
+    پنجره لغزان دقیق برای عملیات با سقف کوچک: زمان هر درخواست مجاز (حداکثر max_requests عدد)
+    
+    GCRA با tolerance = window - interval بعد از burst کامل، هر interval ثانیه یک درخواست
+    دیگه می‌ده؛ برای 3 سفارش در ساعت یعنی تا 5 سفارش در حدود 40 دقیقه. اینجا سقف
+    دقیقاً max_requests در هر window ثانیه گذشته است (مثل RateLimiter).
+    """
+    __slots__ = ('max_requests', 'window', 'hits')
+    
+    def __init__(self, max_requests: int, window_seconds: int):
+        self.max_requests = max_requests
+        self.window = window_seconds
+        self.hits: Dict[int, deque] = {}
+    
+    def active(self, user_id: int, now: float) -> Optional[deque]:
+        """زمان‌های داخل پنجره (قدیمی‌ها حذف میشن)؛ None اگه چیزی نمونده باشه"""
+        hits = self.hits.get(user_id)
+        if hits is None:
+            return None
+        cutoff = now - self.window
+        while hits and hits[0] <= cutoff:
+            hits.popleft()
+        if not hits:
+            del self.hits[user_id]
+            return None
+        return hits
+
+
+class GCRARateLimiter:
+    """
+    ✅ موتور Rate Limiting با GCRA (معادل token bucket)
+    
+    به جای deque از timestamp ها، برای هر کاربر و هر محدودیت فقط یک float
+    نگه می‌داره؛ هر بررسی O(1) است و پاکسازی فقط یک مقایسه برای هر کلید.
+    
+    تفاوت رفتاری با RateLimiter (پنجره لغزان): بعد از پر شدن سهمیه، ظرفیت
+    تدریجی برمی‌گرده (هر window/max ثانیه یک درخواست) نه یکجا بعد از
+    انقضای قدیمی‌ترین درخواست. این فقط برای محدودیت کلی و عملیات با سقف
+    بزرگ‌تر از EXACT_WINDOW_MAX است؛ عملیات با سقف کوچک (سفارش، کد تخفیف)
+    با _WindowLimit دقیقاً مثل RateLimiter شمرده میشن.
+    """
+    
+    # سقف عملیاتی که با پنجره لغزان دقیق بررسی میشن (حافظه: حداکثر همین تعداد float برای هر کاربر)
+    EXACT_WINDOW_MAX = 10
+    
+    def __init__(self, expiry: Optional[TimingWheel] = None):
+        # {('general' یا نام عملیات, max_requests, window_seconds): _GcraLimit}
+        self._limits: Dict[Tuple[str, int, int], _GcraLimit] = {}
+        # {(نام عملیات, max_requests, window_seconds): _WindowLimit}
+        self._windows: Dict[Tuple[str, int, int], _WindowLimit] = {}
+        
+        # {user_id: last_alert_time}
+        self._last_alert: Dict[int, float] = {}
+        
+        self.ALERT_COOLDOWN = 10
+        
+        # ✅ انقضای تدریجی: هر کاربر یک ورودی با مهلت = دیرترین TAT
+        self._user_expiry = self._alert_expiry = None
+        if expiry is not None:
+            self._user_expiry = expiry.registry('rate_limiter', self._expire_user)
+            self._alert_expiry = expiry.registry('rate_limit_alerts', lambda uid: self._last_alert.pop(uid, None))
+    
+    def _get_limit(self, name: str, max_requests: int, window_seconds: int) -> _GcraLimit:
+        key = (name, max_requests, window_seconds)
+        limit = self._limits.get(key)
+        if limit is None:
+            limit = self._limits[key] = _GcraLimit(max_requests, window_seconds)
+        return limit
+    
+    def _is_exact(self, name: str, max_requests: int) -> bool:
+        return name != 'general' and max_requests <= self.EXACT_WINDOW_MAX
+    
+    def _get_window(self, name: str, max_requests: int, window_seconds: int) -> _WindowLimit:
+        key = (name, max_requests, window_seconds)
+        limit = self._windows.get(key)
+        if limit is None:
+            limit = self._windows[key] = _WindowLimit(max_requests, window_seconds)
+        return limit
+    
+    def _record_hit(self, limit: _WindowLimit, user_id: int, now: float):
+        """ثبت یک درخواست مجاز در پنجره + زمان‌بندی انقضا"""
+        hits = limit.hits.get(user_id)
+        if hits is None:
+            hits = limit.hits[user_id] = deque(maxlen=limit.max_requests)
+        hits.append(now)
+        if self._user_expiry is not None:
+            self._user_expiry.schedule(user_id, now + limit.window, extend_only=True)
+    
+    def _check_window(self, name: str, user_id: int, max_requests: int,
+                      window_seconds: int) -> Tuple[bool, int]:
+        """پنجره لغزان دقیق: (allowed, remaining_time)"""
+        limit = self._get_window(name, max_requests, window_seconds)
+        now = time.time()
+        
+        hits = limit.active(user_id, now)
+        if hits is not None and len(hits) >= max_requests:
+            return False, int(hits[0] + window_seconds - now) + 1
+        
+        self._record_hit(limit, user_id, now)
+        return True, 0
+    
+    def _check(self, name: str, user_id: int, max_requests: int,
+               window_seconds: int) -> Tuple[bool, int]:
+        """یک قدم GCRA (یا پنجره دقیق برای عملیات با سقف کوچک): (allowed, remaining_time)"""
+        if max_requests <= 0:
+            return False, int(window_seconds)
+        
+        if self._is_exact(name, max_requests):
+            return self._check_window(name, user_id, max_requests, window_seconds)
+        
+        limit = self._get_limit(name, max_requests, window_seconds)
+        now = time.time()
+        
+        tat = limit.tat.get(user_id, now)
+        if tat < now:
+            tat = now
+        
+        # 1e-9: جلوگیری از رد شدن آخرین درخواست مجاز به خاطر خطای ممیز شناور
+        if tat - now > limit.tolerance + 1e-9:
+            remaining_time = int(tat - limit.tolerance - now) + 1
+            return False, remaining_time
+        
+        limit.tat[user_id] = tat + limit.interval
+        if self._user_expiry is not None:
+            self._user_expiry.schedule(user_id, tat + limit.interval, extend_only=True)
+        return True, 0
+    
+    def _expire_user(self, user_id: int):
+        """callback چرخ: حذف TAT های گذشته‌ی کاربر"""
+        now = time.time()
+        latest = 0.0
+        
+        for key, limit in list(self._limits.items()):
+            tat = limit.tat.get(user_id)
+            if tat is None:
+                continue
+            if tat <= now:
+                del limit.tat[user_id]
+                if not limit.tat:
+                    del self._limits[key]
+            else:
+                latest = max(latest, tat)
+        
+        for key, window in list(self._windows.items()):
+            hits = window.active(user_id, now)
+            if hits is not None:
+                latest = max(latest, hits[-1] + window.window)
+            elif not window.hits:
+                del self._windows[key]
+        
+        if latest and self._user_expiry is not None:
+            self._user_expiry.schedule(user_id, latest)
+    
+    def _should_show_alert(self, user_id: int) -> bool:
+        """بررسی اینکه باید alert نشون بده یا نه (مثل RateLimiter)"""
+        current_time = time.time()
+        last_alert = self._last_alert.get(user_id, 0)
+        
+        if current_time - last_alert >= self.ALERT_COOLDOWN:
+            self._last_alert[user_id] = current_time
+            if self._alert_expiry is not None:
+                self._alert_expiry.schedule(user_id, current_time + self.ALERT_COOLDOWN)
+            return True
+        
+        return False
+    
+    def check_rate_limit(self, user_id: int, max_requests: int = 10,
+                        window_seconds: int = 10) -> Tuple[bool, int, bool]:
+        """
+        بررسی محدودیت کلی
+        
+        Returns:
+            (allowed, remaining_time, show_alert)
+        """
+        allowed, remaining_time = self._check('general', user_id, max_requests, window_seconds)
+        
+        if not allowed:
+            log_rate_limit(user_id, "general", remaining_time)
+            return False, remaining_time, self._should_show_alert(user_id)
+        
+        return True, 0, False
+    
+    def check_action_limit(self, user_id: int, action: str,
+                          max_requests: int, window_seconds: int) -> Tuple[bool, int, bool]:
+        """
+        بررسی محدودیت برای یک عملیات خاص
+        
+        Returns:
+            (allowed, remaining_time, show_alert)
+        """
+        allowed, remaining_time = self._check(action, user_id, max_requests, window_seconds)
+        
+        if not allowed:
+            log_rate_limit(user_id, action, remaining_time)
+            logger.warning(f"⚠️ Action limit exceeded for user {user_id}, action '{action}'")
+            return False, remaining_time, self._should_show_alert(user_id)
+        
+        return True, 0, False
+    
+    def reset_user(self, user_id: int):
+        """ریست کردن محدودیت‌های یک کاربر (برای ادمین)"""
+        for limit in self._limits.values():
+            limit.tat.pop(user_id, None)
+        for window in self._windows.values():
+            window.hits.pop(user_id, None)
+        
+        self._last_alert.pop(user_id, None)
+        
+        if self._user_expiry is not None:
+            self._user_expiry.cancel(user_id)
+            self._alert_expiry.cancel(user_id)
+        
+        logger.info(f"✅ Rate limits reset for user {user_id}")
+    
+    def cleanup_stale_users(self, max_idle_seconds: int = 3600):
+        """
+        حذف کلیدهایی که ظرفیتشان کامل پر شده (TAT گذشته)
+        
+        چنین کلیدی با «کاربر بدون سابقه» یکسان است، پس حذفش رفتار رو عوض
+        نمی‌کنه و max_idle_seconds فقط برای سازگاری با RateLimiter مونده.
+        """
+        now = time.time()
+        removed_keys = 0
+        
+        for key, limit in list(self._limits.items()):
+            stale = [uid for uid, tat in limit.tat.items() if tat <= now]
+            for uid in stale:
+                del limit.tat[uid]
+            removed_keys += len(stale)
+            
+            if not limit.tat:
+                del self._limits[key]
+        
+        for key, window in list(self._windows.items()):
+            for uid in list(window.hits):
+                if window.active(uid, now) is None:
+                    removed_keys += 1
+            if not window.hits:
+                del self._windows[key]
+        
+        alert_cutoff = now - self.ALERT_COOLDOWN
+        stale_alerts = [uid for uid, ts in self._last_alert.items() if ts < alert_cutoff]
+        for uid in stale_alerts:
+            del self._last_alert[uid]
+        
+        if removed_keys or stale_alerts:
+            logger.info(f"🧹 GCRA RateLimiter cleanup: {removed_keys} keys, {len(stale_alerts)} alerts removed")
+    
+    def get_stats(self, user_id: int) -> dict:
+        """
+        دریافت آمار محدودیت‌های یک کاربر
+        تعداد درخواست‌ها از روی TAT تخمین زده میشه (سهمیه مصرف‌شده فعلی)
+        """
+        now = time.time()
+        stats = {
+            'user_id': user_id,
+            'general_requests': 0,
+            'actions': {},
+            'last_alert': self._last_alert.get(user_id, 0)
+        }
+        
+        for (name, _, _), limit in self._limits.items():
+            tat = limit.tat.get(user_id)
+            used = math.ceil((tat - now) / limit.interval) if tat and tat > now else 0
+            
+            if name == 'general':
+                stats['general_requests'] = max(stats['general_requests'], used)
+            else:
+                stats['actions'][name] = max(stats['actions'].get(name, 0), used)
+        
+        for (name, _, _), window in self._windows.items():
+            hits = window.active(user_id, now)
+            stats['actions'][name] = max(stats['actions'].get(name, 0), len(hits) if hits else 0)
+        
+        return stats
+    
+    def key_count(self) -> int:
+        """تعداد کل کلیدهای نگه‌داری شده (برای مانیتورینگ)"""
+        return (sum(len(limit.tat) for limit in self._limits.values())
+                + sum(len(window.hits) for window in self._windows.values()))
+
+
+class PersistentRateLimiter(GCRARateLimiter):
+    """
+    ✅ GCRA با backend مشترک (RateLimitStore) برای restart و چند process
+    
+    - عملیات durable (پیش‌فرض 'order'): هر بررسی مستقیم و اتمیک روی store
+      انجام میشه. با سقف کوچک (<= EXACT_WINDOW_MAX) زمان هر درخواست ذخیره و
+      در پنجره شمرده میشه، پس سقف 3 سفارش در ساعت بین همه process ها و بعد
+      از restart دقیقاً رعایت میشه؛ با سقف بزرگ‌تر TAT (GCRA) ذخیره میشه.
+    - محدودیت کلی (پیام‌های پرتکرار): در حافظه بررسی و به صورت دسته‌ای
+      (write-behind) در store ذخیره میشن و در شروع دوباره بارگذاری میشن.
+    - عملیات غیر durable با سقف کوچک فقط در حافظه شمرده میشن.
+    - اگه store در دسترس نباشه، همان موتور درون‌حافظه‌ای استفاده میشه.
+    """
+    
+    PURGE_INTERVAL = 3600
+    
+    def __init__(self, store, expiry: Optional[TimingWheel] = None, durable_actions=('order',)):
+        super().__init__(expiry)
+        self.store = store
+        self.durable_actions = set(durable_actions)
+        
+        # کلیدهای تغییرکرده از آخرین flush: {(limit_key, user_id)}
+        self._dirty = set()
+        
+        self.fallback_count = 0
+        self.flush_count = 0
+        self.last_error: Optional[str] = None
+        self._last_purge = time.time()
+        
+        self._load()
+    
+    @staticmethod
+    def _store_name(limit_key: Tuple[str, int, int]) -> str:
+        name, max_requests, window_seconds = limit_key
+        return f"{name}:{max_requests}:{window_seconds}"
+    
+    def _load(self):
+        """بارگذاری TAT های فعال از store (بعد از restart)"""
+        now = time.time()
+        try:
+            rows = self.store.load_active(now)
+        except Exception as e:
+            self.last_error = str(e)
+            logger.warning(f"⚠️ Rate limit store unavailable, starting in memory: {e}")
+            return
+        
+        for store_name, user_id, tat in rows:
+            try:
+                name, max_requests, window_seconds = store_name.rsplit(':', 2)
+                limit = self._get_limit(name, int(max_requests), int(window_seconds))
+            except ValueError:
+                continue
+            limit.tat[user_id] = tat
+            if self._user_expiry is not None:
+                self._user_expiry.schedule(user_id, tat, extend_only=True)
+        
+        if rows:
+            logger.info(f"✅ {len(rows)} rate limit entries restored from store")
+    
+    def _store_fallback(self, error: Exception, name: str, user_id: int, max_requests: int,
+                        window_seconds: int) -> Tuple[bool, int]:
+        """✅ Fallback: موتور درون‌حافظه‌ای (TAT ها بعداً با flush ذخیره میشن)"""
+        self.fallback_count += 1
+        self.last_error = str(error)
+        logger.warning(f"⚠️ Rate limit store failed, using in-memory limit: {error}")
+        allowed, remaining_time = super()._check(name, user_id, max_requests, window_seconds)
+        if allowed and not self._is_exact(name, max_requests):
+            self._dirty.add(((name, max_requests, window_seconds), user_id))
+        return allowed, remaining_time
+    
+    def _check_durable_window(self, name: str, user_id: int, max_requests: int,
+                              window_seconds: int) -> Tuple[bool, int]:
+        """پنجره لغزان دقیق روی store برای عملیات durable با سقف کوچک"""
+        now = time.time()
+        try:
+            allowed, hits = self.store.check_window(
+                self._store_name((name, max_requests, window_seconds)),
+                user_id, max_requests, window_seconds, now
+            )
+        except Exception as e:
+            return self._store_fallback(e, name, user_id, max_requests, window_seconds)
+        
+        # کپی محلی برای get_stats و fallback
+        limit = self._get_window(name, max_requests, window_seconds)
+        limit.hits[user_id] = deque(hits, maxlen=max_requests)
+        if hits and self._user_expiry is not None:
+            self._user_expiry.schedule(user_id, hits[-1] + window_seconds, extend_only=True)
+        
+        if not allowed:
+            return False, int(hits[0] + window_seconds - now) + 1
+        return True, 0
+    
+    def _check(self, name: str, user_id: int, max_requests: int,
+               window_seconds: int) -> Tuple[bool, int]:
+        if name in self.durable_actions and max_requests > 0:
+            if self._is_exact(name, max_requests):
+                return self._check_durable_window(name, user_id, max_requests, window_seconds)
+            
+            limit = self._get_limit(name, max_requests, window_seconds)
+            now = time.time()
+            
+            try:
+                allowed, tat = self.store.check_and_increment(
+                    self._store_name((name, max_requests, window_seconds)),
+                    user_id, limit.interval, limit.tolerance, now
+                )
+            except Exception as e:
+                return self._store_fallback(e, name, user_id, max_requests, window_seconds)
+            
+            # کپی محلی برای get_stats و fallback
+            limit.tat[user_id] = tat
+            if self._user_expiry is not None:
+                self._user_expiry.schedule(user_id, tat, extend_only=True)
+            
+            if not allowed:
+                return False, int(tat - limit.tolerance - now) + 1
+            return True, 0
+        
+        allowed, remaining_time = super()._check(name, user_id, max_requests, window_seconds)
+        if allowed and not self._is_exact(name, max_requests):
+            self._dirty.add(((name, max_requests, window_seconds), user_id))
+        return allowed, remaining_time
+    
+    def _collect_dirty(self):
+        """برداشتن ردیف‌های تغییرکرده برای ذخیره (روی thread اصلی)"""
+        dirty, self._dirty = self._dirty, set()
+        
+        rows = []
+        for limit_key, user_id in dirty:
+            limit = self._limits.get(limit_key)
+            tat = limit.tat.get(user_id) if limit else None
+            if tat is not None:
+                rows.append((self._store_name(limit_key), user_id, tat))
+        return rows, dirty
+    
+    def _save(self, rows, dirty) -> bool:
+        """ذخیره دسته‌ای در store؛ در صورت خطا کلیدها برای دفعه بعد می‌مونن"""
+        try:
+            self.store.save_many(rows)
+            
+            now = time.time()
+            if now - self._last_purge >= self.PURGE_INTERVAL:
+                self._last_purge = now
+                self.store.purge_expired(now)
+            
+            self.flush_count += 1
+            return True
+        except Exception as e:
+            self.last_error = str(e)
+            self._dirty |= dirty
+            logger.warning(f"⚠️ Rate limit flush failed ({len(rows)} rows): {e}")
+            return False
+    
+    def flush(self) -> bool:
+        """ذخیره فوری تغییرات (write-behind)"""
+        rows, dirty = self._collect_dirty()
+        return self._save(rows, dirty)
+    
+    async def flush_async(self) -> bool:
+        """flush با نوشتن در thread جدا (برای JobQueue)"""
+        rows, dirty = self._collect_dirty()
+        if not rows:
+            return True
+        return await asyncio.to_thread(self._save, rows, dirty)
+    
+    def reset_user(self, user_id: int):
+        """ریست کاربر در حافظه و store"""
+        super().reset_user(user_id)
+        self._dirty = {item for item in self._dirty if item[1] != user_id}
+        try:
+            self.store.delete_user(user_id)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not reset user {user_id} in rate limit store: {e}")
+    
+    def get_backend_stats(self) -> dict:
+        """وضعیت backend برای مانیتورینگ"""
+        return {
+            'backend': type(self.store).__name__,
+            'durable_actions': sorted(self.durable_actions),
+            'dirty': len(self._dirty),
+            'flushes': self.flush_count,
+            'fallbacks': self.fallback_count,
+            'last_error': self.last_error,
+        }
+
+
+def create_rate_limiter(expiry: Optional[TimingWheel] = expiry_wheel, persistent: bool = True):
+    """
+    ساخت موتور Rate Limiting از روی RATE_LIMIT_ENGINE
+    'sqlite' (پیش‌فرض، پایدار و مشترک)، 'gcra' (فقط حافظه) یا 'window' (پنجره لغزان)
+    
+    Args:
+        persistent: False = بدون ساختن فایل store، حتی با موتور 'sqlite' (GCRA درون‌حافظه‌ای)
+    """
+    if RATE_LIMIT_ENGINE == 'window':
+        return RateLimiter(expiry)
+    
+    if RATE_LIMIT_ENGINE == 'sqlite' and persistent:
+        try:
+            from rate_limit_store import SQLiteRateLimitStore
+            return PersistentRateLimiter(
+                SQLiteRateLimitStore(RATE_LIMIT_DB_PATH),
+                expiry,
+                durable_actions=RATE_LIMIT_DURABLE_ACTIONS
+            )
+        except Exception as e:
+            logger.error(f"❌ Persistent rate limiter unavailable, using in-memory GCRA: {e}")
+    
+    return GCRARateLimiter(expiry)
+
+
+def install_rate_limiter():
+    """
+    ✅ ساخت موتور پایدار هنگام راه‌اندازی ربات (build_application)، نه هنگام import
+    
+    نمونه سراسری جایگزین میشه؛ دکوریتورها rate_limiter رو موقع اجرا از همین ماژول
+    می‌خونن و بقیه باید از get_rate_limiter استفاده کنن. اگه store ساخته نشه همان
+    نمونه درون‌حافظه‌ای می‌مونه. فراخوانی دوباره همان نمونه رو برمی‌گردونه.
+    """
+    global rate_limiter
+    if RATE_LIMIT_ENGINE != 'sqlite' or isinstance(rate_limiter, PersistentRateLimiter):
+        return rate_limiter
+    
+    limiter = create_rate_limiter()
+    if isinstance(limiter, PersistentRateLimiter):
+        # ✅ ذخیره تغییرات باقی‌مانده هنگام خروج
+        atexit.register(limiter.flush)
+        rate_limiter = limiter
+    return rate_limiter
+
+
+def get_rate_limiter():
+    """نمونه سراسری فعلی (بعد از install_rate_limiter همان موتور پایدار)"""
+    return rate_limiter
+
+
+async def flush_rate_limits(context):
+    """Job دوره‌ای write-behind وضعیت Rate Limiting"""
+    if isinstance(rate_limiter, PersistentRateLimiter):
+        await rate_limiter.flush_async()
+
+
+# نمونه سراسری: فقط حافظه تا install_rate_limiter (import هیچ فایلی نمی‌سازه)
+rate_limiter = create_rate_limiter(persistent=False)
 
 
 # ==================== Helper Functions ====================
@@ -240,7 +812,7 @@ def rate_limit(max_requests: int = 10, window_seconds: int = 10):
             
             # ✅ Admin Bypass
             if is_admin(user_id):
-                logger.debug(f"✅ Admin {user_id} bypassed rate limit")
+                logger.debug("✅ Admin %s bypassed rate limit", user_id)
                 return await func(update, context, *args, **kwargs)
             
             # ✅ FIX: دریافت show_alert
@@ -269,7 +841,7 @@ def rate_limit(max_requests: int = 10, window_seconds: int = 10):
                         logger.error(f"❌ Error sending rate limit message: {e}")
                 else:
                     # ✅ Silent mode - هیچ کاری نکن
-                    logger.debug(f"🔇 Silent rate limit for user {user_id}")
+                    logger.debug("🔇 Silent rate limit for user %s", user_id)
                 
                 return None
             
@@ -300,7 +872,7 @@ def action_limit(action: str, max_requests: int, window_seconds: int):
             
             # ✅ Admin Bypass
             if is_admin(user_id):
-                logger.debug(f"✅ Admin {user_id} bypassed action limit for '{action}'")
+                logger.debug("✅ Admin %s bypassed action limit for '%s'", user_id, action)
                 return await func(update, context, *args, **kwargs)
             
             # ✅ FIX: دریافت show_alert
@@ -356,7 +928,7 @@ def action_limit(action: str, max_requests: int, window_seconds: int):
                         logger.error(f"❌ Error sending action limit message: {e}")
                 else:
                     # ✅ Silent mode
-                    logger.debug(f"🔇 Silent action limit for user {user_id}, action '{action}'")
+                    logger.debug("🔇 Silent action limit for user %s, action '%s'", user_id, action)
                 
                 logger.warning(f"⚠️ User {user_id} hit action limit for '{action}'")
                 return None
@@ -0,0 +1,157 @@
+"""
+ابزار بازیابی بکاپ: بکاپ کامل + بکاپ‌های افزایشی به ترتیب
+
+اجرا:
+    python restore_backup.py --list
+    python restore_backup.py latest --verify
+    python restore_backup.py latest restored.db
+    python restore_backup.py backup_20240101_030000 restored.db
+    python restore_backup.py backup_20240101_030000 restored.db --until 5
+    python restore_backup.py backup_20240101_030000 restored.db --full-only
+
+فایل‌های بکاپ (قسمت‌ها، manifest و increment ها) باید در یک پوشه باشن
+(پیش‌فرض BACKUP_FOLDER)؛ فایل‌های دانلودشده از تلگرام هم همین نام‌ها رو دارن.
+خروجی یک فایل دیتابیس کامله که می‌تونه جایگزین DATABASE_NAME بشه (با ربات خاموش).
+بدون مسیر خروجی، بازیابی در مسیر staging انجام میشه (برای اندازه‌گیری زمان
+بازیابی واقعی)؛ --verify همون quick_check و شمارش ردیف بعد از بکاپ رو اجرا می‌کنه.
+"""
+import argparse
+import os
+import sys
+import time
+from typing import Dict, List, Optional
+
+from backup_scheduler import restore_backup_file, backup_sets, staging_path_for, VERIFY_TABLES
+from backup_verify import run_check_subprocess
+from config import BACKUP_FOLDER
+from incremental_backup import list_increments, replay_increments
+
+
+def find_backup_files(folder: str, name: str) -> List[str]:
+    """فایل‌های بکاپ کامل (یک یا چند قسمت) بدون manifest و فایل موقت"""
+    prefix = f"{name}.db"
+    return sorted(
+        os.path.join(folder, filename) for filename in os.listdir(folder)
+        if filename.startswith(prefix)
+        and not filename.endswith(('.sha256', '.tmp'))
+        and '.inc' not in filename
+    )
+
+
+def list_backups(folder: str) -> List[Dict]:
+    """بکاپ‌های موجود (جدیدترین اول)"""
+    backups = []
+    for name in sorted(backup_sets(folder), reverse=True):
+        files = find_backup_files(folder, name)
+        if not files:
+            continue
+        backups.append({
+            'name': name,
+            'parts': len(files),
+            'size': sum(os.path.getsize(f) for f in files),
+            'increments': len(list_increments(folder, name)),
+        })
+    return backups
+
+
+def restore(folder: str, name: str, dest_path: str, until: Optional[int] = None,
+            full_only: bool = False, verify: bool = False) -> Dict:
+    """
+    بازیابی بکاپ name در dest_path
+
+    Args:
+        until: آخرین شماره increment برای اعمال (None = همه)
+        full_only: فقط بکاپ کامل، بدون increment
+        verify: اجرای quick_check و شمارش ردیف‌ها روی خروجی (در پروسه جدا)
+
+    Raises:
+        FileNotFoundError: اگه بکاپ پیدا نشه
+        ValueError: چک‌سام نادرست یا زنجیره increment ناقص
+    """
+    if name == 'latest':
+        backups = list_backups(folder)
+        if not backups:
+            raise FileNotFoundError(f"no backups in {folder}")
+        name = backups[0]['name']
+
+    files = find_backup_files(folder, name)
+    if not files:
+        raise FileNotFoundError(f"backup not found: {name}")
+
+    # فایل‌های WAL یک دیتابیس قبلی در همین مسیر روی خروجی اعمال نشن
+    for suffix in ('', '-wal', '-shm', '-journal'):
+        if os.path.exists(dest_path + suffix):
+            os.remove(dest_path + suffix)
+
+    start = time.perf_counter()
+    restore_backup_file(files, dest_path)
+    full_seconds = time.perf_counter() - start
+
+    replay = {'increments': 0, 'rows': 0}
+    if not full_only:
+        replay = replay_increments(dest_path, list_increments(folder, name), name, until=until)
+    restored = time.perf_counter()
+
+    result = {
+        'name': name,
+        'parts': len(files),
+        'increments': replay['increments'],
+        'rows': replay['rows'],
+        'full_seconds': full_seconds,
+        'replay_seconds': restored - start - full_seconds,
+        'total_seconds': restored - start,
+    }
+    if verify:
+        result['check'] = run_check_subprocess(dest_path, list(VERIFY_TABLES))
+        result['check_seconds'] = time.perf_counter() - restored
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('name', nargs='?', help="نام بکاپ (backup_YYYYmmdd_HHMMSS) یا latest")
+    parser.add_argument('dest', nargs='?', help="مسیر فایل دیتابیس خروجی (پیش‌فرض: مسیر staging)")
+    parser.add_argument('--folder', default=BACKUP_FOLDER)
+    parser.add_argument('--list', action='store_true', help="نمایش بکاپ‌های موجود")
+    parser.add_argument('--until', type=int, default=None, help="آخرین شماره increment")
+    parser.add_argument('--full-only', action='store_true', help="بدون اعمال increment ها")
+    parser.add_argument('--verify', action='store_true', help="quick_check و شمارش ردیف‌ها بعد از بازیابی")
+    parser.add_argument('--force', action='store_true', help="بازنویسی فایل خروجی موجود")
+    args = parser.parse_args()
+
+    if args.list or not args.name:
+        for backup in list_backups(args.folder):
+            print(f"{backup['name']}  {backup['size'] / 1024 / 1024:8.2f} MB  "
+                  f"parts={backup['parts']}  increments={backup['increments']}")
+        return
+
+    # فایل staging فقط برای اندازه‌گیریه و بدون پرسش بازنویسی میشه
+    dest = args.dest or staging_path_for(args.folder)
+    if args.dest and os.path.exists(dest) and not args.force:
+        parser.error(f"{dest} exists (use --force)")
+
+    try:
+        result = restore(args.folder, args.name, dest, until=args.until,
+                         full_only=args.full_only, verify=args.verify)
+    except (FileNotFoundError, ValueError, RuntimeError) as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+    print(f"✅ {result['name']} → {dest}")
+    print(f"   بکاپ کامل: {result['parts']} قسمت در {result['full_seconds']:.2f}s")
+    print(f"   increment ها: {result['increments']} ({result['rows']} ردیف) در {result['replay_seconds']:.2f}s")
+    print(f"   زمان بازیابی: {result['total_seconds']:.2f}s")
+
+    if args.verify:
+        check = result['check']
+        status = '✅ ok' if check['ok'] else f"❌ {'; '.join(check['quick_check'])}"
+        print(f"   quick_check: {status} ({result['check_seconds']:.2f}s)")
+        for table, count in check['counts'].items():
+            if count is not None:
+                print(f"     {table}: {count}")
+        if not check['ok']:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -420,6 +420,117 @@ class TestDatabase:
         assert report['success'] is True
         assert report['deleted_count'] >= 1
     
+    def test_cleanup_cutoff_uses_utc_created_at(self, db):
+        """تست مرز created_at (UTC) در پاکسازی: اختلاف ساعت تهران سفارش جوان‌تر رو حذف نکنه"""
+        db.add_user(12345, "test", "Test")
+        items = [{'product': 'تست', 'pack': 'تست', 'quantity': 1, 'price': 1000}]
+        
+        conn = db._get_conn()
+        ids = {}
+        for name, offset in (('older', '-1 hours'), ('younger', '+2 hours')):
+            order_id = db.create_order(12345, items, 1000, 0, 1000)
+            db.update_order_status(order_id, 'rejected')
+            conn.execute(
+                "UPDATE orders SET created_at = datetime('now', '-7 days', ?) WHERE id = ?",
+                (offset, order_id)
+            )
+            conn.commit()
+            ids[name] = order_id
+        
+        report = db.cleanup_old_orders(days_old=7, pause=0, archive=False)
+        
+        assert report['deleted_count'] == 1
+        assert db.get_order(ids['older']) is None
+        assert db.get_order(ids['younger']) is not None
+    
+    def test_hot_reads_reuse_thread_cursor(self, db):
+        """تست cursor مشترک thread برای خواندن‌های داغ بدون تراکنش باز"""
+        product_id = db.add_product("محصول", "توضیح", None)
+        pack_id = db.add_pack(product_id, "پک ۶", 6, 100000)
+        db.add_user(777, "u", "User")
+        db.add_to_cart(777, product_id, pack_id, 1)
+        
+        cursor = db.pool.get_cursor()
+        assert db.get_product(product_id)['name'] == "محصول"
+        assert db.get_pack(pack_id)['quantity'] == 6
+        assert db.get_user(777)['first_name'] == "User"
+        assert db.get_cart(777)[0][5] == 6
+        assert db.get_product(999999) is None
+        assert db.pool.get_cursor() is cursor
+        
+        # دستور خواندنی نیمه‌کاره نمونده (checkpoint کامل ممکنه)
+        conn = db._get_conn()
+        assert not conn.in_transaction
+        busy, log, done = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+        assert busy == 0 and log == done
+        
+        # cursor سازگاری مستقل از cursor مشترکه
+        assert db.cursor is not cursor
+        
+        # cursor بعد از بسته شدن connection دوباره ساخته میشه
+        db.pool.close_connection()
+        assert db.get_pack(pack_id)['id'] == pack_id
+        assert db.pool.get_cursor() is not cursor
+    
+    def test_sqlite_profiles(self, tmp_path):
+        """تست اعمال پروفایل کارایی روی connection های pool"""
+        from database import Database, SQLITE_PROFILES
+        
+        expected_sync = {'FULL': 2, 'NORMAL': 1, 'OFF': 0}
+        for name, profile in SQLITE_PROFILES.items():
+            db = Database(database_name=str(tmp_path / f'{name}.db'), profile=name)
+            conn = db._get_conn()
+            assert conn.execute("PRAGMA synchronous").fetchone()[0] == expected_sync[profile['synchronous']]
+            assert conn.execute("PRAGMA cache_size").fetchone()[0] == -profile['cache_size_kb']
+            assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == profile['busy_timeout_ms']
+            assert conn.execute("PRAGMA wal_autocheckpoint").fetchone()[0] == profile['wal_autocheckpoint']
+            assert conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+            db.close()
+        
+        # نام نامعتبر → پروفایل پیش‌فرض
+        db = Database(database_name=str(tmp_path / 'unknown.db'), profile='turbo')
+        assert db.pool.profile_name == 'balanced'
+        db.close()
+    
+    def test_cleanup_batches_and_archive(self, db, tmp_path):
+        """تست حذف دسته‌ای به ترتیب id و انتقال به جدول ماهانه آرشیو"""
+        db.add_user(12345, "test", "Test")
+        items = [{'product': 'تست', 'pack': 'تست', 'quantity': 1, 'price': 1000}]
+        
+        old_ids = []
+        for i in range(25):
+            order_id = db.create_order(12345, items, 1000, 0, 1000)
+            db.update_order_status(order_id, 'rejected')
+            old_ids.append(order_id)
+        kept_confirmed = db.create_order(12345, items, 1000, 0, 1000)
+        db.update_order_status(kept_confirmed, 'confirmed')
+        kept_recent = db.create_order(12345, items, 1000, 0, 1000)
+        db.update_order_status(kept_recent, 'rejected')
+        
+        conn = db._get_conn()
+        conn.execute("UPDATE orders SET created_at = '2024-03-05 10:00:00' WHERE id != ?", (kept_recent,))
+        conn.execute("UPDATE orders SET created_at = '2024-04-01 09:00:00' WHERE id IN (?, ?)",
+                     (old_ids[0], old_ids[1]))
+        conn.commit()
+        
+        archive_path = str(tmp_path / 'archive.db')
+        with patch('database.ORDER_ARCHIVE_PATH', archive_path):
+            report = db.cleanup_old_orders(days_old=7, batch_size=10, pause=0, archive=True)
+        
+        assert report['success'] is True
+        assert report['deleted_count'] == 25
+        assert report['archived_count'] == 25
+        assert report['batches'] == 3
+        
+        remaining = [row[0] for row in conn.execute("SELECT id FROM orders ORDER BY id")]
+        assert remaining == [kept_confirmed, kept_recent]
+        
+        archive = sqlite3.connect(archive_path)
+        assert archive.execute("SELECT COUNT(*) FROM orders_202403").fetchone()[0] == 23
+        assert archive.execute("SELECT status FROM orders_202404 WHERE id = ?",
+                               (old_ids[0],)).fetchone()[0] == 'rejected'
+        archive.close()
+    
     def test_delete_product_cascade(self, db):
         """تست حذف محصول با cascade"""
         product_id = db.add_product("محصول", "توضیحات", "photo")
@@ -571,10 +682,1205 @@ class TestRateLimiter:
         
         assert stats['user_id'] == 12345
         assert 'general_requests' in stats
+    
+    def test_gcra_burst_and_refill(self):
+        """تست GCRA (محدودیت کلی): burst تا سقف مجاز و بازگشت تدریجی ظرفیت"""
+        from rate_limiter import GCRARateLimiter
+        
+        limiter = GCRARateLimiter()
+        now = [1000.0]
+        
+        with patch('rate_limiter.time.time', side_effect=lambda: now[0]):
+            for _ in range(3):
+                assert limiter.check_rate_limit(12345, 3, 3600)[0] is True
+            
+            allowed, remaining, show_alert = limiter.check_rate_limit(12345, 3, 3600)
+            assert allowed is False
+            assert remaining == 1201
+            assert show_alert is True
+            
+            # alert فقط یکبار در cooldown
+            assert limiter.check_rate_limit(12345, 3, 3600)[2] is False
+            
+            # بعد از window/max ثانیه یک درخواست دیگه مجازه
+            now[0] += 1200
+            assert limiter.check_rate_limit(12345, 3, 3600)[0] is True
+            assert limiter.check_rate_limit(12345, 3, 3600)[0] is False
+            assert limiter.get_stats(12345)['general_requests'] == 3
+            
+            # کاربر دیگه مستقله
+            assert limiter.check_rate_limit(99999, 3, 3600)[0] is True
+            
+            # کلیدهای پرشده در cleanup حذف میشن
+            now[0] += 3600
+            limiter.cleanup_stale_users()
+            assert limiter.key_count() == 0
+            assert limiter.check_rate_limit(12345, 3, 3600)[0] is True
+    
+    def test_gcra_order_limit_is_exact_window(self):
+        """تست سقف دقیق 3 سفارش در هر ساعت (بدون burst اضافه GCRA)"""
+        from rate_limiter import GCRARateLimiter
+        
+        limiter = GCRARateLimiter()
+        now = [1000.0]
+        
+        with patch('rate_limiter.time.time', side_effect=lambda: now[0]):
+            for _ in range(3):
+                assert limiter.check_action_limit(12345, 'order', 3, 3600)[0] is True
+            
+            # سفارش چهارم و پنجم در همان ساعت (GCRA بعد از 20 و 40 دقیقه اجازه می‌داد)
+            now[0] += 1200
+            allowed, remaining, _ = limiter.check_action_limit(12345, 'order', 3, 3600)
+            assert allowed is False
+            assert remaining == 2401
+            now[0] += 1200
+            assert limiter.check_action_limit(12345, 'order', 3, 3600)[0] is False
+            assert limiter.get_stats(12345)['actions']['order'] == 3
+            
+            # یک ساعت بعد از اولین سفارش، هر سه با هم آزاد میشن
+            now[0] = 1000.0 + 3600
+            assert [limiter.check_action_limit(12345, 'order', 3, 3600)[0] for _ in range(4)] == [True] * 3 + [False]
+            
+            now[0] += 3600
+            limiter.cleanup_stale_users()
+            assert limiter.key_count() == 0
+    
+    def test_gcra_general_limit_and_reset(self):
+        """تست GCRA: محدودیت کلی و ریست کاربر"""
+        from rate_limiter import GCRARateLimiter
+        
+        limiter = GCRARateLimiter()
+        results = [limiter.check_rate_limit(12345, 10, 60)[0] for _ in range(11)]
+        assert results == [True] * 10 + [False]
+        assert limiter.get_stats(12345)['general_requests'] == 10
+        
+        limiter.reset_user(12345)
+        assert limiter.check_rate_limit(12345, 10, 60)[0] is True
+
+
+    def test_persistent_order_limit_survives_restart(self, tmp_path):
+        """تست backend SQLite: سقف سفارش بعد از restart و بین دو process"""
+        import threading
+        from rate_limiter import PersistentRateLimiter
+        from rate_limit_store import SQLiteRateLimitStore
+        
+        path = str(tmp_path / "ratelimit.db")
+        first = PersistentRateLimiter(SQLiteRateLimitStore(path))
+        
+        assert [first.check_action_limit(1, 'order', 3, 3600)[0] for _ in range(2)] == [True, True]
+        
+        # «restart»: نمونه جدید همان فایل را می‌بیند
+        restarted = PersistentRateLimiter(SQLiteRateLimitStore(path))
+        assert restarted.check_action_limit(1, 'order', 3, 3600)[0] is True
+        allowed, remaining, _ = restarted.check_action_limit(1, 'order', 3, 3600)
+        assert allowed is False and remaining > 0
+        
+        # دو «process» همزمان روی یک کاربر جدید: در مجموع فقط 3 سفارش
+        workers = [PersistentRateLimiter(SQLiteRateLimitStore(path)) for _ in range(2)]
+        results = []
+        
+        def attempt(limiter):
+            for _ in range(5):
+                results.append(limiter.check_action_limit(2, 'order', 3, 3600)[0])
+        
+        threads = [threading.Thread(target=attempt, args=(w,)) for w in workers for _ in range(2)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert results.count(True) == 3
+    
+    def test_persistent_order_limit_is_exact_window(self, tmp_path):
+        """تست سقف دقیق 3 سفارش در ساعت روی store، بعد از restart"""
+        from rate_limiter import PersistentRateLimiter
+        from rate_limit_store import SQLiteRateLimitStore
+        
+        path = str(tmp_path / "ratelimit.db")
+        now = [1000.0]
+        
+        with patch('rate_limiter.time.time', side_effect=lambda: now[0]):
+            first = PersistentRateLimiter(SQLiteRateLimitStore(path))
+            assert [first.check_action_limit(1, 'order', 3, 3600)[0] for _ in range(3)] == [True] * 3
+            
+            # سفارش چهارم و پنجم در همان ساعت، حتی بعد از restart
+            restarted = PersistentRateLimiter(SQLiteRateLimitStore(path))
+            now[0] += 1200
+            allowed, remaining, _ = restarted.check_action_limit(1, 'order', 3, 3600)
+            assert allowed is False and remaining == 2401
+            now[0] += 1200
+            assert restarted.check_action_limit(1, 'order', 3, 3600)[0] is False
+            assert restarted.get_stats(1)['actions']['order'] == 3
+            
+            now[0] = 1000.0 + 3600
+            assert [restarted.check_action_limit(1, 'order', 3, 3600)[0] for _ in range(4)] == [True] * 3 + [False]
+            
+            # زمان‌های منقضی‌شده با purge پاک میشن
+            store = SQLiteRateLimitStore(path)
+            assert store.purge_expired(1000.0 + 3600) == 3
+    
+    def test_persistent_write_behind_and_fallback(self, tmp_path):
+        """تست write-behind محدودیت کلی و fallback به حافظه"""
+        from rate_limiter import PersistentRateLimiter
+        from rate_limit_store import SQLiteRateLimitStore
+        
+        path = str(tmp_path / "ratelimit.db")
+        limiter = PersistentRateLimiter(SQLiteRateLimitStore(path))
+        for _ in range(10):
+            assert limiter.check_rate_limit(5, 10, 60)[0] is True
+        
+        # قبل از flush چیزی ذخیره نشده
+        assert PersistentRateLimiter(SQLiteRateLimitStore(path)).check_rate_limit(5, 10, 60)[0] is True
+        
+        assert limiter.flush() is True
+        assert limiter.get_backend_stats()['dirty'] == 0
+        assert PersistentRateLimiter(SQLiteRateLimitStore(path)).check_rate_limit(5, 10, 60)[0] is False
+        
+        # store خراب: همان موتور درون‌حافظه‌ای
+        broken = Mock()
+        broken.load_active.side_effect = sqlite3.OperationalError("disk I/O error")
+        broken.check_window.side_effect = sqlite3.OperationalError("database is locked")
+        fallback = PersistentRateLimiter(broken)
+        results = [fallback.check_action_limit(7, 'order', 3, 3600)[0] for _ in range(4)]
+        assert results == [True, True, True, False]
+        assert fallback.get_backend_stats()['fallbacks'] == 4
+    
+    def test_persistent_store_created_on_install_not_import(self, tmp_path):
+        """تست import بدون ساختن فایل store؛ موتور پایدار با install_rate_limiter"""
+        import subprocess
+        import sys
+        
+        code = (
+            "import os, rate_limiter\n"
+            "from config import RATE_LIMIT_DB_PATH\n"
+            "assert not os.path.exists(RATE_LIMIT_DB_PATH)\n"
+            "assert type(rate_limiter.get_rate_limiter()).__name__ == 'GCRARateLimiter'\n"
+            "limiter = rate_limiter.install_rate_limiter()\n"
+            "assert rate_limiter.install_rate_limiter() is limiter is rate_limiter.get_rate_limiter()\n"
+            "assert type(limiter).__name__ == 'PersistentRateLimiter'\n"
+            "assert os.path.exists(RATE_LIMIT_DB_PATH)\n"
+        )
+        env = dict(os.environ, DATABASE_NAME=str(tmp_path / "shop.db"), RATE_LIMIT_ENGINE='sqlite')
+        env.pop('RATE_LIMIT_DB_PATH', None)
+        proc = subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              env=env, capture_output=True, text=True, timeout=60)
+        assert proc.returncode == 0, proc.stderr
+    
+    def test_incomplete_store_fails_on_construction(self):
+        """تست رابط RateLimitStore: backend ناقص همون موقع ساخت خطا میده"""
+        from rate_limit_store import RateLimitStore
+        
+        class PartialStore(RateLimitStore):
+            def load_active(self, now):
+                return []
+        
+        with pytest.raises(TypeError):
+            PartialStore()
+
+
+# ==================== Tests: Expiry Wheel ====================
+
+class TestExpiryWheel:
+    """تست timing wheel انقضا"""
+    
+    def test_schedule_extend_cancel(self):
+        """تست انقضا در موعد، تمدید lazy و لغو"""
+        from expiry_wheel import TimingWheel
+        
+        wheel = TimingWheel(tick=1.0, slots=16)
+        expired = []
+        reg = wheel.registry('test', expired.append)
+        base = wheel._cursor * wheel.tick
+        
+        reg.schedule('a', base + 3)
+        reg.schedule('b', base + 3)
+        reg.schedule('c', base + 100)  # دورتر از افق چرخ
+        reg.schedule('a', base + 8)    # تمدید
+        reg.cancel('b')
+        
+        wheel.advance(base + 5)
+        assert expired == []
+        
+        wheel.advance(base + 8)
+        assert expired == ['a']
+        
+        # extend_only مهلت رو کوتاه نمی‌کنه
+        reg.schedule('c', base + 10, extend_only=True)
+        wheel.advance(base + 50)
+        assert expired == ['a']
+        
+        wheel.advance(base + 100)
+        assert expired == ['a', 'c']
+        assert len(reg) == 0
+    
+    def test_budget_and_backlog(self):
+        """تست بودجه هر tick و گزارش backlog"""
+        from expiry_wheel import TimingWheel
+        
+        wheel = TimingWheel(tick=1.0, slots=64)
+        expired = []
+        reg = wheel.registry('test', expired.append)
+        base = wheel._cursor * wheel.tick
+        
+        for i in range(100):
+            reg.schedule(i, base + 1)
+        
+        assert wheel.advance(base + 2, budget=30) == 30
+        assert wheel.backlog(base + 2) == 70
+        assert wheel.get_stats()['registries']['test'] == 70
+        
+        wheel.advance(base + 2, budget=1000)
+        assert len(expired) == 100
+        assert wheel.backlog(base + 2) == 0
+    
+    def test_rate_limiter_and_cache_expiry(self):
+        """تست انقضای وضعیت RateLimiter و کش از طریق چرخ"""
+        from expiry_wheel import TimingWheel
+        from rate_limiter import GCRARateLimiter, RateLimiter
+        from cache_manager import CacheManager
+        
+        wheel = TimingWheel(tick=1.0, slots=64)
+        gcra = GCRARateLimiter(wheel)
+        window = RateLimiter(wheel)
+        cache = CacheManager(expiry=wheel)
+        
+        now = [wheel._cursor * wheel.tick]
+        with patch('rate_limiter.time.time', side_effect=lambda: now[0]), \
+             patch('cache_manager.time.time', side_effect=lambda: now[0]):
+            for uid in range(10):
+                gcra.check_rate_limit(uid, 10, 60)
+                window.check_action_limit(uid, 'order', 3, 30)
+            cache.set('product:1', 'x', ttl=20)
+            cache.set('forever', 'y', ttl=0)
+            
+            now[0] += 25
+            wheel.advance(now[0])
+            assert cache.get_stats()['cache_size'] == 1
+            assert len(window._action_requests) == 10
+            assert gcra.key_count() == 0
+            
+            now[0] += 10
+            wheel.advance(now[0])
+            assert len(window._action_requests) == 0
+            assert wheel.get_stats()['pending'] == 0
 
 
 # ==================== Tests: Edge Cases ====================
 
+class TestKeyedLock:
+    """تست قفل‌های کلیددار سبد خرید"""
+    
+    def test_refcounted_locks_are_dropped(self):
+        """تست حذف قفل بعد از آزاد شدن آخرین استفاده‌کننده"""
+        from keyed_lock import KeyedLockManager
+        
+        locks = KeyedLockManager('test')
+        
+        async def run():
+            async with locks.lock(1):
+                async with locks.lock(2):
+                    assert len(locks) == 2
+            assert len(locks) == 0
+        
+        asyncio.run(run())
+        assert locks.get_stats()['acquisitions'] == 2
+    
+    def test_contention_serializes_and_records_wait(self):
+        """تست اجرای ترتیبی و ثبت زمان انتظار"""
+        from keyed_lock import KeyedLockManager
+        
+        locks = KeyedLockManager('test')
+        order = []
+        
+        async def worker(name):
+            async with locks.lock(42):
+                order.append(f'{name}-in')
+                await asyncio.sleep(0.01)
+                order.append(f'{name}-out')
+        
+        async def run():
+            await asyncio.gather(worker('a'), worker('b'), worker('c'))
+        
+        asyncio.run(run())
+        
+        # هیچ دو worker همزمان داخل قفل نبودن
+        for i in range(0, len(order), 2):
+            assert order[i].endswith('-in') and order[i + 1].endswith('-out')
+        
+        stats = locks.get_stats()
+        assert stats['contended'] == 2
+        assert stats['max_waiting'] == 2
+        assert stats['max_wait_ms'] > 0
+        assert stats['waiting'] == 0 and stats['active'] == 0
+        assert len(locks) == 0
+    
+    def test_striped_mode_fixed_size(self):
+        """تست حالت striped با تعداد قفل ثابت"""
+        from keyed_lock import KeyedLockManager
+        
+        locks = KeyedLockManager('test', stripes=4)
+        
+        async def run():
+            for uid in range(100):
+                async with locks.lock(uid):
+                    pass
+        
+        asyncio.run(run())
+        assert len(locks._stripe_entries) == 4
+        assert len(locks._entries) == 0
+        assert locks.get_stats()['mode'] == 'striped(4)'
+
+
+class TestMetrics:
+    """تست رجیستری متریک و middleware"""
+    
+    def test_incomplete_metric_fails_on_construction(self):
+        """تست پایه‌های انتزاعی: کلاس بدون override همون موقع ساخت خطا میده"""
+        from metrics import _Metric, _Sharded
+        
+        class PartialMetric(_Metric):
+            kind = 'counter'
+        
+        class PartialChild(_Sharded):
+            __slots__ = ()
+        
+        with pytest.raises(TypeError):
+            PartialMetric('partial_total', 'doc')
+        with pytest.raises(TypeError):
+            PartialChild()
+    
+    def test_histogram_exposition(self):
+        """تست bucket های تجمعی و فرمت خروجی"""
+        from metrics import MetricsRegistry
+        
+        reg = MetricsRegistry()
+        hist = reg.histogram('test_latency_seconds', 'test', ('handler',), buckets=(0.01, 0.1, 1.0))
+        child = hist.labels('view_cart')
+        for value in (0.005, 0.05, 0.05, 5.0):
+            child.observe(value)
+        reg.counter('test_total', 'test').inc(3)
+        
+        text = reg.exposition()
+        assert '# TYPE test_latency_seconds histogram' in text
+        assert 'test_latency_seconds_bucket{handler="view_cart",le="0.01"} 1' in text
+        assert 'test_latency_seconds_bucket{handler="view_cart",le="0.1"} 3' in text
+        assert 'test_latency_seconds_bucket{handler="view_cart",le="+Inf"} 4' in text
+        assert 'test_latency_seconds_count{handler="view_cart"} 4' in text
+        assert 'test_total 3' in text
+        assert hist.summary('view_cart')['count'] == 4
+    
+    def test_sharded_counter_and_label_overflow(self):
+        """تست شمارش دقیق بین thread ها و سقف ترکیب label"""
+        import threading
+        import metrics
+        from metrics import MetricsRegistry
+        
+        reg = MetricsRegistry()
+        counter = reg.counter('test_requests_total', 'test', ('kind',))
+        child = counter.labels('a')
+        
+        def work():
+            for _ in range(10000):
+                child.inc()
+        
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert child.get() == 40000
+        
+        for i in range(metrics.MAX_LABEL_SETS + 10):
+            counter.labels(f'k{i}').inc()
+        assert len(counter.children()) == metrics.MAX_LABEL_SETS + 1
+        assert counter.labels('k999999').get() > 0  # همه اضافه‌ها در 'other'
+    
+    def test_instrumented_handler_and_callback_prefix(self):
+        """تست middleware: زمان handler، پیشوند callback و شمارش خطا"""
+        from metrics import instrument_callback, HANDLER_LATENCY, CALLBACK_LATENCY, HANDLER_ERRORS
+        
+        async def metrics_test_handler(update, context):
+            if update.callback_query.data == 'boom':
+                raise ValueError('boom')
+            return 7
+        
+        wrapped = instrument_callback(metrics_test_handler)
+        assert instrument_callback(wrapped) is wrapped
+        
+        update = Mock()
+        update.callback_query.data = 'cart_increase:42'
+        assert asyncio.run(wrapped(update, None)) == 7
+        
+        update.callback_query.data = 'boom'
+        with pytest.raises(ValueError):
+            asyncio.run(wrapped(update, None))
+        
+        assert HANDLER_LATENCY.summary('metrics_test_handler')['count'] == 2
+        assert CALLBACK_LATENCY.summary('cart_increase')['count'] >= 1
+        assert HANDLER_ERRORS.labels('metrics_test_handler').get() == 1
+    
+    def test_db_and_cache_metrics(self, db):
+        """تست ثبت زمان query و hit/miss کش"""
+        from metrics import DB_QUERY_LATENCY, CACHE_HIT, CACHE_MISS
+        from cache_manager import CacheManager
+        
+        before = DB_QUERY_LATENCY.summary('SELECT')['count']
+        db.get_all_products()
+        assert DB_QUERY_LATENCY.summary('SELECT')['count'] > before
+        
+        cache = CacheManager()
+        hits, misses = CACHE_HIT.get(), CACHE_MISS.get()
+        cache.get('missing')
+        cache.set('key', 1)
+        cache.get('key')
+        assert CACHE_HIT.get() == hits + 1
+        assert CACHE_MISS.get() == misses + 1
+    
+    def test_metrics_route(self):
+        """تست route /metrics در داشبورد"""
+        pytest.importorskip('flask')
+        from monitoring import app
+        
+        response = app.test_client().get('/metrics')
+        assert response.status_code == 200
+        assert response.mimetype == 'text/plain'
+        assert b'# TYPE bot_handler_latency_seconds histogram' in response.data
+
+
+class TestCallbackRouter:
+    """تست مسیریاب callback_data"""
+
+    def test_resolve_routes(self):
+        """تست تطابق کامل، آرگومان نوع‌دار، پیشوند trie و عدم تطابق"""
+        from callback_router import CallbackRouter
+
+        async def view_cart(update, context): pass
+        async def select_pack(update, context): pass
+        async def dash(update, context): pass
+        async def ship(update, context): pass
+
+        router = CallbackRouter()
+        cart = router.exact('view_cart', view_cart)
+        pack = router.route('select_pack', select_pack, int, int)
+        panel = router.route('dash', dash)
+        shipping = router.prefix('ship_', ship)
+
+        assert router.resolve('view_cart') == (cart, [])
+        assert router.resolve('select_pack:3:7') == (pack, [3, 7])
+        assert router.resolve('dash:queries:p95') == (panel, ['queries', 'p95'])
+        assert router.resolve('ship_tipax') == (shipping, ['tipax'])
+
+        for data in ('view_cart:1', 'select_pack:3', 'select_pack:x:7', 'unknown:1', 'ship', '', None):
+            assert router.resolve(data) is None
+        with pytest.raises(ValueError):
+            router.route('select_pack', select_pack)
+        assert len(router) == 4
+
+    def test_dispatch_sets_args_and_instruments_routes(self):
+        """تست اجرای تابع مقصد با context.args و اندازه‌گیری جدای هر مسیر"""
+        from telegram import Update
+        from callback_router import CallbackRouter
+        from metrics import instrument_application, HANDLER_LATENCY
+
+        async def router_test_target(update, context):
+            return context.args
+
+        router = CallbackRouter()
+        router.route('router_test', router_test_target, int)
+        application = Mock()
+        application.handlers = {0: [router]}
+        assert instrument_application(application) == 1
+
+        update = Update.de_json({
+            'update_id': 1,
+            'callback_query': {
+                'id': '1', 'chat_instance': '1', 'data': 'router_test:42',
+                'from': {'id': 1, 'is_bot': False, 'first_name': 'x'},
+            },
+        }, None)
+        check = router.check_update(update)
+        context = Mock()
+        assert asyncio.run(router.handle_update(update, application, check, context)) == [42]
+        assert HANDLER_LATENCY.summary('router_test_target')['count'] == 1
+        assert router.check_update(Mock(spec=Update, callback_query=None)) is None
+
+
+class TestQueryProfiler:
+    """تست پروفایلر کوئری و لاگ کوئری کند"""
+    
+    def test_fingerprint_normalization(self):
+        """تست یکسان شدن کوئری‌های با literal متفاوت"""
+        from query_profiler import fingerprint
+        
+        a = fingerprint("SELECT * FROM orders WHERE id = 12 AND status IN (?, ?, ?)")
+        b = fingerprint("SELECT *\n  FROM orders WHERE id = 7 AND status IN (?)")
+        assert a == b == "SELECT * FROM orders WHERE id = ? AND status IN (...)"
+        assert fingerprint("UPDATE users SET name = 'O''Neil' WHERE user_id = 5") == \
+            "UPDATE users SET name = ? WHERE user_id = ?"
+        assert fingerprint("SELECT * FROM idx_1") == "SELECT * FROM idx_1"
+    
+    def test_sampling_percentiles_and_slow(self):
+        """تست نمونه‌برداری، صدک‌ها و ثبت همیشگی کوئری کند"""
+        from query_profiler import QueryProfiler
+        
+        profiler = QueryProfiler(sample_rate=0.5, slow_ms=50)
+        with patch('query_profiler.log_slow_query') as log_slow:
+            for i in range(100):
+                profiler.observe(f"SELECT * FROM products WHERE id = {i}", 0.001 * (i % 10 + 1))
+            profiler.observe("DELETE FROM cart WHERE user_id = 1", 0.2)
+        
+        top = profiler.top(10)
+        products = next(r for r in top if r['fingerprint'].startswith('SELECT'))
+        assert products['sampled'] == 50
+        assert products['calls'] == 100
+        assert 1 <= products['p50_ms'] <= products['p95_ms'] <= products['max_ms'] <= 10
+        
+        slow = next(r for r in top if r['fingerprint'].startswith('DELETE'))
+        assert slow['slow'] == 1 and slow['max_ms'] == 200
+        log_slow.assert_called_once()
+        assert profiler.top(1, order_by='max')[0]['fingerprint'].startswith('DELETE')
+        
+        profiler.reset()
+        assert profiler.top() == []
+    
+    def test_pool_connections_are_profiled(self, db):
+        """تست اتصال پروفایلر به connection های pool"""
+        from query_profiler import query_profiler
+        
+        old = (query_profiler.sample_rate, query_profiler.slow_ms)
+        query_profiler.configure(1.0, 10000)
+        try:
+            query_profiler.reset()
+            db.get_all_products()
+            assert any('FROM products' in row['fingerprint'] for row in query_profiler.top(50))
+        finally:
+            query_profiler.configure(*old)
+            query_profiler.reset()
+
+    
+    def test_fetch_time_counts_toward_statement(self):
+        """تست ثبت زمان fetch/پیمایش ردیف‌ها برای همان دستور (یک بار)"""
+        import time
+        from database import TimedConnection
+        
+        conn = sqlite3.connect(':memory:', factory=TimedConnection)
+        conn.create_function('slow', 1, lambda x: time.sleep(0.002) or x)
+        conn.execute("CREATE TABLE t (x INTEGER)")
+        conn.executemany("INSERT INTO t VALUES (?)", [(i,) for i in range(20)])
+        
+        with patch('database._observe_query') as observe:
+            # execute فقط ردیف اول رو می‌خونه؛ بقیه زمان در fetchall و پیمایشه
+            assert len(conn.execute("SELECT slow(x) FROM t").fetchall()) == 20
+            assert sum(1 for _ in conn.execute("SELECT slow(x) FROM t")) == 20
+            # cursor نیمه‌خونده با آزاد شدن ثبت میشه
+            assert conn.execute("SELECT slow(x) FROM t").fetchone() == (0,)
+        
+        assert [c.args[0] for c in observe.call_args_list] == ["SELECT slow(x) FROM t"] * 3
+        assert all(c.args[1] >= 0.03 for c in observe.call_args_list[:2])
+        conn.close()
+
+class TestStackSampler:
+    """تست پروفایلر نمونه‌برداری پشته"""
+    
+    def test_samples_busy_thread(self):
+        """تست ثبت تابع پرمصرف در خروجی collapsed-stack"""
+        import threading
+        import time
+        from stack_sampler import StackSampler, ProfilerBusyError
+        
+        stop = threading.Event()
+        
+        def busy_profile_target():
+            while not stop.is_set():
+                sum(range(1000))
+        
+        worker = threading.Thread(target=busy_profile_target, name="busy-worker")
+        worker.start()
+        
+        sampler = StackSampler(interval=0.002)
+        sampler.start(duration=5)
+        try:
+            with pytest.raises(ProfilerBusyError):
+                StackSampler().start()
+            time.sleep(0.2)
+        finally:
+            result = sampler.stop()
+            stop.set()
+            worker.join()
+        
+        assert result.samples > 10
+        assert 0 <= result.overhead_percent < 100
+        
+        lines = result.collapsed().strip().splitlines()
+        busy = [l for l in lines if l.startswith('busy-worker;') and 'busy_profile_target' in l]
+        assert busy
+        stack, count = busy[0].rsplit(' ', 1)
+        assert int(count) > 0
+        assert any('busy_profile_target' in label for label, _ in result.top_functions(5))
+        
+        # بعد از پایان، جلسه جدید قابل شروع است
+        again = StackSampler()
+        again.start(duration=1)
+        again.stop()
+    
+    def test_finish_profiling_sends_document(self):
+        """تست ارسال فایل نتیجه به ادمین"""
+        from admin_dashboard import _finish_profiling
+        from stack_sampler import StackSampler
+        
+        sampler = StackSampler(interval=0.002)
+        sampler.start(duration=1)
+        bot = AsyncMock()
+        
+        asyncio.run(_finish_profiling(bot, 123, sampler, 0.05))
+        
+        kwargs = bot.send_document.call_args.kwargs
+        assert kwargs['chat_id'] == 123
+        assert kwargs['filename'].endswith('.folded')
+        assert 'سربار' in kwargs['caption']
+
+
+class TestLoopMonitor:
+    """تست مانیتور تأخیر event loop"""
+    
+    def test_detects_blocking_callback_with_stack(self):
+        """تست ثبت lag و پشته callback بلاک‌کننده"""
+        import time
+        from loop_monitor import LoopLagMonitor
+        
+        monitor = LoopLagMonitor(interval=0.02, threshold_ms=60, capture_stacks=True)
+        
+        def blocking_test_call():
+            time.sleep(0.3)
+        
+        async def run():
+            monitor.start()
+            await asyncio.sleep(0.1)
+            blocking_test_call()
+            await asyncio.sleep(0.1)
+            monitor.stop()
+        
+        asyncio.run(run())
+        
+        stats = monitor.get_stats()
+        assert stats['samples'] > 3
+        assert stats['blocked_total'] == 1
+        assert stats['max_ms'] >= 250
+        
+        events = monitor.get_block_events()
+        assert len(events) == 1
+        assert events[0]['blocked_ms'] >= 250
+        assert 'blocking_test_call' in events[0]['stack']
+    
+    def test_health_check_reports_loop_status(self):
+        """تست وضعیت event loop در Health Check"""
+        from health_check import HealthChecker
+        from loop_monitor import LoopLagMonitor
+        
+        monitor = LoopLagMonitor(interval=0.5, threshold_ms=100)
+        monitor._task = Mock(done=Mock(return_value=False))
+        for _ in range(99):
+            monitor.record(0.002)
+        monitor.record(0.5)
+        
+        checker = HealthChecker(Mock(), 0)
+        with patch('loop_monitor.loop_monitor', monitor):
+            result = checker.check_event_loop()
+        
+        assert result['status'] == 'warning'
+        assert result['healthy'] is True
+        assert result['blocked_total'] == 1
+
+
+class TestHealthSampler:
+    """تست نمونه‌بردار پس‌زمینه Health Check"""
+    
+    def test_background_sampler_makes_reads_instant(self, db):
+        """تست خواندن وضعیت از آخرین نمونه (بدون اجرای دوباره بررسی‌ها)"""
+        import time
+        from health_check import HealthChecker
+        
+        checker = HealthChecker(db, time.time())
+        checker.start_sampler(interval=0.05)
+        try:
+            deadline = time.time() + 2
+            while len(checker._samples) < 2 and time.time() < deadline:
+                time.sleep(0.01)
+            assert len(checker._samples) >= 2
+            
+            with patch.object(checker, 'check_database') as check_db, \
+                 patch.object(checker, 'check_cpu') as check_cpu:
+                start = time.perf_counter()
+                status = checker.get_health_status()
+                elapsed = time.perf_counter() - start
+            
+            check_db.assert_not_called()
+            check_cpu.assert_not_called()
+            assert elapsed < 0.05
+            assert status.sampled_at is not None
+            assert 'memory_mb' in status.trends
+            assert 'روند' in checker.get_health_report()
+        finally:
+            checker.stop_sampler()
+    
+    def test_trend_windows(self, db):
+        """تست min/avg/max در پنجره‌های 1/5/15 دقیقه"""
+        from health_check import HealthChecker
+        
+        checker = HealthChecker(db, 0)
+        now = 10000.0
+        for age, mb in ((30, 100), (120, 200), (600, 400), (1200, 800)):
+            checker._samples.append({
+                'time': now - age,
+                'database': {}, 'cpu': {'percent': 10}, 'users': {}, 'orders': {},
+                'memory': {'process_mb': mb},
+            })
+        
+        trends = checker.get_trends(now)['memory_mb']
+        assert trends['1m'] == {'min': 100, 'avg': 100, 'max': 100, 'samples': 1}
+        assert trends['5m']['avg'] == 150
+        assert trends['15m'] == {'min': 100, 'avg': 233.33, 'max': 400, 'samples': 3}
+
+
+class TestLogging:
+    """تست صف لاگ و نمونه‌برداری DEBUG"""
+    
+    def test_queue_listener_formats_in_background(self):
+        """تست ارسال record از طریق صف و ثبت مقدار لحظه‌ای args تغییرپذیر"""
+        import logging
+        import threading
+        from logger import attach_queue
+        
+        records = []
+        
+        class CollectHandler(logging.Handler):
+            def emit(self, record):
+                records.append((threading.current_thread().name, self.format(record)))
+        
+        log = logging.getLogger('test_queue_logging')
+        log.propagate = False
+        log.setLevel(logging.INFO)
+        listener = attach_queue(log, [CollectHandler()], sampling='')
+        
+        items = ['a']
+        log.info("user %s did %s", 42, "buy")
+        log.info("items %s", items)
+        items.append('b')  # بعد از لاگ تغییر کرده
+        listener.stop()
+        
+        assert [msg for _, msg in records] == ["user 42 did buy", "items ['a']"]
+        assert all(name != threading.current_thread().name for name, _ in records)
+    
+    def test_debug_sampling_filter(self):
+        """تست نگه داشتن بخشی از لاگ‌های DEBUG یک دسته"""
+        import logging
+        from logger import DebugSamplingFilter, parse_sampling
+        
+        rates = parse_sampling('cache_manager=0.1, rate_limiter=0,bad')
+        assert rates == {'cache_manager': 0.1, 'rate_limiter': 0.0}
+        
+        sampler = DebugSamplingFilter(rates)
+        
+        def make(name, level):
+            return logging.LogRecord(name, level, __file__, 1, "msg", None, None)
+        
+        kept = sum(sampler.filter(make('cache_manager', logging.DEBUG)) for _ in range(100))
+        assert kept == 10
+        assert not sampler.filter(make('rate_limiter', logging.DEBUG))
+        assert sampler.filter(make('rate_limiter', logging.WARNING))
+        assert sampler.filter(make('database', logging.DEBUG))
+
+
+class TestBackup:
+    """تست بکاپ مرحله‌ای، فشرده‌سازی و تقسیم به قسمت‌ها"""
+    
+    @staticmethod
+    def _make_db(path, rows=2000):
+        conn = sqlite3.connect(path)
+        conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, payload TEXT)")
+        conn.executemany("INSERT INTO items (payload) VALUES (?)",
+                         [(f"row-{i}-" + "x" * 200,) for i in range(rows)])
+        conn.commit()
+        conn.close()
+    
+    def test_stepwise_backup_under_concurrent_writes(self, tmp_path):
+        """تست کپی مرحله‌ای سازگار وقتی connection دیگه همزمان می‌نویسه"""
+        import threading
+        import time
+        from backup_scheduler import safe_sqlite_backup
+        
+        src, dst = str(tmp_path / 'src.db'), str(tmp_path / 'dst.db')
+        self._make_db(src)
+        
+        stop = threading.Event()
+        
+        def writer():
+            conn = sqlite3.connect(src, timeout=5)
+            while not stop.is_set():
+                conn.execute("INSERT INTO items (payload) VALUES ('concurrent')")
+                conn.commit()
+                time.sleep(0.001)
+            conn.close()
+        
+        thread = threading.Thread(target=writer)
+        thread.start()
+        try:
+            restarts = safe_sqlite_backup(src, dst, pages=2, step_sleep=0.001, max_restarts=1)
+        finally:
+            stop.set()
+            thread.join()
+        
+        assert restarts >= 0
+        conn = sqlite3.connect(dst)
+        assert conn.execute("PRAGMA integrity_check").fetchone()[0] == 'ok'
+        assert conn.execute("SELECT COUNT(*) FROM items").fetchone()[0] >= 2000
+        conn.close()
+    
+    def test_compressed_parts_round_trip(self, tmp_path):
+        """تست فشرده‌سازی، تقسیم، چک‌سام و بازسازی"""
+        import hashlib
+        from backup_scheduler import run_backup, restore_backup_file
+        
+        src = str(tmp_path / 'src.db')
+        self._make_db(src, rows=5000)
+        
+        result = run_backup(src, str(tmp_path / 'backups'), codec='gzip', part_size=4096)
+        
+        assert len(result.files) > 1
+        assert all(os.path.getsize(f) <= 4096 for f in result.files)
+        assert result.compressed_size < result.db_size
+        assert result.throughput_mb > 0
+        assert not any(f.endswith('.tmp') for f in os.listdir(tmp_path / 'backups'))
+        
+        joined = b''.join(open(f, 'rb').read() for f in result.files)
+        assert hashlib.sha256(joined).hexdigest() == result.checksum
+        
+        restored = restore_backup_file(result.files, str(tmp_path / 'restored.db'))
+        conn = sqlite3.connect(restored)
+        assert conn.execute("SELECT COUNT(*) FROM items").fetchone()[0] == 5000
+        conn.close()
+        
+        # قسمت خراب با manifest تشخیص داده میشه
+        with open(result.files[1], 'r+b') as f:
+            f.write(b'corrupt')
+        with pytest.raises(ValueError):
+            restore_backup_file(result.files, str(tmp_path / 'bad.db'))
+    
+    def test_restore_verification(self, tmp_path):
+        """تست بازیابی در staging + quick_check در پروسه جدا + مقایسه تعداد ردیف‌ها"""
+        from backup_scheduler import run_backup, verify_backup, format_backup_report
+        
+        src, folder = str(tmp_path / 'src.db'), str(tmp_path / 'backups')
+        self._make_db(src, rows=300)
+        
+        result = run_backup(src, folder, codec='gzip', incremental=False, verify=True)
+        assert result.verified, result.verification
+        assert result.verification['restore_seconds'] > 0
+        assert not os.path.exists(os.path.join(folder, 'restore_staging.db'))
+        assert 'تست بازیابی: ✅' in format_backup_report(result)
+        
+        staging = str(tmp_path / 'staging.db')
+        wrong = verify_backup(result.files, {'items': 301, 'users': None}, staging)
+        assert not wrong['ok'] and wrong['mismatches'] == {'items': (301, 300)}
+        
+        # فایل خراب: خطا گزارش میشه و پروسه ربات سالم می‌مونه
+        with open(result.files[0], 'r+b') as f:
+            f.seek(40)
+            f.write(b'\x00' * 200)
+        broken = verify_backup(result.files, {'items': 300}, staging)
+        assert not broken['ok'] and broken['error']
+        assert not os.path.exists(staging)
+    
+    def test_incremental_chain_restore(self, tmp_path):
+        """تست بکاپ کامل + دو increment و بازیابی به همون وضعیت"""
+        from backup_scheduler import run_backup
+        from incremental_backup import run_incremental_backup, NeedFullBackup
+        from restore_backup import restore
+        
+        src, folder = str(tmp_path / 'src.db'), str(tmp_path / 'backups')
+        self._make_db(src, rows=100)
+        conn = sqlite3.connect(src)
+        conn.execute("CREATE TABLE settings (key TEXT PRIMARY KEY, value BLOB)")
+        conn.execute("INSERT INTO settings VALUES ('a', x'00ff')")
+        conn.commit()
+        
+        run_backup(src, folder, codec='gzip', incremental=True)
+        assert run_incremental_backup(src, folder) is None  # بدون تغییر
+        
+        conn.execute("UPDATE items SET payload = 'changed' WHERE id <= 10")
+        conn.execute("DELETE FROM items WHERE id BETWEEN 50 AND 59")
+        conn.execute("INSERT INTO settings VALUES ('b', x'01')")
+        conn.commit()
+        first = run_incremental_backup(src, folder)
+        assert (first.number, first.upserts, first.deletes) == (1, 11, 10)
+        
+        conn.execute("UPDATE items SET payload = 'again' WHERE id = 1")
+        conn.execute("INSERT INTO items (payload) VALUES ('new')")
+        conn.execute("UPDATE settings SET value = x'02' WHERE key = 'a'")
+        conn.commit()
+        second = run_incremental_backup(src, folder)
+        assert second.number == 2 and second.from_seq == first.to_seq
+        
+        expected = {t: conn.execute(f"SELECT rowid, * FROM {t} ORDER BY rowid").fetchall()
+                    for t in ('items', 'settings')}
+        
+        result = restore(folder, 'latest', str(tmp_path / 'restored.db'))
+        assert result['increments'] == 2
+        restored = sqlite3.connect(str(tmp_path / 'restored.db'))
+        for table, rows in expected.items():
+            assert restored.execute(f"SELECT rowid, * FROM {table} ORDER BY rowid").fetchall() == rows
+        restored.close()
+        
+        # بازیابی تا increment اول
+        restore(folder, 'latest', str(tmp_path / 'first.db'), until=1)
+        partial = sqlite3.connect(str(tmp_path / 'first.db'))
+        assert partial.execute("SELECT payload FROM items WHERE id = 1").fetchone()[0] == 'changed'
+        partial.close()
+        
+        # تغییر schema زنجیره رو می‌شکنه
+        conn.execute("ALTER TABLE items ADD COLUMN extra TEXT")
+        conn.commit()
+        conn.close()
+        with pytest.raises(NeedFullBackup):
+            run_incremental_backup(src, folder)
+    
+    def test_incremental_restore_skips_app_triggers(self, tmp_path):
+        """تست بازیابی increment بدون اجرای دوباره trigger های برنامه (تغییر وضعیت سفارش)"""
+        from backup_scheduler import run_backup
+        from incremental_backup import run_incremental_backup
+        from migrations import run_migrations
+        from restore_backup import restore
+        
+        src, folder = str(tmp_path / 'src.db'), str(tmp_path / 'backups')
+        conn = sqlite3.connect(src)
+        run_migrations(conn)
+        conn.execute("INSERT INTO orders (user_id, items, status) VALUES (1, '[]', 'confirmed')")
+        conn.commit()
+        
+        run_backup(src, folder, codec='gzip', incremental=True)
+        conn.execute("UPDATE orders SET status = 'rejected' WHERE id = 1")
+        conn.execute("UPDATE orders SET status = 'confirmed' WHERE id = 1")
+        conn.commit()
+        assert run_incremental_backup(src, folder).number == 1
+        
+        query = "SELECT id, order_id, sign FROM product_stats_changes ORDER BY id"
+        expected = conn.execute(query).fetchall()
+        assert expected == [(1, 1, 1), (2, 1, -1), (3, 1, 1)]
+        triggers = "SELECT name, sql FROM sqlite_master WHERE type = 'trigger' ORDER BY name"
+        expected_triggers = conn.execute(triggers).fetchall()
+        conn.close()
+        
+        restore(folder, 'latest', str(tmp_path / 'restored.db'))
+        restored = sqlite3.connect(str(tmp_path / 'restored.db'))
+        assert restored.execute(query).fetchall() == expected
+        assert restored.execute(triggers).fetchall() == expected_triggers
+        restored.close()
+    
+    def test_cleanup_removes_whole_sets(self, tmp_path):
+        """تست حذف همه فایل‌های بکاپ‌های قدیمی (قسمت‌ها + manifest + .db قدیمی)"""
+        from backup_scheduler import cleanup_old_backups
+        
+        folder = tmp_path / 'backups'
+        folder.mkdir()
+        (folder / 'backup_20240101_030000.db').write_bytes(b'old')
+        for day in range(2, 10):
+            stem = f'backup_202401{day:02d}_030000'
+            (folder / f'{stem}.db.gz.part001').write_bytes(b'a')
+            (folder / f'{stem}.db.gz.part002').write_bytes(b'b')
+            (folder / f'{stem}.db.gz.sha256').write_text('x')
+        (folder / 'notes.txt').write_text('keep')
+        
+        with patch('backup_scheduler.BACKUP_FOLDER', str(folder)):
+            cleanup_old_backups(keep_count=7)
+        
+        names = sorted(os.listdir(folder))
+        assert 'notes.txt' in names
+        assert not any(n.startswith(('backup_20240101', 'backup_20240102')) for n in names)
+        assert len([n for n in names if n.startswith('backup_')]) == 7 * 3
+
+
+class TestMigrations:
+    """تست migration های نسخه‌دار و راه‌اندازی بدون DDL"""
+    
+    @staticmethod
+    def _ddl_statements(conn, action):
+        statements = []
+        conn.set_trace_callback(statements.append)
+        try:
+            action()
+        finally:
+            conn.set_trace_callback(None)
+        return [sql for sql in statements
+                if sql.lstrip().upper().startswith(('CREATE', 'ALTER', 'DROP'))]
+    
+    def test_startup_skips_ddl_when_current(self, db):
+        """تست اینکه راه‌اندازی دوباره و ساخت Analytics هیچ DDL اجرا نمی‌کنن"""
+        from migrations import LATEST_VERSION, get_schema_version
+        from handlers.analytics import Analytics
+        
+        conn = db._get_conn()
+        assert get_schema_version(conn) == LATEST_VERSION
+        
+        assert self._ddl_statements(conn, db.create_tables) == []
+        assert self._ddl_statements(conn, lambda: Analytics(db)) == []
+        
+        # جدول آمار و trigger ها از migration اومدن
+        triggers = {row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'trg_product_stats_%'"
+        )}
+        assert len(triggers) == 3
+    
+    def test_legacy_database_upgrade(self, tmp_path):
+        """تست ارتقای دیتابیس قدیمی بدون schema_version"""
+        from migrations import run_migrations, get_schema_version, LATEST_VERSION, MIGRATIONS
+        
+        path = str(tmp_path / 'legacy.db')
+        conn = sqlite3.connect(path)
+        conn.executescript("""
+            CREATE TABLE users (user_id INTEGER PRIMARY KEY, username TEXT, first_name TEXT);
+            CREATE TABLE orders (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, items TEXT,
+                                 status TEXT DEFAULT 'pending', created_at TIMESTAMP);
+            CREATE TABLE discount_codes (id INTEGER PRIMARY KEY AUTOINCREMENT, code TEXT UNIQUE NOT NULL,
+                                         type TEXT NOT NULL, value REAL NOT NULL);
+            CREATE TABLE wallets (user_id INTEGER PRIMARY KEY, balance REAL NOT NULL DEFAULT 0,
+                                  expires_at TIMESTAMP, updated_at TIMESTAMP,
+                                  FOREIGN KEY (user_id) REFERENCES users(user_id));
+            INSERT INTO users VALUES (1, 'u', 'U');
+            INSERT INTO orders (user_id, items, created_at) VALUES (1, '[]', '2024-01-01 10:00:00');
+            INSERT INTO wallets VALUES (1, 5000, NULL, NULL);
+        """)
+        
+        applied = run_migrations(conn)
+        assert applied == [version for version, _, _ in MIGRATIONS]
+        assert get_schema_version(conn) == LATEST_VERSION
+        assert conn.execute("SELECT expires_at FROM orders").fetchone()[0] == '2024-01-01 11:00:00'
+        assert 'per_user_limit' in [row[1] for row in conn.execute("PRAGMA table_info(discount_codes)")]
+        assert conn.execute("PRAGMA foreign_key_list(wallets)").fetchall() == []
+        assert conn.execute("SELECT balance FROM wallets").fetchone()[0] == 5000
+        assert run_migrations(conn) == []
+        conn.close()
+    
+    def test_failed_migration_rolls_back(self, tmp_path, monkeypatch):
+        """تست rollback یک migration ناموفق و ادامه از همون نسخه در اجرای بعدی"""
+        import migrations
+        
+        def broken(conn):
+            conn.execute("CREATE TABLE half_done (id INTEGER)")
+            raise sqlite3.OperationalError("boom")
+        
+        path = str(tmp_path / 'broken.db')
+        conn = sqlite3.connect(path)
+        monkeypatch.setattr(migrations, 'MIGRATIONS', migrations.MIGRATIONS + [(99, 'broken', broken)])
+        
+        with pytest.raises(migrations.MigrationError):
+            migrations.run_migrations(conn, target=99)
+        assert migrations.get_schema_version(conn) == migrations.LATEST_VERSION
+        assert conn.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE name = 'half_done'"
+        ).fetchone()[0] == 0
+        conn.close()
+
+
+class TestDbMaintenance:
+    """تست incremental vacuum، checkpoint تطبیقی WAL و optimize"""
+    
+    @staticmethod
+    def _fill(path, rows=3000):
+        conn = sqlite3.connect(path)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS junk (id INTEGER PRIMARY KEY, payload TEXT)")
+        conn.executemany("INSERT INTO junk (payload) VALUES (?)", [("x" * 500,)] * rows)
+        conn.commit()
+        return conn
+    
+    def test_auto_vacuum_migration_and_incremental_vacuum(self, tmp_path):
+        """تست تبدیل دیتابیس قدیمی به INCREMENTAL و آزادسازی مرحله‌ای صفحات"""
+        from db_maintenance import DatabaseMaintenance, get_file_stats
+        
+        path = str(tmp_path / 'old.db')
+        conn = self._fill(path)
+        assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 0
+        conn.close()
+        
+        maint = DatabaseMaintenance(path, vacuum_pages=50, min_free_pages=10)
+        assert maint.ensure_incremental_auto_vacuum(max_mb=100) == 'incremental'
+        
+        conn = sqlite3.connect(path)
+        conn.execute("DELETE FROM junk")
+        conn.commit()
+        free_before = get_file_stats(conn, path)['freelist_pages']
+        conn.close()
+        assert free_before > 100
+        
+        report = maint.run_cycle()
+        assert report['vacuumed_pages'] == min(free_before, 50 * 8)
+        assert report['freelist_pages'] == free_before - report['vacuumed_pages']
+        assert report['auto_vacuum'] == 'incremental'
+        assert report['optimized'] is True
+    
+    def test_adaptive_checkpoint(self, tmp_path):
+        """تست PASSIVE/TRUNCATE بر اساس حجم WAL و تشخیص خواننده طولانی"""
+        from db_maintenance import DatabaseMaintenance, wal_size
+        
+        path = str(tmp_path / 'wal.db')
+        conn = self._fill(path)
+        conn.execute("PRAGMA wal_autocheckpoint = 0")
+        
+        maint = DatabaseMaintenance(path, wal_checkpoint_mb=100)
+        assert maint.run_cycle()['checkpoint'] is None  # WAL کوچیکه
+        
+        # خواننده طولانی جلوی checkpoint کامل رو می‌گیره
+        reader = sqlite3.connect(path)
+        reader.execute("BEGIN")
+        reader.execute("SELECT COUNT(*) FROM junk").fetchone()
+        conn.executemany("INSERT INTO junk (payload) VALUES (?)", [("y" * 500,)] * 500)
+        conn.commit()
+        
+        maint = DatabaseMaintenance(path, wal_checkpoint_mb=0, wal_truncate_mb=0)
+        result = maint.run_cycle()['checkpoint']
+        assert result['checkpointed'] < result['log']
+        assert maint.totals['checkpoint_blocked'] == 1
+        
+        reader.rollback()
+        reader.close()
+        result = maint.run_cycle()['checkpoint']
+        assert result['mode'] == 'truncate'
+        assert wal_size(path) == 0
+        conn.close()
+    
+    def test_health_reports_wal_and_freelist(self, db):
+        """تست نمایش حجم WAL و صفحات آزاد در Health Check"""
+        from health_check import HealthChecker
+        
+        info = HealthChecker(db, 0).check_database()
+        assert info['healthy']
+        assert {'wal_mb', 'freelist_pages', 'freelist_mb'} <= set(info)
+        assert info['auto_vacuum'] == 'incremental'
+
+
+class TestStartup:
+    """تست زمان راه‌اندازی سرد"""
+
+    def test_cold_start_budget(self):
+        """تست بودجه import + build + اولین update و import نشدن ماژول‌های سنگین"""
+        from benchmark_startup import measure_startup, STARTUP_BUDGET_SECONDS
+
+        result = measure_startup()
+        assert result['bot_calls'] == ['getMe', 'sendMessage']
+        assert result['heavy_after_import'] == []
+        # psutil رو thread نمونه‌بردار Health Check در پس‌زمینه لود می‌کنه
+        assert set(result['heavy_after_first_update']) <= {'psutil'}
+        assert result['total_seconds'] < STARTUP_BUDGET_SECONDS
+
+    def test_lazy_pyplot(self):
+        """تست تنظیم backend بدون نمایشگر در اولین استفاده"""
+        pytest.importorskip('matplotlib')
+        from handlers.analytics import get_pyplot
+
+        plt = get_pyplot()
+        assert plt is get_pyplot()
+        assert plt.get_backend().lower() == 'agg'
+
+
 class TestEdgeCases:
     """تست موارد خاص و Edge Cases"""
     
@@ -881,6 +2187,336 @@ class TestOrderManagement:
         assert order2 not in order_ids
 
 
+# ==================== Tests: Analytics ====================
+
+class TestAnalytics:
+    """تست آمار محصولات"""
+    
+    def _stats(self, db):
+        cursor = db.cursor
+        cursor.execute("SELECT product_name, total_sold, total_revenue FROM product_stats ORDER BY product_name")
+        return [tuple(row) for row in cursor.fetchall()]
+    
+    def test_incremental_product_stats(self, db):
+        """تست به‌روزرسانی تدریجی آمار و برابری با بازسازی کامل"""
+        from handlers.analytics import Analytics
+        from states import OrderStatus
+        
+        db.add_user(12345, "test", "Test")
+        analytics = Analytics(db)
+        
+        items_a = [{'product': 'الف', 'pack': 'پک', 'quantity': 6, 'price': 300000}]
+        items_b = [{'product': 'ب', 'pack': 'پک', 'quantity': 2, 'price': 100000}]
+        
+        order1 = db.create_order(12345, items_a, 300000, 0, 300000)
+        db.update_order_status(order1, OrderStatus.CONFIRMED)
+        
+        # اولین اجرا: بازسازی کامل
+        assert analytics.update_product_stats() is True
+        assert self._stats(db) == [('الف', 6, 300000.0)]
+        
+        # سفارشات جدید و تغییر وضعیت
+        order2 = db.create_order(12345, items_a + items_b, 400000, 0, 400000)
+        db.update_order_status(order2, OrderStatus.PAYMENT_CONFIRMED)
+        order3 = db.create_order(12345, items_b, 100000, 0, 100000)
+        db.update_order_status(order3, OrderStatus.CONFIRMED)
+        db.update_order_status(order3, OrderStatus.REJECTED)
+        
+        assert analytics.update_product_stats(batch_size=2) is True
+        assert sorted(self._stats(db)) == sorted([('الف', 12, 600000.0), ('ب', 2, 100000.0)])
+        
+        # حذف سفارش تایید شده
+        db.delete_order(order1)
+        analytics.update_product_stats()
+        incremental = self._stats(db)
+        
+        analytics.rebuild_product_stats()
+        assert self._stats(db) == incremental
+        
+        # صف تغییرات بعد از پردازش خالی میشه
+        cursor = db.cursor
+        cursor.execute("SELECT COUNT(*) FROM product_stats_changes")
+        assert cursor.fetchone()[0] == 0
+
+
+    def test_order_frame_matches_sql(self, db):
+        """تست برابری لایه NumPy با کوئری‌های SQL"""
+        from handlers.analytics import Analytics
+        from states import OrderStatus
+        
+        db.add_user(12345, "test", "Test")
+        db.add_user(12346, "test2", "Test2")
+        items = [{'product': 'الف', 'pack': 'پک', 'quantity': 3, 'price': 1000}]
+        for user_id, price in [(12345, 1000), (12345, 2000), (12346, 5000)]:
+            order_id = db.create_order(user_id, items, price, 0, price)
+            db.update_order_status(order_id, OrderStatus.CONFIRMED)
+        db.create_order(12346, items, 9000, 0, 9000)  # pending
+        
+        analytics = Analytics(db)
+        frame = analytics.load_frame(30)
+        assert len(frame) == 4
+        
+        daily = frame.confirmed().aggregate('day')
+        sql_rows = analytics.get_sales_data(30)
+        assert [str(d) for d in daily['labels']] == [row[0] for row in sql_rows]
+        assert daily['count'].tolist() == [row[1] for row in sql_rows]
+        assert daily['net'].tolist() == [row[2] for row in sql_rows]
+        
+        assert frame.hourly_counts().sum() == 4
+        assert frame.confirmed().repeat_stats()['repeat_rate'] == 1.5
+        assert analytics.get_popular_products(5, use_cache=False) == [('الف', 9)]
+    
+    def test_order_frame_buckets(self):
+        """تست گروه‌بندی زمانی، میانگین متحرک و کوهورت"""
+        import numpy as np
+        from analytics_data import OrderFrame, rolling_mean
+        
+        ts = np.array([
+            '2024-01-01T10:00', '2024-01-01T23:00', '2024-01-08T01:00',
+            '2024-02-03T12:00', '2024-03-05T12:00',
+        ], dtype='datetime64[s]').astype(np.int64)
+        frame = OrderFrame(
+            order_id=[1, 2, 3, 4, 5], user_id=[1, 2, 1, 3, 1], ts=ts,
+            status=[4, 4, 4, 4, 4], total_price=[10, 20, 30, 40, 50],
+            discount_amount=[0, 0, 0, 0, 0], final_price=[10, 20, 30, 40, 50],
+        )
+        
+        weekly = frame.aggregate('week')
+        assert [str(d) for d in weekly['labels']] == ['2024-01-01', '2024-01-08', '2024-01-29', '2024-03-04']
+        assert weekly['count'].tolist() == [2, 1, 1, 1]
+        
+        monthly = frame.aggregate('month')
+        assert [str(m) for m in monthly['labels']] == ['2024-01', '2024-02', '2024-03']
+        assert monthly['net'].tolist() == [60.0, 40.0, 50.0]
+        
+        assert frame.hourly_counts()[[1, 10, 12, 23]].tolist() == [1, 1, 2, 1]
+        assert rolling_mean([1, 2, 3, 4], 2).tolist() == [1.0, 1.5, 2.5, 3.5]
+        
+        cohorts = frame.cohort_retention()
+        assert [str(c) for c in cohorts['cohorts']] == ['2024-01', '2024-02']
+        assert cohorts['sizes'].tolist() == [2, 1]
+        # از کوهورت ژانویه فقط کاربر 1 در ماه سوم (مارس) برگشته
+        assert cohorts['retention'][0].tolist() == [1.0, 0.0, 0.5]
+
+
+    def test_analytics_snapshot(self, db, temp_db, tmp_path):
+        """تست snapshot فقط‌خواندنی و مسیریابی گزارش‌ها"""
+        from analytics_snapshot import AnalyticsSnapshot, get_read_db
+        
+        db.add_user(12345, "test", "Test")
+        snapshot = AnalyticsSnapshot(temp_db, str(tmp_path / "snap.db"), max_age=60)
+        assert snapshot.is_fresh() is False
+        
+        assert snapshot.refresh() is True
+        assert snapshot.is_fresh() is True
+        
+        cursor = snapshot.cursor
+        cursor.execute("SELECT COUNT(*) FROM users")
+        assert cursor.fetchone()[0] == 1
+        
+        # snapshot فقط‌خواندنی است
+        with pytest.raises(sqlite3.OperationalError):
+            snapshot.conn.execute("DELETE FROM users")
+        
+        # تغییرات جدید بعد از refresh دیده میشن
+        db.add_user(12346, "test2", "Test2")
+        snapshot.refresh()
+        cursor = snapshot.cursor
+        cursor.execute("SELECT COUNT(*) FROM users")
+        assert cursor.fetchone()[0] == 2
+        
+        # snapshot کهنه قبل از استفاده بروزرسانی میشه
+        context = Mock()
+        context.bot_data = {'db': db, 'analytics_snapshot': snapshot}
+        snapshot.last_refresh -= 120
+        assert asyncio.run(get_read_db(context)) is snapshot
+        assert snapshot.is_fresh() is True
+        
+        # بدون snapshot همان دیتابیس زنده برمی‌گرده
+        context.bot_data = {'db': db}
+        assert asyncio.run(get_read_db(context)) is db
+        snapshot.close()
+    
+    def test_analytics_snapshot_closes_idle_thread_connections(self, db, temp_db, tmp_path):
+        """تست بستن اتصال thread های بیکار به snapshot های جایگزین‌شده"""
+        import threading
+        from analytics_snapshot import AnalyticsSnapshot
+        
+        snapshot = AnalyticsSnapshot(temp_db, str(tmp_path / "snap.db"), max_age=60)
+        assert snapshot.refresh() is True
+        
+        # یک thread کاری که بعد از اولین گزارش دیگه از snapshot استفاده نمی‌کنه
+        idle = []
+        worker = threading.Thread(target=lambda: idle.append(snapshot.get_connection()))
+        worker.start()
+        worker.join()
+        current = snapshot.get_connection()
+        assert snapshot.get_stats()['connections'] == 2
+        
+        # نسل قبل یک refresh مهلت داره (ممکنه وسط گزارش باشه)
+        snapshot.refresh()
+        idle[0].execute("SELECT 1")
+        snapshot.refresh()
+        with pytest.raises(sqlite3.ProgrammingError):
+            idle[0].execute("SELECT 1")
+        assert snapshot.get_stats()['connections'] == 0
+        
+        # thread فعلی دوباره وصل میشه
+        assert snapshot.get_connection() is not current
+        assert snapshot.get_connection().execute("SELECT COUNT(*) FROM users").fetchone()[0] == 0
+        snapshot.close()
+        assert snapshot.get_stats()['connections'] == 0
+
+
+# ==================== Tests: Export ====================
+
+class TestExport:
+    """تست‌های Export"""
+    
+    def test_streaming_orders_export(self, db, monkeypatch):
+        """تست export جریانی سفارشات با چند دسته fetchmany"""
+        import json
+        import export_manager
+        from openpyxl import load_workbook
+        
+        monkeypatch.setattr(export_manager, 'EXPORT_CHUNK_SIZE', 100)
+        
+        items = json.dumps([{'product': 'مانتو', 'quantity': 6, 'price': 100000}])
+        with db.transaction() as cursor:
+            cursor.executemany("INSERT INTO users (user_id) VALUES (?)", [(i,) for i in range(250)])
+            cursor.executemany("""
+                INSERT INTO orders (user_id, items, total_price, final_price, status,
+                                    shipping_method, created_at)
+                VALUES (?, ?, 600000, 600000, 'confirmed', 'پست', '2024-01-15 10:30:00')
+            """, [(i, items) for i in range(250)])
+        
+        progress = []
+        exporter = export_manager.ExportManager(db)
+        filepath = exporter.export_orders(progress_callback=lambda done, total: progress.append((done, total)))
+        
+        try:
+            assert progress == [(100, 250), (200, 250), (250, 250)]
+            
+            wb = load_workbook(filepath, read_only=True)
+            rows = list(wb.active.iter_rows(values_only=True))
+            assert len(rows) == 251
+            assert rows[0][8] == "نحوه ارسال"
+            assert rows[1][2] == "مانتو (6)"
+            assert rows[1][8] == "پست"
+            assert rows[1][9] == "2024-01-15 10:30"
+            wb.close()
+        finally:
+            os.remove(filepath)
+    
+    def test_csv_gzip_partitioned_export(self, db):
+        """تست خروجی csv.gz، فیلتر وضعیت و پارتیشن ماهانه"""
+        import csv
+        import gzip
+        from export_manager import ExportManager, month_partitions
+        
+        with db.transaction() as cursor:
+            cursor.execute("INSERT INTO users (user_id) VALUES (1)")
+            cursor.executemany("""
+                INSERT INTO orders (user_id, items, total_price, final_price, status, created_at)
+                VALUES (1, '[]', 1000, 1000, ?, ?)
+            """, [
+                ('confirmed', '2024-01-10 10:00:00'),
+                ('payment_confirmed', '2024-01-31 23:59:00+03:30'),
+                ('rejected', '2024-02-05 09:00:00'),
+                ('confirmed', '2024-03-01T08:00:00'),
+            ])
+        
+        partitions = month_partitions(datetime(2024, 1, 10), datetime(2024, 3, 15))
+        assert [p[0] for p in partitions] == ['2024-01', '2024-02', '2024-03']
+        assert partitions[0][1] == datetime(2024, 1, 10)
+        assert partitions[-1][2] == datetime(2024, 3, 15)
+        
+        exporter = ExportManager(db)
+        counts = []
+        for label, start, end in partitions:
+            filepath = exporter.export_orders(
+                start, end, ('confirmed', 'payment_confirmed'), fmt='csv.gz', file_label=label
+            )
+            try:
+                assert filepath.endswith('.csv.gz') and label in filepath
+                with gzip.open(filepath, 'rt', encoding='utf-8-sig', newline='') as f:
+                    rows = list(csv.reader(f))
+                assert rows[0][0] == "شماره سفارش"
+                counts.append(len(rows) - 1)
+                assert exporter.last_export_rows == len(rows) - 1
+            finally:
+                os.remove(filepath)
+        
+        assert counts == [2, 0, 1]
+    
+    def test_sales_report_sets_row_count(self, db):
+        """تست ثبت تعداد سفارش‌های گزارش فروش (rows_count در export_jobs)"""
+        from export_manager import ExportManager
+        
+        recent = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        with db.transaction() as cursor:
+            cursor.execute("INSERT INTO users (user_id) VALUES (1)")
+            cursor.executemany("""
+                INSERT INTO orders (user_id, items, total_price, final_price, status, created_at)
+                VALUES (1, '[]', 1000, 1000, ?, ?)
+            """, [('confirmed', recent), ('payment_confirmed', recent), ('rejected', recent)])
+        
+        exporter = ExportManager(db)
+        filepath = exporter.export_sales_report('week')
+        try:
+            assert exporter.last_export_rows == 2
+        finally:
+            os.remove(filepath)
+    
+    def test_handle_export_runs_in_background(self, db):
+        """تست اجرای export در task پس‌زمینه (handler بلافاصله برمی‌گرده)"""
+        from config import ADMIN_ID
+        from export_manager import handle_export
+        
+        with db.transaction() as cursor:
+            cursor.execute("INSERT INTO users (user_id) VALUES (1)")
+        
+        update = Mock()
+        update.effective_user.id = ADMIN_ID
+        update.callback_query.answer = AsyncMock()
+        update.callback_query.data = 'export:users'
+        message = update.callback_query.message
+        message.reply_text = AsyncMock()
+        message.reply_document = AsyncMock()
+        
+        context = Mock()
+        context.bot_data = {'db': db}
+        context.user_data = {}
+        
+        asyncio.run(handle_export(update, context))
+        
+        # هنوز هیچ فایلی ساخته یا ارسال نشده؛ کار به صورت task ثبت شده
+        message.reply_document.assert_not_called()
+        context.application.create_task.assert_called_once()
+        job, = context.application.create_task.call_args.args
+        assert context.application.create_task.call_args.kwargs['update'] is update
+        assert db.get_export_jobs()[0]['status'] != 'done'
+        
+        asyncio.run(job)
+        message.reply_document.assert_awaited_once()
+        jobs = db.get_export_jobs()
+        assert jobs[0]['status'] == 'done' and jobs[0]['rows_count'] == 1
+    
+    def test_export_jobs_tracking(self, db):
+        """تست جدول export_jobs"""
+        import json
+        
+        job_id = db.create_export_job(12345, 'orders', 'csv', {'range': '365', 'status': 'all'})
+        assert db.update_export_job(job_id, status='done', rows_count=10, size_bytes=2048, parts=3)
+        assert db.update_export_job(job_id, unknown_column=1) is False
+        
+        jobs = db.get_export_jobs()
+        assert len(jobs) == 1
+        assert jobs[0]['status'] == 'done'
+        assert jobs[0]['parts'] == 3
+        assert json.loads(jobs[0]['filters'])['range'] == '365'
+
+
 # ==================== Tests: Integration ====================
 
 class TestIntegration: